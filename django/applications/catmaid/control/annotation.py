@@ -1,20 +1,25 @@
 # -*- coding: utf-8 -*-
 
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import defaultdict
 import dateutil.parser
+import json
 import re
 
 from typing import Any, DefaultDict, Dict, FrozenSet, List, Optional, Set, Tuple, Union
 
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
-from django.db import connection
+from django.db import connection, transaction
 
 from rest_framework.decorators import api_view
 
 from catmaid.models import UserRole, Project, Class, ClassInstance, \
         ClassInstanceClassInstance, Relation, ReviewerWhitelist
-from catmaid.control.authentication import requires_user_role, can_edit_or_fail
+from catmaid.control.authentication import (requires_user_role,
+        get_non_editable_ids)
+from catmaid.history import add_log_entry
 from catmaid.control.common import (get_relation_to_id_map,
         get_class_to_id_map, get_request_bool, get_request_list)
 
@@ -53,6 +58,77 @@ def get_annotated_entities(project_id:Union[int,str], params, relations=None, cl
         with_name:bool=True, with_type:bool=True) -> Tuple[List, int]:
     """Get a list of annotated entities based on the passed in search criteria.
     """
+    entities, num_total_records, _ = get_annotated_entity_page(project_id,
+            params, relations, classes, allowed_classes, sort_by, sort_dir,
+            range_start, range_length, with_annotations, with_skeletons,
+            with_timestamps, import_only, ignore_nonexisting, with_name,
+            with_type)
+    return entities, num_total_records
+
+
+def _encode_range_cursor(sort_by, sort_dir, sort_value, entity_id) -> str:
+    """Create an opaque token that references the position of an entity in a
+    sorted result list.
+    """
+    data = json.dumps([sort_by, sort_dir, sort_value, entity_id])
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _decode_range_cursor(range_cursor, sort_by, sort_dir) -> Tuple[Any, int]:
+    """Return the sort value and entity ID referenced by the passed in range
+    cursor token.
+    """
+    try:
+        cursor_sort_by, cursor_sort_dir, sort_value, entity_id = json.loads(
+                urlsafe_b64decode(range_cursor.encode('ascii')).decode('utf-8'))
+        entity_id = int(entity_id)
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid range cursor: {range_cursor}')
+    if cursor_sort_by != sort_by or cursor_sort_dir != sort_dir:
+        raise ValueError("The range cursor doesn't match the requested sort order")
+    return sort_value, entity_id
+
+
+def _estimate_row_count(cursor, query, params) -> int:
+    """Return the number of result rows the query planner expects for the
+    passed in query, without executing it.
+    """
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_annotated_entity_page(project_id:Union[int,str], params, relations=None,
+        classes=None, allowed_classes=['neuron', 'annotation'], sort_by=None,
+        sort_dir=None, range_start=None, range_length=None,
+        with_annotations:bool=True, with_skeletons:bool=True,
+        with_timestamps:bool=False, import_only:Union[None, str]=None,
+        ignore_nonexisting:bool=False, with_name:bool=True,
+        with_type:bool=True, range_after:Optional[str]=None,
+        count_mode:str='exact') -> Tuple[List, Optional[int], Optional[str]]:
+    """Get a list of annotated entities based on the passed in search criteria,
+    along with the total number of results and a range cursor for the next
+    result page.
+
+    If results are sorted by ID or name and <range_length> is set, a range
+    cursor is returned for every full page. Passing it back as <range_after>
+    returns the results following the last entity of that page (keyset
+    pagination), which takes the same time regardless of how deep the page
+    is. In this case <range_start> is ignored. The total number of results is
+    counted exactly by default. With a <count_mode> of 'estimate' the query
+    planner's estimate is returned instead and with 'none' no count is made.
+    """
+    if count_mode not in ('exact', 'estimate', 'none'):
+        raise ValueError(f'Unknown count mode: {count_mode}')
+    keyset_sort = sort_by in ('id', 'name') and sort_dir is not None
+    if range_after is not None:
+        if not keyset_sort:
+            raise ValueError('Range cursors can only be used when sorting by ID or name')
+        if range_length is None:
+            raise ValueError('Range cursors require the range_length parameter')
+
     if not relations:
         relations = get_relation_to_id_map(project_id)
     if not classes:
@@ -275,9 +351,12 @@ def get_annotated_entities(project_id:Union[int,str], params, relations=None, cl
     # limiting on the Python side.
     num_total_records = None
     offset = ""
-    if range_start is not None and range_length is not None:
+    paginated = range_length is not None and \
+            (range_start is not None or range_after is not None)
+    if paginated:
         # Get total number of results with separate query. No sorting or offset
-        # is needed for this.
+        # is needed for this. Alternatively, only the query planner's estimate
+        # is used, which doesn't require executing the query.
         query_fmt_params = {
             'fields': 'COUNT(*)',
             'joins': '\n'.join(joins),
@@ -285,12 +364,31 @@ def get_annotated_entities(project_id:Union[int,str], params, relations=None, cl
             'sort': '',
             'offset': ''
         }
-        cursor.execute(query.format(**query_fmt_params), params)
-        num_total_records = cursor.fetchone()[0]
+        if count_mode == 'exact':
+            cursor.execute(query.format(**query_fmt_params), params)
+            num_total_records = cursor.fetchone()[0]
+        elif count_mode == 'estimate':
+            query_fmt_params['fields'] = '1'
+            num_total_records = _estimate_row_count(cursor,
+                    query.format(**query_fmt_params), params)
 
-        offset = "OFFSET %(range_start)s LIMIT %(range_length)s"
-        params['range_start'] = int(range_start)
         params['range_length'] = int(range_length)
+        if range_after is not None:
+            # Continue after the last entity of the previous page. Combined
+            # with the ID as tie breaker, the sort order is total and the
+            # sort key indices can be used to find the page start.
+            after_value, after_id = _decode_range_cursor(range_after, sort_by, sort_dir)
+            op = '>' if sort_dir.lower() == 'asc' else '<'
+            if sort_by == 'id':
+                filters.append(f'ci.id {op} %(range_after_id)s')
+            else:
+                filters.append(f'(ci.name, ci.id) {op} (%(range_after_value)s, %(range_after_id)s)')
+                params['range_after_value'] = after_value
+            params['range_after_id'] = after_id
+            offset = "LIMIT %(range_length)s"
+        else:
+            offset = "OFFSET %(range_start)s LIMIT %(range_length)s"
+            params['range_start'] = int(range_start)
 
     # Add skeleton ID info (if available)
     joins.append("""
@@ -338,20 +436,34 @@ def get_annotated_entities(project_id:Union[int,str], params, relations=None, cl
             raise ValueError(f'Unknown sort direction: {sort_by}')
         if sort_by in timebased_sort_order and not with_timestamps:
             raise ValueError('Set <with_timestamps> parameter to true')
-        if sort_by in regular_sort_orders:
-            sort_col = sort_by
+        sort_expr = sort_by
+        if sort_by == 'id':
+            sort_expr = 'ci.id'
+        elif sort_by == 'name':
+            # Use the ID as tie breaker to get a stable order for pagination.
+            sort_expr = f'ci.name {sort_dir.upper()}, ci.id'
         elif sort_by == 'annotated_on':
-            sort_by = ', '.join(creation_timestamp_fields)
+            sort_expr = ', '.join(creation_timestamp_fields)
         elif sort_by == 'last_annotation_link_edit':
-            sort_by = ', '.join(edition_timestamp_fields)
-        query_fmt_params['sort'] = f"ORDER BY {sort_by} {sort_dir.upper()}"
+            sort_expr = ', '.join(edition_timestamp_fields)
+        query_fmt_params['sort'] = f"ORDER BY {sort_expr} {sort_dir.upper()}"
 
     # Execute query and build result data structure
     cursor.execute(query.format(**query_fmt_params), params)
 
+    rows = cursor.fetchall()
+
+    # A full page likely has a successor, which can be referenced by a cursor
+    # to the last entity on this page.
+    next_range_cursor = None
+    if paginated and keyset_sort and rows and len(rows) == int(range_length):
+        last_row = rows[-1]
+        next_range_cursor = _encode_range_cursor(sort_by, sort_dir,
+                last_row[0] if sort_by == 'id' else last_row[6], last_row[0])
+
     entities = []
     seen_ids:Set = set()
-    for ent in cursor.fetchall():
+    for ent in rows:
         # Don't export objects with same ID multiple times
         if ent[0] in seen_ids:
             continue
@@ -375,7 +487,7 @@ def get_annotated_entities(project_id:Union[int,str], params, relations=None, cl
         entities.append(entity_info)
         seen_ids.add(ent[0])
 
-    if num_total_records is None:
+    if num_total_records is None and not paginated:
         num_total_records = len(entities)
 
     if with_annotations:
@@ -402,62 +514,96 @@ def get_annotated_entities(project_id:Union[int,str], params, relations=None, cl
         for ent in entities:
             ent['annotations'] = annotation_dict.get(ent['id'], [])
 
-    return entities, num_total_records
+    return entities, num_total_records, next_range_cursor
 
 
 def get_sub_annotation_ids(project_id:Union[int,str], annotation_sets, relations, classes) -> Dict:
     """ Sub-annotations are annotations that are annotated with an annotation
     from the annotation_set passed. Additionally, transivitely annotated
     annotations are returned as well. Note that all entries annotation_sets
-    must be frozenset instances, they need to be hashable.
+    must be frozenset instances, they need to be hashable. Sub-annotations
+    are looked up in the annotation closure table, which is maintained by the
+    database.
     """
     if not annotation_sets:
         return {}
 
-    aaa_tuples = ClassInstanceClassInstance.objects.filter(
-            project_id=project_id,
-            class_instance_a__class_column=classes['annotation'],
-            class_instance_b__class_column=classes['annotation'],
-            relation_id = relations['annotated_with']).values_list(
-                    'class_instance_b', 'class_instance_a')
-
-    # A set wrapper to keep a set in a dictionary
-    class set_wrapper:
-        def __init__(self):
-            self.data:Set = set()
-
-    # Create a dictionary of all annotations annotating a set of annotations
-    aaa:Dict = {}
-    for aa in aaa_tuples:
-        sa_set = aaa.get(aa[0])
-        if sa_set is None:
-            sa_set = set_wrapper()
-            aaa[aa[0]] = sa_set
-        sa_set.data.add(aa[1])
-
-    # Collect all sub-annotations by following the annotation hierarchy for
-    # every annotation in the annotation set passed.
-    sa_ids:Dict = {}
-    for annotation_set in annotation_sets:
-        # Start with an empty result set for each requested annotation set
-        ls:Set = set()
-        for a in annotation_set:
-            working_set = set([a])
-            while working_set:
-                parent_id = working_set.pop()
-                # Try to get the sub-annotations for this parent
-                child_ids = aaa.get(parent_id) or set_wrapper()
-                for child_id in child_ids.data:
-                    if child_id not in sa_ids:
-                        if child_id not in ls:
-                            # Add all children as sub annotations
-                            ls.add(child_id)
-                            working_set.add(child_id)
-        # Store the result list for this ID
-        sa_ids[annotation_set] = list(ls)
+    annotation_sets = list(annotation_sets)
+    set_indices = []
+    annotation_ids = []
+    for n, annotation_set in enumerate(annotation_sets):
+        for annotation_id in annotation_set:
+            set_indices.append(n)
+            annotation_ids.append(annotation_id)
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT DISTINCT query.set_index, ac.descendant_id
+        FROM UNNEST(%(set_indices)s::int[], %(annotation_ids)s::bigint[])
+            query(set_index, annotation_id)
+        JOIN catmaid_annotation_closure ac
+            ON ac.ancestor_id = query.annotation_id
+        WHERE ac.project_id = %(project_id)s
+    """, {
+        'project_id': project_id,
+        'set_indices': set_indices,
+        'annotation_ids': annotation_ids,
+    })
+
+    sa_ids:Dict = {annotation_set: [] for annotation_set in annotation_sets}
+    for set_index, sub_annotation_id in cursor.fetchall():
+        sa_ids[annotation_sets[set_index]].append(sub_annotation_id)
 
     return sa_ids
 
+
+def rebuild_annotation_closure(project_ids=None) -> None:
+    """Recompute the annotation closure table for the passed in projects or all
+    projects if no project IDs are passed in. Normally, the table is kept
+    up-to-date by database triggers.
+    """
+    cursor = connection.cursor()
+    if project_ids:
+        closure_filter = 'WHERE ac.project_id = ANY(%(project_ids)s::int[])'
+        link_filter = 'AND cici.project_id = ANY(%(project_ids)s::int[])'
+    else:
+        closure_filter, link_filter = '', ''
+    cursor.execute(f"""
+        DELETE FROM catmaid_annotation_closure ac
+        {closure_filter};
+
+        SELECT rebuild_annotation_closure(ARRAY(
+            SELECT DISTINCT cici.class_instance_b
+            FROM class_instance_class_instance cici
+            JOIN relation r
+                ON r.id = cici.relation_id
+            JOIN class_instance ci
+                ON ci.id = cici.class_instance_a
+            JOIN class c
+                ON c.id = ci.class_id
+            WHERE r.relation_name = 'annotated_with'
+                AND c.class_name = 'annotation'
+                {link_filter}
+        ))
+    """, {
+        'project_ids': [int(pid) for pid in project_ids] if project_ids else None,
+    })
+
+
+def rebuild_annotation_stats(project_ids=None) -> None:
+    """Recompute the annotation statistics and co-occurrence tables for the
+    passed in projects or all projects if no project IDs are passed in.
+    Normally, both tables are kept up-to-date by database triggers.
+    """
+    if not project_ids:
+        project_ids = list(Project.objects.all().values_list('id', flat=True))
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT rebuild_annotation_stats(%(project_ids)s::int[])
+    """, {
+        'project_ids': [int(pid) for pid in project_ids],
+    })
+
 @api_view(['POST'])
 @requires_user_role([UserRole.Browse])
 def query_annotated_classinstances(request:HttpRequest, project_id:Optional[Union[int,str]] = None) -> JsonResponse:
@@ -560,6 +706,26 @@ def query_annotated_classinstances(request:HttpRequest, project_id:Optional[Unio
         description: The number of results
         type: integer
         paramType: form
+      - name: range_after
+        description: |
+            A range cursor returned as nextRangeCursor by a previous query. If
+            provided, results following the last result element of the previous
+            query are returned and range_start is ignored. Its time is
+            independent of the page depth. Requires range_length and sorting by
+            ID or name.
+        type: string
+        paramType: form
+      - name: count_mode
+        description: |
+            How the total number of results is computed for range queries:
+            'exact' counts all results, 'estimate' returns the query planner's
+            estimate and 'none' doesn't count results, totalRecords is null
+            then.
+        type: string
+        enum: [exact, estimate, none]
+        defaultValue: exact
+        required: false
+        paramType: form
       - name: annotation_reference
         description: Whether annoation references are IDs or names, can be 'id' or 'name.
         type: string
@@ -634,6 +800,12 @@ def query_annotated_classinstances(request:HttpRequest, project_id:Optional[Unio
         totalRecords:
             type: integer
             required: true
+        nextRangeCursor:
+            type: string
+            description: |
+                A range cursor for the next result page, if results are sorted
+                by ID or name and the current page is full.
+            required: false
     """
     p = get_object_or_404(Project, pk = project_id)
 
@@ -661,17 +833,25 @@ def query_annotated_classinstances(request:HttpRequest, project_id:Optional[Unio
     import_only = request.POST.get('import_only', None)
     import_only = request.POST.get('import_only', None)
     ignore_nonexisting = get_request_bool(request.POST, 'ignore_nonexisting', False)
+    range_after = request.POST.get('range_after', None)
+    count_mode = request.POST.get('count_mode', 'exact')
 
-    entities, num_total_records = get_annotated_entities(p.id, request.POST,
-            relations, classes, allowed_classes, sort_by, sort_dir, range_start,
-            range_length, with_annotations, with_timestamps=with_timestamps,
-            import_only=import_only, ignore_nonexisting=ignore_nonexisting,
-            with_name=with_name, with_type=with_type)
+    entities, num_total_records, next_range_cursor = get_annotated_entity_page(
+            p.id, request.POST, relations, classes, allowed_classes, sort_by,
+            sort_dir, range_start, range_length, with_annotations,
+            with_timestamps=with_timestamps, import_only=import_only,
+            ignore_nonexisting=ignore_nonexisting, with_name=with_name,
+            with_type=with_type, range_after=range_after,
+            count_mode=count_mode)
 
-    return JsonResponse({
+    result = {
         'entities': entities,
         'totalRecords': num_total_records,
-    })
+    }
+    if next_range_cursor:
+        result['nextRangeCursor'] = next_range_cursor
+
+    return JsonResponse(result)
 
 
 def _update_neuron_annotations(project_id:Union[int,str], neuron_id,
@@ -785,6 +965,52 @@ def delete_annotation_if_unused(project, annotation, relation) -> Tuple[bool, in
 
         return True, 0
 
+def _get_or_create_annotations(project_id:Union[int,str], names:List[str],
+        user_ids:List[int], annotation_class_id, cursor=None) -> Dict[str, Tuple[int, bool]]:
+    """Find or create the annotations with the passed in names using a single
+    query. New annotations are created by the user at the same position in
+    <user_ids>. Returned is a dictionary that maps each name to a tuple of the
+    annotation ID and whether the annotation was created.
+    """
+    if not names:
+        return {}
+    if not cursor:
+        cursor = connection.cursor()
+
+    cursor.execute("""
+        WITH wanted AS (
+            SELECT DISTINCT ON (q.name) q.name, q.user_id
+            FROM UNNEST(%(names)s::text[], %(user_ids)s::integer[]) q(name, user_id)
+        ), existing AS (
+            SELECT DISTINCT ON (ci.name) ci.name, ci.id
+            FROM class_instance ci
+            JOIN wanted w
+                ON w.name = ci.name
+            WHERE ci.project_id = %(project_id)s
+                AND ci.class_id = %(class_id)s
+            ORDER BY ci.name, ci.id
+        ), created AS (
+            INSERT INTO class_instance (user_id, project_id, class_id, name)
+            SELECT w.user_id, %(project_id)s, %(class_id)s, w.name
+            FROM wanted w
+            WHERE NOT EXISTS (
+                SELECT 1 FROM existing e WHERE e.name = w.name
+            )
+            RETURNING name, id
+        )
+        SELECT name, id, FALSE FROM existing
+        UNION ALL
+        SELECT name, id, TRUE FROM created
+    """, {
+        'project_id': project_id,
+        'class_id': annotation_class_id,
+        'names': names,
+        'user_ids': user_ids,
+    })
+
+    return {name: (annotation_id, created) for name, annotation_id, created
+            in cursor.fetchall()}
+
 def _annotate_entities(project_id:Union[int,str], entity_ids, annotation_map:Dict[str,Any],
         update_existing=False) -> Tuple[Dict,Set,Set]:
     """ Annotate the entities with the given <entity_ids> with the given
@@ -803,15 +1029,14 @@ def _annotate_entities(project_id:Union[int,str], entity_ids, annotation_map:Dic
 
     annotation_class = Class.objects.get(project_id = project_id,
                                          class_name = 'annotation')
-    annotation_objects = {}
     # Create a regular expression to find allowed patterns. The first group is
     # the whole {nX} part, while the second group is X only.
     counting_pattern = re.compile(r"(\{n(\d+)\})")
+    # A list of (annotation name, entity IDs, meta) entries
+    expanded_annotations = []
     for annotation, meta in annotation_map.items():
         # Look for patterns, replace all {n} with {n1} to normalize
         annotation = annotation.replace("{n}", "{n1}")
-        # Find all {nX} in the annotation name
-        expanded_annotations = {}
 
         if counting_pattern.search(annotation):
             # Create annotation names based on the counting patterns found, for
@@ -827,47 +1052,100 @@ def _annotate_entities(project_id:Union[int,str], entity_ids, annotation_map:Dic
                     count = int(m.groups()[1]) + i
                     a = m.string[:m.start()] + str(count) + m.string[m.end():]
                 # Remember this annotation for the current entity
-                expanded_annotations[a] = [eid]
+                expanded_annotations.append((a, [eid], meta))
         else:
             # No matches, so use same annotation for all entities
-            expanded_annotations = {annotation: entity_ids}
-
-        # Make sure the annotation's class instance exists.
-        for a, a_entity_ids in expanded_annotations.items():
-            ci, created = ClassInstance.objects.get_or_create(
-                    project_id=project_id, name=a,
-                    class_column=annotation_class,
-                    defaults={'user_id': meta['user_id']})
-
-            if created:
-                new_annotations.add(ci.id)
-
-            newly_annotated = set()
-            # Annotate each of the entities. Don't allow duplicates.
-            for entity_id in a_entity_ids:
-                new_cici_defaults = {
-                    'class_instance_a_id': entity_id,
-                    'user_id': meta['user_id']
-                }
-                for field in ('creation_time', 'edition_time'):
-                    value = meta.get(field)
-                    if value:
-                        new_cici_defaults[field] = value
-
-                cici, created = ClassInstanceClassInstance.objects.get_or_create(
-                        project_id=project_id, relation=r,
-                        class_instance_a__id=entity_id, class_instance_b=ci,
-                        defaults=new_cici_defaults)
-                if created:
-                    newly_annotated.add(entity_id)
-                else:
-                    existing_annotations.add(ci.id)
-                    if update_existing:
-                        # Update creation time and edition_time, if requested
-                        cici.update(**new_cici_defaults)
-
-            # Remember which entities got newly annotated
-            annotation_objects[ci] = newly_annotated
+            expanded_annotations.append((annotation, entity_ids, meta))
+
+    if not expanded_annotations:
+        return {}, new_annotations, existing_annotations
+
+    # Make sure the class instances of all annotations exist.
+    cursor = connection.cursor()
+    annotation_ids = _get_or_create_annotations(project_id,
+            [a for a, _, _ in expanded_annotations],
+            [meta['user_id'] for _, _, meta in expanded_annotations],
+            annotation_class.id, cursor)
+    new_annotations.update(aid for aid, created in annotation_ids.values() if created)
+
+    # Annotate all entities with a single query. Existing links aren't
+    # duplicated.
+    link_entity_ids, link_annotation_ids, link_user_ids = [], [], []
+    link_creation_times, link_edition_times = [], []
+    for a, a_entity_ids, meta in expanded_annotations:
+        annotation_id = annotation_ids[a][0]
+        for entity_id in a_entity_ids:
+            link_entity_ids.append(entity_id)
+            link_annotation_ids.append(annotation_id)
+            link_user_ids.append(meta['user_id'])
+            link_creation_times.append(meta.get('creation_time') or None)
+            link_edition_times.append(meta.get('edition_time') or None)
+
+    link_params = {
+        'project_id': project_id,
+        'relation_id': r.id,
+        'entity_ids': link_entity_ids,
+        'annotation_ids': link_annotation_ids,
+        'user_ids': link_user_ids,
+        'creation_times': link_creation_times,
+        'edition_times': link_edition_times,
+    }
+    if update_existing:
+        # Update user, creation time and edition time of existing links, if
+        # requested. This happens before new links are created so that only
+        # existing links are affected.
+        cursor.execute("""
+            UPDATE class_instance_class_instance cici
+            SET user_id = link.user_id,
+                creation_time = COALESCE(link.creation_time, cici.creation_time),
+                edition_time = COALESCE(link.edition_time, cici.edition_time)
+            FROM UNNEST(%(entity_ids)s::bigint[], %(annotation_ids)s::bigint[],
+                %(user_ids)s::integer[], %(creation_times)s::timestamptz[],
+                %(edition_times)s::timestamptz[])
+                link(entity_id, annotation_id, user_id, creation_time, edition_time)
+            WHERE cici.class_instance_a = link.entity_id
+                AND cici.class_instance_b = link.annotation_id
+                AND cici.relation_id = %(relation_id)s
+        """, link_params)
+
+    cursor.execute("""
+        WITH link AS (
+            SELECT DISTINCT ON (q.entity_id, q.annotation_id) q.*
+            FROM UNNEST(%(entity_ids)s::bigint[], %(annotation_ids)s::bigint[],
+                %(user_ids)s::integer[], %(creation_times)s::timestamptz[],
+                %(edition_times)s::timestamptz[])
+                q(entity_id, annotation_id, user_id, creation_time, edition_time)
+        )
+        INSERT INTO class_instance_class_instance (project_id, user_id,
+                class_instance_a, class_instance_b, relation_id,
+                creation_time, edition_time)
+        SELECT %(project_id)s, link.user_id, link.entity_id, link.annotation_id,
+                %(relation_id)s, COALESCE(link.creation_time, now()),
+                COALESCE(link.edition_time, now())
+        FROM link
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM class_instance_class_instance cici
+            WHERE cici.class_instance_a = link.entity_id
+                AND cici.class_instance_b = link.annotation_id
+                AND cici.relation_id = %(relation_id)s
+        )
+        RETURNING class_instance_a, class_instance_b
+    """, link_params)
+    created_links = set(cursor.fetchall())
+
+    for entity_id, annotation_id in zip(link_entity_ids, link_annotation_ids):
+        if (entity_id, annotation_id) not in created_links:
+            existing_annotations.add(annotation_id)
+
+    # Remember which entities got newly annotated
+    annotation_instances = ClassInstance.objects.in_bulk(
+            set(aid for aid, _ in annotation_ids.values()))
+    annotation_objects:Dict[ClassInstance, Set] = {}
+    for a, _, _ in expanded_annotations:
+        annotation_objects[annotation_instances[annotation_ids[a][0]]] = set()
+    for entity_id, annotation_id in created_links:
+        annotation_objects[annotation_instances[annotation_id]].add(entity_id)
 
     return annotation_objects, new_annotations, existing_annotations
 
@@ -1161,15 +1439,12 @@ def _remove_annotation(user, project_id:Union[int,str], entity_ids, annotation_i
             class_instance_a__id__in=entity_ids,
             class_instance_b__id=annotation_id)
     # Make sure the current user has permissions to remove the annotation.
-    missed_cicis = []
-    cicis_to_delete = []
-    for cici in cici_n_a:
-        try:
-            can_edit_or_fail(user, cici.id, 'class_instance_class_instance')
-            cicis_to_delete.append(cici)
-        except Exception:
-            # Remember links for which permissions are missing
-            missed_cicis.append(cici)
+    # Links for which permissions are missing are remembered.
+    cici_n_a = list(cici_n_a)
+    non_editable_ids = get_non_editable_ids(user, [cici.id for cici in cici_n_a],
+            'class_instance_class_instance')
+    missed_cicis = [cici for cici in cici_n_a if cici.id in non_editable_ids]
+    cicis_to_delete = [cici for cici in cici_n_a if cici.id not in non_editable_ids]
 
     # Remove link between entity and annotation for all links on which the user
     # the necessary permissions has.
@@ -1187,6 +1462,443 @@ def _remove_annotation(user, project_id:Union[int,str], entity_ids, annotation_i
 
     return cicis_to_delete, missed_cicis, deleted, num_left
 
+def _chunks(values:List, chunk_size:int):
+    for offset in range(0, len(values), chunk_size):
+        yield offset, values[offset:offset + chunk_size]
+
+def bulk_annotate_entities(project_id:Union[int,str], user_id, entity_ids,
+        annotation_names, chunk_size:Optional[int]=None, progress=None) -> Dict[str, Any]:
+    """Annotate a potentially large set of entities with all passed in
+    annotations, using set based queries. Missing annotations are created
+    with a single query first, then the entities are linked to them in chunks
+    of <chunk_size> entities, each in its own transaction. This bounds the
+    time locks are held and allows long running scripts to resume after
+    failures. After each chunk the <progress> callback is called, if any,
+    with a dictionary describing the chunk. Annotation names are used as is,
+    i.e. counting patterns aren't expanded. Returned is a dictionary with the
+    annotation IDs and the progress information of all chunks.
+    """
+    if chunk_size is None:
+        chunk_size = settings.ANNOTATION_BULK_CHUNK_SIZE
+    if chunk_size < 1:
+        raise ValueError("The chunk size needs to be positive")
+
+    # Preserve order, but ignore duplicates
+    entity_ids = list(dict.fromkeys(entity_ids))
+    annotation_names = list(dict.fromkeys(annotation_names))
+    if not annotation_names:
+        raise ValueError("No annotations provided")
+
+    relations = get_relation_to_id_map(project_id, ('annotated_with',))
+    classes = get_class_to_id_map(project_id, ('annotation',))
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT array_agg(q.id)
+        FROM UNNEST(%(entity_ids)s::bigint[]) q(id)
+        LEFT JOIN class_instance ci
+            ON ci.id = q.id
+            AND ci.project_id = %(project_id)s
+        WHERE ci.id IS NULL
+    """, {
+        'project_id': project_id,
+        'entity_ids': entity_ids,
+    })
+    missing_entity_ids = cursor.fetchone()[0]
+    if missing_entity_ids:
+        raise ValueError("Could not find the following entities in project "
+                f"{project_id}: {', '.join(map(str, missing_entity_ids))}")
+
+    with transaction.atomic():
+        add_log_entry(user_id, 'annotations.add', project_id)
+        annotations = _get_or_create_annotations(project_id, annotation_names,
+                [user_id] * len(annotation_names), classes['annotation'], cursor)
+    annotation_ids = [annotations[name][0] for name in annotation_names]
+
+    chunks = []
+    for offset, chunk in _chunks(entity_ids, chunk_size):
+        with transaction.atomic():
+            add_log_entry(user_id, 'annotations.add', project_id)
+            cursor.execute("""
+                INSERT INTO class_instance_class_instance (project_id, user_id,
+                        class_instance_a, class_instance_b, relation_id)
+                SELECT %(project_id)s, %(user_id)s, e.id, a.id, %(relation_id)s
+                FROM UNNEST(%(entity_ids)s::bigint[]) e(id)
+                CROSS JOIN UNNEST(%(annotation_ids)s::bigint[]) a(id)
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM class_instance_class_instance cici
+                    WHERE cici.class_instance_a = e.id
+                        AND cici.class_instance_b = a.id
+                        AND cici.relation_id = %(relation_id)s
+                )
+                RETURNING id
+            """, {
+                'project_id': project_id,
+                'user_id': user_id,
+                'relation_id': relations['annotated_with'],
+                'entity_ids': chunk,
+                'annotation_ids': annotation_ids,
+            })
+            n_created_links = cursor.rowcount
+
+        chunk_info = {
+            'offset': offset,
+            'n_entities': len(chunk),
+            'n_created_links': n_created_links,
+        }
+        chunks.append(chunk_info)
+        if progress:
+            progress(chunk_info)
+
+    return {
+        'annotations': {name: annotations[name][0] for name in annotation_names},
+        'new_annotations': [a[0] for a in annotations.values() if a[1]],
+        'n_created_links': sum(c['n_created_links'] for c in chunks),
+        'chunks': chunks,
+    }
+
+def _delete_unused_annotations(project_id:Union[int,str], annotation_ids,
+        relation_id, annotation_class_id, cursor) -> List[int]:
+    """Delete all passed in annotations that aren't used anymore, along with
+    their meta annotation links. Meta annotations that become unused this way
+    are deleted as well. Returns the IDs of all deleted annotations.
+    """
+    deleted_annotation_ids:List[int] = []
+    while annotation_ids:
+        cursor.execute("""
+            WITH unused AS (
+                SELECT ci.id
+                FROM class_instance ci
+                JOIN UNNEST(%(annotation_ids)s::bigint[]) q(id)
+                    ON q.id = ci.id
+                WHERE ci.project_id = %(project_id)s
+                    AND ci.class_id = %(class_id)s
+                    AND NOT EXISTS (
+                        SELECT 1
+                        FROM class_instance_class_instance cici
+                        WHERE cici.class_instance_b = ci.id
+                            AND cici.relation_id = %(relation_id)s
+                    )
+            ), deleted_meta_link AS (
+                DELETE FROM class_instance_class_instance cici
+                USING unused
+                WHERE cici.class_instance_a = unused.id
+                    AND cici.relation_id = %(relation_id)s
+                RETURNING cici.class_instance_b
+            ), deleted_annotation AS (
+                DELETE FROM class_instance ci
+                USING unused
+                WHERE ci.id = unused.id
+                RETURNING ci.id
+            )
+            SELECT
+                ARRAY(SELECT id FROM deleted_annotation),
+                ARRAY(SELECT DISTINCT class_instance_b FROM deleted_meta_link)
+        """, {
+            'project_id': project_id,
+            'relation_id': relation_id,
+            'class_id': annotation_class_id,
+            'annotation_ids': list(annotation_ids),
+        })
+        deleted, meta_annotation_ids = cursor.fetchone()
+        deleted_annotation_ids.extend(deleted)
+        annotation_ids = meta_annotation_ids
+
+    return deleted_annotation_ids
+
+def bulk_remove_annotations(user, project_id:Union[int,str], entity_ids,
+        annotation_ids, chunk_size:Optional[int]=None, progress=None) -> Dict[str, Any]:
+    """Remove the passed in annotations from a potentially large set of
+    entities, using set based queries. Entities are processed in chunks of
+    <chunk_size> entities, each in its own transaction. For each chunk, the
+    edit permissions for all affected links are checked with a single query
+    and all links the user is allowed to edit are deleted with a single
+    query. After each chunk the <progress> callback is called, if any, with a
+    dictionary describing the chunk. Finally, annotations that aren't used
+    anymore are deleted. Returned is a dictionary with the progress
+    information of all chunks, the deleted annotations and the number of
+    uses left for each annotation.
+    """
+    if chunk_size is None:
+        chunk_size = settings.ANNOTATION_BULK_CHUNK_SIZE
+    if chunk_size < 1:
+        raise ValueError("The chunk size needs to be positive")
+
+    entity_ids = list(dict.fromkeys(entity_ids))
+    annotation_ids = list(dict.fromkeys(annotation_ids))
+    if not annotation_ids:
+        raise ValueError("No annotation IDs provided")
+
+    relations = get_relation_to_id_map(project_id, ('annotated_with',))
+    classes = get_class_to_id_map(project_id, ('annotation',))
+    relation_id = relations['annotated_with']
+
+    cursor = connection.cursor()
+    chunks = []
+    for offset, chunk in _chunks(entity_ids, chunk_size):
+        with transaction.atomic():
+            add_log_entry(user.id, 'annotations.remove', project_id)
+            cursor.execute("""
+                SELECT cici.id
+                FROM class_instance_class_instance cici
+                JOIN UNNEST(%(entity_ids)s::bigint[]) e(id)
+                    ON e.id = cici.class_instance_a
+                JOIN UNNEST(%(annotation_ids)s::bigint[]) a(id)
+                    ON a.id = cici.class_instance_b
+                WHERE cici.project_id = %(project_id)s
+                    AND cici.relation_id = %(relation_id)s
+            """, {
+                'project_id': project_id,
+                'relation_id': relation_id,
+                'entity_ids': chunk,
+                'annotation_ids': annotation_ids,
+            })
+            link_ids = [row[0] for row in cursor.fetchall()]
+            non_editable_ids = get_non_editable_ids(user, link_ids,
+                    'class_instance_class_instance', cursor)
+            editable_ids = [link_id for link_id in link_ids
+                    if link_id not in non_editable_ids]
+
+            cursor.execute("""
+                DELETE FROM class_instance_class_instance cici
+                USING UNNEST(%(link_ids)s::bigint[]) l(id)
+                WHERE cici.id = l.id
+            """, {
+                'link_ids': editable_ids,
+            })
+            n_deleted_links = cursor.rowcount
+
+        chunk_info = {
+            'offset': offset,
+            'n_entities': len(chunk),
+            'n_deleted_links': n_deleted_links,
+            'n_missed_links': len(non_editable_ids),
+        }
+        chunks.append(chunk_info)
+        if progress:
+            progress(chunk_info)
+
+    # Remove the annotation class instances, regardless of the owner, if there
+    # are no more links to them.
+    with transaction.atomic():
+        add_log_entry(user.id, 'annotations.remove', project_id)
+        deleted_annotation_ids = _delete_unused_annotations(project_id,
+                annotation_ids, relation_id, classes['annotation'], cursor)
+
+    cursor.execute("""
+        SELECT a.id, COUNT(cici.id)
+        FROM UNNEST(%(annotation_ids)s::bigint[]) a(id)
+        LEFT JOIN class_instance_class_instance cici
+            ON cici.class_instance_b = a.id
+            AND cici.relation_id = %(relation_id)s
+        GROUP BY a.id
+    """, {
+        'relation_id': relation_id,
+        'annotation_ids': annotation_ids,
+    })
+    left_uses = dict(cursor.fetchall())
+
+    return {
+        'deleted_annotations': deleted_annotation_ids,
+        'n_deleted_links': sum(c['n_deleted_links'] for c in chunks),
+        'n_missed_links': sum(c['n_missed_links'] for c in chunks),
+        'left_uses': left_uses,
+        'chunks': chunks,
+    }
+
+@transaction.non_atomic_requests
+@api_view(['POST'])
+@requires_user_role(UserRole.Annotate)
+def bulk_annotate_entities_view(request:HttpRequest, project_id=None) -> JsonResponse:
+    """Annotate a large set of entities with one or more annotations.
+
+    All passed in entities are annotated with all passed in annotations.
+    Missing annotations are created. Unlike the regular annotation endpoint,
+    entities are processed in chunks, each in its own transaction. If an error
+    occurs, the links created by the chunks before are kept, which allows
+    clients to resume. Annotation names are used as is, counting patterns are
+    not expanded.
+    ---
+    parameters:
+      - name: project_id
+        description: Project to operate in
+        type: integer
+        paramType: path
+        required: true
+      - name: annotations
+        description: The names of the annotations to add
+        type: array
+        items:
+          type: string
+        paramType: form
+        required: true
+      - name: entity_ids
+        description: The entities to annotate
+        type: array
+        items:
+          type: integer
+        paramType: form
+        required: false
+      - name: skeleton_ids
+        description: The skeletons whose neurons should be annotated
+        type: array
+        items:
+          type: integer
+        paramType: form
+        required: false
+      - name: chunk_size
+        description: |
+          The number of entities processed per transaction. Defaults to the
+          ANNOTATION_BULK_CHUNK_SIZE setting.
+        type: integer
+        paramType: form
+        required: false
+    type:
+      annotations:
+        description: A mapping of all annotation names to their IDs
+        type: object
+        required: true
+      new_annotations:
+        description: The IDs of all created annotations
+        type: array
+        items:
+          type: integer
+        required: true
+      n_created_links:
+        description: The total number of created annotation links
+        type: integer
+        required: true
+      chunks:
+        description: |
+          For each processed chunk an object with the fields "offset",
+          "n_entities" and "n_created_links".
+        type: array
+        items:
+          type: object
+        required: true
+    """
+    annotations = get_request_list(request.POST, 'annotations', [])
+    entity_ids = get_request_list(request.POST, 'entity_ids', [], map_fn=int)
+    skeleton_ids = get_request_list(request.POST, 'skeleton_ids', [], map_fn=int)
+    chunk_size = request.POST.get('chunk_size')
+    if chunk_size is not None:
+        chunk_size = int(chunk_size)
+
+    if skeleton_ids:
+        entity_ids += _get_neuron_ids_for_skeletons(project_id, skeleton_ids)
+
+    if not entity_ids:
+        raise ValueError("Need either 'skeleton_ids' or 'entity_ids'")
+
+    return JsonResponse(bulk_annotate_entities(project_id, request.user.id,
+            entity_ids, annotations, chunk_size))
+
+@transaction.non_atomic_requests
+@api_view(['POST'])
+@requires_user_role(UserRole.Annotate)
+def bulk_remove_annotations_view(request:HttpRequest, project_id=None) -> JsonResponse:
+    """Remove one or more annotations from a large set of entities.
+
+    Entities are processed in chunks, each in its own transaction. Links the
+    requesting user has no permission to edit are kept. Annotations that
+    aren't used anymore after the removal are deleted.
+    ---
+    parameters:
+      - name: project_id
+        description: Project to operate in
+        type: integer
+        paramType: path
+        required: true
+      - name: annotation_ids
+        description: The annotations to remove
+        type: array
+        items:
+          type: integer
+        paramType: form
+        required: true
+      - name: entity_ids
+        description: The entities to remove the annotations from
+        type: array
+        items:
+          type: integer
+        paramType: form
+        required: false
+      - name: skeleton_ids
+        description: The skeletons whose neurons the annotations should be removed from
+        type: array
+        items:
+          type: integer
+        paramType: form
+        required: false
+      - name: chunk_size
+        description: |
+          The number of entities processed per transaction. Defaults to the
+          ANNOTATION_BULK_CHUNK_SIZE setting.
+        type: integer
+        paramType: form
+        required: false
+    type:
+      deleted_annotations:
+        description: The IDs of all deleted annotations
+        type: array
+        items:
+          type: integer
+        required: true
+      n_deleted_links:
+        description: The total number of deleted annotation links
+        type: integer
+        required: true
+      n_missed_links:
+        description: The number of links kept due to missing permissions
+        type: integer
+        required: true
+      left_uses:
+        description: A mapping of annotation IDs to their number of uses left
+        type: object
+        required: true
+      chunks:
+        description: |
+          For each processed chunk an object with the fields "offset",
+          "n_entities", "n_deleted_links" and "n_missed_links".
+        type: array
+        items:
+          type: object
+        required: true
+    """
+    annotation_ids = get_request_list(request.POST, 'annotation_ids', [], map_fn=int)
+    entity_ids = get_request_list(request.POST, 'entity_ids', [], map_fn=int)
+    skeleton_ids = get_request_list(request.POST, 'skeleton_ids', [], map_fn=int)
+    chunk_size = request.POST.get('chunk_size')
+    if chunk_size is not None:
+        chunk_size = int(chunk_size)
+
+    if skeleton_ids:
+        entity_ids += _get_neuron_ids_for_skeletons(project_id, skeleton_ids)
+
+    if not entity_ids:
+        raise ValueError("Need either 'skeleton_ids' or 'entity_ids'")
+
+    return JsonResponse(bulk_remove_annotations(request.user, project_id,
+            entity_ids, annotation_ids, chunk_size))
+
+def _get_neuron_ids_for_skeletons(project_id:Union[int,str], skeleton_ids) -> List[int]:
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT cici.class_instance_b
+        FROM class_instance_class_instance cici
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+            ON skeleton.id = cici.class_instance_a
+        JOIN relation r
+            ON r.id = cici.relation_id
+        WHERE cici.project_id = %(project_id)s
+            AND r.relation_name = 'model_of'
+    """, {
+        'project_id': project_id,
+        'skeleton_ids': skeleton_ids,
+    })
+    return [row[0] for row in cursor.fetchall()]
+
 @api_view(['POST'])
 @requires_user_role(UserRole.Annotate)
 def replace_annotations(request:HttpRequest, project_id=None) -> JsonResponse:
@@ -1301,15 +2013,70 @@ def create_annotation_query(project_id, param_dict):
     return annotation_query
 
 def generate_co_annotation_query(project_id:Union[int,str], co_annotation_ids, classIDs, relationIDs) -> Tuple[str,str]:
+    """Create a query for all annotations that are used on neurons together
+    with all of the passed in co-annotations. For a single co-annotation, the
+    co-occurrence table is used. Usage information is read from the annotation
+    statistics table.
+    """
     if not co_annotation_ids:
         raise ValueError("Need co-annotations")
 
-    tables = []
-    where = []
-
     annotation_class = classIDs['annotation']
     annotated_with = relationIDs['annotated_with']
 
+    select = """
+    SELECT DISTINCT
+        a.id,
+        a.name,
+        u.username AS "last_user",
+        s.last_edition_time AS "last_used",
+        COALESCE(s.num_usage, 0) AS "num_usage"
+    """
+
+    annotation_source = """
+        class_instance a
+        LEFT JOIN catmaid_annotation_stats s
+            ON s.annotation_id = a.id
+        LEFT JOIN auth_user u
+            ON u.id = s.last_user_id"""
+
+    if len(co_annotation_ids) == 1:
+        # The co-annotation itself is part of the result if it is used on any
+        # neuron.
+        co_annotation_id = int(next(iter(co_annotation_ids)))
+        rest = """
+        FROM %s
+        WHERE a.project_id = %s
+          AND a.class_id = %s
+          AND a.id IN (
+            SELECT co.annotation_b_id
+            FROM catmaid_annotation_co_occurrence co
+            WHERE co.annotation_a_id = %s
+            UNION ALL
+            (
+              SELECT cici.class_instance_b
+              FROM class_instance_class_instance cici
+              JOIN class_instance neuron
+                  ON neuron.id = cici.class_instance_a
+              WHERE cici.class_instance_b = %s
+                AND cici.relation_id = %s
+                AND neuron.class_id = %s
+              LIMIT 1
+            )
+          )
+        """ % (annotation_source,
+               project_id,
+               annotation_class,
+               co_annotation_id,
+               co_annotation_id,
+               annotated_with,
+               classIDs['neuron'])
+
+        return select, rest
+
+    tables = []
+    where = []
+
     for i, annotation_id in enumerate(co_annotation_ids):
         tables.append("""
         class_instance a%s,
@@ -1329,21 +2096,9 @@ def generate_co_annotation_query(project_id:Union[int,str], co_annotation_ids, c
                i, i,
                i, annotation_id))
 
-    select = """
-    SELECT DISTINCT
-        a.id,
-        a.name,
-        (SELECT username FROM auth_user, class_instance_class_instance cici
-          WHERE cici.class_instance_b = cc.id
-            AND cici.user_id = auth_user.id
-            ORDER BY cici.edition_time DESC LIMIT 1) AS "last_user",
-        (SELECT MAX(edition_time) FROM class_instance_class_instance cici WHERE cici.class_instance_b = a.id) AS "last_used",
-        (SELECT count(*) FROM class_instance_class_instance cici WHERE cici.class_instance_b = a.id) AS "num_usage"
-    """
-
     rest = """
     FROM
-        class_instance a,
+        %s,
         class_instance_class_instance cc,
         class_instance neuron,
         %s
@@ -1355,7 +2110,8 @@ def generate_co_annotation_query(project_id:Union[int,str], co_annotation_ids, c
         AND cc.relation_id = %s
         AND cc.class_instance_b = a.id
     %s
-    """ % (',\n'.join(tables),
+    """ % (annotation_source,
+           ',\n'.join(tables),
            classIDs['neuron'],
            annotation_class,
            project_id,
@@ -1638,25 +2394,40 @@ def list_annotations_datatable(request:HttpRequest, project_id=None) -> JsonResp
         conditions += "AND cici.user_id = %s " % \
                 request.POST.get('user_id')
 
-    # Add (last) annotated on time
-    annotation_query = annotation_query.extra(
-        select={'annotated_on': 'SELECT MAX(cici.creation_time) FROM ' \
-            'class_instance_class_instance cici WHERE ' \
-            'cici.class_instance_b = class_instance.id %s' % conditions})
-
-    # Add user ID of last user
-    annotation_query = annotation_query.extra(
-        select={'last_user': 'SELECT auth_user.id FROM auth_user, ' \
-            'class_instance_class_instance cici ' \
-            'WHERE cici.class_instance_b = class_instance.id ' \
-            'AND cici.user_id = auth_user.id %s' \
-            'ORDER BY cici.edition_time DESC LIMIT 1' % conditions})
-
-    # Add usage count
-    annotation_query = annotation_query.extra(
-        select={'num_usage': 'SELECT COUNT(*) FROM ' \
-            'class_instance_class_instance cici WHERE ' \
-            'cici.class_instance_b = class_instance.id %s' % conditions})
+    if conditions:
+        # Add (last) annotated on time
+        annotation_query = annotation_query.extra(
+            select={'annotated_on': 'SELECT MAX(cici.creation_time) FROM ' \
+                'class_instance_class_instance cici WHERE ' \
+                'cici.class_instance_b = class_instance.id %s' % conditions})
+
+        # Add user ID of last user
+        annotation_query = annotation_query.extra(
+            select={'last_user': 'SELECT auth_user.id FROM auth_user, ' \
+                'class_instance_class_instance cici ' \
+                'WHERE cici.class_instance_b = class_instance.id ' \
+                'AND cici.user_id = auth_user.id %s' \
+                'ORDER BY cici.edition_time DESC LIMIT 1' % conditions})
+
+        # Add usage count
+        annotation_query = annotation_query.extra(
+            select={'num_usage': 'SELECT COUNT(*) FROM ' \
+                'class_instance_class_instance cici WHERE ' \
+                'cici.class_instance_b = class_instance.id %s' % conditions})
+    else:
+        # Without constraints, the last use and usage count can be looked up in
+        # the annotation statistics table.
+        annotation_query = annotation_query.extra(select={
+            'annotated_on': ('SELECT s.last_creation_time FROM '
+                'catmaid_annotation_stats s WHERE '
+                's.annotation_id = class_instance.id'),
+            'last_user': ('SELECT s.last_user_id FROM '
+                'catmaid_annotation_stats s WHERE '
+                's.annotation_id = class_instance.id'),
+            'num_usage': ('SELECT COALESCE((SELECT s.num_usage FROM '
+                'catmaid_annotation_stats s WHERE '
+                's.annotation_id = class_instance.id), 0)'),
+        })
 
     if len(search_term) > 0:
         annotation_query = annotation_query.filter(name__iregex=search_term)
@@ -605,6 +605,71 @@ def can_edit_all_or_fail(user, ob_ids, table_name) -> bool:
         raise PermissionError('User %s cannot edit all of the %s unique objects from table %s' % (user.username, len(ob_ids), table_name))
     raise ObjectDoesNotExist('One or more of the %s unique objects were not found in table %s' % (len(ob_ids), table_name))
 
+def get_non_editable_ids(user, ob_ids, table_name, cursor=None) -> Set[int]:
+    """Return the subset of the passed in object IDs that the passed in user
+    can't edit. This applies the same rules as can_edit_all_or_fail(), i.e.
+    superusers can edit everything, users can edit objects created by users in
+    their domain and objects imported by users in their domain, but checks all
+    objects with a single query. Objects that don't exist are ignored. The
+    passed in table is expected to have history tracking enabled.
+    """
+    if not re.match('^[a-z_]+$', table_name):
+        raise ValueError(f'Invalid table name: {table_name}')
+
+    if user.is_superuser:
+        return set()
+
+    ob_ids = list(ob_ids)
+    if not ob_ids:
+        return set()
+
+    if not cursor:
+        cursor = connection.cursor()
+
+    cursor.execute(f"""
+        WITH domain AS (
+            SELECT %(user_id)s::integer AS user_id
+            UNION
+            SELECT u2.id
+            FROM auth_user u1,
+                 auth_user u2,
+                 auth_group g,
+                 auth_user_groups ug
+            WHERE u1.id = %(user_id)s
+              AND u1.id = ug.user_id
+              AND ug.group_id = g.id
+              AND u2.username = g.name
+        )
+        SELECT t.id
+        FROM {table_name} t
+        JOIN UNNEST(%(obj_ids)s::bigint[]) obj(id)
+            ON obj.id = t.id
+        WHERE t.user_id NOT IN (SELECT user_id FROM domain)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM (
+                SELECT txid, edition_time
+                FROM {table_name}__with_history th
+                WHERE th.id = t.id
+                ORDER BY edition_time ASC
+                LIMIT 1
+            ) t_origin
+            JOIN catmaid_transaction_info cti
+                -- Transaction ID wraparound match protection. A transaction
+                -- ID is only unique together with a date.
+                ON cti.transaction_id = t_origin.txid
+                AND cti.execution_time = t_origin.edition_time
+            WHERE cti.label = 'skeletons.import'
+                AND cti.user_id IN (SELECT user_id FROM domain)
+        )
+    """, {
+        'user_id': user.id,
+        'obj_ids': ob_ids,
+    })
+
+    return set(row[0] for row in cursor.fetchall())
+
+
 def user_can_edit(cursor, user_id, other_user_id) -> bool:
     """ determine whether the user with id 'user_'id' can edit the work of the user with id 'other_user_id'. this will be the case when the user_id belongs to a group whose name is identical to ther username of other_user_id.
     this function is equivalent to 'other_user_id in user_domain(cursor, user_id), but consumes less resources."""
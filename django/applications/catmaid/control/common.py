@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import dateutil.parser
+from datetime import datetime
 import json
 import random
 import requests
@@ -12,6 +14,7 @@ from collections import defaultdict
 from django.db import connection
 from django.conf import settings
 from django.http import HttpRequest, JsonResponse
+from django.utils import timezone
 
 from catmaid.fields import Double3D
 from catmaid.models import Log, NeuronSearch, CELL_BODY_CHOICES, \
@@ -57,6 +60,23 @@ def get_request_bool(request_dict:Dict, name:Optional[str], default:Optional[boo
     value = request_dict.get(name)
     return default if value is None else value.lower() == 'true'
 
+def get_request_datetime(request_dict:Dict, name:str, default:Optional[datetime]=None) -> Optional[datetime]:
+    """Extract a timezone aware datetime for the passed in parameter name in
+    the passed in dictionary. Any ISO 8601 like date string is accepted and
+    dates without time zone information are interpreted as UTC. Raises a
+    ValueError if the value can't be parsed.
+    """
+    value = request_dict.get(name)
+    if not value:
+        return default
+    try:
+        date = dateutil.parser.parse(value)
+    except (ValueError, OverflowError):
+        raise ValueError(f'Could not parse date for parameter "{name}": {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
 def get_request_list(request_dict:Dict, name, default=None, map_fn=identity) -> Optional[List]:
     """Look for a list in a request dictionary where individual items are named
     with or without an index. Traditionally, the CATMAID web front-end sends
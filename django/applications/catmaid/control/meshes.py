@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+
+# Helpers to work with triangle meshes, represented as a pair of a vertex array
+# (N x 3) and a face array (M x 3), each face referencing three vertices.
+
+import struct
+import numpy as np
+from typing import Tuple
+
+
+# WKB geometry types of surfaces that can be read directly as triangle lists,
+# both in their ISO (Z = +1000) and EWKB (Z flag) variants.
+_wkb_surface_types = {15, 16, 1015, 1016, 0x8000000F, 0x80000010}
+
+# Header of the binary mesh format: magic, version, quantization bits, LOD,
+# number of LODs, number of vertices, number of faces, vertex offset (x, y, z)
+# and vertex scale (x, y, z).
+_mesh_header = struct.Struct('<4sBBBBII3f3f')
+_mesh_magic = b'CMSH'
+_mesh_version = 1
+
+
+class TriangleMeshIndex(object):
+    """A spatial index for exact point-in-mesh and segment-in-mesh tests on a
+    triangle mesh.
+
+    All triangles are registered in a regular 2D grid of columns in the XY
+    plane, each column covering the full Z extent of the mesh. Point
+    containment is tested by counting the triangles that are crossed by a ray
+    starting at the query point and pointing in +Z direction: an odd number of
+    crossings means the point is inside. Only the triangles of the column the
+    point is in are considered. Segments are tested against the triangles of
+    all columns their XY bounding box overlaps. All tests are done for many
+    points or segments at once. The mesh is expected to be closed, results for
+    open meshes are undefined.
+    """
+
+    # The maximum number of (query, triangle) pairs that are tested at once.
+    # This bounds the memory needed for a single batch.
+    max_pairs_per_batch = 2000000
+
+    def __init__(self, vertices, faces, cells_per_triangle=1.0, max_cells=1000000):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if len(self.faces) == 0:
+            raise ValueError("Need at least one face to build a mesh index")
+
+        self.triangles = self.vertices[self.faces]
+        self.tri_min = self.triangles.min(axis=1)
+        self.tri_max = self.triangles.max(axis=1)
+        self.bbox_min = self.tri_min.min(axis=0)
+        self.bbox_max = self.tri_max.max(axis=0)
+
+        # Choose the number of columns proportional to the number of triangles
+        # and the aspect ratio of the bounding box.
+        n_triangles = len(self.faces)
+        extent = np.maximum(self.bbox_max - self.bbox_min, 1e-9)
+        n_cells = max(1.0, min(max_cells, n_triangles * cells_per_triangle))
+        aspect = extent[0] / extent[1]
+        nx = int(max(1, min(n_cells, round(np.sqrt(n_cells * aspect)))))
+        ny = int(max(1, min(n_cells, round(n_cells / nx))))
+        self.grid_shape = (nx, ny)
+        self.cell_size = extent[:2] / np.array([nx, ny], dtype=np.float64)
+
+        # Register every triangle with every column its XY bounding box
+        # overlaps and store this as compressed sparse rows (cell -> triangles).
+        c0 = self._cell_coords(self.tri_min[:, :2])
+        c1 = self._cell_coords(self.tri_max[:, :2])
+        tri_idx, cells = self._expand_cell_ranges(c0, c1)
+        order = np.argsort(cells, kind='stable')
+        self.cell_triangles = tri_idx[order]
+        counts = np.bincount(cells, minlength=nx * ny)
+        self.cell_offsets = np.zeros(nx * ny + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_offsets[1:])
+
+        # Precompute the XY projection data for the ray test. Triangles are
+        # oriented counter-clockwise in XY, vertical triangles can't be hit by
+        # a ray in Z direction and are ignored.
+        a, b, c = self.triangles[:, 0], self.triangles[:, 1], self.triangles[:, 2]
+        area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - \
+                (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+        flip = area < 0
+        self.proj_tris = self.triangles.copy()
+        self.proj_tris[flip, 1], self.proj_tris[flip, 2] = \
+                self.triangles[flip, 2], self.triangles[flip, 1]
+        self.proj_area = np.abs(area)
+
+    @property
+    def size(self) -> int:
+        """The approximate memory use of this index in bytes.
+        """
+        return sum(a.nbytes for a in (self.vertices, self.faces, self.triangles,
+                self.proj_tris, self.tri_min, self.tri_max, self.proj_area,
+                self.cell_triangles, self.cell_offsets))
+
+    def _cell_coords(self, xy) -> np.ndarray:
+        c = np.floor((xy - self.bbox_min[:2]) / self.cell_size).astype(np.int64)
+        return np.clip(c, 0, np.array(self.grid_shape) - 1)
+
+    def _expand_cell_ranges(self, c0, c1) -> Tuple[np.ndarray, np.ndarray]:
+        """For each row i in the passed in inclusive ranges of cell coordinates,
+        return pairs of i and each linear cell index in the range.
+        """
+        ni = c1[:, 0] - c0[:, 0] + 1
+        nj = c1[:, 1] - c0[:, 1] + 1
+        counts = ni * nj
+        idx = np.repeat(np.arange(len(c0), dtype=np.int64), counts)
+        offsets = np.arange(idx.size, dtype=np.int64) - \
+                np.repeat(np.cumsum(counts) - counts, counts)
+        ci = c0[idx, 0] + offsets // nj[idx]
+        cj = c0[idx, 1] + offsets % nj[idx]
+        return idx, ci * self.grid_shape[1] + cj
+
+    def _candidate_pairs(self, c0, c1, unique=True):
+        """Yield batches of (query index, triangle index) pairs for all
+        triangles registered with the cells in the passed in ranges. If
+        <unique> is true, duplicate pairs within a batch are removed, which is
+        only needed if ranges span more than one cell.
+        """
+        query_idx, cells = self._expand_cell_ranges(c0, c1)
+        counts = self.cell_offsets[cells + 1] - self.cell_offsets[cells]
+        cum_counts = np.cumsum(counts)
+        n_triangles = len(self.faces)
+        start = 0
+        while start < len(query_idx):
+            # Find a batch of cells that doesn't exceed the pair limit.
+            base = cum_counts[start - 1] if start > 0 else 0
+            end = max(start + 1, int(np.searchsorted(cum_counts,
+                    base + self.max_pairs_per_batch, side='right')))
+            b_query = query_idx[start:end]
+            b_cells = cells[start:end]
+            b_counts = counts[start:end]
+            pair_query = np.repeat(b_query, b_counts)
+            pair_offsets = np.arange(pair_query.size, dtype=np.int64) - \
+                    np.repeat(np.cumsum(b_counts) - b_counts, b_counts)
+            pair_tri = self.cell_triangles[np.repeat(self.cell_offsets[b_cells], b_counts) + pair_offsets]
+            if unique:
+                keys = np.unique(pair_query * n_triangles + pair_tri)
+                pair_query, pair_tri = keys // n_triangles, keys % n_triangles
+            yield pair_query, pair_tri
+            start = end
+
+    def contains(self, points) -> np.ndarray:
+        """Return a boolean array that is True for every passed in point that
+        is inside of the mesh.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        result = np.zeros(len(points), dtype=bool)
+        in_bbox = np.all((points >= self.bbox_min) & (points <= self.bbox_max), axis=1)
+        if not in_bbox.any():
+            return result
+
+        query_idx = np.nonzero(in_bbox)[0]
+        query = points[query_idx]
+        crossings = np.zeros(len(query), dtype=np.int64)
+        cells = self._cell_coords(query[:, :2])
+        # Each point is in exactly one column, no duplicates can occur.
+        for p_idx, t_idx in self._candidate_pairs(cells, cells, unique=False):
+            hit = self._ray_hits(query[p_idx], t_idx)
+            crossings += np.bincount(p_idx[hit], minlength=len(query))
+        result[query_idx] = (crossings % 2) == 1
+        return result
+
+    def _ray_hits(self, points, t_idx) -> np.ndarray:
+        """Test whether rays starting at the passed in points in +Z direction
+        cross the respective triangles. Points on shared edges and vertices are
+        assigned to exactly one triangle using a top-left fill rule, which
+        prevents double counting.
+        """
+        tris = self.proj_tris[t_idx]
+        area = self.proj_area[t_idx]
+        valid = area > 0
+        px, py = points[:, 0], points[:, 1]
+        weights = []
+        covered = valid
+        for i in range(3):
+            a = tris[:, (i + 1) % 3]
+            b = tris[:, (i + 2) % 3]
+            dx = b[:, 0] - a[:, 0]
+            dy = b[:, 1] - a[:, 1]
+            w = dx * (py - a[:, 1]) - dy * (px - a[:, 0])
+            top_left = (dy < 0) | ((dy == 0) & (dx > 0))
+            covered = covered & ((w > 0) | ((w == 0) & top_left))
+            weights.append(w)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (weights[0] * tris[:, 0, 2] + weights[1] * tris[:, 1, 2] +
+                    weights[2] * tris[:, 2, 2]) / area
+        return covered & (z > points[:, 2])
+
+    def intersects_segments(self, starts, ends) -> np.ndarray:
+        """Return a boolean array that is True for every passed in segment
+        that is at least partially inside the mesh or crosses its surface.
+        """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 3)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+        result = self.contains(starts) | self.contains(ends)
+        remaining = np.nonzero(~result)[0]
+        if len(remaining):
+            seg_idx, _ = self._segment_crossings(starts[remaining], ends[remaining])
+            result[remaining[np.unique(seg_idx)]] = True
+        return result
+
+    def _segment_crossings(self, starts, ends) -> Tuple[np.ndarray, np.ndarray]:
+        """Find all intersections of the passed in segments with the mesh
+        surface. Returns an array of segment indices and an array of the
+        respective intersection parameters t in [0, 1].
+        """
+        seg_min = np.minimum(starts, ends)
+        seg_max = np.maximum(starts, ends)
+        overlap = np.all((seg_max >= self.bbox_min) & (seg_min <= self.bbox_max), axis=1)
+        if not overlap.any():
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        seg_idx = np.nonzero(overlap)[0]
+        c0 = self._cell_coords(seg_min[seg_idx, :2])
+        c1 = self._cell_coords(seg_max[seg_idx, :2])
+        hit_segments = []
+        hit_params = []
+        for s_idx, t_idx in self._candidate_pairs(c0, c1):
+            s_idx = seg_idx[s_idx]
+            # Only test triangles with an overlapping bounding box.
+            bb_overlap = np.all((seg_max[s_idx] >= self.tri_min[t_idx]) &
+                    (seg_min[s_idx] <= self.tri_max[t_idx]), axis=1)
+            s_idx, t_idx = s_idx[bb_overlap], t_idx[bb_overlap]
+            hit, t = self._segment_triangle_hits(starts[s_idx], ends[s_idx], t_idx)
+            hit_segments.append(s_idx[hit])
+            hit_params.append(t[hit])
+
+        if not hit_segments:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        return np.concatenate(hit_segments), np.concatenate(hit_params)
+
+    def _segment_triangle_hits(self, starts, ends, t_idx) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized Möller–Trumbore intersection test of segments with
+        triangles.
+        """
+        tris = self.triangles[t_idx]
+        direction = ends - starts
+        e1 = tris[:, 1] - tris[:, 0]
+        e2 = tris[:, 2] - tris[:, 0]
+        p = np.cross(direction, e2)
+        det = np.einsum('ij,ij->i', e1, p)
+        parallel = np.abs(det) < 1e-12
+        inv_det = 1.0 / np.where(parallel, 1.0, det)
+        s = starts - tris[:, 0]
+        u = np.einsum('ij,ij->i', s, p) * inv_det
+        q = np.cross(s, e1)
+        v = np.einsum('ij,ij->i', direction, q) * inv_det
+        t = np.einsum('ij,ij->i', e2, q) * inv_det
+        hit = ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= 1)
+        return hit, t
+
+    def segment_lengths_inside(self, starts, ends) -> np.ndarray:
+        """Return for every passed in segment the length of the part that is
+        inside the mesh.
+        """
+        starts = np.asarray(starts, dtype=np.float64).reshape(-1, 3)
+        ends = np.asarray(ends, dtype=np.float64).reshape(-1, 3)
+        n = len(starts)
+        lengths = np.linalg.norm(ends - starts, axis=1)
+        seg_idx, params = self._segment_crossings(starts, ends)
+
+        # Split every segment at its surface crossings and test the midpoint of
+        # each resulting piece for containment.
+        all_idx = np.concatenate([np.arange(n), np.arange(n), seg_idx])
+        all_params = np.concatenate([np.zeros(n), np.ones(n), params])
+        order = np.lexsort((all_params, all_idx))
+        all_idx, all_params = all_idx[order], all_params[order]
+        same = all_idx[1:] == all_idx[:-1]
+        piece_idx = all_idx[1:][same]
+        piece_t0 = all_params[:-1][same]
+        piece_t1 = all_params[1:][same]
+        nonempty = piece_t1 > piece_t0
+        piece_idx, piece_t0, piece_t1 = piece_idx[nonempty], piece_t0[nonempty], piece_t1[nonempty]
+
+        mid_t = ((piece_t0 + piece_t1) * 0.5)[:, np.newaxis]
+        midpoints = starts[piece_idx] + (ends[piece_idx] - starts[piece_idx]) * mid_t
+        inside = self.contains(midpoints)
+        fractions = np.bincount(piece_idx[inside],
+                weights=(piece_t1 - piece_t0)[inside], minlength=n)
+        return fractions * lengths
+
+
+def wkb_to_triangles(wkb) -> np.ndarray:
+    """Read a TIN or polyhedral surface made of triangles from its (E)WKB
+    representation and return it as an array of triangles (M x 3 x 3). Every
+    triangle is stored as a single ring of four 3D points, which allows reading
+    all of them at once.
+    """
+    wkb = bytes(wkb)
+    byte_order = '<' if wkb[0] == 1 else '>'
+    geom_type, n_triangles = struct.unpack_from(byte_order + 'II', wkb, 1)
+    if geom_type not in _wkb_surface_types:
+        raise ValueError(f"Unsupported geometry type: {geom_type}")
+    triangle_dtype = np.dtype([
+        ('byte_order', 'u1'),
+        ('type', byte_order + 'u4'),
+        ('n_rings', byte_order + 'u4'),
+        ('n_points', byte_order + 'u4'),
+        ('points', byte_order + 'f8', (4, 3)),
+    ])
+    if len(wkb) != 9 + n_triangles * triangle_dtype.itemsize:
+        raise ValueError("Only surfaces made of triangles are supported")
+    triangles = np.frombuffer(wkb, dtype=triangle_dtype, count=n_triangles, offset=9)
+    if n_triangles and (np.any(triangles['n_rings'] != 1) or
+            np.any(triangles['n_points'] != 4)):
+        raise ValueError("Only surfaces made of triangles are supported")
+    return triangles['points'][:, :3].astype(np.float64)
+
+
+def triangles_to_indexed_mesh(triangles) -> Tuple[np.ndarray, np.ndarray]:
+    """Collapse the vertices of a list of triangles (M x 3 x 3) into a shared
+    vertex array and return it along with the face array referencing it.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    vertices, idx_map = np.unique(triangles.reshape(-1, 3), return_inverse=True, axis=0)
+    return vertices, idx_map.reshape(-1, 3)
+
+
+def decimate_mesh(vertices, faces, cell_size) -> Tuple[np.ndarray, np.ndarray]:
+    """Simplify a mesh by vertex clustering: all vertices in the same cell of
+    a regular grid with the passed in cell size are merged into their mean.
+    Faces that collapse to a line or point as well as duplicate faces are
+    removed. This doesn't preserve the topology of the mesh, but it is fast
+    and well suited for coarse previews.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if len(vertices) == 0:
+        return vertices, faces
+
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    _, cluster, counts = np.unique(cells, return_inverse=True,
+            return_counts=True, axis=0)
+    cluster = cluster.reshape(-1)
+    new_vertices = np.zeros((len(counts), 3), dtype=np.float64)
+    np.add.at(new_vertices, cluster, vertices)
+    new_vertices /= counts[:, np.newaxis]
+
+    new_faces = cluster[faces]
+    valid = (new_faces[:, 0] != new_faces[:, 1]) & \
+            (new_faces[:, 1] != new_faces[:, 2]) & \
+            (new_faces[:, 0] != new_faces[:, 2])
+    new_faces = new_faces[valid]
+
+    # Remove faces that reference the same vertices, independent of their
+    # orientation, and keep the first one.
+    if len(new_faces):
+        _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+        new_faces = new_faces[np.sort(first)]
+
+    # Drop vertices that aren't referenced anymore.
+    used, new_faces = np.unique(new_faces, return_inverse=True)
+    return new_vertices[used], new_faces.reshape(-1, 3)
+
+
+def encode_mesh(vertices, faces, quantization_bits=0, lod=0, n_lods=1) -> bytes:
+    """Encode a mesh in CATMAID's binary indexed mesh format. All values are
+    little endian. A 40 byte header contains the magic string "CMSH", the
+    format version, the number of quantization bits, the LOD of this mesh and
+    the number of available LODs (one byte each), the number of vertices and
+    faces (uint32 each) as well as the offset and scale of the vertex
+    coordinates (three float32 each). Vertices follow as float32 triplets or,
+    if quantization bits are set, as uint16 triplets that map to <offset> +
+    <value> * <scale>. The vertex block is padded to a multiple of four bytes
+    and followed by the faces as uint32 triplets.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if not 0 <= quantization_bits <= 16:
+        raise ValueError("Quantization bits have to be in the range [0, 16]")
+
+    if quantization_bits and len(vertices):
+        offset = vertices.min(axis=0)
+        extent = vertices.max(axis=0) - offset
+        scale = np.where(extent > 0, extent / (2 ** quantization_bits - 1), 1.0)
+        vertex_data = np.round((vertices - offset) / scale).astype('<u2').tobytes()
+    else:
+        offset = np.zeros(3)
+        scale = np.ones(3)
+        vertex_data = vertices.astype('<f4').tobytes()
+
+    header = _mesh_header.pack(_mesh_magic, _mesh_version, quantization_bits,
+            lod, n_lods, len(vertices), len(faces), *offset, *scale)
+    padding = b'\0' * (-len(vertex_data) % 4)
+    return b''.join((header, vertex_data, padding, faces.astype('<u4').tobytes()))
+
+
+def decode_mesh(data) -> Tuple[np.ndarray, np.ndarray, dict]:
+    """Decode a mesh in CATMAID's binary indexed mesh format, see
+    encode_mesh(). Returns vertices, faces and a dictionary with the header
+    fields.
+    """
+    magic, version, quantization_bits, lod, n_lods, n_vertices, n_faces, \
+            ox, oy, oz, sx, sy, sz = _mesh_header.unpack_from(data, 0)
+    if magic != _mesh_magic or version != _mesh_version:
+        raise ValueError("Unsupported mesh format")
+
+    offset = _mesh_header.size
+    if quantization_bits:
+        vertices = np.frombuffer(data, dtype='<u2', count=n_vertices * 3,
+                offset=offset).astype(np.float64).reshape(-1, 3)
+        vertices = vertices * np.array([sx, sy, sz]) + np.array([ox, oy, oz])
+        offset += n_vertices * 6
+    else:
+        vertices = np.frombuffer(data, dtype='<f4', count=n_vertices * 3,
+                offset=offset).astype(np.float64).reshape(-1, 3)
+        offset += n_vertices * 12
+    offset += -offset % 4
+    faces = np.frombuffer(data, dtype='<u4', count=n_faces * 3,
+            offset=offset).astype(np.int64).reshape(-1, 3)
+
+    return vertices, faces, {
+        'quantization_bits': quantization_bits,
+        'lod': lod,
+        'n_lods': n_lods,
+    }
@@ -2,16 +2,19 @@
 
 from abc import ABCMeta
 from aggdraw import Draw, Pen, Brush, Font
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from concurrent import futures
 import copy
 import json
+import logging
 import math
 import msgpack
+import numpy as np
 from PIL import Image, ImageDraw
 import progressbar
 import psycopg2.extras
 import struct
+import threading
 from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple, Union
 import ujson
 
@@ -25,14 +28,25 @@ from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view
 
 from catmaid import state
+from catmaid.history import get_historic_table_query
+from catmaid.metrics import server_metrics
 from catmaid.models import (ClassInstance, UserRole, Treenode,
         ClassInstanceClassInstance, Review, Project)
 from catmaid.control.authentication import requires_user_role, \
         can_edit_all_or_fail
 from catmaid.control.common import (batches, get_relation_to_id_map,
-        get_request_bool, get_request_list)
+        get_request_bool, get_request_datetime, get_request_list)
 
 
+logger = logging.getLogger(__name__)
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+    logger.warning("CATMAID was unable to load the scipy module. "
+        "Skeleton restricted bulk nearest node queries will not be available")
+
 
 ORIENTATIONS = {
     'xy': 0,
@@ -1378,6 +1392,108 @@ class ExtraNodesOnlyNodeProvider(BasicNodeProvider):
         return tuples, 'json'
 
 
+class HistoricNodeProvider(BasicNodeProvider):
+    """Return the tracing data that was valid at the point in time passed in
+    as "as_of" query parameter. Live table rows that were last edited before
+    this time are combined with history table rows whose validity period
+    contains it, which is supported by GiST indices on the history tables.
+    Spatial caches only represent the current state and are therefore not
+    used. Unlike the regular node providers, treenodes are selected by their
+    location and not by their edges, only parents of treenodes in the
+    bounding box are added to the result.
+    """
+
+    treenode_columns = ('id', 'parent_id', 'project_id', 'location_x',
+            'location_y', 'location_z', 'confidence', 'radius', 'skeleton_id',
+            'edition_time', 'user_id')
+
+    connector_columns = ('id', 'project_id', 'location_x', 'location_y',
+            'location_z', 'confidence', 'edition_time', 'user_id')
+
+    link_columns = ('id', 'treenode_id', 'connector_id', 'relation_id',
+            'confidence', 'edition_time')
+
+    def matches(self, params) -> bool:
+        return params.get('as_of') is not None and super().matches(params)
+
+    def get_treenode_data(self, cursor, params, extra_treenode_ids=None):
+        params['sanitized_treenode_ids'] = list(map(int, extra_treenode_ids or []))
+        treenode = get_historic_table_query('treenode', self.treenode_columns)
+        cursor.execute(f"""
+            WITH bb_node AS (
+                SELECT t.id, t.parent_id
+                FROM {treenode} t
+                WHERE t.project_id = %(project_id)s
+                AND t.location_z >= %(z1)s AND t.location_z < %(z2)s
+                AND t.location_x >= %(left)s AND t.location_x < %(right)s
+                AND t.location_y >= %(top)s AND t.location_y < %(bottom)s
+            )
+            SELECT
+                t.id,
+                t.parent_id,
+                t.location_x,
+                t.location_y,
+                t.location_z,
+                t.confidence,
+                t.radius,
+                t.skeleton_id,
+                EXTRACT(EPOCH FROM t.edition_time),
+                t.user_id
+            FROM (
+                SELECT id FROM bb_node
+                UNION
+                SELECT parent_id FROM bb_node WHERE parent_id IS NOT NULL
+                UNION
+                SELECT UNNEST(%(sanitized_treenode_ids)s::bigint[])
+            ) node(id)
+            JOIN {treenode} t
+                ON t.id = node.id
+            LIMIT %(limit)s
+        """, params)
+
+        treenodes = cursor.fetchall()
+        treenode_ids = [t[0] for t in treenodes]
+
+        return treenode_ids, treenodes
+
+    def get_connector_data(self, cursor, params, missing_connector_ids=None) -> List:
+        params['sanitized_connector_ids'] = list(map(int, missing_connector_ids or []))
+        connector = get_historic_table_query('connector', self.connector_columns)
+        link = get_historic_table_query('treenode_connector', self.link_columns)
+        cursor.execute(f"""
+            SELECT
+                c.id,
+                c.location_x,
+                c.location_y,
+                c.location_z,
+                c.confidence,
+                EXTRACT(EPOCH FROM c.edition_time),
+                c.user_id,
+                tc.treenode_id,
+                tc.relation_id,
+                tc.confidence,
+                EXTRACT(EPOCH FROM tc.edition_time),
+                tc.id
+            FROM (
+                SELECT c.id
+                FROM {connector} c
+                WHERE c.project_id = %(project_id)s
+                AND c.location_z >= %(z1)s AND c.location_z < %(z2)s
+                AND c.location_x >= %(left)s AND c.location_x < %(right)s
+                AND c.location_y >= %(top)s AND c.location_y < %(bottom)s
+                UNION
+                SELECT UNNEST(%(sanitized_connector_ids)s::bigint[])
+            ) connector(id)
+            JOIN {connector} c
+                ON c.id = connector.id
+            LEFT JOIN {link} tc
+                ON tc.connector_id = c.id
+            LIMIT %(limit)s
+        """, params)
+
+        return list(cursor.fetchall())
+
+
 # A map of all available node providers that can be used.
 AVAILABLE_NODE_PROVIDERS = {
     'postgis3d': Postgis3dNodeProvider,
@@ -1444,13 +1560,13 @@ def update_node_query_cache(node_providers=None, log=print, force=False) -> None
     if not node_providers:
         node_providers = get_node_provider_configs()
 
-    for np in node_providers:
-        log(f"Checking node provider {np}")
-        if type(np) in (list, tuple):
-            key = np[0]
-            options = np[1]
+    for provider in node_providers:
+        log(f"Checking node provider {provider}")
+        if type(provider) in (list, tuple):
+            key = provider[0]
+            options = provider[1]
         else:
-            key = np
+            key = provider
             options = {}
 
         project_id = options.get('project_id')
@@ -2305,6 +2421,15 @@ def node_list_tuples(request:HttpRequest, project_id=None, provider=None) -> Htt
       required: false
       type: string
       paramType: form
+    - name: as_of
+      description: |
+        Optional point in time (ISO 8601). If provided, the tracing data that
+        was valid at this time is returned, based on the history tables.
+        Configured node providers and caches are not used in this case.
+      required: false
+      type: string
+      format: date-time
+      paramType: form
     type:
     - type: array
       items:
@@ -2369,8 +2494,11 @@ def node_list_tuples(request:HttpRequest, project_id=None, provider=None) -> Htt
     params['orientation'] = orientation
     params['lod'] = data.get('lod', 'max')
     params['lod_type'] = data.get('lod_type', 'absolute')
+    params['as_of'] = get_request_datetime(data, 'as_of')
 
-    if override_provider:
+    if params['as_of']:
+        node_providers = [HistoricNodeProvider()]
+    elif override_provider:
         node_providers = get_configured_node_providers([override_provider])
     else:
         node_providers = get_configured_node_providers(get_node_provider_configs())
@@ -2464,35 +2592,57 @@ def _node_list_tuples_query(params, project_id, node_provider,
                 z1 <= r[4] < z2
 
         if include_labels:
+            # Labels of historic snapshots are looked up in the same snapshot.
+            as_of = params.get('as_of')
+            if as_of:
+                class_instance_table = get_historic_table_query('class_instance',
+                        ('id', 'name', 'edition_time'))
+                treenode_label_table = get_historic_table_query('treenode_class_instance',
+                        ('treenode_id', 'class_instance_id', 'relation_id', 'edition_time'))
+                connector_label_table = get_historic_table_query('connector_class_instance',
+                        ('connector_id', 'class_instance_id', 'relation_id', 'edition_time'))
+            else:
+                class_instance_table = 'class_instance'
+                treenode_label_table = 'treenode_class_instance'
+                connector_label_table = 'connector_class_instance'
+
             # Collect treenodes visible in the current section
             visible_treenodes = [row[0] for row in treenodes if is_visible(row)]
             if visible_treenodes:
-                cursor.execute('''
+                cursor.execute(f'''
                 SELECT treenode_class_instance.treenode_id,
                        class_instance.name
-                FROM class_instance,
-                     treenode_class_instance,
-                     UNNEST(%s::bigint[]) treenodes(tnid)
-                WHERE treenode_class_instance.relation_id = %s
+                FROM {class_instance_table} class_instance,
+                     {treenode_label_table} treenode_class_instance,
+                     UNNEST(%(node_ids)s::bigint[]) treenodes(tnid)
+                WHERE treenode_class_instance.relation_id = %(labeled_as)s
                   AND class_instance.id = treenode_class_instance.class_instance_id
                   AND treenode_class_instance.treenode_id = tnid
-                ''', (visible_treenodes, relation_map['labeled_as']))
+                ''', {
+                    'node_ids': visible_treenodes,
+                    'labeled_as': relation_map['labeled_as'],
+                    'as_of': as_of,
+                })
                 for row in cursor.fetchall():
                     labels[row[0]].append(row[1])
 
             # Collect connectors visible in the current section
             visible = [row[0] for row in connectors if z1 <= row[3] < z2]
             if visible:
-                cursor.execute('''
+                cursor.execute(f'''
                 SELECT connector_class_instance.connector_id,
                        class_instance.name
-                FROM class_instance,
-                     connector_class_instance,
-                     UNNEST(%s::bigint[]) connectors(cnid)
-                WHERE connector_class_instance.relation_id = %s
+                FROM {class_instance_table} class_instance,
+                     {connector_label_table} connector_class_instance,
+                     UNNEST(%(node_ids)s::bigint[]) connectors(cnid)
+                WHERE connector_class_instance.relation_id = %(labeled_as)s
                   AND class_instance.id = connector_class_instance.class_instance_id
                   AND connector_class_instance.connector_id = cnid
-                ''', (visible, relation_map['labeled_as']))
+                ''', {
+                    'node_ids': visible,
+                    'labeled_as': relation_map['labeled_as'],
+                    'as_of': as_of,
+                })
                 for row in cursor.fetchall():
                     labels[row[0]].append(row[1])
 
@@ -2567,7 +2717,10 @@ def compile_node_list_result(project_id, node_providers, params,
                 with_relation_map, with_origin)
             result_tuple, data_type = result
 
-            if result_tuple and data_type:
+            answered = bool(result_tuple and data_type)
+            server_metrics.observe_node_provider(type(node_provider).__name__,
+                    answered)
+            if answered:
                 break
 
     if not (result_tuple and data_type):
@@ -3005,6 +3158,235 @@ def node_nearest(request:HttpRequest, project_id=None) -> JsonResponse:
     })
 
 
+# KD-trees of the nodes of recently used skeletons, mapping skeleton IDs to
+# tuples of the skeleton summary version the tree was built for, the tree and
+# the node IDs. The least recently used entries are evicted first. The lock
+# guards all cache access, because requests can be served by multiple threads.
+_skeleton_kdtree_cache:OrderedDict = OrderedDict()
+_skeleton_kdtree_cache_lock = threading.Lock()
+
+
+def get_skeleton_kdtrees(project_id, skeleton_ids, cursor=None) -> Dict[int, Tuple[Any, np.ndarray]]:
+    """Get a KD-tree of the node locations for each passed in skeleton along
+    with an array of the respective node IDs, in the order of the tree's data.
+    Trees are cached per worker process and are rebuilt if the skeleton summary
+    of a skeleton indicates that it changed.
+    """
+    if cKDTree is None:
+        raise ImportError("The scipy module is required for skeleton "
+                "restricted nearest node queries")
+
+    if not cursor:
+        cursor = connection.cursor()
+
+    cursor.execute("""
+        SELECT css.skeleton_id, css.last_summary_update, css.num_nodes
+        FROM catmaid_skeleton_summary css
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) query_skeleton(id)
+            ON query_skeleton.id = css.skeleton_id
+        WHERE css.project_id = %(project_id)s
+    """, {
+        'project_id': project_id,
+        'skeleton_ids': list(skeleton_ids),
+    })
+    versions = {r[0]: (r[1], r[2]) for r in cursor.fetchall()}
+
+    kdtrees = {}
+    stale_skeleton_ids = []
+    with _skeleton_kdtree_cache_lock:
+        for skeleton_id, version in versions.items():
+            cached = _skeleton_kdtree_cache.get(skeleton_id)
+            if cached and cached[0] == version:
+                _skeleton_kdtree_cache.move_to_end(skeleton_id)
+                kdtrees[skeleton_id] = (cached[1], cached[2])
+            else:
+                stale_skeleton_ids.append(skeleton_id)
+
+    if stale_skeleton_ids:
+        cursor.execute("""
+            SELECT t.id, t.skeleton_id, t.location_x, t.location_y, t.location_z
+            FROM treenode t
+            JOIN UNNEST(%(skeleton_ids)s::bigint[]) query_skeleton(id)
+                ON query_skeleton.id = t.skeleton_id
+            WHERE t.project_id = %(project_id)s
+            ORDER BY t.skeleton_id
+        """, {
+            'project_id': project_id,
+            'skeleton_ids': stale_skeleton_ids,
+        })
+        rows = cursor.fetchall()
+        node_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        node_skeleton_ids = np.array([r[1] for r in rows], dtype=np.int64)
+        locations = np.array([r[2:] for r in rows], dtype=np.float64).reshape(-1, 3)
+
+        # Nodes are ordered by skeleton, find the start of each skeleton.
+        starts = np.flatnonzero(np.diff(node_skeleton_ids)) + 1
+        new_kdtrees = {}
+        for start, end in zip(np.append(0, starts), np.append(starts, len(rows))):
+            if start == end:
+                continue
+            skeleton_id = int(node_skeleton_ids[start])
+            kdtree = cKDTree(locations[start:end])
+            kdtrees[skeleton_id] = (kdtree, node_ids[start:end])
+            new_kdtrees[skeleton_id] = (versions[skeleton_id], kdtree,
+                    node_ids[start:end])
+
+        with _skeleton_kdtree_cache_lock:
+            for skeleton_id, entry in new_kdtrees.items():
+                _skeleton_kdtree_cache[skeleton_id] = entry
+                _skeleton_kdtree_cache.move_to_end(skeleton_id)
+
+            while len(_skeleton_kdtree_cache) > settings.NEAREST_NODE_KDTREE_CACHE_SIZE:
+                _skeleton_kdtree_cache.popitem(last=False)
+
+    return kdtrees
+
+
+def find_nearest_nodes(project_id, points, skeleton_ids=None, cursor=None) -> List[Optional[List]]:
+    """Find the closest treenode to each of the passed in [x, y, z] points.
+    If a list of skeleton IDs is passed in, the nearest node to each point is
+    searched only in the skeleton at the same index, unless the skeleton ID is
+    None. Unrestricted points are looked up in the database in a single query,
+    using a KNN index scan per point. Restricted points are looked up using
+    cached KD-trees of their skeletons. A list of [treenode_id, skeleton_id,
+    x, y, z] lists is returned in the order of the passed in points, entries
+    are None if no node was found.
+    """
+    if not cursor:
+        cursor = connection.cursor()
+
+    if skeleton_ids is None:
+        skeleton_ids = [None] * len(points)
+    elif len(skeleton_ids) != len(points):
+        raise ValueError("Need one skeleton ID per point")
+
+    result:List[Optional[List]] = [None] * len(points)
+
+    unrestricted = [i for i, skid in enumerate(skeleton_ids) if skid is None]
+    if unrestricted:
+        # Like for single points, the closest node is expected to be among the
+        # nodes of the 100 closest edges, which can be found using the index.
+        cursor.execute("""
+            SELECT q.idx, n.id, n.skeleton_id, n.location_x, n.location_y,
+                n.location_z
+            FROM UNNEST(%(idx)s::int[], %(x)s::float8[], %(y)s::float8[],
+                %(z)s::float8[]) q(idx, x, y, z)
+            CROSS JOIN LATERAL (
+                SELECT t.id, t.skeleton_id, t.location_x, t.location_y,
+                    t.location_z
+                FROM (
+                    SELECT te.id, te.edge
+                    FROM treenode_edge te
+                    WHERE te.project_id = %(project_id)s
+                    ORDER BY te.edge <<->> ST_MakePoint(q.x, q.y, q.z)
+                    LIMIT 100
+                ) closest_edge
+                JOIN treenode t
+                    ON t.id = closest_edge.id
+                ORDER BY ST_StartPoint(closest_edge.edge) <<->> ST_MakePoint(q.x, q.y, q.z)
+                LIMIT 1
+            ) n
+        """, {
+            'project_id': project_id,
+            'idx': unrestricted,
+            'x': [float(points[i][0]) for i in unrestricted],
+            'y': [float(points[i][1]) for i in unrestricted],
+            'z': [float(points[i][2]) for i in unrestricted],
+        })
+        for row in cursor.fetchall():
+            result[row[0]] = list(row[1:])
+
+    restricted = [i for i, skid in enumerate(skeleton_ids) if skid is not None]
+    if restricted:
+        kdtrees = get_skeleton_kdtrees(project_id,
+                set(skeleton_ids[i] for i in restricted), cursor)
+        points_per_skeleton:DefaultDict[int, List[int]] = defaultdict(list)
+        for i in restricted:
+            points_per_skeleton[skeleton_ids[i]].append(i)
+
+        for skeleton_id, point_indices in points_per_skeleton.items():
+            if skeleton_id not in kdtrees:
+                continue
+            kdtree, node_ids = kdtrees[skeleton_id]
+            _, node_indices = kdtree.query([points[i] for i in point_indices])
+            for i, node_index in zip(point_indices, node_indices):
+                location = kdtree.data[node_index]
+                result[i] = [int(node_ids[node_index]), skeleton_id,
+                        float(location[0]), float(location[1]),
+                        float(location[2])]
+
+    return result
+
+
+@api_view(['POST'])
+@requires_user_role(UserRole.Browse)
+def node_nearest_bulk(request:HttpRequest, project_id=None) -> JsonResponse:
+    """Find the closest treenode for each of multiple query locations.
+
+    Optionally, the nearest node for each location can be restricted to a
+    particular skeleton, by passing in a list of skeleton IDs that has the
+    same length as the list of points. All points are processed together,
+    which makes this much faster than individual nearest node requests.
+    ---
+    parameters:
+        - name: project_id
+          description: The project to operate in.
+          required: true
+          paramType: path
+        - name: points
+          description: |
+            A list of [x, y, z] lists, each representing a query location. Can
+            also be provided as JSON encoded string.
+          required: true
+          type: array
+          items:
+            type: array
+            items:
+              type: number
+              format: double
+          paramType: form
+        - name: skeleton_ids
+          description: |
+            A list of skeleton IDs, one for each point. The nearest node to a
+            point is only searched in the skeleton with the same index. Use -1
+            for points that should not be restricted to a skeleton.
+          required: false
+          type: array
+          items:
+            type: integer
+          paramType: form
+    type:
+        - type: array
+          items:
+            type: array
+            items:
+              type: number
+          description: |
+            A list with one [treenode_id, skeleton_id, x, y, z] list for each
+            query point, in the same order. Entries are null if no node was
+            found.
+          required: true
+    """
+    points = request.POST.get('points')
+    if points:
+        points = json.loads(points)
+    else:
+        points = get_request_list(request.POST, 'points', map_fn=float)
+    if not points:
+        raise ValueError("Need at least one point")
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError("Points need to have three coordinates each")
+
+    skeleton_ids = get_request_list(request.POST, 'skeleton_ids', map_fn=int)
+    if skeleton_ids is not None:
+        skeleton_ids = [None if skid < 0 else skid for skid in skeleton_ids]
+
+    nearest_nodes = find_nearest_nodes(int(project_id), points, skeleton_ids)
+
+    return JsonResponse(nearest_nodes, safe=False)
+
+
 def _fetch_location(project_id, location_id):
     """Get the locations of the passed in node ID in the passed in project."""
     locations = _fetch_locations(project_id, [location_id])
@@ -3197,10 +3579,12 @@ def find_labels(request:HttpRequest, project_id=None) -> JsonResponse:
     z = float(request.POST['z'])
     label_regex = str(request.POST['label_regex'])
 
+    # Treenode labels are read from the label index, which also stores the
+    # location of labeled nodes.
     cursor = connection.cursor()
     cursor.execute("""
             (SELECT
-                n.id,
+                n.treenode_id,
                 n.location_x,
                 n.location_y,
                 n.location_z,
@@ -3208,14 +3592,11 @@ def find_labels(request:HttpRequest, project_id=None) -> JsonResponse:
                    + POW(n.location_y - %s, 2)
                    + POW(n.location_z - %s, 2)) AS dist,
                 ARRAY_TO_JSON(ARRAY_AGG(l.name)) AS labels
-            FROM treenode n, class_instance l, treenode_class_instance nl, relation r
-            WHERE r.id = nl.relation_id
-              AND r.relation_name = 'labeled_as'
-              AND nl.treenode_id = n.id
-              AND l.id = nl.class_instance_id
+            FROM catmaid_treenode_label n, class_instance l
+            WHERE l.id = n.label_id
               AND n.project_id = %s
               AND l.name ~ %s
-            GROUP BY n.id)
+            GROUP BY n.treenode_id, n.location_x, n.location_y, n.location_z)
 
             UNION ALL
 
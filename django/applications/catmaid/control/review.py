@@ -68,10 +68,9 @@ def get_review_count(skeleton_ids) -> DefaultDict:
     # Count nodes that have been reviewed by each user in each partner skeleton
     cursor = connection.cursor()
     cursor.execute('''
-        SELECT skeleton_id, reviewer_id, count(*)
-        FROM review
+        SELECT skeleton_id, reviewer_id, num_reviewed_nodes
+        FROM catmaid_skeleton_reviewer_summary
         WHERE skeleton_id = ANY(%(skeleton_ids)s::bigint[])
-        GROUP BY reviewer_id, skeleton_id
     ''', {
         'skeleton_ids': skeleton_ids,
     })
@@ -106,20 +105,86 @@ def get_review_status(skeleton_ids, project_id=None, whitelist_id=False,
 
     skeletons = {}
 
-    # Get node count for each skeleton
+    # Get node count and the number of reviewed nodes for each skeleton
     cursor.execute('''
-        SELECT skeleton_id, num_nodes
+        SELECT s.skeleton_id, s.num_nodes, COALESCE(rs.num_reviewed_nodes, 0)
         FROM catmaid_skeleton_summary s
+        LEFT JOIN catmaid_skeleton_review_summary rs
+            ON rs.skeleton_id = s.skeleton_id
         WHERE s.skeleton_id = ANY(%(skeleton_ids)s::bigint[])
     ''', {
         'skeleton_ids': list(skeleton_ids)
     })
+    union_counts = {}
     for row in cursor.fetchall():
         skeletons[row[0]] = [row[1], 0]
+        union_counts[row[0]] = row[2]
+
+    if not (whitelist_id or user_ids or excluding_user_ids):
+        for skeleton_id, n_reviewed_nodes in union_counts.items():
+            skeletons[skeleton_id][1] = n_reviewed_nodes
+        return skeletons
+
+    # Most skeletons can be resolved from the number of reviewed nodes per
+    # reviewer: if no reviewer is relevant, nothing is reviewed. If only one
+    # reviewer or all reviewers are relevant, and all their reviews are
+    # accepted, their count or the union count can be used. Only the reviews
+    # of the remaining skeletons have to be looked at.
+    if whitelist_id:
+        accept_after = dict(ReviewerWhitelist.objects.filter(
+                project_id=project_id, user_id=whitelist_id).values_list(
+                'reviewer_id', 'accept_after'))
+    elif user_ids:
+        user_ids = set(user_ids)
+    else:
+        excluding_user_ids = set(excluding_user_ids)
+
+    cursor.execute('''
+        SELECT skeleton_id, reviewer_id, num_reviewed_nodes, min_review_time
+        FROM catmaid_skeleton_reviewer_summary
+        WHERE skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+    ''', {
+        'skeleton_ids': list(skeleton_ids)
+    })
+    reviewer_counts:DefaultDict[int, List] = defaultdict(list)
+    for row in cursor.fetchall():
+        reviewer_counts[row[0]].append(row[1:])
+
+    unresolved_skeleton_ids = []
+    for skeleton_id, counts in reviewer_counts.items():
+        if skeleton_id not in skeletons:
+            continue
+        relevant_counts = []
+        all_accepted = True
+        for reviewer_id, n_reviewed_nodes, min_review_time in counts:
+            if whitelist_id:
+                if reviewer_id not in accept_after:
+                    continue
+                # The minimum review time is only a lower bound.
+                if min_review_time < accept_after[reviewer_id]:
+                    all_accepted = False
+            elif user_ids:
+                if reviewer_id not in user_ids:
+                    continue
+            elif reviewer_id in excluding_user_ids:
+                continue
+            relevant_counts.append(n_reviewed_nodes)
+
+        if not relevant_counts:
+            continue
+        elif all_accepted and len(relevant_counts) == 1:
+            skeletons[skeleton_id][1] = relevant_counts[0]
+        elif all_accepted and len(relevant_counts) == len(counts):
+            skeletons[skeleton_id][1] = union_counts[skeleton_id]
+        else:
+            unresolved_skeleton_ids.append(skeleton_id)
+
+    if not unresolved_skeleton_ids:
+        return skeletons
 
     query_params = {
         'project_id': project_id,
-        'skeleton_ids': skeleton_ids
+        'skeleton_ids': unresolved_skeleton_ids,
     }
 
     query_joins = []
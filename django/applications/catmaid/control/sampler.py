@@ -1,7 +1,8 @@
 from collections import defaultdict
 from itertools import chain
 import json
-from typing import Any, DefaultDict, Dict, List, Optional, Tuple
+import numpy as np
+from typing import Any, DefaultDict, Dict, List
 
 from django.db import connection
 from django.http import HttpRequest, JsonResponse
@@ -13,8 +14,8 @@ from catmaid.control.common import get_request_bool, get_request_list
 from catmaid.models import (Class, ClassInstance, Connector, Relation, Sampler,
         SamplerDomain, SamplerDomainType, SamplerDomainEnd, SamplerInterval,
         SamplerIntervalState, SamplerState, SamplerConnector,
-        SamplerConnectorState, Treenode, TreenodeClassInstance, UserRole)
-from catmaid.util import Point3D, is_collinear
+        SamplerConnectorState, TreenodeClassInstance, UserRole)
+from catmaid.util import Point3D, are_collinear, is_collinear
 
 from rest_framework.decorators import api_view
 from rest_framework.views import APIView
@@ -1109,125 +1110,143 @@ def add_all_intervals(request:HttpRequest, project_id, domain_id) -> JsonRespons
 
     intervals = [(int(x[0]), int(x[1])) for x in
             get_request_list(request.POST, 'intervals', [], map_fn=lambda x: x)]
-    interval_start_index = dict((n[0], n) for n in intervals)
     added_nodes = json.loads(request.POST.get('added_nodes', '[]'))
     for data in added_nodes:
         data[0], data[1], data[2] = int(data[0]), int(data[1]), int(data[2])
     added_node_index = dict((n[0], n) for n in added_nodes)
 
-    label_class = Class.objects.get(project=project_id, class_name='label')
-    labeled_as = Relation.objects.get(project=project_id,
-            relation_name='labeled_as')
-
-    def create_added_node(data, new_nodes):
-        # Try to get parent from newly created nodes. If not available from
-        # there, assume the node exists in the database.
-        parent = new_nodes.get(data[2])
-        if not parent:
-            parent = Treenode.objects.get(pk=data[2])
-        x, y, z = float(data[3]), float(data[4]), float(data[5])
-        n = Treenode.objects.create(project_id=project_id, parent_id=parent.id,
-                user=request.user, editor=request.user, location_x=x, location_y=y,
-                location_z=z, radius=0, confidence=5, skeleton_id=skeleton_id)
-
-        return n
-
-    def link_added_node(data, new_nodes):
-        # The target node has to be a new node
-        n = new_nodes[data[0]]
-        # Find child and parent of new treenode. Check first if they have been
-        # created as newly as well.
-        child = new_nodes.get(data[1])
-        if not child:
-            child = Treenode.objects.get(pk=data[1])
-        parent = new_nodes.get(data[2])
-        if not parent:
-            parent = Treenode.objects.get(pk=data[2])
-
-        # Make sure both nodes are actually child and parent
-        if not child.parent == parent:
+    cursor = connection.cursor()
+
+    # Get all existing nodes that are referenced by added nodes at once.
+    existing_node_ids = set(chain.from_iterable(
+            n[1:3] for n in added_nodes)) - set(added_node_index.keys())
+    cursor.execute("""
+        SELECT t.id, t.parent_id, t.location_x, t.location_y, t.location_z
+        FROM treenode t
+        JOIN UNNEST(%(node_ids)s::bigint[]) node(id)
+            ON node.id = t.id
+        WHERE t.skeleton_id = %(skeleton_id)s
+    """, {
+        'node_ids': list(existing_node_ids),
+        'skeleton_id': skeleton_id,
+    })
+    existing_nodes = dict((r[0], r) for r in cursor.fetchall())
+    missing_node_ids = existing_node_ids - set(existing_nodes.keys())
+    if missing_node_ids:
+        raise ValueError('Could not find nodes in skeleton {}: {}'.format(
+                skeleton_id, ', '.join(map(str, missing_node_ids))))
+
+    # The current parent of all involved nodes. Each added node references
+    # its child and parent, which have to be child and parent at the time the
+    # added node is linked. Added nodes are linked in the order they are
+    # passed in and each linked node becomes the new parent of its child.
+    parents = dict((node_id, n[1]) for node_id, n in existing_nodes.items())
+    parents.update((n[0], n[2]) for n in added_nodes)
+    locations = dict((node_id, n[2:5]) for node_id, n in existing_nodes.items())
+    locations.update((n[0], n[3:6]) for n in added_nodes)
+    for data in added_nodes:
+        if parents[data[1]] != data[2]:
             raise ValueError('The provided nodes need to be child and parent')
+        parents[data[1]] = data[0]
+
+    # Test all added nodes for collinearity with their child and parent.
+    child_locs = [locations[n[1]] for n in added_nodes]
+    parent_locs = [locations[n[2]] for n in added_nodes]
+    new_node_locs = [locations[n[0]] for n in added_nodes]
+    collinear = are_collinear(child_locs, parent_locs, new_node_locs, True, epsilon)
+    if not collinear.all():
+        i = int(np.flatnonzero(~collinear)[0])
+        raise ValueError('New node location has to be collinear with child ' +
+                f'and parent. Child: {Point3D(*child_locs[i])}, New Node: ' +
+                f'{Point3D(*new_node_locs[i])}, Parent: {Point3D(*parent_locs[i])}')
+
+    # The IDs of added nodes are only placeholders. Reserve real IDs for all of
+    # them and create all nodes with a single query.
+    new_node_ids:Dict[int, int] = dict()
+    if added_nodes:
+        cursor.execute("""
+            SELECT nextval('location_id_seq')
+            FROM generate_series(1, %(n_nodes)s)
+        """, {
+            'n_nodes': len(added_nodes),
+        })
+        new_node_ids = dict(zip(added_node_index.keys(),
+                (r[0] for r in cursor.fetchall())))
+
+        def final_id(node_id):
+            return new_node_ids.get(node_id, node_id)
 
-        x, y, z = n.location_x, n.location_y, n.location_z
-        new_node_loc = Point3D(x, y, z)
-        child_loc = Point3D(child.location_x, child.location_y, child.location_z)
-        parent_loc = Point3D(parent.location_x, parent.location_y, parent.location_z)
+        cursor.execute("""
+            INSERT INTO treenode (id, project_id, parent_id, user_id,
+                editor_id, location_x, location_y, location_z, radius,
+                confidence, skeleton_id)
+            SELECT node.id, %(project_id)s, node.parent_id, %(user_id)s,
+                %(user_id)s, node.x, node.y, node.z, 0, 5, %(skeleton_id)s
+            FROM UNNEST(%(node_ids)s::bigint[], %(parent_ids)s::bigint[],
+                %(xs)s::real[], %(ys)s::real[], %(zs)s::real[])
+                node(id, parent_id, x, y, z)
+        """, {
+            'project_id': project_id,
+            'user_id': request.user.id,
+            'skeleton_id': skeleton_id,
+            'node_ids': [new_node_ids[n[0]] for n in added_nodes],
+            'parent_ids': [final_id(parents[n[0]]) for n in added_nodes],
+            'xs': [float(n[3]) for n in added_nodes],
+            'ys': [float(n[4]) for n in added_nodes],
+            'zs': [float(n[5]) for n in added_nodes],
+        })
 
-        if not is_collinear(child_loc, parent_loc, new_node_loc, True, epsilon):
-            raise ValueError('New node location has to be collinear with child ' +
-                    f'and parent. Child: {child_loc}, New Node: {new_node_loc}, Parent: {parent_loc}')
+        # Update the parents of existing nodes. Reviews don't need to be
+        # updated, because they are only reset of a node's location changes.
+        changed_parents = [(node_id, final_id(parents[node_id]))
+                for node_id, n in existing_nodes.items()
+                if parents[node_id] != n[1]]
+        if changed_parents:
+            cursor.execute("""
+                UPDATE treenode t
+                SET parent_id = node.parent_id
+                FROM UNNEST(%(node_ids)s::bigint[], %(parent_ids)s::bigint[])
+                    node(id, parent_id)
+                WHERE t.id = node.id
+            """, {
+                'node_ids': [n[0] for n in changed_parents],
+                'parent_ids': [n[1] for n in changed_parents],
+            })
 
-        # Tag new treenode with SAMPLER_CREATED_CLASS
+        # Tag new treenodes with SAMPLER_CREATED_CLASS
+        label_class = Class.objects.get(project=project_id, class_name='label')
+        labeled_as = Relation.objects.get(project=project_id,
+                relation_name='labeled_as')
         label, _ = ClassInstance.objects.get_or_create(project_id=project_id,
                 name=SAMPLER_CREATED_CLASS, class_column=label_class, defaults={
                     'user': request.user
                 })
-        TreenodeClassInstance.objects.create(project_id=project_id,
-                user=request.user, relation=labeled_as, treenode=n,
-                class_instance=label)
-
-        # Update child node. Reviews don't need to be updated, because they are
-        # only reset of a node's location changes.
-        child.parent_id = n.id
-        child.save()
-
-    # Sort intervals so that we create them in reverse. Each node needs to
-    # reference a potentially newly created parent node.
-    existing_parent_intervals = [i for i in intervals
-            if i[0] not in added_node_index]
-    # Iterate over root intervals and create child nodes until another existing
-    # node is found.
-    new_nodes:Dict = dict()
-    for root_interval in existing_parent_intervals:
-        current_interval: Optional[Tuple[int, int]] = root_interval
-        while current_interval:
-            child_id = current_interval[1]
-            new_child_data = added_node_index.get(child_id)
-            if new_child_data:
-                new_nodes[child_id] = create_added_node(new_child_data, new_nodes)
-                current_interval = interval_start_index.get(child_id)
-            else:
-                break
-
-    # Ensure that all parents of existing children are set correctly to newly
-    # createad nodes.
-    for data in added_nodes:
-        link_added_node(data, new_nodes)
+        TreenodeClassInstance.objects.bulk_create([TreenodeClassInstance(
+                project_id=project_id, user=request.user, relation=labeled_as,
+                treenode_id=new_node_id, class_instance=label)
+                for new_node_id in new_node_ids.values()])
 
     # Create actual intervals
-    result_intervals = []
-    for i in intervals:
-        start_node = int(i[0])
-        end_node = int(i[1])
-
-        added_start_node_data = added_node_index.get(start_node)
-        if added_start_node_data:
-            start_node = new_nodes[start_node].id
-
-        added_end_node_data = added_node_index.get(end_node)
-        if added_end_node_data:
-            end_node = new_nodes[end_node].id
-
-        si = SamplerInterval.objects.create(
+    sampler_intervals = SamplerInterval.objects.bulk_create([SamplerInterval(
             domain=domain,
             interval_state=state,
-            start_node_id=start_node,
-            end_node_id=end_node,
+            start_node_id=new_node_ids.get(start_node, start_node),
+            end_node_id=new_node_ids.get(end_node, end_node),
             user=request.user,
-            project_id=project_id)
+            project_id=project_id) for start_node, end_node in intervals])
 
-        result_intervals.append({
-            "id": si.id,
-            "interval_state_id": si.interval_state_id,
-            "start_node_id": si.start_node_id,
-            "end_node_id": si.end_node_id,
-            "user_id": si.user_id,
-            "project_id": si.project_id
-        })
+    result_intervals = [{
+        "id": si.id,
+        "interval_state_id": si.interval_state_id,
+        "start_node_id": si.start_node_id,
+        "end_node_id": si.end_node_id,
+        "user_id": si.user_id,
+        "project_id": si.project_id
+    } for si in sampler_intervals]
 
     return JsonResponse({
         'intervals': result_intervals,
-        'n_added_nodes': len(new_nodes)
+        'n_added_nodes': len(new_node_ids)
     })
 
 
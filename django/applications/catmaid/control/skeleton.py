@@ -1,22 +1,32 @@
 # -*- coding: utf-8 -*-
 
 from collections import defaultdict
+from concurrent import futures
 import csv
 from datetime import datetime, timedelta
-from itertools import chain
 import dateutil.parser
+import glob
+from io import StringIO
 import json
 import math
 import networkx as nx
+import numpy as np
+import os
+from psycopg2 import sql
 import pytz
 import re
-from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple, Union
+import shutil
+import tarfile
+import time
+from typing import (Any, Callable, DefaultDict, Dict, Iterator, List,
+        Optional, Set, Tuple, Union)
+import zipfile
 
 from django.conf import settings
 from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, Http404, \
         JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models import Q
 from django.views.decorators.cache import never_cache
 from django.utils.decorators import method_decorator
@@ -26,6 +36,10 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from celery.task import task
+from celery.utils.log import get_task_logger
+
+from catmaid.consumers import msg_user
 from catmaid.history import add_log_entry
 from catmaid.control import tracing
 from catmaid.models import (Project, UserRole, Class, ClassInstance, Review,
@@ -40,7 +54,7 @@ from catmaid.control.authentication import check_user_role, requires_user_role,
         PermissionError
 from catmaid.control.common import (insert_into_log, get_class_to_id_map,
         get_relation_to_id_map, _create_relation, get_request_bool,
-        get_request_list, Echo, get_last_concept_id)
+        get_request_list, Echo, get_last_concept_id, id_generator)
 from catmaid.history import record_request_action as record_view
 from catmaid.control.link import LINK_TYPES
 from catmaid.control.neuron import _delete_if_empty
@@ -49,10 +63,14 @@ from catmaid.control.annotation import (annotations_for_skeleton,
         clear_annotations)
 from catmaid.control.provenance import get_data_source, normalize_source_url
 from catmaid.control.review import get_review_status
-from catmaid.control.tree_util import find_root, reroot, edge_count_to_root
+from catmaid.control.tree_util import (edge_count_to_node, get_arbor_topology,
+        node_degrees)
 from catmaid.control.volume import get_volume_details
 
 
+logger = get_task_logger(__name__)
+
+
 def get_skeleton_permissions(request:HttpRequest, project_id, skeleton_id) -> JsonResponse:
     """ Tests editing permissions of a user on a skeleton and returns the
     result as JSON object."""
@@ -126,44 +144,24 @@ def open_leaves(request:HttpRequest, project_id=None, skeleton_id=None) -> JsonR
 def _open_leaves(project_id, skeleton_id, tnid=None):
     cursor = connection.cursor()
 
-    relations = get_relation_to_id_map(project_id, ['labeled_as'])
-    labeled_as = relations['labeled_as']
-
-    # Select all nodes and their tags
-    cursor.execute('''
-        SELECT t.id, t.parent_id
-        FROM treenode t
-        WHERE t.skeleton_id = %s
-        ''', (int(skeleton_id),))
-
-    # Some entries repeated, when a node has more than one tag
-    # Create a graph with edges from parent to child, and accumulate parents.
-    tree = nx.DiGraph()
-    n_nodes = 0
-    for row in cursor.fetchall():
-        n_nodes += 1
-        node_id = row[0]
-        if row[1]:
-            # It is ok to add edges that already exist: DiGraph doesn't keep duplicates
-            tree.add_edge(row[1], node_id)
-        else:
-            tree.add_node(node_id)
+    arbor = get_arbor_topology(int(skeleton_id), cursor)
+    node_ids, parent_index = arbor.node_ids, arbor.parent_index
+    n_nodes = len(node_ids)
 
-            # Default to root node
-            if not tnid:
-                tnid = node_id
-
-    if tnid not in tree:
+    # Default to root node
+    if tnid:
+        origin = np.flatnonzero(node_ids == tnid)
+    else:
+        origin = np.flatnonzero(parent_index == -1)
+    if len(origin) == 0:
         raise ValueError("Could not find %s in skeleton %s" % (tnid, int(skeleton_id)))
 
-    reroot(tree, tnid)
-    distances = edge_count_to_root(tree, root_node=tnid)
-    leaves = set()
-
-    for node_id, out_degree in tree.out_degree():
-        if 0 == out_degree or node_id == tnid and 1 == out_degree:
-            # Found an end node
-            leaves.add(node_id)
+    # End nodes have at most one neighbor, which includes the origin node, if
+    # it is at the end of a branch.
+    leaf_index = np.flatnonzero(node_degrees(parent_index) <= 1)
+    leaf_distances = edge_count_to_node(parent_index, origin[0])[leaf_index]
+    distances = dict(zip(node_ids[leaf_index].tolist(), leaf_distances.tolist()))
+    leaves = list(distances.keys())
 
     # Select all nodes and their tags
     cursor.execute('''
@@ -172,13 +170,12 @@ def _open_leaves(project_id, skeleton_id, tnid=None):
         JOIN UNNEST(%s::bigint[]) AS leaves (tnid)
           ON t.id = leaves.tnid
         LEFT OUTER JOIN (
-            treenode_class_instance tci
+            catmaid_treenode_label tl
             INNER JOIN class_instance ci
-              ON tci.class_instance_id = ci.id
-                AND tci.relation_id = %s)
-          ON t.id = tci.treenode_id
+              ON tl.label_id = ci.id)
+          ON t.id = tl.treenode_id
         GROUP BY t.id
-        ''', (list(leaves), labeled_as))
+        ''', (leaves,))
 
     # Iterate end nodes to find which are open.
     nearest = []
@@ -263,77 +260,53 @@ def _find_labels(project_id, skeleton_id, label_regex, tnid=None,
         only_leaves=False):
     cursor = connection.cursor()
 
-    if tnid is None:
-        cursor.execute("""
-            SELECT id FROM treenode
-            WHERE skeleton_id = %(skeleton_id)s AND parent_id IS NULL
-        """)
-        tnid = cursor.fetchone()[0]
-
-    cursor.execute("SELECT id FROM relation WHERE project_id=%s AND relation_name='labeled_as'" % int(project_id))
-    labeled_as = cursor.fetchone()[0]
+    arbor = get_arbor_topology(int(skeleton_id), cursor)
+    node_ids, parent_index = arbor.node_ids, arbor.parent_index
 
-    # Select all nodes in the skeleton and any matching labels
-    cursor.execute('''
-            SELECT
-                t.id,
-                t.parent_id,
-                t.location_x,
-                t.location_y,
-                t.location_z,
-                ci.name
-            FROM treenode t
-            LEFT OUTER JOIN (
-                treenode_class_instance tci
-                INNER JOIN class_instance ci
-                  ON (tci.class_instance_id = ci.id AND tci.relation_id = %s AND ci.name ~ %s))
-              ON t.id = tci.treenode_id
-            WHERE t.skeleton_id = %s
-            ''', (labeled_as, label_regex, int(skeleton_id)))
-
-    # Some entries repeated, when a node has more than one matching label
-    # Create a graph with edges from parent to child, and accumulate parents
-    tree = nx.DiGraph()
-    for row in cursor.fetchall():
-        nodeID = row[0]
-        if row[1]:
-            # It is ok to add edges that already exist: DiGraph doesn't keep duplicates
-            tree.add_edge(row[1], nodeID)
-        else:
-            tree.add_node(nodeID)
-        tree.nodes[nodeID]['loc'] = (row[2], row[3], row[4])
-        if row[5]:
-            props = tree.nodes[nodeID]
-            tags = props.get('tags')
-            if tags:
-                tags.append(row[5])
-            else:
-                props['tags'] = [row[5]]
-
-    if tnid not in tree:
+    if tnid is None:
+        origin = np.flatnonzero(parent_index == -1)
+    else:
+        origin = np.flatnonzero(node_ids == tnid)
+    if len(origin) == 0:
         raise ValueError("Could not find %s in skeleton %s" % (tnid, int(skeleton_id)))
 
-    reroot(tree, tnid)
-    distances = edge_count_to_root(tree, root_node=tnid)
+    # Select all labeled nodes in the skeleton with matching labels from the
+    # label index.
+    cursor.execute('''
+        SELECT tl.treenode_id, tl.location_x, tl.location_y, tl.location_z,
+            array_agg(ci.name)
+        FROM catmaid_treenode_label tl
+        JOIN class_instance ci
+            ON ci.id = tl.label_id
+        WHERE tl.skeleton_id = %(skeleton_id)s
+            AND ci.name ~ %(label_regex)s
+        GROUP BY tl.treenode_id, tl.location_x, tl.location_y, tl.location_z
+        ORDER BY tl.treenode_id
+    ''', {
+        'skeleton_id': int(skeleton_id),
+        'label_regex': label_regex,
+    })
+    labeled_nodes = cursor.fetchall()
+    if not labeled_nodes:
+        return []
 
-    nearest = []
-    leaves = set()
+    labeled_index = np.searchsorted(node_ids,
+            np.array([n[0] for n in labeled_nodes], dtype=np.int64))
+    distances = edge_count_to_node(parent_index, origin[0])[labeled_index]
 
     if only_leaves:
-        for node_id, out_degree in tree.out_degree():
-            if 0 == out_degree or node_id == tnid and 1 == out_degree:
-                # Found an end node
-                leaves.add(node_id)
-
-    for nodeID, props in tree.nodes(data=True):
-        if only_leaves and nodeID not in leaves:
-            continue
-        if 'tags' in props:
-            # Found a node with a matching label
-            d = distances[nodeID]
-            nearest.append([nodeID, props['loc'], d, props['tags']])
+        # End nodes have at most one neighbor, which includes the origin node,
+        # if it is at the end of a branch.
+        is_leaf = node_degrees(parent_index)[labeled_index] <= 1
+    else:
+        is_leaf = np.ones(len(labeled_nodes), dtype=bool)
 
-    nearest.sort(key=lambda n: n[2])
+    nearest = []
+    for i in np.argsort(distances, kind='stable'):
+        if is_leaf[i]:
+            row = labeled_nodes[i]
+            nearest.append([row[0], (row[1], row[2], row[3]),
+                    int(distances[i]), row[4]])
 
     return nearest
 
@@ -812,7 +785,9 @@ def cable_lengths(request:HttpRequest, project_id=None) -> HttpResponse:
 def summary(request:HttpRequest, project_id=None) -> HttpResponse:
     """Get the original creation time, last edit time, number of nodes, number
     of imported nodes, cable length and last editor information for a list
-    skeleton IDs.
+    skeleton IDs. Optionally, the bounding box, the number of branch, end and
+    tagged end nodes as well as the number of input and output synapses can
+    be included.
 
     Returns a mapping from skeleton ID to summary info
     ---
@@ -829,6 +804,14 @@ def summary(request:HttpRequest, project_id=None) -> HttpResponse:
         items:
           type: integer
         paramType: form
+      - name: with_details
+        description: |
+          Whether to include bounding box, topology and synapse count
+          information.
+        type: boolean
+        required: false
+        defaultValue: false
+        paramType: form
     """
 
     if request.method == 'GET':
@@ -842,23 +825,49 @@ def summary(request:HttpRequest, project_id=None) -> HttpResponse:
     if not skeleton_ids:
         raise ValueError('Need at least one skeleton ID')
 
+    with_details = get_request_bool(data, 'with_details', False)
+
     cursor = connection.cursor()
+
+    if with_details:
+        update_skeleton_detail_summary(project_id, skeleton_ids, cursor)
+        extra_fields = """,
+            'bbox', json_build_object(
+                'min', json_build_object('x', sds.min_x, 'y', sds.min_y, 'z', sds.min_z),
+                'max', json_build_object('x', sds.max_x, 'y', sds.max_y, 'z', sds.max_z)
+            ),
+            'num_branch_nodes', sds.num_branch_nodes,
+            'num_end_nodes', sds.num_end_nodes,
+            'num_tagged_end_nodes', sds.num_tagged_end_nodes,
+            'num_input_synapses', sds.num_input_synapses,
+            'num_output_synapses', sds.num_output_synapses
+        """
+        extra_join = """
+            JOIN catmaid_skeleton_detail_summary sds
+                ON sds.skeleton_id = css.skeleton_id
+        """
+    else:
+        extra_fields = ''
+        extra_join = ''
+
     cursor.execute("""
         SELECT COALESCE(json_object_agg(css.skeleton_id, json_build_object(
-            'skeleton_id', skeleton_id,
-            'last_summary_update', last_summary_update,
-            'original_creation_time', original_creation_time,
-            'last_edition_time', last_edition_time,
-            'num_nodes', num_nodes,
-            'cable_length', cable_length,
-            'last_editor_id', last_editor_id,
-            'num_imported_nodes', num_imported_nodes
-        )), '{}'::json)::text
+            'skeleton_id', css.skeleton_id,
+            'last_summary_update', css.last_summary_update,
+            'original_creation_time', css.original_creation_time,
+            'last_edition_time', css.last_edition_time,
+            'num_nodes', css.num_nodes,
+            'cable_length', css.cable_length,
+            'last_editor_id', css.last_editor_id,
+            'num_imported_nodes', css.num_imported_nodes
+            {extra_fields}
+        )), '{{}}'::json)::text
         FROM catmaid_skeleton_summary css
         JOIN UNNEST(%(query_skeleton_ids)s::bigint[]) query_skeleton(id)
             ON query_skeleton.id = css.skeleton_id
-        WHERE project_id = %(project_id)s
-    """, {
+        {extra_join}
+        WHERE css.project_id = %(project_id)s
+    """.format(extra_fields=extra_fields, extra_join=extra_join), {
         'query_skeleton_ids': skeleton_ids,
         'project_id': project_id,
     })
@@ -866,6 +875,207 @@ def summary(request:HttpRequest, project_id=None) -> HttpResponse:
     return HttpResponse(cursor.fetchone()[0], content_type='application/json')
 
 
+# The number of outdated skeletons whose details are computed by a single
+# query, if the computation is done in parallel.
+SKELETON_DETAIL_SUMMARY_CHUNK_SIZE = 500
+
+# The number of skeletons for which completeness is computed at a time when
+# streaming results.
+COMPLETENESS_STREAM_BATCH_SIZE = 2000
+
+
+def update_skeleton_detail_summary(project_id, skeleton_ids, cursor=None,
+        jobs:int=1) -> None:
+    """Make sure the detail summary of all passed in skeletons is up-to-date.
+    Triggers only mark the details of changed skeletons as outdated, which
+    is why they are recomputed here for those skeletons that changed since
+    their details were computed last. Skeletons without nodes are ignored.
+
+    With <jobs> larger than one and more outdated skeletons than fit in one
+    chunk, chunks of outdated skeletons are computed concurrently in a pool
+    of <jobs> threads, each with its own database connection and
+    transaction. These transactions don't see uncommitted changes of the
+    calling transaction, which is why the details are computed in the
+    calling transaction if it wrote anything already.
+    """
+    if not cursor:
+        cursor = connection.cursor()
+
+    cursor.execute("""
+        SELECT css.skeleton_id
+        FROM catmaid_skeleton_summary css
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+            ON skeleton.id = css.skeleton_id
+        LEFT JOIN catmaid_skeleton_detail_summary sds
+            ON sds.skeleton_id = css.skeleton_id
+        WHERE css.project_id = %(project_id)s
+            AND (sds.skeleton_id IS NULL
+                OR sds.computed_version IS DISTINCT FROM sds.version)
+    """, {
+        'project_id': project_id,
+        'skeleton_ids': skeleton_ids,
+    })
+    outdated_skeleton_ids = [r[0] for r in cursor.fetchall()]
+    if not outdated_skeleton_ids:
+        return
+
+    chunk_size = SKELETON_DETAIL_SUMMARY_CHUNK_SIZE
+    if jobs > 1 and len(outdated_skeleton_ids) > chunk_size and \
+            not _has_uncommitted_writes(cursor):
+        chunks = [outdated_skeleton_ids[i:i + chunk_size]
+                for i in range(0, len(outdated_skeleton_ids), chunk_size)]
+        with futures.ThreadPoolExecutor(jobs) as executor:
+            tasks = [executor.submit(_compute_skeleton_details_in_thread,
+                    project_id, chunk) for chunk in chunks]
+            for future in futures.as_completed(tasks):
+                future.result()
+    else:
+        _compute_skeleton_details(project_id, outdated_skeleton_ids, cursor)
+
+
+def _has_uncommitted_writes(cursor) -> bool:
+    """Whether the current transaction changed any data so far. Postgres
+    assigns a transaction ID only to transactions that write.
+    """
+    cursor.execute("""
+        SELECT txid_current_if_assigned() IS NOT NULL
+    """)
+    return cursor.fetchone()[0]
+
+
+def _compute_skeleton_details_in_thread(project_id, skeleton_ids) -> None:
+    """Compute the details of the passed in skeletons in a new transaction,
+    using the database connection of the current thread, which is closed
+    afterwards.
+    """
+    try:
+        with transaction.atomic():
+            _compute_skeleton_details(project_id, skeleton_ids,
+                    connection.cursor())
+    finally:
+        connection.close()
+
+
+def _compute_skeleton_details(project_id, skeleton_ids, cursor) -> None:
+    """Recompute and store the detail summary of all passed in skeletons.
+    """
+    relations = get_relation_to_id_map(project_id,
+            ['labeled_as', 'presynaptic_to', 'postsynaptic_to'], cursor)
+    end_label_ci_ids = list(ClassInstance.objects.filter(project_id=project_id,
+            class_column__class_name='label', name__in=tracing.end_tags) \
+            .values_list('id', flat=True))
+    non_fragment_ci_ids = list(ClassInstance.objects.filter(project_id=project_id,
+            class_column__class_name='label', name__in=['soma', 'out to nerve']) \
+            .values_list('id', flat=True))
+
+    # The version of each skeleton is read in the same snapshot as its nodes,
+    # links and tags. If a skeleton is changed concurrently, its version will
+    # be increased and the details computed here are outdated right away.
+    # End nodes are all nodes without child nodes plus the root node.
+    cursor.execute("""
+        INSERT INTO catmaid_skeleton_detail_summary AS sds (skeleton_id,
+            project_id, version, computed_version, min_x, min_y, min_z,
+            max_x, max_y, max_z, num_branch_nodes, num_end_nodes,
+            num_tagged_end_nodes, is_fragment, num_input_synapses,
+            num_output_synapses, link_counts, partner_link_counts)
+        SELECT css.skeleton_id, css.project_id, COALESCE(cur.version, 0),
+            COALESCE(cur.version, 0), nodes.min_x, nodes.min_y, nodes.min_z,
+            nodes.max_x, nodes.max_y, nodes.max_z, nodes.num_branch_nodes,
+            nodes.num_end_nodes, nodes.num_tagged_end_nodes,
+            fragment.is_fragment, links.num_input_synapses,
+            links.num_output_synapses, links.link_counts,
+            partners.partner_link_counts
+        FROM catmaid_skeleton_summary css
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+            ON skeleton.id = css.skeleton_id
+        LEFT JOIN catmaid_skeleton_detail_summary cur
+            ON cur.skeleton_id = css.skeleton_id
+        CROSS JOIN LATERAL (
+            SELECT MIN(t.location_x), MIN(t.location_y), MIN(t.location_z),
+                MAX(t.location_x), MAX(t.location_y), MAX(t.location_z),
+                COUNT(*) FILTER (WHERE c.n_children > 1),
+                COUNT(*) FILTER (WHERE c.n_children IS NULL OR t.parent_id IS NULL),
+                COUNT(*) FILTER (WHERE (c.n_children IS NULL OR t.parent_id IS NULL)
+                    AND EXISTS(
+                        SELECT 1
+                        FROM treenode_class_instance tci
+                        WHERE tci.treenode_id = t.id
+                            AND tci.relation_id = %(labeled_as)s
+                            AND tci.class_instance_id = ANY(%(end_label_ci_ids)s::bigint[])
+                    ))
+            FROM treenode t
+            LEFT JOIN (
+                SELECT child.parent_id, COUNT(*)
+                FROM treenode child
+                WHERE child.skeleton_id = css.skeleton_id
+                    AND child.parent_id IS NOT NULL
+                GROUP BY child.parent_id
+            ) c(parent_id, n_children)
+                ON c.parent_id = t.id
+            WHERE t.skeleton_id = css.skeleton_id
+        ) nodes(min_x, min_y, min_z, max_x, max_y, max_z, num_branch_nodes,
+            num_end_nodes, num_tagged_end_nodes)
+        CROSS JOIN LATERAL (
+            SELECT NOT EXISTS(
+                SELECT 1
+                FROM treenode_class_instance tci
+                JOIN treenode t
+                    ON t.id = tci.treenode_id
+                WHERE tci.class_instance_id = ANY(%(non_fragment_ci_ids)s::bigint[])
+                    AND tci.relation_id = %(labeled_as)s
+                    AND t.skeleton_id = css.skeleton_id
+            )
+        ) fragment(is_fragment)
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(SUM(l.n) FILTER (WHERE l.relation_id = %(postsynaptic_to)s), 0),
+                COALESCE(SUM(l.n) FILTER (WHERE l.relation_id = %(presynaptic_to)s), 0),
+                COALESCE(jsonb_object_agg(l.relation_id, l.n), '{}'::jsonb)
+            FROM (
+                SELECT tc.relation_id, COUNT(*)
+                FROM treenode_connector tc
+                WHERE tc.skeleton_id = css.skeleton_id
+                GROUP BY tc.relation_id
+            ) l(relation_id, n)
+        ) links(num_input_synapses, num_output_synapses, link_counts)
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(jsonb_object_agg(p.relation_key, p.n), '{}'::jsonb)
+            FROM (
+                SELECT tc.relation_id::text || ':' || tc2.relation_id::text, COUNT(*)
+                FROM treenode_connector tc
+                JOIN treenode_connector tc2
+                    ON tc2.connector_id = tc.connector_id
+                    AND tc2.id <> tc.id
+                WHERE tc.skeleton_id = css.skeleton_id
+                GROUP BY 1
+            ) p(relation_key, n)
+        ) partners(partner_link_counts)
+        ORDER BY css.skeleton_id
+        ON CONFLICT (skeleton_id) DO UPDATE
+        SET computed_version = EXCLUDED.computed_version,
+            min_x = EXCLUDED.min_x,
+            min_y = EXCLUDED.min_y,
+            min_z = EXCLUDED.min_z,
+            max_x = EXCLUDED.max_x,
+            max_y = EXCLUDED.max_y,
+            max_z = EXCLUDED.max_z,
+            num_branch_nodes = EXCLUDED.num_branch_nodes,
+            num_end_nodes = EXCLUDED.num_end_nodes,
+            num_tagged_end_nodes = EXCLUDED.num_tagged_end_nodes,
+            is_fragment = EXCLUDED.is_fragment,
+            num_input_synapses = EXCLUDED.num_input_synapses,
+            num_output_synapses = EXCLUDED.num_output_synapses,
+            link_counts = EXCLUDED.link_counts,
+            partner_link_counts = EXCLUDED.partner_link_counts
+    """, {
+        'skeleton_ids': skeleton_ids,
+        'labeled_as': relations.get('labeled_as', -1),
+        'presynaptic_to': relations.get('presynaptic_to', -1),
+        'postsynaptic_to': relations.get('postsynaptic_to', -1),
+        'end_label_ci_ids': end_label_ci_ids,
+        'non_fragment_ci_ids': non_fragment_ci_ids,
+    })
+
+
 @api_view(['GET', 'POST'])
 @requires_user_role(UserRole.Browse)
 def validity(request:HttpRequest, project_id=None) -> HttpResponse:
@@ -1145,48 +1355,49 @@ def connectivity_counts(request:HttpRequest, project_id=None) -> JsonResponse:
 
     relations = dict(Relation.objects.filter(project_id=project_id).values_list('relation_name', 'id'))
 
-    source_relation_ids = map(lambda r: relations[r], source_relations)
-    target_relation_ids = map(lambda r: relations[r], target_relations)
+    source_relation_ids = [relations[r] for r in source_relations]
+    target_relation_ids = [relations[r] for r in target_relations]
 
-    extra_select = []
+    # Link counts are read from the skeleton detail summary. Partner link
+    # counts are stored as "<relation ID>:<partner relation ID>" keys, plain
+    # link counts use the relation ID as key.
     if count_partner_links:
-        if target_relation_ids:
-            extra_target_check = """
-                AND tc2.relation_id IN ({})
-            """.format(','.join(map(str, target_relation_ids)))
-        else:
-            extra_target_check = ""
-
-        extra_select.append(f"""
-            JOIN treenode_connector tc2
-                ON tc.connector_id = tc2.connector_id
-                AND tc.id <> tc2.id
-                {extra_target_check}
-        """)
+        count_field = 'partner_link_counts'
+    else:
+        count_field = 'link_counts'
 
+    relation_filters = []
     if source_relation_ids:
-        extra_source_check = """
-            AND tc.relation_id IN ({})
-        """.format(','.join(map(str, source_relation_ids)))
-    else:
-        extra_source_check = ""
+        relation_filters.append("""
+            AND split_part(c.relation_key, ':', 1)::bigint = ANY(%(source_relation_ids)s::bigint[])
+        """)
+    if count_partner_links and target_relation_ids:
+        relation_filters.append("""
+            AND split_part(c.relation_key, ':', 2)::bigint = ANY(%(target_relation_ids)s::bigint[])
+        """)
 
     cursor = connection.cursor()
+    update_skeleton_detail_summary(project_id, skeleton_ids, cursor)
+
     cursor.execute("""
-        SELECT tc.skeleton_id, tc.relation_id, COUNT(tc)
-        FROM treenode_connector tc
+        SELECT sds.skeleton_id,
+            split_part(c.relation_key, ':', 1)::bigint AS relation_id,
+            SUM(c.n_links::integer)
+        FROM catmaid_skeleton_detail_summary sds
         JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
-            ON skeleton.id = tc.skeleton_id
-        {extra_select}
-        WHERE tc.project_id = %(project_id)s
-        {extra_source_check}
-        GROUP BY tc.skeleton_id, tc.relation_id
+            ON skeleton.id = sds.skeleton_id
+        CROSS JOIN LATERAL jsonb_each_text(sds.{count_field}) c(relation_key, n_links)
+        WHERE sds.project_id = %(project_id)s
+        {relation_filters}
+        GROUP BY sds.skeleton_id, relation_id
     """.format(**{
-        'extra_select': '\n'.join(extra_select),
-        'extra_source_check': extra_source_check,
+        'count_field': count_field,
+        'relation_filters': '\n'.join(relation_filters),
     }), {
         'project_id': project_id,
         'skeleton_ids': skeleton_ids,
+        'source_relation_ids': source_relation_ids,
+        'target_relation_ids': target_relation_ids,
     })
 
     connectivity:Dict = {}
@@ -1328,33 +1539,54 @@ def split_skeleton(request:HttpRequest, project_id=None) -> JsonResponse:
     upstream_annotation_map = make_annotation_map(upstream_annotation_map, neuron.id, cursor)
     downstream_annotation_map = make_annotation_map(downstream_annotation_map, neuron.id, cursor)
 
-    # Retrieve the id, parent_id of all nodes in the skeleton. Also
-    # pre-emptively lock all treenodes and connectors in the skeleton to prevent
-    # race conditions resulting in inconsistent skeleton IDs from, e.g., node
-    # creation or update.
+    # Find all nodes downstream of the split node (inclusive), which are moved
+    # to the new skeleton. The recursive query only visits these nodes, the
+    # rest of the skeleton isn't read. Also pre-emptively lock the moved
+    # treenodes and their connector links to prevent race conditions resulting
+    # in inconsistent skeleton IDs from, e.g., node creation or update.
     cursor.execute('''
-        SELECT 1 FROM treenode_connector tc WHERE tc.skeleton_id = %s
-        ORDER BY tc.id
-        FOR NO KEY UPDATE OF tc;
-        SELECT t.id, t.parent_id FROM treenode t WHERE t.skeleton_id = %s
+        WITH RECURSIVE downstream(id) AS (
+            SELECT %(treenode_id)s::bigint
+            UNION ALL
+            SELECT t.id
+            FROM downstream d
+            JOIN treenode t
+                ON t.parent_id = d.id
+        )
+        SELECT t.id
+        FROM treenode t
+        JOIN downstream d
+            ON d.id = t.id
         ORDER BY t.id
         FOR NO KEY UPDATE OF t
-        ''', (skeleton_id, skeleton_id)) # no need to sanitize
-    # build the networkx graph from it
-    graph = nx.DiGraph()
-    for row in cursor.fetchall():
-        graph.add_node( row[0] )
-        if row[1]:
-            # edge from parent_id to id
-            graph.add_edge( row[1], row[0] )
-    # find downstream nodes starting from target treenode_id
-    # and generate the list of IDs to change, starting at treenode_id (inclusive)
-    change_list = list(nx.bfs_tree(graph, treenode_id).nodes)
-    if not change_list:
-        # When splitting an end node, the bfs_tree doesn't return any nodes,
-        # which is surprising, because when the splitted tree has 2 or more nodes
-        # the node at which the split is made is included in the list.
-        change_list.append(treenode_id)
+    ''', {
+        'treenode_id': treenode_id,
+    })
+    change_list = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute('''
+        SELECT 1 FROM treenode_connector tc
+        WHERE tc.treenode_id = ANY(%(change_list)s::bigint[])
+        ORDER BY tc.id
+        FOR NO KEY UPDATE OF tc
+    ''', {
+        'change_list': change_list,
+    })
+
+    # Samplers are updated based on the graph of the complete skeleton before
+    # the split. It is only built if samplers reference this skeleton.
+    if Sampler.objects.filter(skeleton_id=skeleton_id).exists():
+        cursor.execute('''
+            SELECT t.id, t.parent_id FROM treenode t WHERE t.skeleton_id = %s
+        ''', (skeleton_id,))
+        graph = nx.DiGraph()
+        for row in cursor.fetchall():
+            graph.add_node( row[0] )
+            if row[1]:
+                # edge from parent_id to id
+                graph.add_edge( row[1], row[0] )
+    else:
+        graph = None
     # create a new skeleton
     new_skeleton = ClassInstance()
     new_skeleton.name = 'Skeleton'
@@ -1383,23 +1615,45 @@ def split_skeleton(request:HttpRequest, project_id=None) -> JsonResponse:
     cici.project_id = project_id
     cici.save()
 
-    # Update skeleton IDs for treenodes, treenode_connectors, and reviews.
-    # TODO: No need to duplicate the change_list array three times in the query.
-    # Use a CTE
+    # Update skeleton IDs for treenodes, treenode_connectors, and reviews of
+    # the moved nodes and make the split node the new root. Doing this in a
+    # single statement makes the statement level summary and edge table
+    # triggers run only once, for the moved nodes only.
     cursor.execute("""
-        UPDATE treenode
-          SET skeleton_id = %(new_skeleton_id)s
-          WHERE id = ANY(%(change_list)s::bigint[]);
-        UPDATE treenode_connector
-          SET skeleton_id = %(new_skeleton_id)s
-          WHERE treenode_id = ANY(%(change_list)s::bigint[]);
-        UPDATE review
-          SET skeleton_id = %(new_skeleton_id)s
-          WHERE treenode_id = ANY(%(change_list)s::bigint[]);
-        """, {'new_skeleton_id': new_skeleton.id, 'change_list': change_list})
-
-    # setting new root treenode's parent to null
-    Treenode.objects.filter(id=treenode_id).update(parent=None, editor=request.user)
+        -- Set transaction user ID to update skeleton summary more precicely in trigger function.
+        SET LOCAL catmaid.user_id=%(user_id)s;
+        WITH changed(id) AS (
+            SELECT UNNEST(%(change_list)s::bigint[])
+        ), updated_treenode AS (
+            UPDATE treenode t
+            SET skeleton_id = %(new_skeleton_id)s,
+                parent_id = CASE WHEN t.id = %(treenode_id)s THEN NULL ELSE t.parent_id END,
+                editor_id = CASE WHEN t.id = %(treenode_id)s THEN %(user_id)s ELSE t.editor_id END
+            FROM changed c
+            WHERE t.id = c.id
+            RETURNING t.id
+        ), updated_link AS (
+            UPDATE treenode_connector tc
+            SET skeleton_id = %(new_skeleton_id)s
+            FROM changed c
+            WHERE tc.treenode_id = c.id
+            RETURNING tc.id
+        ), updated_review AS (
+            UPDATE review r
+            SET skeleton_id = %(new_skeleton_id)s
+            FROM changed c
+            WHERE r.treenode_id = c.id
+            RETURNING r.id
+        )
+        SELECT (SELECT COUNT(*) FROM updated_treenode),
+            (SELECT COUNT(*) FROM updated_link),
+            (SELECT COUNT(*) FROM updated_review)
+    """, {
+        'new_skeleton_id': new_skeleton.id,
+        'change_list': change_list,
+        'treenode_id': treenode_id,
+        'user_id': request.user.id,
+    })
 
     # Update annotations of existing neuron to have only over set
     if upstream_annotation_map:
@@ -1410,7 +1664,10 @@ def split_skeleton(request:HttpRequest, project_id=None) -> JsonResponse:
     _annotate_entities(project_id, [new_neuron.id], downstream_annotation_map)
 
     # If samplers reference this skeleton, make sure they are updated as well
-    sampler_info = prune_samplers(skeleton_id, graph, treenode_parent, treenode)
+    if graph is not None:
+        sampler_info = prune_samplers(skeleton_id, graph, treenode_parent, treenode)
+    else:
+        sampler_info = None
 
     # Log the location of the node at which the split was done
     location = (treenode.location_x, treenode.location_y, treenode.location_z)
@@ -2267,71 +2524,74 @@ def _reroot_skeleton(treenode_id, project_id):
         if first_parent is None:
             return False
 
-        q_treenode = Treenode.objects.filter(
-                skeleton_id=rootnode.skeleton_id,
-                project=project_id).values_list('id', 'parent_id', 'confidence')
-        nodes = {tnid: (parent_id, confidence) for (tnid, parent_id, confidence) in list(q_treenode)}
+        cursor = connection.cursor()
 
-        # Make sure this skeleton is not used in a sampler
-        samplers = Sampler.objects.prefetch_related('samplerdomain_set') \
-                .filter(skeleton=rootnode.skeleton)
+        # Make sure this skeleton is not used in a sampler. Walking up from
+        # each sampler domain start node, the new root has to be reached. If
+        # it is, nothing needs to change for these samplers.
+        samplers = Sampler.objects.filter(skeleton=rootnode.skeleton_id)
         n_samplers = len(samplers)
         if n_samplers > 0:
-            def is_same_or_downstream(node_id, upstream_node_id):
-                while True:
-                    if node_id == upstream_node_id:
-                        return True
-                    parent = nodes.get(node_id)
-                    if parent:
-                        node_id = parent[0]
-                    else:
-                        return False
-                return False
-            for sampler in samplers:
-                # Check if each sampler domain start node has a parent path to the
-                # new root. If it is has, nothing needs to change for these
-                # samplers.
-                for domain in sampler.samplerdomain_set.all():
-                    if not is_same_or_downstream(domain.start_node_id, rootnode.id):
-                        response_on_error = 'Neuron is used in a sampler, which is affected by the new root'
-                        raise ValueError(f'Skeleton {rootnode.skeleton_id} '
-                                    f'is used in {n_samplers} sampler(s), can\'t reeroot')
-
-        # Traverse up the chain of parents, reversing the parent relationships so
-        # that the selected treenode (with ID treenode_id) becomes the root.
-        new_parents = []
-        new_parent = rootnode.id
-        new_confidence = rootnode.confidence
-        node = first_parent
-
+            cursor.execute("""
+                WITH RECURSIVE upstream(domain_id, node_id) AS (
+                    SELECT sd.id, sd.start_node_id
+                    FROM catmaid_samplerdomain sd
+                    WHERE sd.sampler_id = ANY(%(sampler_ids)s::bigint[])
+                    UNION ALL
+                    SELECT u.domain_id, t.parent_id
+                    FROM upstream u
+                    JOIN treenode t
+                        ON t.id = u.node_id
+                    WHERE u.node_id <> %(treenode_id)s
+                        AND t.parent_id IS NOT NULL
+                )
+                SELECT EXISTS(
+                    SELECT 1
+                    FROM upstream
+                    GROUP BY domain_id
+                    HAVING NOT bool_or(node_id = %(treenode_id)s)
+                )
+            """, {
+                'sampler_ids': [sampler.id for sampler in samplers],
+                'treenode_id': rootnode.id,
+            })
+            if cursor.fetchone()[0]:
+                response_on_error = 'Neuron is used in a sampler, which is affected by the new root'
+                raise ValueError(f'Skeleton {rootnode.skeleton_id} '
+                            f'is used in {n_samplers} sampler(s), can\'t reeroot')
+
+        # Traverse up the chain of parents in a recursive query, reversing the
+        # parent relationships so that the selected treenode (with ID
+        # treenode_id) becomes the root. Each node on the path gets the node
+        # below it as new parent, along with that node's edge confidence. Only
+        # the nodes on this path are read and updated. The new root is reset to
+        # maximum confidence.
         response_on_error = 'An error occured while rerooting.'
-        while True:
-            # Store current values to be used in next iteration
-            parent, confidence = nodes[node]
-
-            # Set new values
-            new_parents.append((node, new_parent, new_confidence))
-
-            if parent is None:
-                # Root has been reached
-                break
-            else:
-                # Prepare next iteration
-                new_parent = node
-                new_confidence = confidence
-                node = parent
-
-        # Finally make treenode root
-        new_parents.append((rootnode.id, 'NULL', 5)) # Reset to maximum confidence.
-
-        cursor = connection.cursor()
-        cursor.execute('''
-                UPDATE treenode
-                SET parent_id = v.parent_id,
-                    confidence = v.confidence
-                FROM (VALUES %s) v(id, parent_id, confidence)
-                WHERE treenode.id = v.id
-                ''' % ','.join(['(%s,%s,%s)' % node for node in new_parents]))
+        cursor.execute("""
+            WITH RECURSIVE path(id, parent_id, confidence, depth) AS (
+                SELECT t.id, t.parent_id, t.confidence, 0
+                FROM treenode t
+                WHERE t.id = %(treenode_id)s
+                UNION ALL
+                SELECT t.id, t.parent_id, t.confidence, p.depth + 1
+                FROM path p
+                JOIN treenode t
+                    ON t.id = p.parent_id
+            ), new_parent AS (
+                SELECT p.id,
+                    lag(p.id) OVER w AS parent_id,
+                    COALESCE(lag(p.confidence) OVER w, 5) AS confidence
+                FROM path p
+                WINDOW w AS (ORDER BY p.depth)
+            )
+            UPDATE treenode t
+            SET parent_id = np.parent_id,
+                confidence = np.confidence
+            FROM new_parent np
+            WHERE t.id = np.id
+        """, {
+            'treenode_id': rootnode.id,
+        })
 
         return rootnode
 
@@ -2641,36 +2901,50 @@ def _join_skeleton(user, from_treenode_id, to_treenode_id, project_id,
 
         response_on_error = 'Could not update Treenode table with new skeleton id for joined treenodes.'
 
-        Treenode.objects.filter(skeleton=to_skid).update(skeleton=from_skid)
+        # Move all nodes, connector links and reviews of the consumed skeleton
+        # and attach the merge target node to the node it is merged into. This
+        # is done in a single statement so that the statement level summary and
+        # edge table triggers run only once for all changed nodes.
         cursor.execute("""
             -- Set transaction user ID to update skeleton summary more precicely in trigger function.
             SET LOCAL catmaid.user_id=%(user_id)s;
-            UPDATE treenode
-            SET skeleton_id = %(from_skeleton_id)s
-            WHERE skeleton_id = %(to_skeleton_id)s
+            WITH updated_treenode AS (
+                UPDATE treenode t
+                SET skeleton_id = %(from_skeleton_id)s,
+                    parent_id = CASE WHEN t.id = %(to_treenode_id)s
+                        THEN %(from_treenode_id)s ELSE t.parent_id END,
+                    editor_id = CASE WHEN t.id = %(to_treenode_id)s
+                        THEN %(user_id)s ELSE t.editor_id END
+                WHERE t.skeleton_id = %(to_skeleton_id)s
+                RETURNING t.id
+            ), updated_link AS (
+                UPDATE treenode_connector tc
+                SET skeleton_id = %(from_skeleton_id)s
+                WHERE tc.skeleton_id = %(to_skeleton_id)s
+                RETURNING tc.id
+            ), updated_review AS (
+                -- Update reviews from 'losing' neuron to now belong to the new neuron
+                UPDATE review r
+                SET skeleton_id = %(from_skeleton_id)s
+                WHERE r.skeleton_id = %(to_skeleton_id)s
+                RETURNING r.id
+            )
+            SELECT (SELECT COUNT(*) FROM updated_treenode),
+                (SELECT COUNT(*) FROM updated_link),
+                (SELECT COUNT(*) FROM updated_review)
         """, {
             'user_id': user.id,
             'from_skeleton_id': from_skid,
             'to_skeleton_id': to_skid,
+            'from_treenode_id': from_treenode_id,
+            'to_treenode_id': to_treenode_id,
         })
 
-        response_on_error = 'Could not update TreenodeConnector table.'
-        TreenodeConnector.objects.filter(
-            skeleton=to_skid).update(skeleton=from_skid)
-
-        # Update reviews from 'losing' neuron to now belong to the new neuron
-        response_on_error = 'Could not update reviews with new skeleton IDs for joined treenodes.'
-        Review.objects.filter(skeleton_id=to_skid).update(skeleton=from_skid)
-
         # Remove skeleton of to_id (deletes cicic part_of to neuron by cascade,
         # leaving the parent neuron dangling in the object tree).
         response_on_error = 'Could not delete skeleton with ID %s.' % to_skid
         ClassInstance.objects.filter(pk=to_skid).delete()
 
-        # Update the parent of to_treenode.
-        response_on_error = 'Could not update parent of treenode with ID %s' % to_treenode_id
-        Treenode.objects.filter(id=to_treenode_id).update(parent=from_treenode_id, editor=user)
-
         # Update linked annotations of neuron
         response_on_error = 'Could not update annotations of neuron ' \
                 'with ID %s' % from_neuron['neuronid']
@@ -3099,45 +3373,633 @@ def import_skeleton(request:HttpRequest, project_id=None) -> Union[HttpResponse,
     return HttpResponseBadRequest('No file received.')
 
 
-def _import_skeleton_swc(user, project_id, swc_string, neuron_id=None,
-        skeleton_id=None, name=None, annotations=['Import'], force=False,
-        auto_id=True, source_id=None, source_url=None, source_project_id=None,
-        source_type='skeleton', replace_annotations=False) -> JsonResponse:
-    """Import a neuron modeled by a skeleton in SWC format.
+@api_view(['POST'])
+@requires_user_role(UserRole.Import)
+def import_skeletons(request:HttpRequest, project_id=None) -> JsonResponse:
+    """Import many neurons modeled by skeletons from a set of uploaded files.
+
+    Each file is imported as a new neuron and skeleton, in the same way
+    single files are imported through skeletons/import. Currently only SWC and
+    eSWC representations are supported. Files are imported independently: if
+    a file can't be imported, its error is reported and the remaining files
+    are imported nevertheless.
+    ---
+    consumes: multipart/form-data
+    parameters:
+      - name: annotations
+        description: >
+            An optional list of annotation names that is added to all imported
+            skeletons.
+        paramType: form
+        type: array
+        items:
+          type: string
+      - name: use_file_names
+        description: >
+            If enabled, the name of each new neuron will be the name of its
+            file without extension. Otherwise default names are used.
+        type: boolean
+        required: false
+        defaultValue: false
+        paramType: form
+      - name: source_url
+        description: >
+            If specified, this source URL will be saved and mapped to the new
+            skeleton IDs. This is only valid together with source_project_id.
+        paramType: form
+        type: string
+      - name: source_project_id
+        description: >
+            If specified, this source project ID will be saved and mapped to the
+            new skeleton IDs.
+        paramType: form
+        type: integer
+      - name: source_type
+        description: >
+            Can be either 'skeleton' or 'segmentation', to further specify of
+            what type the origin data is.
+        paramType: form
+        type: string
+      - name: file
+        required: true
+        description: >
+            One or more skeleton representation files to import, each with a
+            different form field name.
+        paramType: body
+        dataType: File
+    type:
+        imported:
+            type: array
+            required: true
+            description: >
+                A list of objects, one for each successfully imported file, with
+                the fields file_name, neuron_id, skeleton_id and node_id_map.
+        errors:
+            type: array
+            required: true
+            description: >
+                A list of objects, one for each file that couldn't be imported,
+                with the fields file_name and error.
     """
+    project_id = int(project_id)
+    annotations = get_request_list(request.POST, 'annotations', ['Import'])
+    use_file_names = get_request_bool(request.POST, 'use_file_names', False)
+    source_url = request.POST.get('source_url', None)
+    source_project_id = request.POST.get('source_project_id', None)
+    source_type = request.POST.get('source_type', 'skeleton')
+
+    if not request.FILES:
+        raise ValueError('No file received.')
 
-    g = nx.DiGraph()
-    for line in swc_string.splitlines():
-        if line.startswith('#') or not line.strip():
+    errors:List[Dict[str, str]] = []
+
+    def get_files():
+        for uploadedfile in request.FILES.values():
+            filename = uploadedfile.name
+            if uploadedfile.size > settings.IMPORTED_SKELETON_FILE_MAXIMUM_SIZE:
+                errors.append({
+                    'file_name': filename,
+                    'error': ('File too large. Maximum file size is '
+                            f'{settings.IMPORTED_SKELETON_FILE_MAXIMUM_SIZE} bytes.'),
+                })
+                continue
+            swc_string = '\n'.join([line.decode('utf-8') for line in uploadedfile])
+            name = filename.rpartition('.')[0] if use_file_names else None
+            yield filename, swc_string, name, annotations
+
+    imported, import_errors = _import_skeleton_files(request.user, project_id,
+            get_files(), source_url, source_project_id, source_type)
+    errors.extend(import_errors)
+
+    return JsonResponse({
+        'imported': imported,
+        'errors': errors,
+    })
+
+
+@api_view(['POST'])
+@requires_user_role(UserRole.Import)
+def import_skeleton_archive(request:HttpRequest, project_id=None) -> Union[HttpResponse, JsonResponse]:
+    """Import all SWC and eSWC files of an uploaded zip or tar archive
+    asynchronously.
+
+    The files of the archive are split into chunks, which are imported in
+    parallel by Celery workers. Each file is imported as a new neuron and
+    skeleton. The progress of each chunk is reported to the user as a
+    "skeleton-import-update" message, and the final result as a
+    "skeleton-import-complete" message. Files that can't be imported are
+    reported without aborting the import of other files. The result of a
+    job can also be queried through skeletons/import-archive/{job_id}.
+
+    Neuron names and annotations can be defined in an optional file
+    "manifest.json" in the archive. It is an object with an optional list of
+    annotations for all skeletons in the field "annotations" and an optional
+    object "files", mapping file names to objects with the optional fields
+    "name" and "annotations".
+    ---
+    consumes: multipart/form-data
+    parameters:
+      - name: annotations
+        description: >
+            An optional list of annotation names that is added to all imported
+            skeletons, in addition to annotations from the manifest.
+        paramType: form
+        type: array
+        items:
+          type: string
+      - name: use_file_names
+        description: >
+            If enabled, the name of each new neuron will be the name of its
+            file without extension, unless the manifest defines a name.
+            Otherwise default names are used.
+        type: boolean
+        required: false
+        defaultValue: true
+        paramType: form
+      - name: source_url
+        description: >
+            If specified, this source URL will be saved and mapped to the new
+            skeleton IDs. This is only valid together with source_project_id.
+        paramType: form
+        type: string
+      - name: source_project_id
+        description: >
+            If specified, this source project ID will be saved and mapped to the
+            new skeleton IDs.
+        paramType: form
+        type: integer
+      - name: source_type
+        description: >
+            Can be either 'skeleton' or 'segmentation', to further specify of
+            what type the origin data is.
+        paramType: form
+        type: string
+      - name: file
+        required: true
+        description: A zip or tar archive of skeleton files to import.
+        paramType: body
+        dataType: File
+    type:
+        job_id:
+            type: string
+            required: true
+            description: ID of the import job.
+        n_files:
+            type: integer
+            required: true
+            description: The number of files that are imported.
+        n_tasks:
+            type: integer
+            required: true
+            description: The number of tasks the import is split into.
+        errors:
+            type: array
+            required: true
+            description: >
+                A list of objects, one for each skeleton file of the archive
+                that can't be imported, with the fields file_name and error.
+    """
+    project_id = int(project_id)
+    annotations = get_request_list(request.POST, 'annotations', [])
+    use_file_names = get_request_bool(request.POST, 'use_file_names', True)
+    source_url = request.POST.get('source_url', None)
+    source_project_id = request.POST.get('source_project_id', None)
+    source_type = request.POST.get('source_type', 'skeleton')
+
+    if len(request.FILES) != 1:
+        return HttpResponseBadRequest('Expected exactly one archive file.')
+
+    archive = next(iter(request.FILES.values()))
+    if archive.size > settings.IMPORTED_SKELETON_ARCHIVE_MAXIMUM_SIZE:
+        return HttpResponse('File too large. Maximum file size is '
+                f'{settings.IMPORTED_SKELETON_ARCHIVE_MAXIMUM_SIZE} bytes.', status=413)
+
+    import_path = os.path.join(settings.MEDIA_ROOT,
+            settings.MEDIA_IMPORT_SUBDIRECTORY)
+    while True:
+        job_id = id_generator(12)
+        job_path = os.path.join(import_path, f'skeleton_import_{job_id}')
+        if not os.path.exists(job_path):
+            break
+    os.makedirs(job_path)
+
+    # Store all skeleton files of the archive in the job folder, so that they
+    # can be read by Celery workers.
+    manifest:Dict[str, Any] = {}
+    files = []
+    errors:List[Dict[str, str]] = []
+    try:
+        for member_name, member_size, read_member in _iter_archive_files(archive):
+            file_name = os.path.basename(member_name)
+            if file_name == 'manifest.json':
+                manifest = json.loads(read_member().decode('utf-8'))
+                if not isinstance(manifest, dict):
+                    raise ValueError('The manifest has to be a JSON object')
+                continue
+            extension = file_name.rpartition('.')[2].lower()
+            if file_name.startswith('.') or extension not in SKELETON_IMPORTERS:
+                continue
+            if member_size > settings.IMPORTED_SKELETON_FILE_MAXIMUM_SIZE:
+                errors.append({
+                    'file_name': file_name,
+                    'error': ('File too large. Maximum file size is '
+                            f'{settings.IMPORTED_SKELETON_FILE_MAXIMUM_SIZE} bytes.'),
+                })
+                continue
+            path = os.path.join(job_path, f'{len(files)}.{extension}')
+            with open(path, 'wb') as f:
+                f.write(read_member())
+            files.append((file_name, path))
+
+        if not files:
+            raise ValueError('No SWC or eSWC files found in archive.')
+    except:
+        shutil.rmtree(job_path)
+        raise
+
+    # Find name and annotations of each imported neuron.
+    file_info = manifest.get('files', {})
+    common_annotations = annotations + manifest.get('annotations', [])
+    entries = []
+    for file_name, path in files:
+        info = file_info.get(file_name, {})
+        name = info.get('name')
+        if name is None and use_file_names:
+            name = file_name.rpartition('.')[0]
+        file_annotations = common_annotations + info.get('annotations', [])
+        entries.append((file_name, path, name, file_annotations or ['Import']))
+
+    files_per_task = settings.IMPORTED_SKELETON_ARCHIVE_FILES_PER_TASK
+    chunks = [entries[i:i + files_per_task]
+            for i in range(0, len(entries), files_per_task)]
+
+    with open(os.path.join(job_path, 'job.json'), 'w') as f:
+        json.dump({
+            'project_id': project_id,
+            'user_id': request.user.id,
+            'n_files': len(entries),
+            'n_tasks': len(chunks),
+            'errors': errors,
+        }, f)
+
+    for chunk_index, chunk in enumerate(chunks):
+        import_skeleton_archive_chunk.delay(project_id, request.user.id, job_id,
+                job_path, chunk_index, len(chunks), chunk, source_url,
+                source_project_id, source_type)
+
+    return JsonResponse({
+        'job_id': job_id,
+        'n_files': len(entries),
+        'n_tasks': len(chunks),
+        'errors': errors,
+    })
+
+
+@api_view(['GET'])
+@requires_user_role(UserRole.Import)
+def import_skeleton_archive_status(request:HttpRequest, project_id=None, job_id=None) -> JsonResponse:
+    """Get the status of an asynchronous skeleton archive import job.
+
+    Only the user who started the import can query its status.
+    ---
+    parameters:
+      - name: project_id
+        description: Project of the import job
+        type: integer
+        paramType: path
+        required: true
+      - name: job_id
+        description: ID of the import job
+        type: string
+        paramType: path
+        required: true
+    type:
+        status:
+            type: string
+            required: true
+            description: Either "running" or "complete".
+        n_files:
+            type: integer
+            required: true
+            description: The number of files that are imported.
+        n_tasks:
+            type: integer
+            required: true
+            description: The number of tasks the import is split into.
+        n_completed_tasks:
+            type: integer
+            required: true
+            description: The number of tasks that are complete.
+        imported:
+            type: array
+            required: true
+            description: >
+                A list of objects, one for each imported file of the completed
+                tasks, with the fields file_name, neuron_id, skeleton_id and
+                n_nodes.
+        errors:
+            type: array
+            required: true
+            description: >
+                A list of objects, one for each file that couldn't be imported,
+                with the fields file_name and error.
+    """
+    if not re.match(r'^[a-z0-9]+$', job_id):
+        raise ValueError('Invalid job ID')
+    job_path = os.path.join(settings.MEDIA_ROOT,
+            settings.MEDIA_IMPORT_SUBDIRECTORY, f'skeleton_import_{job_id}')
+    job = _get_skeleton_import_job(job_path)
+    if job is None or job['project_id'] != int(project_id) or \
+            job['user_id'] != request.user.id:
+        raise ValueError(f'Unknown import job: {job_id}')
+
+    return JsonResponse({
+        'status': 'complete' if job['complete'] else 'running',
+        'n_files': job['n_files'],
+        'n_tasks': job['n_tasks'],
+        'n_completed_tasks': job['n_completed_tasks'],
+        'imported': job['imported'],
+        'errors': job['errors'],
+    })
+
+
+def _iter_archive_files(archive_file) -> Iterator[Tuple[str, int, Callable[[], bytes]]]:
+    """Yield the name, the size and a function returning the content of each
+    regular file in the passed in zip or tar archive.
+    """
+    if zipfile.is_zipfile(archive_file):
+        archive_file.seek(0)
+        with zipfile.ZipFile(archive_file) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, \
+                            lambda info=info: archive.read(info)
+    else:
+        archive_file.seek(0)
+        try:
+            tar = tarfile.open(fileobj=archive_file, mode='r:*')
+        except tarfile.TarError:
+            raise ValueError('Unknown archive format, expected a zip or tar archive')
+        with tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, member.size, \
+                            lambda member=member: tar.extractfile(member).read()
+
+
+def cleanup_skeleton_import_jobs(max_age:int, max_incomplete_age:int) -> int:
+    """Remove the folders of skeleton archive import jobs that are older than
+    max_age, which is specified in seconds. Completed jobs age from the time
+    they completed. Jobs that aren't complete yet might still wait for a
+    worker and are only removed if their last change, e.g. the last finished
+    task, is longer ago than max_incomplete_age seconds. Returns the number of
+    removed jobs.
+    """
+    import_path = os.path.join(settings.MEDIA_ROOT,
+            settings.MEDIA_IMPORT_SUBDIRECTORY)
+    search_pattern = os.path.join(import_path, 'skeleton_import_*')
+    now = time.time()
+    n_removed = 0
+    for job_path in glob.glob(search_pattern):
+        job = _get_skeleton_import_job(job_path)
+        try:
+            if job and job['complete']:
+                complete_path = os.path.join(job_path, 'complete')
+                if os.path.exists(complete_path):
+                    last_change = os.path.getmtime(complete_path)
+                else:
+                    last_change = os.path.getmtime(job_path)
+                job_max_age = max_age
+            else:
+                last_change = os.path.getmtime(job_path)
+                job_max_age = max_incomplete_age
+        except FileNotFoundError:
             continue
-        row = line.strip().split()
-        if len(row) != 7:
-            raise ValueError(f'SWC has a malformed line: {line}')
-
-        node_id = int(row[0])
-        parent_id = int(row[6])
-        g.add_node(node_id, **{
-            'x': float(row[2]),
-            'y': float(row[3]),
-            'z': float(row[4]),
-            'radius': float(row[5])
-        })
+        if (now - last_change) > job_max_age:
+            shutil.rmtree(job_path, ignore_errors=True)
+            n_removed += 1
+    return n_removed
 
-        if parent_id != -1:
-            g.add_edge(parent_id, node_id)
 
-    if not nx.is_directed_acyclic_graph(g):
-        raise ValueError('SWC skeleton is malformed: it contains a cycle.')
+def _get_skeleton_import_job(job_path) -> Optional[Dict[str, Any]]:
+    """Collect the results of all completed tasks of a skeleton archive import
+    job. Returns None if the job doesn't exist.
+    """
+    try:
+        with open(os.path.join(job_path, 'job.json'), 'r') as f:
+            job = json.load(f)
+    except FileNotFoundError:
+        return None
 
-    import_info = _import_skeleton(user, project_id, g, neuron_id, skeleton_id,
+    job['imported'] = []
+    job['n_completed_tasks'] = 0
+    for chunk_index in range(job['n_tasks']):
+        try:
+            with open(os.path.join(job_path, f'result_{chunk_index}.json'), 'r') as f:
+                result = json.load(f)
+        except FileNotFoundError:
+            continue
+        job['n_completed_tasks'] += 1
+        job['imported'].extend(result['imported'])
+        job['errors'].extend(result['errors'])
+    job['complete'] = job['n_completed_tasks'] == job['n_tasks']
+
+    return job
+
+
+@task()
+def import_skeleton_archive_chunk(project_id, user_id, job_id, job_path,
+        chunk_index, n_chunks, entries, source_url=None, source_project_id=None,
+        source_type='skeleton') -> str:
+    """Import a chunk of the skeleton files of an archive import job, each
+    file in its own transaction. The result is stored in the job folder and
+    sent to the user. The task that completes the last chunk of a job sends
+    the overall result.
+    """
+    # The job folder is removed if the job expired before this task ran.
+    if not os.path.exists(job_path):
+        logger.warning(f'Skipping task {chunk_index + 1}/{n_chunks} of '
+                f'expired import job {job_id}')
+        return f'Import job {job_id} expired'
+
+    user = User.objects.get(pk=user_id)
+    imported = []
+    errors = []
+    for file_name, path, name, annotations in entries:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                swc_string = f.read()
+            file_imported, file_errors = _import_skeleton_files(user, project_id,
+                    [(file_name, swc_string, name, annotations)], source_url,
+                    source_project_id, source_type)
+        except Exception as e:
+            logger.exception(f'Could not import file {file_name} of import job {job_id}')
+            file_imported, file_errors = [], [{
+                'file_name': file_name,
+                'error': str(e),
+            }]
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        imported.extend({
+            'file_name': r['file_name'],
+            'neuron_id': r['neuron_id'],
+            'skeleton_id': r['skeleton_id'],
+            'n_nodes': len(r['node_id_map']),
+        } for r in file_imported)
+        errors.extend(file_errors)
+
+    # Write the result atomically, other tasks of this job might read it.
+    result_path = os.path.join(job_path, f'result_{chunk_index}.json')
+    try:
+        with open(result_path + '.tmp', 'w') as f:
+            json.dump({
+                'imported': imported,
+                'errors': errors,
+            }, f)
+        os.replace(result_path + '.tmp', result_path)
+    except FileNotFoundError:
+        logger.warning(f'Import job {job_id} expired while task '
+                f'{chunk_index + 1}/{n_chunks} was running')
+        return f'Imported {len(imported)} of {len(entries)} skeletons in ' \
+                f'task {chunk_index + 1}/{n_chunks} of expired import job {job_id}'
+
+    msg_user(user_id, 'skeleton-import-update', {
+        'job_id': job_id,
+        'task': chunk_index,
+        'n_tasks': n_chunks,
+        'n_imported': len(imported),
+        'errors': errors,
+    })
+
+    # If all chunks are complete, the first task to notice it reports the
+    # overall result.
+    job = _get_skeleton_import_job(job_path)
+    if job and job['complete']:
+        try:
+            with open(os.path.join(job_path, 'complete'), 'x'):
+                pass
+        except FileExistsError:
+            pass
+        else:
+            msg_user(user_id, 'skeleton-import-complete', {
+                'job_id': job_id,
+                'n_files': job['n_files'],
+                'n_imported': len(job['imported']),
+                'errors': job['errors'],
+            })
+
+    return f'Imported {len(imported)} of {len(entries)} skeletons in task ' \
+            f'{chunk_index + 1}/{n_chunks} of import job {job_id}'
+
+
+def parse_swc(swc_string, extended=False) -> Dict[str, np.ndarray]:
+    """Parse an SWC string, or an eSWC string if <extended> is true, into a
+    dictionary of NumPy arrays with one element per node. Besides the regular
+    columns, the field "parent_index" contains the array index of each node's
+    parent or -1 for the root node. A ValueError is raised if the nodes don't
+    form a single tree.
+    """
+    format_name = 'eSWC' if extended else 'SWC'
+    n_columns = 12 if extended else 7
+    rows = [line.split() for line in swc_string.splitlines()
+            if not line.startswith('#') and line.strip()]
+    for row in rows:
+        if len(row) != n_columns:
+            raise ValueError(f'{format_name} has a malformed line ({len(row)} '
+                    f'instead of {n_columns} columns): {" ".join(row)}')
+    if not rows:
+        raise ValueError(f'{format_name} contains no nodes')
+    table = np.array(rows)
+
+    try:
+        node_ids = table[:, 0].astype(np.int64)
+        parent_ids = table[:, 6].astype(np.int64)
+        locations = table[:, 2:6].astype(np.float64)
+        confidence = table[:, 11].astype(np.int64) if extended else None
+    except ValueError as e:
+        raise ValueError(f'{format_name} has a malformed value: {e}')
+
+    parent_index = get_parent_index(node_ids, parent_ids, format_name)
+
+    swc = {
+        'id': node_ids,
+        'parent_id': parent_ids,
+        'parent_index': parent_index,
+        'x': locations[:, 0],
+        'y': locations[:, 1],
+        'z': locations[:, 2],
+        'radius': locations[:, 3],
+    }
+    if extended:
+        swc['creator'] = table[:, 7]
+        swc['creation_time'] = table[:, 8]
+        swc['editor'] = table[:, 9]
+        swc['edition_time'] = table[:, 10]
+        swc['confidence'] = confidence
+
+    return swc
+
+
+def get_parent_index(node_ids, parent_ids, format_name='SWC') -> np.ndarray:
+    """Map the passed in parent IDs to indices into the <node_ids> array, -1
+    for the root node. Raise a ValueError if the nodes don't form a single
+    tree, i.e. if node IDs are not unique, parents are missing, there isn't
+    exactly one root or there are cycles.
+    """
+    n_nodes = len(node_ids)
+    sorted_index = np.argsort(node_ids, kind='stable')
+    sorted_ids = node_ids[sorted_index]
+    if (sorted_ids[1:] == sorted_ids[:-1]).any():
+        raise ValueError(f'{format_name} skeleton is malformed: node IDs are not unique.')
+
+    is_root = parent_ids == -1
+    n_roots = np.count_nonzero(is_root)
+    if n_roots != 1:
+        raise ValueError(f'{format_name} skeleton is malformed: it has {n_roots} '
+                'root nodes instead of one.')
+
+    parent_index = sorted_index[np.minimum(
+            np.searchsorted(sorted_ids, parent_ids), n_nodes - 1)]
+    is_known = (node_ids[parent_index] == parent_ids) | is_root
+    if not is_known.all():
+        raise ValueError(f'{format_name} skeleton is malformed: parent node '
+                f'{parent_ids[~is_known][0]} doesn\'t exist.')
+    parent_index[is_root] = -1
+
+    # With a single root and known parents, the nodes form a tree unless there
+    # is a cycle. By repeatedly replacing each node's ancestor with the
+    # ancestor's ancestor, all nodes reach the root after log2(n) steps, unless
+    # they are part of a cycle.
+    root_index = np.flatnonzero(is_root)[0]
+    ancestor = np.where(is_root, root_index, parent_index)
+    for _ in range(n_nodes.bit_length()):
+        ancestor = ancestor[ancestor]
+    if (ancestor != root_index).any():
+        raise ValueError(f'{format_name} skeleton is malformed: it contains a cycle.')
+
+    return parent_index
+
+
+def _import_skeleton_swc(user, project_id, swc_string, neuron_id=None,
+        skeleton_id=None, name=None, annotations=['Import'], force=False,
+        auto_id=True, source_id=None, source_url=None, source_project_id=None,
+        source_type='skeleton', replace_annotations=False) -> Dict[str, Any]:
+    """Import a neuron modeled by a skeleton in SWC format.
+    """
+    swc = parse_swc(swc_string)
+
+    import_info = _import_skeleton(user, project_id, swc, neuron_id, skeleton_id,
             name, annotations, force, auto_id, source_id, source_url,
             source_project_id, source_type, replace_annotations=replace_annotations)
-    node_id_map = {n: d['id'] for n, d in import_info['graph'].nodes(data=True)}
 
     return {
         'neuron_id': import_info['neuron_id'],
         'skeleton_id': import_info['skeleton_id'],
-        'node_id_map': node_id_map,
+        'node_id_map': dict(zip(swc['id'].tolist(), import_info['node_ids'].tolist())),
     }
 
 
@@ -3152,77 +4014,120 @@ def import_skeleton_swc(user, project_id, swc_string, neuron_id=None,
         source_url, source_project_id, source_type, replace_annotations=replace_annotations))
 
 
-def import_skeleton_eswc(user, project_id, swc_string, neuron_id=None,
+def _import_skeleton_eswc(user, project_id, swc_string, neuron_id=None,
         skeleton_id=None, name=None, annotations=['Import'], force=False,
         auto_id=True, source_id=None, source_url=None, source_project_id=None,
-        source_type='skeleton', replace_annotations=False) -> JsonResponse:
+        source_type='skeleton', replace_annotations=False) -> Dict[str, Any]:
     """Import a neuron modeled by a skeleton in eSWC format.
     """
+    swc = parse_swc(swc_string, extended=True)
 
+    # Map user names to user IDs and create a deactivated user for each
+    # unknown user name.
     user_map = dict(User.objects.all().values_list('username', 'id'))
-
+    usernames, user_index = np.unique(np.concatenate(
+            (swc['creator'], swc['editor'])), return_inverse=True)
+    for username in usernames:
+        if username not in user_map:
+            new_user = User.objects.create(username=str(username), is_active=False)
+            user_map[username] = new_user.id
+    user_ids = np.array([user_map[username] for username in usernames],
+            dtype=np.int64)[user_index]
+    n_nodes = len(swc['id'])
+    swc['user_id'] = user_ids[:n_nodes]
+    swc['editor_id'] = user_ids[n_nodes:]
+
+    # Parse every distinct timestamp only once.
     parse_time = dateutil.parser.parse
-    g = nx.DiGraph()
-    for line in swc_string.splitlines():
-        if line.startswith('#') or not line.strip():
-            continue
-        row = line.strip().split()
-        if len(row) != 12:
-            raise ValueError(f'eSWC has a malformed line ({len(row)} instead of 12 columns): {line}')
-
-        if row[7] not in user_map:
-            # Create deactivated user with this username
-            new_creator = User.objects.create(username=row[7], is_active=False)
-            user_map[row[7]] = new_creator.id
-
-        if row[9] not in user_map:
-            # Create deactivated user with this username
-            new_editor = User.objects.create(username=row[9], is_active=False)
-            user_map[row[9]] = new_editor.id
-
-        node_id = int(row[0])
-        parent_id = int(row[6])
-        g.add_node(node_id, **{
-            'x': float(row[2]),
-            'y': float(row[3]),
-            'z': float(row[4]),
-            'radius': float(row[5]),
-            'user_id': user_map[row[7]],
-            'creation_time': parse_time(row[8]),
-            'editor_id': user_map[row[9]],
-            'edition_time': parse_time(row[10]),
-            'confidence': int(row[11]),
-        })
+    for field in ('creation_time', 'edition_time'):
+        times, time_index = np.unique(swc[field], return_inverse=True)
+        swc[field] = np.array([parse_time(t).isoformat() for t in times])[time_index]
 
-        if parent_id != -1:
-            g.add_edge(parent_id, node_id)
-
-    if not nx.is_directed_acyclic_graph(g):
-        raise ValueError('SWC skeleton is malformed: it contains a cycle.')
-
-    import_info = _import_skeleton(user, project_id, g, neuron_id, skeleton_id,
+    import_info = _import_skeleton(user, project_id, swc, neuron_id, skeleton_id,
             name, annotations, force, auto_id, source_id, source_url,
             source_project_id, source_type, extended_data=True,
             replace_annotations=replace_annotations)
-    node_id_map = {n: d['id'] for n, d in import_info['graph'].nodes(data=True)}
 
-    return JsonResponse({
+    return {
         'neuron_id': import_info['neuron_id'],
         'skeleton_id': import_info['skeleton_id'],
-        'node_id_map': node_id_map,
-    })
+        'node_id_map': dict(zip(swc['id'].tolist(), import_info['node_ids'].tolist())),
+    }
 
 
-def _import_skeleton(user, project_id, arborescence, neuron_id=None,
+def import_skeleton_eswc(user, project_id, swc_string, neuron_id=None,
+        skeleton_id=None, name=None, annotations=['Import'], force=False,
+        auto_id=True, source_id=None, source_url=None, source_project_id=None,
+        source_type='skeleton', replace_annotations=False) -> JsonResponse:
+    """Import a neuron modeled by a skeleton in eSWC format.
+    """
+    return JsonResponse(_import_skeleton_eswc(user, project_id, swc_string,
+        neuron_id, skeleton_id, name, annotations, force, auto_id, source_id,
+        source_url, source_project_id, source_type, replace_annotations=replace_annotations))
+
+
+SKELETON_IMPORTERS = {
+    'swc': _import_skeleton_swc,
+    'eswc': _import_skeleton_eswc,
+}
+
+
+def _import_skeleton_files(user, project_id, files, source_url=None,
+        source_project_id=None, source_type='skeleton') -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    """Import each (file name, file content, neuron name, annotations) tuple of
+    <files> as a new neuron and skeleton. The extension of the file name
+    selects the file format. Each file is imported in its own savepoint, so
+    that a failed import doesn't affect the others. Returns a list of import
+    results and a list of errors for files that couldn't be imported.
+    """
+    imported = []
+    errors = []
+    for file_name, swc_string, name, annotations in files:
+        extension = file_name.rpartition('.')[2].strip().lower()
+        importer = SKELETON_IMPORTERS.get(extension)
+        if not importer:
+            errors.append({
+                'file_name': file_name,
+                'error': (f'File type "{extension}" not understood. Known file '
+                        f'types: {", ".join(SKELETON_IMPORTERS.keys())}'),
+            })
+            continue
+
+        try:
+            with transaction.atomic():
+                # Label the transaction, which Celery tasks don't do otherwise.
+                # Import info relies on this label.
+                add_log_entry(user.id, "skeletons.import", project_id)
+                result = importer(user, project_id, swc_string, name=name,
+                        annotations=annotations, source_url=source_url,
+                        source_project_id=source_project_id,
+                        source_type=source_type)
+        except (ValueError, PermissionError) as e:
+            errors.append({
+                'file_name': file_name,
+                'error': str(e),
+            })
+            continue
+
+        result['file_name'] = file_name
+        imported.append(result)
+
+    return imported, errors
+
+
+def _import_skeleton(user, project_id, swc, neuron_id=None,
         skeleton_id=None, name=None, annotations=['Import'], force=False,
         auto_id=True, source_id=None, source_url=None, source_project_id=None,
         source_type='skeleton', extended_data=False, map_available_users=True,
         replace_annotations=False) -> Dict[str, Any]:
-    """Create a skeleton from a networkx directed tree.
+    """Create a skeleton from a dictionary of node arrays as returned by
+    parse_swc(). If <extended_data> is true, the arrays "user_id",
+    "creation_time", "editor_id", "edition_time" and "confidence" are
+    imported as well.
 
     Associate the skeleton to the specified neuron, or a new one if none is
-    provided. Returns a dictionary of the neuron and skeleton IDs, and the
-    original arborescence with attributes added for treenode IDs.
+    provided. Returns a dictionary of the neuron and skeleton IDs, and an
+    array of the new treenode IDs in the order of the passed in nodes.
     """
     # TODO: There is significant reuse here of code from create_treenode that
     # could be DRYed up.
@@ -3412,94 +4317,52 @@ def _import_skeleton(user, project_id, arborescence, neuron_id=None,
         annotation_map = {a:{'user_id': user.id} for a in annotations}
         _annotate_entities(project_id, [new_neuron.id], annotation_map)
 
-    # For pathological networks this can error, so do it before inserting
-    # treenodes.
-    root = find_root(arborescence)
-    if root is None:
+    parent_index = swc['parent_index']
+    root_index = np.flatnonzero(parent_index == -1)
+    if len(root_index) != 1:
         raise ValueError('No root, provided graph is malformed!')
+    root_index = root_index[0]
+    new_location = tuple(float(swc[k][root_index]) for k in ('x', 'y', 'z'))
 
-    # Bulk create the required number of treenodes. This must be done in two
-    # steps because treenode IDs are not known.
+    # Reserve IDs for all new treenodes with a single query, which allows to
+    # insert them with their final parent IDs right away.
+    n_nodes = len(parent_index)
     cursor = connection.cursor()
     cursor.execute("""
-        INSERT INTO treenode (project_id, location_x, location_y, location_z,
-            editor_id, user_id, skeleton_id)
-        SELECT t.project_id, t.x, t.x, t.x, t.user_id, t.user_id, t.skeleton_id
-        FROM (VALUES (%(project_id)s, 0, %(user_id)s, %(skeleton_id)s))
-            AS t (project_id, x, user_id, skeleton_id),
-            generate_series(1, %(num_treenodes)s)
-        RETURNING treenode.id
+        SELECT nextval('location_id_seq')
+        FROM generate_series(1, %(n_nodes)s)
     """, {
-        'project_id': int(project_id),
-        'user_id': user.id,
-        'skeleton_id': new_skeleton.id,
-        'num_treenodes': arborescence.number_of_nodes()
+        'n_nodes': n_nodes,
     })
-    treenode_ids = cursor.fetchall()
-    # Flatten IDs
-    treenode_ids = list(chain.from_iterable(treenode_ids))
-    nx.set_node_attributes(arborescence, name='id', values=dict(zip(arborescence.nodes(), treenode_ids)))
-
-    # Set parent node ID
-    for n, nbrs in arborescence.adjacency():
-        for nbr in nbrs:
-            # FIXME: the cast here and below in the SQL (::bigint) shouldn't be
-            # needed
-            arborescence.nodes[nbr]['parent_id'] = int(arborescence.nodes[n]['id'])
-            if 'radius' not in arborescence.nodes[nbr]:
-                arborescence.nodes[nbr]['radius'] = -1
-    arborescence.nodes[root]['parent_id'] = None
-    if 'radius' not in arborescence.nodes[root]:
-        arborescence.nodes[root]['radius'] = -1
-    new_location = tuple([arborescence.nodes[root][k] for k in ('x', 'y', 'z')])
-
+    treenode_ids = np.fromiter((row[0] for row in cursor.fetchall()),
+            dtype=np.int64, count=n_nodes)
+    parent_ids = treenode_ids[parent_index].astype(object)
+    parent_ids[root_index] = '\\N'
+
+    # Insert all treenodes using COPY, which is much faster than regular
+    # inserts for large skeletons. Treenode triggers run once for all nodes.
+    columns = ['id', 'location_x', 'location_y', 'location_z', 'parent_id',
+            'radius']
+    values = [treenode_ids, swc['x'], swc['y'], swc['z'], parent_ids,
+            swc['radius']]
     if extended_data:
-        treenode_template = '(' + '),('.join(
-            '%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s' for _ in arborescence.nodes
-        ) + ')'
-        treenode_values = list(chain.from_iterable(
-            [
-                d['id'], d['x'], d['y'], d['z'],
-                d['parent_id'], d['radius'], d['user_id'],
-                d['creation_time'], d['editor_id'],
-                d['edition_time'], d['confidence']
-            ] for n, d in arborescence.nodes(data=True)
-        ))
-        # Include skeleton ID for index performance.
-        cursor.execute(f"""
-            UPDATE treenode SET
-                location_x = v.x,
-                location_y = v.y,
-                location_z = v.z,
-                parent_id = v.parent_id::bigint,
-                radius = v.radius,
-                user_id = v.user_id,
-                creation_time = v.creation_time,
-                editor_id = v.editor_id,
-                edition_time = v.edition_time,
-                confidence = v.confidence
-            FROM (VALUES {treenode_template}) AS v(id, x, y, z, parent_id,
-                radius, user_id, creation_time, editor_id, edition_time,
-                confidence)
-            WHERE treenode.id = v.id
-                AND treenode.skeleton_id = %s
-        """, treenode_values + [new_skeleton.id])
+        columns.extend(['user_id', 'creation_time', 'editor_id',
+                'edition_time', 'confidence'])
+        values.extend([swc['user_id'], swc['creation_time'], swc['editor_id'],
+                swc['edition_time'], swc['confidence']])
+        constant_columns = ['project_id', 'skeleton_id']
+        constant_values = [project_id, new_skeleton.id]
     else:
-        treenode_template = '(' + '),('.join('%s,%s,%s,%s,%s,%s' for _ in arborescence.nodes) + ')'
-        treenode_values = list(chain.from_iterable([d['id'], d['x'], d['y'], d['z'], d['parent_id'], d['radius']] \
-                for n, d in arborescence.nodes(data=True)))
-        # Include skeleton ID for index performance.
-        cursor.execute(f"""
-            UPDATE treenode SET
-                location_x = v.x,
-                location_y = v.y,
-                location_z = v.z,
-                parent_id = v.parent_id,
-                radius = v.radius
-            FROM (VALUES {treenode_template}) AS v(id, x, y, z, parent_id, radius)
-            WHERE treenode.id = v.id
-                AND treenode.skeleton_id = %s
-        """, treenode_values + [new_skeleton.id])
+        constant_columns = ['project_id', 'skeleton_id', 'user_id', 'editor_id']
+        constant_values = [project_id, new_skeleton.id, user.id, user.id]
+
+    row_suffix = ''.join(f'\t{v}' for v in constant_values)
+    treenode_data = StringIO(''.join(
+        '\t'.join(map(str, row)) + row_suffix + '\n'
+        for row in zip(*(v.tolist() for v in values))))
+    cursor.copy_expert(sql.SQL("COPY treenode ({}) FROM STDIN").format(
+            sql.SQL(', ').join(map(sql.Identifier, columns + constant_columns))),
+            treenode_data)
 
     # Log import.
     annotation_info = f' {", ".join(annotations)}' if annotations else ''
@@ -3527,7 +4390,7 @@ def _import_skeleton(user, project_id, arborescence, neuron_id=None,
     return {
         'neuron_id': neuron_id,
         'skeleton_id': new_skeleton.id,
-        'graph': arborescence,
+        'node_ids': treenode_ids,
         'has_new_neuron_id': has_new_neuron_id,
         'has_new_skeleton_id': has_new_skeleton_id,
     }
@@ -3826,7 +4689,16 @@ def _list_skeletons(project_id, created_by=None, reviewed_by=None, from_date=Non
         'project_id': project_id,
     }
 
-    if reviewed_by:
+    if reviewed_by and not (from_date or to_date):
+        # Without time constraints, the reviewer summary is enough.
+        params['reviewed_by'] = reviewed_by
+        query = '''
+            SELECT srs.skeleton_id
+            FROM catmaid_skeleton_reviewer_summary srs
+            WHERE srs.project_id=%(project_id)s
+            AND srs.reviewer_id=%(reviewed_by)s
+        '''
+    elif reviewed_by:
         params['reviewed_by'] = reviewed_by
         query = '''
             SELECT DISTINCT r.skeleton_id
@@ -4020,36 +4892,132 @@ def skeletons_by_node_labels(request:HttpRequest, project_id=None) -> JsonRespon
     if not label_ids and not label_names:
         return JsonResponse([], safe=False)
 
-    label_class = Class.objects.get(project=project_id, class_name='label')
-    labeled_as_relation = Relation.objects.get(project=project_id, relation_name='labeled_as')
-
     if label_names:
+        label_class = Class.objects.get(project=project_id, class_name='label')
         extra_label_ids = ClassInstance.objects.filter(project_id=project_id,
                 class_column=label_class, name__in=label_names).values_list('id', flat=True)
         label_ids.extend(extra_label_ids)
 
+    # Skeleton label membership is maintained by the database.
     cursor = connection.cursor()
     cursor.execute("""
-        SELECT ci.id, array_agg(DISTINCT t.skeleton_id)
-          FROM treenode t
-          JOIN treenode_class_instance tci
-            ON t.id = tci.treenode_id
-          JOIN class_instance ci
-            ON tci.class_instance_id = ci.id
-          JOIN UNNEST(%(label_ids)s::bigint[]) label(id)
-            ON label.id = ci.id
-          WHERE ci.project_id = %(project_id)s
-            AND tci.relation_id = %(labeled_as)s
-          GROUP BY ci.id;
+        SELECT sl.label_id, array_agg(sl.skeleton_id ORDER BY sl.skeleton_id)
+          FROM catmaid_skeleton_label sl
+          JOIN (
+            SELECT DISTINCT label.id
+            FROM UNNEST(%(label_ids)s::bigint[]) label(id)
+          ) label
+            ON label.id = sl.label_id
+          WHERE sl.project_id = %(project_id)s
+          GROUP BY sl.label_id
+          ORDER BY sl.label_id;
     """, {
         'label_ids': label_ids,
         'project_id': int(project_id),
-        'labeled_as': labeled_as_relation.id
     })
 
     return JsonResponse(cursor.fetchall(), safe=False)
 
 
+# The blocks surrounding the interior footprint blocks of a bounding box
+# query. Each entry defines the minimum and maximum corner of a slab, using the
+# bounds of the outer query box and the inner box made of complete blocks.
+FOOTPRINT_SHELL_SLABS = (
+    (('outer_min', 'outer_min', 'outer_min'), ('inner_min', 'outer_max', 'outer_max')),
+    (('inner_max', 'outer_min', 'outer_min'), ('outer_max', 'outer_max', 'outer_max')),
+    (('inner_min', 'outer_min', 'outer_min'), ('inner_max', 'inner_min', 'outer_max')),
+    (('inner_min', 'inner_max', 'outer_min'), ('inner_max', 'outer_max', 'outer_max')),
+    (('inner_min', 'inner_min', 'outer_min'), ('inner_max', 'inner_max', 'inner_min')),
+    (('inner_min', 'inner_min', 'inner_max'), ('inner_max', 'inner_max', 'outer_max')),
+)
+
+
+def get_interior_footprint_blocks(cursor, params) -> Optional[Tuple[List[int], List[int], float]]:
+    """Get the lowest and highest X, Y and Z index of all skeleton footprint
+    blocks that are completely contained in the bounding box defined in
+    <params>, along with the block size. If no block is contained completely,
+    None is returned.
+    """
+    cursor.execute("SELECT skeleton_footprint_block_size()")
+    block_size = cursor.fetchone()[0]
+
+    block_min, block_max = [], []
+    for dim in ('x', 'y', 'z'):
+        dim_min = math.floor(params['min' + dim] / block_size) + 1
+        dim_max = math.ceil(params['max' + dim] / block_size) - 2
+        if dim_min > dim_max:
+            return None
+        block_min.append(dim_min)
+        block_max.append(dim_max)
+
+    return block_min, block_max, block_size
+
+
+def get_skeleton_footprint_query(provider, params, block_min, block_max,
+        block_size) -> str:
+    """Get a query for all skeletons that intersect with the bounding box
+    defined in <params>. Skeletons with nodes in footprint blocks that are
+    completely inside the bounding box are found without looking at nodes.
+    Only edges in the remaining shell of the bounding box are tested
+    individually. Parameters used by the query are added to <params>.
+    """
+    if provider == 'postgis2d':
+        edge_filter = """
+            floatrange(ST_ZMin(te.edge), ST_ZMax(te.edge), '[]') &&
+                floatrange(%(minz)s, %(maxz)s, '[)')
+            AND te.edge && ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s)
+        """
+    elif provider == 'postgis3d':
+        edge_filter = """
+            te.edge &&& ST_MakeLine(ARRAY[
+                ST_MakePoint(%(minx)s, %(maxy)s, %(maxz)s),
+                ST_MakePoint(%(maxx)s, %(miny)s, %(minz)s)] ::geometry[])
+        """
+    else:
+        raise ValueError('Need valid node provider (src)')
+
+    # Edges within the query distance of the bounding box can extend beyond
+    # it in X and Y.
+    for i, dim in enumerate(('x', 'y', 'z')):
+        extent = params['halfzdiff'] if dim != 'z' else 0
+        params['block_min_' + dim] = block_min[i]
+        params['block_max_' + dim] = block_max[i]
+        params['outer_min_' + dim] = params['min' + dim] - extent
+        params['outer_max_' + dim] = params['max' + dim] + extent
+        params['inner_min_' + dim] = block_min[i] * block_size
+        params['inner_max_' + dim] = (block_max[i] + 1) * block_size
+
+    corner = 'ST_MakePoint(%({}_x)s, %({}_y)s, %({}_z)s)'
+    shell = '\n                OR '.join(
+        'te.edge &&& ST_MakeLine(ARRAY[{}, {}]::geometry[])'.format(
+            corner.format(*slab_min), corner.format(*slab_max))
+        for slab_min, slab_max in FOOTPRINT_SHELL_SLABS)
+
+    return """
+        SELECT sf.skeleton_id
+        FROM catmaid_skeleton_footprint sf
+        WHERE sf.project_id = %(project_id)s
+            AND sf.block_z BETWEEN %(block_min_z)s AND %(block_max_z)s
+            AND sf.block_y BETWEEN %(block_min_y)s AND %(block_max_y)s
+            AND sf.block_x BETWEEN %(block_min_x)s AND %(block_max_x)s
+        UNION
+        SELECT t.skeleton_id
+        FROM treenode_edge te
+        JOIN treenode t
+            ON t.id = te.id
+        WHERE te.project_id = %(project_id)s
+            AND ({shell})
+            AND {edge_filter}
+            AND ST_3DDWithin(te.edge, ST_MakePolygon(ST_MakeLine(ARRAY[
+                ST_MakePoint(%(minx)s, %(miny)s, %(halfz)s),
+                ST_MakePoint(%(maxx)s, %(miny)s, %(halfz)s),
+                ST_MakePoint(%(maxx)s, %(maxy)s, %(halfz)s),
+                ST_MakePoint(%(minx)s, %(maxy)s, %(halfz)s),
+                ST_MakePoint(%(minx)s, %(miny)s, %(halfz)s)]::geometry[])),
+                %(halfzdiff)s)
+    """.format(shell=shell, edge_filter=edge_filter)
+
+
 def get_skeletons_in_bb(params) -> List:
     cursor = connection.cursor()
     extra_joins = []
@@ -4084,7 +5052,11 @@ def get_skeletons_in_bb(params) -> List:
                 ON query_skeleton.id = skeleton.id
         """)
 
-    if provider == 'postgis2d':
+    interior_blocks = get_interior_footprint_blocks(cursor, params)
+    if interior_blocks:
+        node_query = get_skeleton_footprint_query(provider, params,
+                *interior_blocks)
+    elif provider == 'postgis2d':
         node_query = """
             SELECT DISTINCT t.skeleton_id
             FROM (
@@ -4279,6 +5251,11 @@ def skeletons_in_bounding_box(request:HttpRequest, project_id) -> JsonResponse:
     return JsonResponse(skeleton_ids, safe=False)
 
 
+# The number of changed treenodes that are processed per query when the change
+# history of skeletons is computed.
+CHANGE_HISTORY_BATCH_SIZE = 50000
+
+
 @api_view(['GET'])
 @requires_user_role([UserRole.Browse])
 def change_history(request:HttpRequest, project_id=None) -> JsonResponse:
@@ -4329,138 +5306,175 @@ def change_history(request:HttpRequest, project_id=None) -> JsonResponse:
     changes_before = request.GET.get('changes_before')
     skeleton_ids = get_request_list(request.GET, 'skeleton_ids', map_fn=int)
 
+    result = get_skeleton_change_history(project_id, initial_user_id,
+            changes_after, changes_before, skeleton_ids)
+
+    return JsonResponse(result, safe=False)
+
+
+def get_skeleton_change_history(project_id, initial_user_id=None,
+        changes_after=None, changes_before=None, skeleton_ids=None,
+        batch_size=CHANGE_HISTORY_BATCH_SIZE) -> List:
+    """Return the skeleton ID paths of all treenodes that match the passed in
+    constraints, along with the number of treenodes that share each path. The
+    treenode history is processed in batches of <batch_size> treenodes, which
+    are selected in ID order, each batch continuing after the last treenode of
+    the previous one. Only the per-path aggregates are kept in memory.
+    """
     init_constraints = ['project_id = %(project_id)s']
-    constraints = ['project_id = %(project_id)s']
 
     if initial_user_id is not None:
-        init_constraints.append("cti.user_id = %(initial_user_id)s")
+        init_constraints.append("user_id = %(initial_user_id)s")
 
+    # Constraining the edition time allows the use of the BRIN indices on the
+    # edition time of both the live and the history table.
     if changes_after:
         init_constraints.append("edition_time > %(changes_after)s")
-        constraints.append("execution_time > %(changes_after)s")
 
     if changes_before:
-        init_constraints.append("execution_time > %(changes_before)s")
-        constraints.append("execution_time > %(changes_before)s")
+        init_constraints.append("edition_time < %(changes_before)s")
 
     if skeleton_ids:
-        init_constraints.append('skeleton_id = ANY(ARRAY[%(skeleton_ids)s])')
-
-    if not init_constraints:
-        raise ValueError("Please provide at least one constraint")
-
-    # 1. Get all relevant initial transactions
-    # 2. Find treenode IDs modified by those transactions
-    # 3. Get all history and live table entries for those treenodes, ordered by
-    #    transaction execution time, oldest last. History entries come first, live
-    #    entries are last.
-    # 4. Collect all referenced skeleton IDs from ordered treenodes. This results in
-    #    a skeleton ID path for each treenode. To reduce this to distinct paths, a
-    #    textual representation is done for each (id:id:id…) and only distinct values
-    #    are selected. This should allow then to get fragment skeleton ID changes
-    #    through merges and splits.
-    cursor = connection.cursor()
-    cursor.execute("""
-        WITH skeleton_class AS (
-                SELECT id as class_id
-                FROM class
-                WHERE project_id = %(project_id)s
-                    AND class_name = 'skeleton'
-        ),
-        changed_treenodes AS (
-                SELECT t.id, t.skeleton_id, MIN(edition_time) as edition_time,
-                    bool_or(is_live) AS is_live
-                FROM (
-                        /* Deleted skeletons from history */
-                        SELECT th.id as id, th.skeleton_id as skeleton_id,
-                            MIN(th.edition_time) AS edition_time, False AS is_live
-                        FROM treenode__history th
-                        {init_constraints}
-                        GROUP By th.id, th.skeleton_id
-
-                        UNION ALL
-
-                        /* Current skeletons: */
-                        select t.id as id, t.skeleton_id as skeleton_id,
-                            MIN(t.edition_time) AS edition_time, True AS is_live
-                        FROM treenode t
-                        {init_constraints}
-                        GROUP By t.id, t.skeleton_id
-                ) t
-                GROUP BY id, t.skeleton_id
-        ),
-        /* Get all versions of all treenodes that where ever part of the query
-         * skeletons. Sort them by a "pos" number with the following pattern:
-         * -1: oldest versions of treenodes, 0: historic versions of treenodes
-         * that are newer than the oldest versions, 1: present versions of
-         * treenodes that are newer than the oldest versions. */
-        all_changed_skeletons AS (
-          SELECT id, skeleton_id, MAX(pos) AS pos, MIN(edition_time) AS edition_time,
-            bool_or(is_live) AS is_live
-          FROM (
-                /* Part 1/3 - pos column -1: all oldest treenodes of the query
-                 * skeletons, both in terms of live tables and history tables. */
-                SELECT ct.id, ct.skeleton_id, -1 as pos, ct.edition_time, ct.is_live
-                FROM changed_treenodes ct
-                /* Part 2/3 - pos column 0: all historic treenodes that are
-                 * newer than the oldest version of them. */
-                UNION
-                SELECT th.id as treenode_id, th.skeleton_id, 0 as pos, th.edition_time, False AS is_live
-                FROM changed_treenodes ct
-                JOIN treenode__history th
-                        ON th.id = ct.id
-                WHERE th.edition_time > ct.edition_time
-                OR th.skeleton_id <> ct.skeleton_id
-                /* Part 3/3 - pos column 1: all present treenodes that are newer
-                 * than the oldest version of them. */
-                UNION
-                SELECT t.id, t.skeleton_id, 1 as pos, t.edition_time, True AS is_live
-                FROM changed_treenodes ct
-                JOIN treenode t
-                        ON t.id = ct.id
-                WHERE t.edition_time > ct.edition_time
-                OR t.skeleton_id <> ct.skeleton_id
-          ) sub
-          GROUP BY id, skeleton_id
-        ),
-        agg_skeletons AS (
-                SELECT string_agg(skeleton_id::text, ':' ORDER BY pos ASC, edition_time ASC) as key,
-                    array_agg(skeleton_id ORDER BY pos ASC, edition_time ASC) AS skeleton_ids,
-                    array_agg(edition_time ORDER BY pos ASC, edition_time ASC) AS edition_times,
-                    max(pos) as present, bool_or(is_live) AS is_live
-                FROM all_changed_skeletons
-                GROUP BY id
-        )
-        /*
-        ,agg_treenodes AS (
-                SELECT key, skeleton_ids[1]::text || '-' || skeleton_ids[array_length(skeleton_ids, 1)]::text as begin_end, count(*) as c, skeleton_ids, max(present) as present
-                FROM agg_skeletons
-                GROUP BY key, skeleton_ids
-                ORDER BY key
-        )
-        */
-        SELECT skeleton_ids, count(*), max(present), sum(CASE WHEN is_live THEN 1 ELSE 0 END)::bigint AS is_live
-        FROM agg_skeletons
-        GROUP BY key, skeleton_ids
-        ORDER BY skeleton_ids[0], count(*) DESC;
-        /*
-        SELECT begin_end, SUM(c), max(present) from agg_treenodes
-        GROUP BY begin_end, skeleton_ids[1], skeleton_ids[array_length(skeleton_ids, 1)]
-        ORDER by skeleton_ids[1], sum(c) desc;
-        */
-    """.format(**{
-        'init_constraints': ('WHERE ' if init_constraints else '') + ' AND '.join(init_constraints),
-        'constraints': ('WHERE ' if constraints else '') + ' AND '.join(constraints),
-    }), {
+        init_constraints.append('skeleton_id = ANY(%(skeleton_ids)s::bigint[])')
+
+    params = {
         'project_id': project_id,
         'initial_user_id': initial_user_id,
         'changes_after': changes_after,
         'changes_before': changes_before,
         'skeleton_ids': skeleton_ids,
-    })
+        'batch_size': batch_size,
+    }
 
-    result = cursor.fetchall()
-    return JsonResponse(result, safe=False)
+    # Each path maps to its treenode count, the maximum "present" value and
+    # the number of live treenodes.
+    paths:Dict[Tuple, List[int]] = {}
+    cursor = connection.cursor()
+    after_id = -1
+    while True:
+        # 1. Get the next batch of treenodes that were changed by the relevant
+        #    initial transactions.
+        cursor.execute("""
+            SELECT id
+            FROM (
+                (SELECT th.id
+                FROM treenode__history th
+                WHERE {init_constraints}
+                ORDER BY th.id
+                LIMIT %(batch_size)s)
+                UNION
+                (SELECT t.id
+                FROM treenode t
+                WHERE {init_constraints}
+                ORDER BY t.id
+                LIMIT %(batch_size)s)
+            ) changed
+            ORDER BY id
+            LIMIT %(batch_size)s
+        """.format(**{
+            'init_constraints': ' AND '.join(init_constraints + ['id > %(after_id)s']),
+        }), dict(params, after_id=after_id))
+        treenode_ids = [row[0] for row in cursor.fetchall()]
+        if not treenode_ids:
+            break
+        after_id = treenode_ids[-1]
+
+        # 2. Get all history and live table entries for those treenodes,
+        #    ordered by transaction execution time, oldest last. History
+        #    entries come first, live entries are last.
+        # 3. Collect all referenced skeleton IDs from ordered treenodes. This
+        #    results in a skeleton ID path for each treenode. To reduce this to
+        #    distinct paths, a textual representation is done for each
+        #    (id:id:id…) and only distinct values are selected. This should
+        #    allow then to get fragment skeleton ID changes through merges and
+        #    splits.
+        cursor.execute("""
+            WITH changed_treenodes AS (
+                    SELECT t.id, t.skeleton_id, MIN(edition_time) as edition_time,
+                        bool_or(is_live) AS is_live
+                    FROM (
+                            /* Deleted skeletons from history */
+                            SELECT th.id as id, th.skeleton_id as skeleton_id,
+                                MIN(th.edition_time) AS edition_time, False AS is_live
+                            FROM treenode__history th
+                            {init_constraints}
+                            GROUP By th.id, th.skeleton_id
+
+                            UNION ALL
+
+                            /* Current skeletons: */
+                            select t.id as id, t.skeleton_id as skeleton_id,
+                                MIN(t.edition_time) AS edition_time, True AS is_live
+                            FROM treenode t
+                            {init_constraints}
+                            GROUP By t.id, t.skeleton_id
+                    ) t
+                    GROUP BY id, t.skeleton_id
+            ),
+            /* Get all versions of all treenodes that where ever part of the query
+             * skeletons. Sort them by a "pos" number with the following pattern:
+             * -1: oldest versions of treenodes, 0: historic versions of treenodes
+             * that are newer than the oldest versions, 1: present versions of
+             * treenodes that are newer than the oldest versions. */
+            all_changed_skeletons AS (
+              SELECT id, skeleton_id, MAX(pos) AS pos, MIN(edition_time) AS edition_time,
+                bool_or(is_live) AS is_live
+              FROM (
+                    /* Part 1/3 - pos column -1: all oldest treenodes of the query
+                     * skeletons, both in terms of live tables and history tables. */
+                    SELECT ct.id, ct.skeleton_id, -1 as pos, ct.edition_time, ct.is_live
+                    FROM changed_treenodes ct
+                    /* Part 2/3 - pos column 0: all historic treenodes that are
+                     * newer than the oldest version of them. */
+                    UNION
+                    SELECT th.id as treenode_id, th.skeleton_id, 0 as pos, th.edition_time, False AS is_live
+                    FROM changed_treenodes ct
+                    JOIN treenode__history th
+                            ON th.id = ct.id
+                    WHERE th.edition_time > ct.edition_time
+                    OR th.skeleton_id <> ct.skeleton_id
+                    /* Part 3/3 - pos column 1: all present treenodes that are newer
+                     * than the oldest version of them. */
+                    UNION
+                    SELECT t.id, t.skeleton_id, 1 as pos, t.edition_time, True AS is_live
+                    FROM changed_treenodes ct
+                    JOIN treenode t
+                            ON t.id = ct.id
+                    WHERE t.edition_time > ct.edition_time
+                    OR t.skeleton_id <> ct.skeleton_id
+              ) sub
+              GROUP BY id, skeleton_id
+            ),
+            agg_skeletons AS (
+                    SELECT string_agg(skeleton_id::text, ':' ORDER BY pos ASC, edition_time ASC) as key,
+                        array_agg(skeleton_id ORDER BY pos ASC, edition_time ASC) AS skeleton_ids,
+                        array_agg(edition_time ORDER BY pos ASC, edition_time ASC) AS edition_times,
+                        max(pos) as present, bool_or(is_live) AS is_live
+                    FROM all_changed_skeletons
+                    GROUP BY id
+            )
+            SELECT skeleton_ids, count(*), max(present), sum(CASE WHEN is_live THEN 1 ELSE 0 END)::bigint AS is_live
+            FROM agg_skeletons
+            GROUP BY key, skeleton_ids
+        """.format(**{
+            'init_constraints': 'WHERE ' + ' AND '.join(init_constraints +
+                    ['id = ANY(%(treenode_ids)s::bigint[])']),
+        }), dict(params, treenode_ids=treenode_ids))
+
+        for path, count, present, n_live in cursor.fetchall():
+            path_info = paths.get(tuple(path))
+            if path_info:
+                path_info[0] += count
+                path_info[1] = max(path_info[1], present)
+                path_info[2] += n_live
+            else:
+                paths[tuple(path)] = [count, present, n_live]
+
+    result = [[list(path), count, present, n_live]
+            for path, (count, present, n_live) in paths.items()]
+    result.sort(key=lambda r: (r[0][0], -r[1]))
+
+    return result
 
 
 @api_view(['GET', 'POST'])
@@ -4573,7 +5587,7 @@ def import_info(request:HttpRequest, project_id=None) -> JsonResponse:
 
 @api_view(['GET', 'POST'])
 @requires_user_role([UserRole.Browse])
-def completeness(request:HttpRequest, project_id) -> JsonResponse:
+def completeness(request:HttpRequest, project_id) -> Union[JsonResponse, StreamingHttpResponse]:
     """Obtain completeness information for a set of skeleton IDs.
     ---
     paramaters:
@@ -4619,6 +5633,15 @@ def completeness(request:HttpRequest, project_id) -> JsonResponse:
         paramType: form
         default: true
         required: false
+      - name: format
+        description: |
+            Either "json" (default) for a single list of results or "ndjson"
+            to stream one result per line as newline delimited JSON, computed
+            in batches of skeletons.
+        type: string
+        paramType: form
+        default: json
+        required: false
     """
     if request.method == 'GET':
         data = request.GET
@@ -4635,15 +5658,40 @@ def completeness(request:HttpRequest, project_id) -> JsonResponse:
     min_nodes = max(0, int(data.get('min_nodes', 500)))
     min_cable = max(0.0, float(data.get('min_cable', 0)))
     ignore_fragments = get_request_bool(data, 'ignore_fragments', True)
+    response_format = data.get('format', 'json')
+    jobs = settings.SKELETON_DETAIL_SUMMARY_UPDATE_JOBS
+
+    if response_format == 'ndjson':
+        lines = (json.dumps(row) + '\n' for row in stream_completeness_data(
+                project_id, skeleton_ids, open_ends_percent, min_nodes,
+                min_cable, ignore_fragments, jobs=jobs))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    elif response_format != 'json':
+        raise ValueError(f'Unknown format: {response_format}')
 
     completeness = get_completeness_data(project_id, skeleton_ids,
-            open_ends_percent, min_nodes, min_cable, ignore_fragments)
+            open_ends_percent, min_nodes, min_cable, ignore_fragments,
+            jobs=jobs)
 
     return JsonResponse(completeness, safe=False)
 
 
+def stream_completeness_data(project_id, skeleton_ids, open_ends_percent=0.03,
+        min_nodes=500, min_cable=0, ignore_fragments=True, include_data=False,
+        batch_size=COMPLETENESS_STREAM_BATCH_SIZE, jobs:int=1) -> Iterator[Tuple]:
+    """Yield the completeness information of all passed in skeletons, computed
+    in batches of <batch_size> skeletons. See get_completeness_data().
+    """
+    skeleton_ids = list(dict.fromkeys(skeleton_ids))
+    for i in range(0, len(skeleton_ids), batch_size):
+        yield from get_completeness_data(project_id,
+                skeleton_ids[i:i + batch_size], open_ends_percent, min_nodes,
+                min_cable, ignore_fragments, include_data, jobs=jobs)
+
+
 def get_completeness_data(project_id, skeleton_ids, open_ends_percent=0.03,
-        min_nodes=500, min_cable=0, ignore_fragments=True, include_data=False):
+        min_nodes=500, min_cable=0, ignore_fragments=True, include_data=False,
+        jobs:int=1):
     """Obtain completeness information for a set of skeleton IDs. Returns a two
     element list containing the input skeleton ID and a boolean, indicating
     whether the skeleton can be considered complete.If <include_data> is True,
@@ -4653,13 +5701,15 @@ def get_completeness_data(project_id, skeleton_ids, open_ends_percent=0.03,
     The <open_ends_percent> is a value in range [0,1] and represents the ratio
     of open leaf nodes versus total leaf nodes. As leaf nodes are all nodes
     counted that don't have child nodes plus the root node.
+
+    End node and fragment information is cached in the skeleton detail
+    summary. With <jobs> larger than one, the details of many changed
+    skeletons are recomputed in parallel, see
+    update_skeleton_detail_summary().
     """
     if not project_id or not skeleton_ids:
         raise ValueError('Need project ID and skeleton IDs')
 
-    classes = get_class_to_id_map(project_id, ['label'])
-    relations = get_relation_to_id_map(project_id, ['labeled_as'])
-
     tests = []
     extra_joins = []
     params = {
@@ -4669,80 +5719,42 @@ def get_completeness_data(project_id, skeleton_ids, open_ends_percent=0.03,
         'min_cable': min_cable,
         'ignore_fragments': ignore_fragments,
         'open_ends_percent': open_ends_percent,
-        'labeled_as': relations['labeled_as'],
     }
 
     extra_select = []
     if include_data:
-        extra_select = ['css.num_nodes', 'css.cable_length', 'n_open_ends',
-                'n_ends', 'is_fragment']
+        extra_select = ['css.num_nodes', 'css.cable_length',
+                'sds.num_end_nodes - sds.num_tagged_end_nodes',
+                'sds.num_end_nodes', 'sds.is_fragment']
 
-    if open_ends_percent < 1.0 or include_data:
-        tests.append('open_end_ratio < %(open_ends_percent)s')
-        params['end_label_ci_ids'] = list(ClassInstance.objects.filter(
-                project_id=project_id, class_column_id=classes['label'],
-                name__in=tracing.end_tags).values_list('id', flat=True))
+    cursor = connection.cursor()
+
+    # End node and fragment information is read from the skeleton detail
+    # summary.
+    if open_ends_percent < 1.0 or ignore_fragments or include_data:
+        update_skeleton_detail_summary(project_id, skeleton_ids, cursor,
+                jobs=jobs)
         extra_joins.append("""
-            -- Compute open end ratio
-            LEFT JOIN LATERAL (
-                SELECT n_open_ends::float / n_ends::float, n_open_ends, n_ends
-                FROM (
-                    -- Tagged end nodes in skeleton
-                    SELECT COUNT(*) AS n_ends,
-                        COUNT(*) FILTER (WHERE n_tags = 0) AS n_open_ends
-                    FROM (
-                        SELECT t.id, COUNT(*) FILTER (WHERE tci.id IS NOT NULL) AS n_tags
-                        FROM treenode t
-                        LEFT JOIN treenode c
-                            ON c.parent_id = t.id
-                        LEFT JOIN treenode_class_instance tci
-                            ON tci.treenode_id = t.id
-                            AND tci.relation_id = %(labeled_as)s
-                            AND tci.class_instance_id = ANY(%(end_label_ci_ids)s::bigint[])
-                        WHERE (c.id IS NULL OR t.parent_id IS NULL)
-                            AND t.skeleton_id = skeleton.id
-                        -- Needed, because treenodes can have multiple tags
-                        GROUP BY t.id
-                    ) categorized_ends(node_id, n_tags)
-                ) end_counts(n_ends, n_open_ends)
-            ) end_info(open_end_ratio, n_open_ends, n_ends)
-                ON TRUE
+            JOIN catmaid_skeleton_detail_summary sds
+                ON sds.skeleton_id = css.skeleton_id
+        """)
+
+    if open_ends_percent < 1.0 or include_data:
+        tests.append("""
+            (sds.num_end_nodes - sds.num_tagged_end_nodes)::float /
+                NULLIF(sds.num_end_nodes, 0)::float < %(open_ends_percent)s
         """)
     if min_nodes > 0:
         tests.append('css.num_nodes >= %(min_nodes)s')
     if min_cable > 0:
         tests.append('css.cable_length >= %(min_cable)s')
-    if ignore_fragments or include_data:
-        if ignore_fragments:
-            tests.append('NOT is_fragment')
-        # Find all skeleton IDs in the query set that have treenodes tagged with
-        # "soma" or "out to nerve"
-        non_fragment_tags = ['soma', 'out to nerve']
-        params['non_fragment_ci_ids'] = list(ClassInstance.objects.filter(
-                project_id=project_id, class_column_id=classes['label'],
-                name__in=non_fragment_tags).values_list('id', flat=True))
-        extra_joins.append("""
-            LEFT JOIN LATERAL (
-                SELECT NOT EXISTS(
-                    SELECT 1
-                    FROM treenode_class_instance tci
-                    JOIN treenode t
-                        ON t.id = tci.treenode_id
-                    JOIN class_instance ci
-                        ON ci.id = tci.class_instance_id
-                    WHERE ci.id = ANY(%(non_fragment_ci_ids)s::bigint[])
-                        AND t.skeleton_id = skeleton.id
-                        AND tci.relation_id = %(labeled_as)s
-                )
-            ) soma_labels(is_fragment)
-                ON TRUE
-        """)
+    if ignore_fragments:
+        tests.append('NOT sds.is_fragment')
 
     # Default return value without filters.
     if not tests:
         tests.append('TRUE')
 
-    cursor = connection.cursor()
     cursor.execute("""
         SELECT skeleton.id,
             {is_complete}
@@ -21,12 +21,13 @@ from django.db.models.query import QuerySet
 
 from rest_framework.decorators import api_view
 
+from catmaid.history import get_historic_table_query
 from catmaid.models import UserRole, ClassInstance, Treenode, \
         TreenodeClassInstance, ConnectorClassInstance, Review, User
 from catmaid.control import export_NeuroML_Level3
 from catmaid.control.authentication import requires_user_role
 from catmaid.control.common import (get_relation_to_id_map, get_request_bool,
-        get_request_list, is_empty)
+        get_request_datetime, get_request_list, is_empty)
 from catmaid.control.review import get_treenodes_to_reviews, \
         get_treenodes_to_reviews_with_time
 from catmaid.control.tree_util import edge_count_to_root, partition
@@ -321,6 +322,15 @@ def compact_skeleton_detail(request:HttpRequest, project_id=None, skeleton_id=No
       type: boolean
       defaultValue: true
       paramType: form
+    - name: as_of
+      description: |
+        Optional point in time (ISO 8601). If provided, the skeleton is
+        returned in the state it had at this time. Can't be combined with
+        with_history.
+      required: false
+      type: string
+      format: date-time
+      paramType: form
     type:
     - type: array
       items:
@@ -339,11 +349,12 @@ def compact_skeleton_detail(request:HttpRequest, project_id=None, skeleton_id=No
     with_user_info = get_request_bool(request.GET, "with_user_info", False)
     return_format = request.GET.get('format', 'json')
     ordered = get_request_bool(request.GET, "ordered", False)
+    as_of = get_request_datetime(request.GET, "as_of")
 
     result = _compact_skeleton(project_id, skeleton_id, with_connectors,
                                with_tags, with_history, with_merge_history,
                                with_reviews, with_annotations, with_user_info,
-                               ordered)
+                               ordered, as_of=as_of)
 
     if return_format == 'msgpack':
         data = msgpack.packb(result)
@@ -377,11 +388,12 @@ def compact_skeleton(request:HttpRequest, project_id=None, skeleton_id=None,
     with_annotations = get_request_bool(request.GET, "with_annotations", False)
     with_user_info = get_request_bool(request.GET, "with_user_info", False)
     ordered = get_request_bool(request.GET, "ordered", False)
+    as_of = get_request_datetime(request.GET, "as_of")
 
     result = _compact_skeleton(project_id, skeleton_id, with_connectors,
                                with_tags, with_history, with_merge_history,
                                with_reviews, with_annotations, with_user_info,
-                               ordered)
+                               ordered, as_of=as_of)
 
     return JsonResponse(result, safe=False,
             json_dumps_params={
@@ -478,6 +490,15 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
       type: boolean
       defaultValue: "false"
       paramType: form
+    - name: as_of
+      description: |
+        Optional point in time (ISO 8601). If provided, all skeletons are
+        returned in the state they had at this time. Can't be combined with
+        with_history.
+      required: false
+      type: string
+      format: date-time
+      paramType: form
     type:
     - type: array
       items:
@@ -495,6 +516,7 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
     with_user_info = get_request_bool(request.POST, "with_user_info", False)
     return_format = request.POST.get('format', 'json')
     ordered = get_request_bool(request.POST, "ordered", False)
+    as_of = get_request_datetime(request.POST, "as_of")
 
     if not skeleton_ids:
         raise ValueError("No skeleton IDs provided")
@@ -503,7 +525,8 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
     for skeleton_id in skeleton_ids:
         skeletons[skeleton_id] = _compact_skeleton(project_id, skeleton_id,
                 with_connectors, with_tags, with_history, with_merge_history,
-                with_reviews, with_annotations, with_user_info, ordered)
+                with_reviews, with_annotations, with_user_info, ordered,
+                as_of=as_of)
 
     result = {
         "skeletons": skeletons
@@ -522,7 +545,7 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
 def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
         with_tags=True, with_history=False, with_merge_history=True,
         with_reviews=False, with_annotations=False, with_user_info=False,
-        ordered=False, scale=None) -> Tuple[Tuple, Tuple, DefaultDict[Any, List], List, List]:
+        ordered=False, scale=None, as_of=None) -> Tuple[Tuple, Tuple, DefaultDict[Any, List], List, List]:
     """Get a compact treenode representation of a skeleton, optionally with the
     history of individual nodes and connector, reviews and annotationss. Note
     this function is performance critical! Returns, in JSON:
@@ -541,24 +564,48 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
     data. This requires the client to do slightly more work, but unfortunately
     the original creation time is needed for data that was created without
     history tables enabled.
+
+    If <as_of> is a point in time, the skeleton is returned in the state it
+    had at this time, in the same format as without history. It is
+    reconstructed from live and history tables and can't be combined with
+    <with_history>.
     """
+    if as_of and with_history:
+        raise ValueError("Historic snapshots can't include history")
 
     cursor = connection.cursor()
 
+    if as_of:
+        treenode_table = get_historic_table_query('treenode', ('id',
+                'parent_id', 'user_id', 'location_x', 'location_y',
+                'location_z', 'radius', 'confidence', 'skeleton_id',
+                'edition_time'))
+        connector_table = get_historic_table_query('connector', ('id',
+                'location_x', 'location_y', 'location_z', 'edition_time'))
+        link_table = get_historic_table_query('treenode_connector', ('id',
+                'treenode_id', 'connector_id', 'relation_id', 'skeleton_id',
+                'user_id', 'edition_time'))
+    else:
+        treenode_table = 'treenode'
+        connector_table = 'connector'
+        link_table = 'treenode_connector'
+
     if not with_history:
         cursor.execute('''
             SELECT id, parent_id, user_id,
                 location_x{scale}, location_y{scale}, location_z{scale},
                 radius{scale}, confidence
-            FROM treenode
+            FROM {treenode_table} treenode
             WHERE skeleton_id = %(skeleton_id)s
             {order}
         '''.format(**{
             'order': 'ORDER BY id' if ordered else '',
             'scale': '*%(scale)s' if scale else '',
+            'treenode_table': treenode_table,
         }), {
             'skeleton_id': skeleton_id,
             'scale': scale,
+            'as_of': as_of,
         })
 
         nodes = tuple(cursor.fetchall())
@@ -567,6 +614,17 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
             'skeleton_id': skeleton_id,
             'scale': scale,
         }
+        # History rows of a skeleton's nodes can only have been archived after
+        # the skeleton was created. Passing this as a constant lets the query
+        # planner skip history partitions with older data.
+        cursor.execute('''
+            SELECT creation_time - interval '1 day'
+            FROM class_instance
+            WHERE id = %(skeleton_id)s
+        ''', params)
+        result = cursor.fetchone()
+        params['min_archive_time'] = result[0] if result else None
+
         # Get present and historic nodes. If a historic validity range is empty
         # (e.g. due to a change in the same transaction), the edition time is
         # taken for both start and end validity, because this is what actually
@@ -601,8 +659,12 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
                 2 as ordering
             FROM treenode__history
             WHERE treenode__history.skeleton_id = %(skeleton_id)s
+            {archive_constraint}
         '''.format(**{
             'scale': '*%(scale)s' if scale else '',
+            'archive_constraint': '''
+                AND upper(treenode__history.sys_period) >= %(min_archive_time)s
+            ''' if params['min_archive_time'] else '',
         })
 
         if with_merge_history:
@@ -643,8 +705,9 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
 
         nodes = tuple(cursor.fetchall())
 
-    if 0 == len(nodes):
-        # Check if the skeleton exists
+    if 0 == len(nodes) and not as_of:
+        # Check if the skeleton exists. Historic snapshots of skeletons that
+        # have been deleted since are expected to exist.
         if 0 == ClassInstance.objects.filter(pk=skeleton_id).count():
             raise Http404(f"Skeleton #{skeleton_id} doesn't exist")
         # Otherwise returns an empty list of nodes
@@ -671,14 +734,16 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
                 SELECT tc.treenode_id, tc.connector_id, tc.relation_id,
                     c.location_x{scale}, c.location_y{scale}, c.location_z{scale}
                     {user_select}
-                FROM treenode_connector tc,
-                    connector c
+                FROM {link_table} tc,
+                    {connector_table} c
                 WHERE tc.skeleton_id = %(skeleton_id)s
                 AND tc.connector_id = c.id
                 AND tc.relation_id IN (%(pre_id)s, %(post_id)s, %(gj_id)s, %(dm_id)s)
             '''.format(**{
                 'user_select': user_select,
                 'scale': '*%(scale)s' if scale else '',
+                'link_table': link_table,
+                'connector_table': connector_table,
             }), {
                 'skeleton_id': skeleton_id,
                 'pre_id': pre,
@@ -686,6 +751,7 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
                 'gj_id': gj,
                 'dm_id': dm,
                 'scale': scale,
+                'as_of': as_of,
             })
 
             if with_user_info:
@@ -766,14 +832,23 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
         history_suffix = '__with_history' if with_history else ''
         t_history_query = ', tci.edition_time' if with_history else ''
         user_select = ', tci.user_id' if with_user_info else ''
+        if as_of:
+            tag_link_table = get_historic_table_query('treenode_class_instance',
+                    ('treenode_id', 'class_instance_id', 'relation_id',
+                    'user_id', 'edition_time'))
+            tag_table = get_historic_table_query('class_instance', ('id',
+                    'name', 'edition_time'))
+        else:
+            tag_link_table = f'treenode_class_instance{history_suffix}'
+            tag_table = f'class_instance{history_suffix}'
         # Fetch all node tags
         cursor.execute('''
             SELECT c.name, tci.treenode_id
                    {history_query}
                    {user_select}
-            FROM treenode{history_suffix} t,
-                 treenode_class_instance{history_suffix} tci,
-                 class_instance{history_suffix} c
+            FROM {treenode_table} t,
+                 {tag_link_table} tci,
+                 {tag_table} c
             WHERE t.skeleton_id = %(skeleton_id)s
               AND t.id = tci.treenode_id
               AND tci.relation_id = %(relation_id)s
@@ -781,12 +856,15 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
             {order}
         '''.format(**{
             'history_query': t_history_query,
-            'history_suffix': history_suffix,
+            'treenode_table': f'treenode{history_suffix}' if with_history else treenode_table,
+            'tag_link_table': tag_link_table,
+            'tag_table': tag_table,
             'user_select': user_select,
             'order': 'ORDER BY tci.treenode_id ASC' if ordered else '',
         }), {
             'skeleton_id': skeleton_id,
             'relation_id': relations['labeled_as'],
+            'as_of': as_of,
         })
 
         if with_history:
@@ -807,11 +885,20 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
     if with_reviews:
         r_history_query = ', r.review_time' if with_history else ''
         history_suffix = '__with_history' if with_history else ''
+        if as_of:
+            review_table = get_historic_table_query('review', ('id',
+                    'treenode_id', 'reviewer_id', 'skeleton_id', 'review_time'),
+                    time_column='review_time')
+        else:
+            review_table = f'review{history_suffix}'
         cursor.execute(f"""
             SELECT r.treenode_id, r.id, r.reviewer_id{r_history_query}
-            FROM review{history_suffix} r
-            WHERE r.skeleton_id = %s
-        """, [skeleton_id])
+            FROM {review_table} r
+            WHERE r.skeleton_id = %(skeleton_id)s
+        """, {
+            'skeleton_id': skeleton_id,
+            'as_of': as_of,
+        })
 
         for r in cursor.fetchall():
             reviews.append(r)
@@ -821,13 +908,19 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
         history_suffix = '__with_history' if with_history else ''
         link_history_query = ', annotation_link.edition_time' if with_history else ''
         user_select = ', neuron_link.user_id' if with_user_info else ''
+        if as_of:
+            cici_table = get_historic_table_query('class_instance_class_instance',
+                    ('class_instance_a', 'class_instance_b', 'relation_id',
+                    'user_id', 'edition_time'))
+        else:
+            cici_table = f'class_instance_class_instance{history_suffix}'
         # Fetch all node tags
         cursor.execute(f'''
             SELECT annotation_link.class_instance_b
                    {link_history_query}
                    {user_select}
-            FROM class_instance_class_instance{history_suffix} neuron_link
-            JOIN class_instance_class_instance{history_suffix} annotation_link
+            FROM {cici_table} neuron_link
+            JOIN {cici_table} annotation_link
                 ON annotation_link.class_instance_a = neuron_link.class_instance_b
             WHERE neuron_link.class_instance_a = %(skeleton_id)s
               AND neuron_link.relation_id = %(model_of)s
@@ -835,7 +928,8 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
         ''', {
             'skeleton_id': skeleton_id,
             'model_of': relations['model_of'],
-            'annotated_with': relations['annotated_with']
+            'annotated_with': relations['annotated_with'],
+            'as_of': as_of,
         })
 
         annotations = list(cursor.fetchall())
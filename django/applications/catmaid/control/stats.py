@@ -1,15 +1,16 @@
 # -*- coding: utf-8 -*-
 
+from concurrent import futures
 from datetime import timedelta, datetime
 from dateutil import parser as dateparser
 import json
 import os
 import pytz
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 from django.conf import settings
-from django.http import HttpRequest, JsonResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.db.models.aggregates import Count
 from django.db import connection, transaction
 from django.utils import timezone
@@ -22,6 +23,7 @@ from rest_framework.views import APIView
 
 from catmaid.control.authentication import requires_user_role
 from catmaid.control.common import get_relation_to_id_map, get_request_bool
+from catmaid.metrics import get_celery_queue_depths, server_metrics, to_prometheus
 from catmaid.models import ClassInstance, Connector, Treenode, User, UserRole, \
         Review, Relation, TreenodeConnector
 
@@ -1055,22 +1057,92 @@ def select_review_stats(cursor, project_id, start_date_utc, end_date_utc,
 
     return cursor.fetchall()
 
-@transaction.atomic
-def populate_stats_summary(project_id, delete:bool=False, incremental:bool=True) -> None:
-    """Create statistics summary tables from scratch until yesterday.
+def populate_stats_summary(project_id, delete:bool=False, incremental:bool=True,
+        metrics=None) -> None:
+    """Create statistics summary tables from scratch until yesterday. Each
+    metric is computed in its own transaction and keeps its own high-water mark
+    (the last hour with data for it), so that a failure of one metric doesn't
+    require recomputing the others.
     """
-    cursor = connection.cursor()
     if delete:
-        cursor.execute("""
-            DELETE FROM catmaid_stats_summary WHERE project_id = %(project_id)s
-        """, dict(project_id=project_id))
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("""
+                DELETE FROM catmaid_stats_summary WHERE project_id = %(project_id)s
+            """, dict(project_id=project_id))
+
+    for metric in (metrics or stats_summary_metrics):
+        populate_stats_summary_metric(project_id, metric, incremental)
 
-    populate_review_stats_summary(project_id, incremental, cursor)
-    populate_connector_stats_summary(project_id, incremental, cursor)
-    populate_cable_stats_summary(project_id, incremental, cursor)
-    populate_nodecount_stats_summary(project_id, incremental, cursor)
-    populate_import_nodecount_stats_summary(project_id, incremental, cursor)
-    populate_import_cable_stats_summary(project_id, incremental, cursor)
+def populate_stats_summary_metric(project_id, metric, incremental:bool=True) -> None:
+    """Populate a single metric of the statistics summary table for a project
+    in its own transaction.
+    """
+    populate = stats_summary_metrics.get(metric)
+    if not populate:
+        raise ValueError(f"Unknown statistics summary metric: {metric}")
+    with transaction.atomic():
+        populate(project_id, incremental, connection.cursor())
+
+def _populate_stats_summary_metric_in_thread(project_id, metric,
+        incremental:bool=True) -> Optional[str]:
+    """Populate a single metric using the database connection of the current
+    thread, which is closed afterwards. Returns an error message on failure.
+    """
+    try:
+        populate_stats_summary_metric(project_id, metric, incremental)
+        return None
+    except Exception as e:
+        return str(e)
+    finally:
+        connection.close()
+
+def populate_stats_summaries(project_ids, delete:bool=False,
+        incremental:bool=True, jobs:int=1, log=None) -> List[Tuple[int, str, str]]:
+    """Populate the statistics summary of all passed in projects. With <jobs>
+    larger than one, each combination of project and metric is computed
+    concurrently in a pool of <jobs> threads, each with its own database
+    connection. Threads are sufficient, because the work is done by the
+    database. A list of (project ID, metric, error message) tuples is returned
+    for all failed metrics, the remaining metrics are still stored.
+    """
+    if not log:
+        log = lambda x: None
+
+    if delete:
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("""
+                DELETE FROM catmaid_stats_summary
+                WHERE project_id = ANY(%(project_ids)s::int[])
+            """, dict(project_ids=list(project_ids)))
+
+    work = [(project_id, metric) for project_id in project_ids
+            for metric in stats_summary_metrics]
+    failures = []
+    if jobs > 1:
+        with futures.ThreadPoolExecutor(jobs) as executor:
+            tasks = {executor.submit(_populate_stats_summary_metric_in_thread,
+                    project_id, metric, incremental): (project_id, metric)
+                    for project_id, metric in work}
+            for future in futures.as_completed(tasks):
+                project_id, metric = tasks[future]
+                error = future.result()
+                if error:
+                    failures.append((project_id, metric, error))
+                    log(f'Could not compute {metric} statistics for project {project_id}: {error}')
+                else:
+                    log(f'Computed {metric} statistics for project {project_id}')
+    else:
+        for project_id, metric in work:
+            try:
+                populate_stats_summary_metric(project_id, metric, incremental)
+                log(f'Computed {metric} statistics for project {project_id}')
+            except Exception as e:
+                failures.append((project_id, metric, str(e)))
+                log(f'Could not compute {metric} statistics for project {project_id}: {e}')
+
+    return failures
 
 def populate_review_stats_summary(project_id, incremental:bool=True, cursor=None) -> None:
     """Add review summary information to the summary table. Create hourly
@@ -1106,6 +1178,7 @@ def populate_review_stats_summary(project_id, incremental:bool=True, cursor=None
                 n_reviewed_nodes)
         SELECT %(project_id)s, ri.user_id, ri.date, ri.n_reviewed_nodes
         FROM review_info ri
+        ORDER BY ri.user_id, ri.date
         ON CONFLICT (project_id, user_id, date) DO UPDATE
         SET n_reviewed_nodes = EXCLUDED.n_reviewed_nodes;
     """, dict(project_id=project_id, incremental=incremental))
@@ -1151,6 +1224,7 @@ def populate_connector_stats_summary(project_id, incremental:bool=True, cursor=N
                     n_connector_links)
             SELECT %(project_id)s, ci.user_id, ci.date, ci.n_connector_links
             FROM connector_info ci
+            ORDER BY ci.user_id, ci.date
             ON CONFLICT (project_id, user_id, date) DO UPDATE
             SET n_connector_links = EXCLUDED.n_connector_links;
         """, dict(project_id=project_id, pre_id=pre_id, post_id=post_id,
@@ -1205,6 +1279,7 @@ def populate_cable_stats_summary(project_id, incremental:bool=True, cursor=None)
                 cable_length)
         SELECT %(project_id)s, ci.user_id, ci.date, ci.cable_length
         FROM cable_info ci
+        ORDER BY ci.user_id, ci.date
         ON CONFLICT (project_id, user_id, date) DO UPDATE
         SET cable_length = EXCLUDED.cable_length;
     """, dict(project_id=project_id, incremental=incremental))
@@ -1244,6 +1319,7 @@ def populate_nodecount_stats_summary(project_id, incremental:bool=True,
                 n_treenodes)
         SELECT %(project_id)s, ni.user_id, ni.date, ni.node_count
         FROM node_info ni
+        ORDER BY ni.user_id, ni.date
         ON CONFLICT (project_id, user_id, date) DO UPDATE
         SET n_treenodes = EXCLUDED.n_treenodes;
     """, dict(project_id=project_id, incremental=incremental))
@@ -1298,6 +1374,7 @@ def populate_import_nodecount_stats_summary(project_id, incremental:bool=True,
                 n_imported_treenodes)
         SELECT %(project_id)s, ni.user_id, ni.date, ni.node_count
         FROM node_info ni
+        ORDER BY ni.user_id, ni.date
         ON CONFLICT (project_id, user_id, date) DO UPDATE
         SET n_imported_treenodes = EXCLUDED.n_imported_treenodes;
     """, dict(project_id=project_id, incremental=incremental))
@@ -1364,23 +1441,61 @@ def populate_import_cable_stats_summary(project_id, incremental:bool=True, curso
                 import_cable_length)
         SELECT %(project_id)s, ci.user_id, ci.date, ci.cable_length
         FROM cable_info ci
+        ORDER BY ci.user_id, ci.date
         ON CONFLICT (project_id, user_id, date) DO UPDATE
         SET import_cable_length = EXCLUDED.cable_length;
     """, dict(project_id=project_id, incremental=incremental))
 
 
+# All metrics of the statistics summary table along with the functions that
+# populate them. Rows are inserted ordered by user and date, so that metrics of
+# the same project can be populated concurrently without deadlocks.
+stats_summary_metrics = {
+    'review': populate_review_stats_summary,
+    'connector': populate_connector_stats_summary,
+    'cable': populate_cable_stats_summary,
+    'nodecount': populate_nodecount_stats_summary,
+    'import_nodecount': populate_import_nodecount_stats_summary,
+    'import_cable': populate_import_cable_stats_summary,
+}
+
+
 class ServerStats(APIView):
 
     @method_decorator(requires_user_role(UserRole.Admin))
     def get(self, request:Request, project_id) -> Response:
         """Return an object that represents the state of various server and
         database objects.
+
+        Besides load and database statistics, this includes request latency
+        histograms and database use per endpoint, node provider hits and misses
+        as well as Celery queue lengths. Request and node provider metrics are
+        collected by the server process that answers this request since it
+        started.
+        ---
+        parameters:
+          - name: project_id
+            description: Project to operate in
+            type: integer
+            paramType: path
+            required: true
+          - name: celery
+            description: Whether to include Celery queue lengths.
+            type: boolean
+            paramType: form
+            required: false
+            defaultValue: true
         """
+        include_celery = get_request_bool(request.GET, 'celery', True)
 
         return Response({
             'time': self.get_current_timestamp(),
             'server': self.get_server_stats(),
             'database': self.get_database_stats(),
+            'requests': server_metrics.as_dict(),
+            'celery': {
+                'queues': get_celery_queue_depths() if include_celery else {},
+            },
         })
 
 
@@ -1500,3 +1615,31 @@ class ServerStats(APIView):
             # Must be << 1
             'percent_towards_emergency_autovac': tx_stats[3],
         }
+
+
+@api_view(['GET'])
+@requires_user_role(UserRole.Admin)
+def server_metrics_prometheus(request:Request, project_id) -> HttpResponse:
+    """Return request, database, node provider and Celery metrics in the
+    Prometheus text format.
+
+    The metrics are collected by the server process that answers this
+    request, each process keeps its own numbers.
+    ---
+    parameters:
+      - name: project_id
+        description: Project to operate in
+        type: integer
+        paramType: path
+        required: true
+      - name: celery
+        description: Whether to include Celery queue lengths.
+        type: boolean
+        paramType: form
+        required: false
+        defaultValue: true
+    """
+    include_celery = get_request_bool(request.GET, 'celery', True)
+    queue_depths = get_celery_queue_depths() if include_celery else None
+    return HttpResponse(to_prometheus(server_metrics.as_dict(), queue_depths),
+            content_type='text/plain; version=0.0.4')
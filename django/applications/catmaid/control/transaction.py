@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 
-from typing import Dict
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import json
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
 from django.db import connection
+from django.http import StreamingHttpResponse
 
 from catmaid.error import ClientError
 from catmaid.control.authentication import requires_user_role
+from catmaid.control.common import get_request_bool
 from catmaid.models import UserRole
 
 from rest_framework.decorators import api_view
@@ -16,10 +21,118 @@ class LocationLookupError(ClientError):
     pass
 
 
+# The number of transactions that are fetched per query when streaming
+# transactions.
+TRANSACTION_STREAM_BATCH_SIZE = 10000
+
+
+def _encode_transaction_cursor(execution_time, transaction_id) -> str:
+    """Create an opaque token that references the position of a transaction in
+    the transaction log.
+    """
+    data = json.dumps([execution_time, transaction_id])
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _decode_transaction_cursor(range_cursor) -> Tuple[str, int]:
+    """Return the execution time and transaction ID referenced by the passed in
+    range cursor token.
+    """
+    try:
+        execution_time, transaction_id = json.loads(
+                urlsafe_b64decode(range_cursor.encode('ascii')).decode('utf-8'))
+        return str(execution_time), int(transaction_id)
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid range cursor: {range_cursor}')
+
+
+def _get_transaction_constraints(user_id=None, label=None, changes_after=None,
+        changes_before=None) -> List[str]:
+    where = ['project_id = %(project_id)s']
+
+    if user_id:
+        where.append('user_id = %(user_id)s')
+
+    if label:
+        where.append('label = %(label)s')
+
+    if changes_after:
+        where.append('execution_time > %(changes_after)s')
+
+    if changes_before:
+        where.append('execution_time < %(changes_before)s')
+
+    return where
+
+
+def get_transactions(project_id, user_id=None, label=None, changes_after=None,
+        changes_before=None, range_after=None, offset=None, limit=None,
+        cursor=None) -> List[Dict[str, Any]]:
+    """Return the transactions of the passed in project, newest first. Results
+    start after the transaction referenced by the <range_after> cursor, if
+    provided. Unlike an <offset>, this allows an index scan to start right at
+    the requested position, which makes the cost of a query independent of its
+    position in the transaction log.
+    """
+    where = _get_transaction_constraints(user_id, label, changes_after,
+            changes_before)
+    params:Dict[str, Any] = {
+        'project_id': project_id,
+        'user_id': user_id,
+        'label': label,
+        'changes_after': changes_after,
+        'changes_before': changes_before,
+        'offset': offset,
+        'limit': limit,
+    }
+
+    if range_after:
+        params['after_time'], params['after_id'] = _decode_transaction_cursor(range_after)
+        where.append('(execution_time, transaction_id) < (%(after_time)s, %(after_id)s)')
+
+    if not cursor:
+        cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT row_to_json(cti)
+        FROM catmaid_transaction_info cti
+        WHERE {' AND '.join(where)}
+        ORDER BY execution_time DESC, transaction_id DESC
+        {'OFFSET %(offset)s' if offset else ''}
+        {'LIMIT %(limit)s' if limit else ''}
+    """, params)
+
+    return [row[0] for row in cursor.fetchall()]
+
+
+def stream_transactions(project_id, batch_size=TRANSACTION_STREAM_BATCH_SIZE,
+        **kwargs) -> Iterator[Dict[str, Any]]:
+    """Yield all transactions of the passed in project, newest first. The
+    transaction log is read in batches of <batch_size> transactions, each
+    continuing after the last transaction of the previous batch. Memory use is
+    therefore independent of the number of transactions.
+    """
+    range_after = kwargs.pop('range_after', None)
+    while True:
+        transactions = get_transactions(project_id, range_after=range_after,
+                limit=batch_size, **kwargs)
+        yield from transactions
+        if len(transactions) < batch_size:
+            break
+        last = transactions[-1]
+        range_after = _encode_transaction_cursor(last['execution_time'],
+                last['transaction_id'])
+
+
 @api_view(["GET"])
 @requires_user_role([UserRole.Browse])
-def transaction_collection(request:Request, project_id) -> Response:
+def transaction_collection(request:Request, project_id) -> Union[Response, StreamingHttpResponse]:
     """Get a collection of all available transactions in the passed in project.
+
+    Transactions are returned newest first. Large transaction logs are best
+    paged through with the <range_after> parameter, passing in the
+    <next_range_cursor> of the previous page. Alternatively, all matching
+    transactions can be streamed as newline delimited JSON by setting the
+    <format> parameter to "ndjson", which uses constant memory on the server.
     ---
     parameters:
       - name: range_start
@@ -32,6 +145,14 @@ def transaction_collection(request:Request, project_id) -> Response:
         type: integer
         paramType: form
         required: false
+      - name: range_after
+        description: |
+          A <next_range_cursor> value of a previous response. Only
+          transactions older than the last transaction of the previous
+          response are returned. Can't be combined with <range_start>.
+        type: string
+        paramType: form
+        required: false
       - name: user_id
         description: The user ID to retrieve transactions for.
         type: integer
@@ -40,6 +161,33 @@ def transaction_collection(request:Request, project_id) -> Response:
         description: The type of log entry to retriee.
         type: string
         required: false
+      - name: changes_after
+        description: |
+          Date of format YYYY-MM-DDTHH:mm:ss, only the date part is required.
+          Limits returned transactions to those executed after this date.
+        type: string
+        required: false
+      - name: changes_before
+        description: |
+          Date of format YYYY-MM-DDTHH:mm:ss, only the date part is required.
+          Limits returned transactions to those executed before this date.
+        type: string
+        required: false
+      - name: with_count
+        description: |
+          Whether the total number of matching transactions should be
+          returned. Not counting is faster on large transaction logs.
+        type: boolean
+        required: false
+        defaultValue: true
+      - name: format
+        description: |
+          Either "json" (default) or "ndjson". If "ndjson" is used, all
+          matching transactions are streamed as one JSON object per line and
+          all paging parameters except <range_after> are ignored.
+        type: string
+        required: false
+        defaultValue: json
     models:
       transaction_entity:
         id: transaction_entity
@@ -78,49 +226,68 @@ def transaction_collection(request:Request, project_id) -> Response:
         required: true
       total_count:
         type: integer
-        description: The total number of elements
+        description: The total number of elements, null if not counted
+        required: true
+      next_range_cursor:
+        type: string
+        description: |
+          A cursor for the next page of results, null if there are no more
+          results.
         required: true
     """
     if request.method == 'GET':
         range_start = request.GET.get('range_start', None)
         range_length = request.GET.get('range_length', None)
-        user_id = request.GET.get('user_id', None)
-        label = request.GET.get('type', None)
-        constraints = []
-        where = ['project_id = %(project_id)s']
-
-        if range_start:
-            constraints.append("OFFSET %(range_start)s")
+        range_after = request.GET.get('range_after', None)
+        with_count = get_request_bool(request.GET, 'with_count', True)
+        response_format = request.GET.get('format', 'json')
+        constraints = {
+            'user_id': request.GET.get('user_id', None),
+            'label': request.GET.get('type', None),
+            'changes_after': request.GET.get('changes_after', None),
+            'changes_before': request.GET.get('changes_before', None),
+        }
 
-        if range_length:
-            constraints.append("LIMIT %(range_length)s")
+        if response_format == 'ndjson':
+            lines = (json.dumps(t) + '\n' for t in stream_transactions(
+                    project_id, range_after=range_after, **constraints))
+            return StreamingHttpResponse(lines,
+                    content_type='application/x-ndjson')
+        elif response_format != 'json':
+            raise ValueError(f'Unknown format: {response_format}')
 
-        if user_id:
-            where.append('user_id = %(user_id)s')
+        if range_start and range_after:
+            raise ValueError("Can't use both range_start and range_after")
 
-        if label:
-            where.append('label = %(label)s')
+        range_length = int(range_length) if range_length else None
+        range_start = int(range_start) if range_start else None
 
         cursor = connection.cursor()
-        cursor.execute(f"""
-            SELECT row_to_json(cti), COUNT(*) OVER() AS full_count
-            FROM catmaid_transaction_info cti
-            WHERE {' AND '.join(where)}
-            ORDER BY execution_time DESC {" ".join(constraints)}
-        """, {
-            'project_id': project_id,
-            'user_id': user_id,
-            'label': label,
-            'range_start': range_start,
-            'range_length': range_length,
-        })
-        result = cursor.fetchall()
-        json_data = [row[0] for row in result]
-        total_count = result[0][1] if len(json_data) > 0 else 0
+        json_data = get_transactions(project_id, range_after=range_after,
+                offset=range_start, limit=range_length, cursor=cursor,
+                **constraints)
+
+        if range_length and len(json_data) == range_length:
+            last = json_data[-1]
+            next_range_cursor = _encode_transaction_cursor(last['execution_time'],
+                    last['transaction_id'])
+        else:
+            next_range_cursor = None
+
+        total_count = None
+        if with_count:
+            where = _get_transaction_constraints(**constraints)
+            cursor.execute(f"""
+                SELECT COUNT(*)
+                FROM catmaid_transaction_info
+                WHERE {' AND '.join(where)}
+            """, dict(constraints, project_id=project_id))
+            total_count = cursor.fetchone()[0]
 
         return Response({
             "transactions": json_data,
-            "total_count": total_count
+            "total_count": total_count,
+            "next_range_cursor": next_range_cursor,
         })
 
 
@@ -189,7 +356,10 @@ def get_location(request:Request, project_id) -> Response:
             raise LocationLookupError("A representative location for this change was not found")
         query = provider.get()
         while query:
-            cursor.execute(query, (transaction_id, ))
+            cursor.execute(query, {
+                'transaction_id': transaction_id,
+                'execution_time': execution_time,
+            })
             query = None
             result = cursor.fetchall()
             if result and len(result) == 1:
@@ -217,7 +387,13 @@ class LocationQuery(object):
         representing X, Y and Z coordinates of a location. If this string
         contains "{history}", this part will be replaced by the history suffix,
         which will replace the tablename with a reference to a history view,
-        which includes the live table as well as the history.
+        which includes the live table as well as the history. The query can
+        refer to the "transaction_id" and "execution_time" parameters. History
+        rows are archived at or after the execution time of the transaction
+        that created or replaced them. Constraining direct history table
+        lookups on the upper bound of the validity period with the execution
+        time lets the query planner skip history partitions that can't contain
+        matching rows.
         """
         self.txid_column = txid_column
         self.history_suffix = history_suffix
@@ -247,7 +423,7 @@ location_queries.update({
             AND t.parent_id IS NULL)
         JOIN class_instance_class_instance{history} cici_e
             ON (cici_s.class_instance_b = cici_e.class_instance_a
-            AND cici_e.{txid} = %s)
+            AND cici_e.{txid} = %(transaction_id)s)
         LIMIT 1
     """),
     'annotations.remove': LocationQuery("""
@@ -258,14 +434,16 @@ location_queries.update({
             AND t.parent_id IS NULL)
         JOIN class_instance_class_instance__history cici_e
             ON (cici_s.class_instance_b = cici_e.class_instance_a
-            AND cici_e.exec_transaction_id = %s)
+            AND cici_e.exec_transaction_id = %(transaction_id)s
+            AND upper(cici_e.sys_period) >= %(execution_time)s)
         LIMIT 1
     """),
     'connectors.create': LocationRef(location_queries, "nodes.update_location"),
     'connectors.remove': LocationQuery("""
         SELECT c.location_x, c.location_y, c.location_z
         FROM location__history c
-        WHERE c.exec_transaction_id = %s
+        WHERE c.exec_transaction_id = %(transaction_id)s
+        AND upper(c.sys_period) >= %(execution_time)s
         LIMIT 1
     """),
     'labels.remove': LocationQuery("""
@@ -273,7 +451,8 @@ location_queries.update({
         FROM treenode_class_instance__history tci
         JOIN treenode{history} t
         ON t.id = tci.treenode_id
-        WHERE tci.exec_transaction_id = %s
+        WHERE tci.exec_transaction_id = %(transaction_id)s
+        AND upper(tci.sys_period) >= %(execution_time)s
         LIMIT 1
     """),
     'labels.update': LocationQuery("""
@@ -281,7 +460,7 @@ location_queries.update({
         FROM treenode_class_instance{history} tci
         JOIN treenode{history} t
         ON t.id = tci.treenode_id
-        WHERE tci.{txid} = %s
+        WHERE tci.{txid} = %(transaction_id)s
         LIMIT 1
     """),
     'links.create': LocationQuery("""
@@ -289,7 +468,7 @@ location_queries.update({
         FROM treenode_connector{history} tc
         JOIN treenode{history} t
         ON t.id = tc.treenode_id
-        WHERE tc.{txid} = %s
+        WHERE tc.{txid} = %(transaction_id)s
         LIMIT 1
     """),
     'links.remove': LocationQuery("""
@@ -297,7 +476,8 @@ location_queries.update({
         FROM treenode_connector__history tc
         JOIN treenode{history} t
         ON t.id = tc.treenode_id
-        WHERE tc.{txid} = %s
+        WHERE tc.{txid} = %(transaction_id)s
+        AND upper(tc.sys_period) >= %(execution_time)s
     """),
     'neurons.remove': LocationQuery("""
         SELECT location_x, location_y, location_z
@@ -307,7 +487,8 @@ location_queries.update({
             AND t.parent_id IS NULL)
         JOIN class_instance_class_instance__history cici_e
             ON (cici_s.class_instance_b = cici_e.class_instance_a
-            AND cici_e.{txid} = %s)
+            AND cici_e.{txid} = %(transaction_id)s
+            AND upper(cici_e.sys_period) >= %(execution_time)s)
         LIMIT 1
     """),
     'neurons.rename': LocationQuery("""
@@ -318,7 +499,7 @@ location_queries.update({
             AND t.parent_id IS NULL)
         JOIN class_instance_class_instance__history{history} cici_e
             ON (cici_s.class_instance_b = cici_e.class_instance_a
-            AND cici_e.{txid} = %s)
+            AND cici_e.{txid} = %(transaction_id)s)
         LIMIT 1
     """),
     'nodes.add_or_update_review': LocationQuery("""
@@ -326,19 +507,19 @@ location_queries.update({
         FROM review{history} r
         JOIN treenode{history} t
         ON t.id = r.treenode_id
-        WHERE r.{txid} = %s
+        WHERE r.{txid} = %(transaction_id)s
         LIMIT 1
     """),
     'nodes.update_location': LocationQuery("""
         SELECT location_x, location_y, location_z
         FROM location{history}
-        WHERE {txid} = %s
+        WHERE {txid} = %(transaction_id)s
         LIMIT 1
     """),
     'skeletons.import': LocationQuery("""
         SELECT location_x, location_y, location_z
         FROM skeleton_origin__with_history so, treenode{history} t
-        WHERE so.{txid} = %s AND t.skeleton_id = so.skeleton_id
+        WHERE so.{txid} = %(transaction_id)s AND t.skeleton_id = so.skeleton_id
         ORDER BY t.edition_time DESC
         LIMIT 1;
     """),
@@ -347,7 +528,7 @@ location_queries.update({
         FROM textlabel{history} t
         JOIN textlabel_location{history} tl
         ON t.id = tl.textlabel_id
-        WHERE t.{txid} = %s
+        WHERE t.{txid} = %(transaction_id)s
         LIMIT 1
     """),
     'textlabels.update': LocationRef(location_queries, "textlabels.create"),
@@ -356,7 +537,8 @@ location_queries.update({
         FROM textlabel__history t
         JOIN textlabel_location{history} tl
         ON t.id = tl.textlabel_id
-        WHERE t.{txid} = %s
+        WHERE t.{txid} = %(transaction_id)s
+        AND upper(t.sys_period) >= %(execution_time)s
         LIMIT 1
     """),
     # Look transaction and edition time up in treenode table and return node
@@ -372,7 +554,7 @@ location_queries.update({
         FROM suppressed_virtual_treenode{history} svt
         JOIN treenode{history} t
         ON t.id = svt.child_id
-        WHERE svt.{txid} = %s
+        WHERE svt.{txid} = %(transaction_id)s
         LIMIT 1
     """),
     'treenodes.unsuppress_virtual_node': LocationRef(location_queries,
@@ -1,17 +1,32 @@
 # -*- coding: utf-8 -*-
 
 # A 'tree' is a networkx.DiGraph with a single root node (a node without parents)
+import logging
 import networkx as nx
+import numpy as np
+import threading
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from itertools import islice
 from math import sqrt
 from operator import itemgetter
-from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple
+from typing import Any, DefaultDict, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection
 
 from catmaid.control.common import is_empty
 from catmaid.models import Treenode
 
+logger = logging.getLogger(__name__)
+
+try:
+    from scipy.sparse import coo_matrix, csr_matrix
+    from scipy.sparse.csgraph import depth_first_order, dijkstra
+except ImportError:
+    logger.warning("CATMAID was unable to load the scipy module. "
+        "Array based path distances won't be available")
+
 
 def find_root(tree):
     """ Search and return the first node that has zero predecessors.
@@ -38,6 +53,138 @@ def edge_count_to_root(tree, root_node=None) -> Dict:
         count += 1
     return distances
 
+def to_parent_index_arrays(rows) -> Tuple[np.ndarray, np.ndarray]:
+    """ Convert a list of (node ID, parent ID) tuples of a tree into a sorted
+    array of node IDs and an array with the index of each node's parent in the
+    first array. The root node has a parent index of -1."""
+    n = len(rows)
+    node_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    parent_ids = np.fromiter((-1 if r[1] is None else r[1] for r in rows),
+            dtype=np.int64, count=n)
+    order = np.argsort(node_ids)
+    node_ids = node_ids[order]
+    parent_ids = parent_ids[order]
+    parent_index = np.full(n, -1, dtype=np.int64)
+    has_parent = parent_ids != -1
+    parent_index[has_parent] = np.searchsorted(node_ids, parent_ids[has_parent])
+    return node_ids, parent_index
+
+def node_degrees(parent_index) -> np.ndarray:
+    """ Return the number of neighbors of each node of a tree, which is given
+    as parent index array (see to_parent_index_arrays())."""
+    has_parent = parent_index != -1
+    return np.bincount(parent_index[has_parent],
+            minlength=len(parent_index)) + has_parent
+
+def edge_count_to_node(parent_index, origin_index) -> np.ndarray:
+    """ Return for each node of a tree, which is given as parent index array
+    (see to_parent_index_arrays()), the number of edges to the node at
+    <origin_index>. Like with edge_count_to_root(), the origin itself has a
+    count of one. Unlike edge_count_to_root(), the tree doesn't need to be
+    rerooted and no graph has to be built in Python."""
+    n = len(parent_index)
+    children = np.flatnonzero(parent_index != -1)
+    graph = coo_matrix((np.ones(len(children)), (children, parent_index[children])),
+            shape=(n, n))
+    distances = dijkstra(graph, directed=False, indices=origin_index,
+            unweighted=True)
+    return distances.astype(np.int64) + 1
+
+class ArborTopology(NamedTuple):
+    """ The topology of a skeleton as arrays. Nodes are referred to by their
+    index in the sorted array of node IDs. The children of the node at index
+    i are child_index[child_offsets[i]:child_offsets[i+1]] (compressed sparse
+    row format). Branch nodes have more than one child, end nodes have none."""
+    node_ids: np.ndarray
+    parent_index: np.ndarray
+    child_offsets: np.ndarray
+    child_index: np.ndarray
+    num_children: np.ndarray
+
+    def index_of(self, node_id) -> int:
+        """ Return the index of the passed in node ID or raise a ValueError
+        if the node isn't part of this arbor."""
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i == len(self.node_ids) or self.node_ids[i] != node_id:
+            raise ValueError(f"Node {node_id} isn't part of this arbor")
+        return i
+
+    def children(self, i) -> np.ndarray:
+        """ Return the indices of the child nodes of the node at index i."""
+        return self.child_index[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def arbor_size(self, i) -> int:
+        """ Return the number of nodes with children in the downstream arbor
+        of the node at index i, including the node itself. Only this arbor is
+        traversed, which is done in compiled code even for deep arbors."""
+        n = len(self.node_ids)
+        graph = csr_matrix((np.ones(len(self.child_index)), self.child_index,
+                self.child_offsets), shape=(n, n))
+        arbor = depth_first_order(graph, i, directed=True,
+                return_predecessors=False)
+        return int(np.count_nonzero(self.num_children[arbor]))
+
+def build_arbor_topology(rows) -> ArborTopology:
+    """ Build the topology of an arbor from a list of (node ID, parent ID)
+    tuples."""
+    node_ids, parent_index = to_parent_index_arrays(rows)
+    n = len(node_ids)
+    children = np.flatnonzero(parent_index != -1)
+    child_index = children[np.argsort(parent_index[children], kind='stable')]
+    num_children = np.bincount(parent_index[children], minlength=n)
+    child_offsets = np.zeros(n + 1, dtype=np.int64)
+    child_offsets[1:] = np.cumsum(num_children)
+    return ArborTopology(node_ids, parent_index, child_offsets, child_index,
+            num_children)
+
+# Topologies of recently used skeletons, mapping skeleton IDs to tuples of the
+# skeleton summary version the topology was built for and the topology. The
+# least recently used entries are evicted first. Worker threads share this
+# cache, which is why it is only accessed while holding its lock.
+_arbor_topology_cache:OrderedDict = OrderedDict()
+_arbor_topology_cache_lock = threading.Lock()
+
+def get_arbor_topology(skeleton_id, cursor=None) -> ArborTopology:
+    """ Get the topology of a skeleton. Topologies are cached per worker
+    process and are rebuilt if the skeleton summary of a skeleton indicates
+    that it changed."""
+    if not cursor:
+        cursor = connection.cursor()
+
+    cursor.execute("""
+        SELECT last_summary_update, num_nodes
+        FROM catmaid_skeleton_summary
+        WHERE skeleton_id = %(skeleton_id)s
+    """, {
+        'skeleton_id': skeleton_id,
+    })
+    row = cursor.fetchone()
+    version = (row[0], row[1]) if row else None
+
+    with _arbor_topology_cache_lock:
+        cached = _arbor_topology_cache.get(skeleton_id)
+        if version and cached and cached[0] == version:
+            _arbor_topology_cache.move_to_end(skeleton_id)
+            return cached[1]
+
+    cursor.execute("""
+        SELECT id, parent_id
+        FROM treenode
+        WHERE skeleton_id = %(skeleton_id)s
+    """, {
+        'skeleton_id': skeleton_id,
+    })
+    topology = build_arbor_topology(cursor.fetchall())
+
+    if version:
+        with _arbor_topology_cache_lock:
+            _arbor_topology_cache[skeleton_id] = (version, topology)
+            _arbor_topology_cache.move_to_end(skeleton_id)
+            while len(_arbor_topology_cache) > settings.ARBOR_TOPOLOGY_CACHE_SIZE:
+                _arbor_topology_cache.popitem(last=False)
+
+    return topology
+
 def find_common_ancestor(tree, nodes, ds=None, root_node=None) -> Tuple[Any, Any]:
     """ Return the node in tree that is the nearest common ancestor to all nodes.
     Assumes that nodes contains at least 1 node.
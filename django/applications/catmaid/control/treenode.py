@@ -3,7 +3,6 @@
 from collections import defaultdict
 import itertools
 import math
-import networkx as nx
 import re
 from typing import Any, DefaultDict, Dict, List, Union
 
@@ -24,6 +23,7 @@ from catmaid.control.common import (get_relation_to_id_map,
 from catmaid.control.neuron import _delete_if_empty
 from catmaid.control.node import _fetch_location, _fetch_locations
 from catmaid.control.link import create_connector_link
+from catmaid.control.tree_util import get_arbor_topology
 from catmaid.util import Point3D, is_collinear
 
 
@@ -1149,25 +1149,6 @@ def update_confidence(request:HttpRequest, project_id=None, treenode_id=None) ->
     else:
         raise ValueError('Failed to update confidence at treenode %s.' % tnid)
 
-def _skeleton_as_graph(skeleton_id) -> nx.DiGraph:
-    # Fetch all nodes of the skeleton
-    cursor = connection.cursor()
-    cursor.execute('''
-        SELECT id, parent_id
-        FROM treenode
-        WHERE skeleton_id=%s''', [skeleton_id])
-    # Create a directed graph of the skeleton
-    graph = nx.DiGraph()
-    for row in cursor.fetchall():
-        # row[0]: id
-        # row[1]: parent_id
-        graph.add_node(row[0])
-        if row[1]:
-            # Create directional edge from parent to child
-            graph.add_edge(row[1], row[0])
-    return graph
-
-
 def _find_first_interesting_node(sequence):
     """ Find the first node that:
     1. Has confidence lower than 5
@@ -1212,19 +1193,18 @@ def find_previous_branchnode_or_root(request:HttpRequest, project_id=None, treen
         tnid = int(treenode_id)
         alt = 1 == int(request.POST['alt'])
         skid = Treenode.objects.get(pk=tnid).skeleton_id
-        graph = _skeleton_as_graph(skid)
+        arbor = get_arbor_topology(skid)
         # Travel upstream until finding a parent node with more than one child
         # or reaching the root node
         seq = [] # Does not include the starting node tnid
-        while True:
-            parents = list(graph.predecessors(tnid))
-            if parents: # list of parents is not empty
-                tnid = parents[0] # Can ony have one parent
-                seq.append(tnid)
-                if 1 != len(list(graph.successors(tnid))):
-                    break # Found a branch node
-            else:
-                break # Found the root node
+        i = arbor.index_of(tnid)
+        while arbor.parent_index[i] != -1:
+            i = arbor.parent_index[i]
+            seq.append(int(arbor.node_ids[i]))
+            if 1 != arbor.num_children[i]:
+                break # Found a branch node
+        if seq:
+            tnid = seq[-1]
 
         if seq and alt:
             tnid = _find_first_interesting_node(seq)
@@ -1239,32 +1219,28 @@ def find_next_branchnode_or_end(request:HttpRequest, project_id=None, treenode_i
     try:
         tnid = int(treenode_id)
         skid = Treenode.objects.get(pk=tnid).skeleton_id
-        graph = _skeleton_as_graph(skid)
+        arbor = get_arbor_topology(skid)
 
-        children = list(graph.successors(tnid))
+        children = arbor.children(arbor.index_of(tnid))
         branches = []
-        for child_node_id in children:
+        for child_index in children:
             # Travel downstream until finding a child node with more than one
             # child or reaching an end node
-            seq = [child_node_id] # Does not include the starting node tnid
-            branch_end = child_node_id
-            while True:
-                branch_children = list(graph.successors(branch_end))
-                if 1 == len(branch_children):
-                    branch_end = branch_children[0]
-                    seq.append(branch_end)
-                else:
-                    break # Found an end node or a branch node
+            seq = [int(arbor.node_ids[child_index])] # Does not include the starting node tnid
+            branch_end = child_index
+            while 1 == arbor.num_children[branch_end]:
+                branch_end = arbor.child_index[arbor.child_offsets[branch_end]]
+                seq.append(int(arbor.node_ids[branch_end]))
 
-            branches.append([child_node_id,
+            branches.append([seq[0],
                              _find_first_interesting_node(seq),
-                             branch_end])
+                             seq[-1],
+                             child_index])
 
         # If more than one branch exists, sort based on downstream arbor size.
         if len(children) > 1:
-            branches.sort(
-                   key=lambda b: len(nx.algorithms.traversal.depth_first_search.dfs_successors(graph, b[0])),
-                   reverse=True)
+            branches.sort(key=lambda b: arbor.arbor_size(b[3]), reverse=True)
+        branches = [b[:3] for b in branches]
 
         # Leaf nodes will have no branches
         if len(children) > 0:
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 from itertools import chain
 import io
 import logging
@@ -8,6 +9,7 @@ import os
 import re
 import struct
 import sys
+import threading
 import trimesh
 import numpy as np
 from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
@@ -22,7 +24,9 @@ from django.utils.decorators import method_decorator
 
 from catmaid.control.annotation import get_annotated_entities
 from catmaid.control.authentication import requires_user_role, user_can_edit
-from catmaid.control.common import get_request_list
+from catmaid.control.common import get_request_bool, get_request_list
+from catmaid.control.meshes import (TriangleMeshIndex, decimate_mesh,
+        encode_mesh, triangles_to_indexed_mesh, wkb_to_triangles)
 from catmaid.control.provenance import get_data_source, normalize_source_url
 from catmaid.models import ClassInstance, UserRole, Project, Volume, VolumeOrigin
 from catmaid.serializers import VolumeSerializer
@@ -40,6 +44,13 @@ logger = logging.getLogger(__name__)
 _num = '[-+]?[0-9]*.?[0-9]+'
 _bbox_re = rf'BOX3D\(({_num})\s+({_num})\s+({_num}),\s*({_num})\s+({_num})\s+({_num})\)'
 
+# Mesh indices of recently used volumes, mapping volume IDs to tuples of the
+# volume edition time the index was built for and the index itself. The least
+# recently used entries are evicted first. The lock guards all cache access,
+# because requests can be served by multiple threads.
+_mesh_index_cache:OrderedDict = OrderedDict()
+_mesh_index_cache_lock = threading.Lock()
+
 
 def get_req_coordinate(request_dict, c) -> float:
     """Get a coordinate from a request dictionary or error.
@@ -90,6 +101,7 @@ class PostGISVolume(object):
             params = {
                 "id": self.id,
                 "project_id": self.project_id or 'project_id',
+                "keep_innervations": not surface,
             }
             editable_params = {
                 "editor_id": self.user_id,
@@ -102,10 +114,26 @@ class PostGISVolume(object):
             fields = [k for k in editable_params.keys() if editable_params.get(k)]
             # If surface is none, the old value will be used. This makes it
             # possible to update the volume without overriding its geometry.
+            # In this case, precomputed innervations that are up-to-date stay
+            # valid, which is recorded with the new edition time.
             cursor.execute("""
-                UPDATE catmaid_volume SET ({fields}) = ({templates})
-                WHERE id=%(id)s
-                RETURNING id
+                WITH old_volume AS (
+                    SELECT id, edition_time
+                    FROM catmaid_volume
+                    WHERE id=%(id)s
+                ), updated_volume AS (
+                    UPDATE catmaid_volume SET ({fields}) = ({templates})
+                    WHERE id=%(id)s
+                    RETURNING id, edition_time
+                ), innervation_state AS (
+                    UPDATE catmaid_volume_innervation_state s
+                    SET edition_time = uv.edition_time
+                    FROM old_volume ov, updated_volume uv
+                    WHERE %(keep_innervations)s
+                        AND s.volume_id = ov.id
+                        AND s.edition_time = ov.edition_time
+                )
+                SELECT id FROM updated_volume
             """.format(**{
                 'fields': ', '.join(fields + ['edition_time']),
                 'templates': ', '.join([f'%({f})s' for f in fields] + ['now()'])
@@ -883,10 +911,73 @@ def export_volume(request, project_id, volume_id, extension) -> HttpResponse:
             extension, ', '.join(chain.from_iterable(acceptable.values()))), status=415)
 
 
+@api_view(['GET'])
+@renderer_classes((AnyRenderer,))
+@requires_user_role([UserRole.Browse])
+def get_volume_mesh(request, project_id, volume_id) -> HttpResponse:
+    """Get the mesh of a volume in a compact binary format, optionally at a
+    lower level of detail (LOD).
+
+    The response is a little endian indexed triangle mesh. A 40 byte header
+    contains the magic string "CMSH", the format version, the number of
+    quantization bits, the LOD of the returned mesh and the number of available
+    LODs (one byte each), the number of vertices and faces (uint32 each) as well
+    as the offset and scale of the vertex coordinates (three float32 each).
+    Vertices follow as float32 triplets or, if quantization bits are set, as
+    uint16 triplets that map to <offset> + <value> * <scale>. The vertex block
+    is padded to a multiple of four bytes and followed by the faces as uint32
+    triplets of vertex indices.
+    ---
+    parameters:
+      - name: project_id
+        description: Project to operate in
+        type: integer
+        paramType: path
+        required: true
+      - name: volume_id
+        description: The volume to get the mesh of
+        type: integer
+        paramType: path
+        required: true
+      - name: lod
+        description: |
+            The level of detail, 0 is the original mesh and higher levels are
+            increasingly coarse. Levels beyond the coarsest one return the
+            coarsest one.
+        type: integer
+        paramType: form
+        required: false
+        defaultValue: 0
+      - name: quantization_bits
+        description: |
+            If set to a value between 1 and 16, vertex coordinates are
+            quantized to this many bits per component and are transferred as
+            uint16 values. Otherwise float32 values are used.
+        type: integer
+        paramType: form
+        required: false
+        defaultValue: 0
+    """
+    lod = int(request.GET.get('lod', 0))
+    if lod < 0:
+        raise ValueError("The LOD has to be positive")
+    quantization_bits = int(request.GET.get('quantization_bits', 0))
+    if not 0 <= quantization_bits <= 16:
+        raise ValueError("Quantization bits have to be in the range [0, 16]")
+
+    data = get_volume_mesh_lod(int(project_id), int(volume_id), lod,
+            quantization_bits)
+    return HttpResponse(data, content_type='application/octet-stream')
+
+
 @api_view(['GET'])
 @requires_user_role([UserRole.Browse])
 def intersects(request, project_id, volume_id) -> JsonResponse:
-    """Test if a point intersects with the bounding box of a given volume.
+    """Test if a point intersects with a given volume.
+
+    By default, only the bounding box of the volume is tested. If the
+    parameter `exact` is set to true, the point is tested against the actual
+    triangle mesh of the volume.
     ---
     parameters:
       - name: x
@@ -901,6 +992,12 @@ def intersects(request, project_id, volume_id) -> JsonResponse:
         description: Z coordinate of point to test
         paramType: query
         type: number
+      - name: exact
+        description: Whether to test against the volume mesh rather than its bounding box.
+        paramType: query
+        type: boolean
+        defaultValue: false
+        required: false
     type:
       'intersects':
         type: boolean
@@ -917,6 +1014,16 @@ def intersects(request, project_id, volume_id) -> JsonResponse:
         raise ValueError("Please provide valid X, Y and Z coordinates")
 
     x, y, z = float(x), float(y), float(z)
+    exact = get_request_bool(request.GET, 'exact', False)
+
+    if exact:
+        volume_id = int(volume_id)
+        mesh_indices = get_volume_mesh_indices(p.id, [volume_id])
+        if volume_id not in mesh_indices:
+            raise Http404(f"Could not find volume {volume_id}")
+        return JsonResponse({
+            'intersects': bool(mesh_indices[volume_id].contains([[x, y, z]])[0])
+        })
 
     # This test works only for boxes, because it only checks bounding box
     # overlap (&&& operator).
@@ -934,6 +1041,71 @@ def intersects(request, project_id, volume_id) -> JsonResponse:
     })
 
 
+@api_view(['POST'])
+@requires_user_role([UserRole.Browse])
+def intersect_points(request, project_id) -> JsonResponse:
+    """Test many points at once for being inside of a set of volumes.
+
+    Points are tested against the actual triangle mesh of each volume. Meshes
+    are expected to be closed. For each volume ID, a list of booleans is
+    returned, one for each passed in point in the order they were provided.
+    ---
+    parameters:
+      - name: project_id
+        description: Project to operate in
+        type: integer
+        paramType: path
+        required: true
+      - name: volume_ids
+        description: The volumes to test the points against
+        paramType: form
+        type: array
+        items:
+            type: integer
+        required: true
+      - name: points
+        description: >
+            A list of points to test, each one a list of three numbers: X, Y
+            and Z. Can also be provided as JSON encoded string.
+        paramType: form
+        type: array
+        items:
+            type: number
+        required: true
+    type:
+      '{volume_id}':
+        description: A list of booleans, one for each point.
+        type: array
+        items:
+          type: boolean
+        required: true
+    """
+    volume_ids = get_request_list(request.POST, 'volume_ids', map_fn=int)
+    if not volume_ids:
+        raise ValueError("Need at least one volume ID")
+
+    points = request.POST.get('points')
+    if points:
+        points = json.loads(points)
+    else:
+        points = get_request_list(request.POST, 'points', map_fn=float)
+    if not points:
+        raise ValueError("Need at least one point")
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError("Points need to have three coordinates each")
+
+    mesh_indices = get_volume_mesh_indices(project_id, volume_ids)
+    missing = set(volume_ids) - set(mesh_indices.keys())
+    if missing:
+        raise ValueError(f"Could not find volumes: {', '.join(map(str, missing))}")
+
+    return JsonResponse({
+        volume_id: mesh_index.contains(points).tolist()
+        for volume_id, mesh_index in mesh_indices.items()
+    })
+
+
 @api_view(['POST'])
 @requires_user_role([UserRole.Browse])
 def get_volume_entities(request, project_id) -> JsonResponse:
@@ -1126,6 +1298,21 @@ def get_skeleton_innervations(request, project_id) -> JsonResponse:
           description: A minimum number of cable length esult skeleton need to have.
           required: false
           type: boolean
+        - name: exact
+          description: >
+            Whether skeletons should be tested against the actual volume meshes
+            rather than only their bounding boxes.
+          required: false
+          type: boolean
+          defaultValue: false
+        - name: precomputed
+          description: >
+            Whether the precomputed innervation table should be used. It is
+            based on exact mesh intersections. Skeletons changed since the last
+            table update are refreshed first.
+          required: false
+          type: boolean
+          defaultValue: false
     """
     skeleton_ids = get_request_list(request.POST, 'skeleton_ids', map_fn=int)
     if not skeleton_ids:
@@ -1137,21 +1324,29 @@ def get_skeleton_innervations(request, project_id) -> JsonResponse:
     min_cable = request.POST.get('min_cable')
     if min_cable:
         min_cable = int(min_cable)
+    exact = get_request_bool(request.POST, 'exact', False)
+    precomputed = get_request_bool(request.POST, 'precomputed', False)
 
     volume_intersections = _get_skeleton_innervations(project_id, skeleton_ids,
-            volume_annotation, min_nodes, min_cable)
+            volume_annotation, min_nodes, min_cable, exact, precomputed)
 
     return JsonResponse(volume_intersections, safe=False)
 
 
 def _get_skeleton_innervations(project_id, skeleton_ids, volume_annotation,
-        min_nodes=None, min_cable=None) -> List[Dict[str, Any]]:
+        min_nodes=None, min_cable=None, exact=False, precomputed=False) -> List[Dict[str, Any]]:
+    volume_ids = [v['id'] for v in
+            find_volumes(project_id, volume_annotation, simple=True)]
+
+    if precomputed:
+        return _get_precomputed_skeleton_innervations(project_id, skeleton_ids,
+                volume_ids, min_nodes, min_cable)
+
     # Build an intersection query for each volume bounding box with the passed
     # in set of skeletons.
     query_params = {
         'project_id': project_id,
-        'volume_ids': [v['id'] for v in
-                find_volumes(project_id, volume_annotation, simple=True)],
+        'volume_ids': volume_ids,
         'skeleton_ids': skeleton_ids,
     }
 
@@ -1174,12 +1369,12 @@ def _get_skeleton_innervations(project_id, skeleton_ids, volume_annotation,
         """)
     if min_nodes:
         extra_where.append("""
-            css.num_nodes >= %(min_nodes)s
+            AND css.num_nodes >= %(min_nodes)s
         """)
         query_params['min_nodes'] = min_nodes
     if min_cable:
         extra_where.append("""
-            css.cable_length >= %(min_cable)s
+            AND css.cable_length >= %(min_cable)s
         """)
         query_params['min_cable'] = min_cable
 
@@ -1235,9 +1430,334 @@ def _get_skeleton_innervations(project_id, skeleton_ids, volume_annotation,
         'skeleton_id': x[0],
         'volume_ids': x[1]
     }, cursor.fetchall()))
+
+    if exact and skeleton_intersections:
+        skeleton_intersections = _refine_skeleton_innervations(project_id,
+                skeleton_intersections)
+
     return skeleton_intersections
 
 
+def get_skeleton_segments(project_id, skeleton_ids) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """Get the edges of the passed in skeletons as a tuple of start point and
+    end point arrays for each skeleton. Root nodes are represented as edges of
+    zero length so that single node skeletons can be tested, too.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT t.skeleton_id, t.location_x, t.location_y, t.location_z,
+            COALESCE(p.location_x, t.location_x),
+            COALESCE(p.location_y, t.location_y),
+            COALESCE(p.location_z, t.location_z)
+        FROM treenode t
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+            ON skeleton.id = t.skeleton_id
+        LEFT JOIN treenode p
+            ON p.id = t.parent_id
+        WHERE t.project_id = %(project_id)s
+        ORDER BY t.skeleton_id
+    """, {
+        'project_id': project_id,
+        'skeleton_ids': skeleton_ids,
+    })
+    rows = cursor.fetchall()
+    if not rows:
+        return {}
+
+    data = np.array(rows, dtype=np.float64)
+    edge_skeleton_ids = data[:, 0].astype(np.int64)
+    unique_skeleton_ids, starts = np.unique(edge_skeleton_ids, return_index=True)
+    ends = np.append(starts[1:], len(data))
+    return {
+        int(skeleton_id): (data[s:e, 1:4], data[s:e, 4:7])
+        for skeleton_id, s, e in zip(unique_skeleton_ids, starts, ends)
+    }
+
+
+def _refine_skeleton_innervations(project_id, skeleton_intersections) -> List[Dict[str, Any]]:
+    """Test the candidate volumes of each skeleton in the passed in list
+    against the volume meshes and remove all volumes that aren't actually
+    intersected by at least one edge of the skeleton.
+    """
+    volume_ids = set(chain.from_iterable(si['volume_ids'] for si in skeleton_intersections))
+    mesh_indices = get_volume_mesh_indices(project_id, volume_ids)
+    segments = get_skeleton_segments(project_id,
+            [si['skeleton_id'] for si in skeleton_intersections])
+
+    refined_intersections = []
+    for si in skeleton_intersections:
+        starts, ends = segments.get(si['skeleton_id'], (None, None))
+        if starts is None:
+            continue
+        intersected_volume_ids = [volume_id for volume_id in si['volume_ids']
+                if volume_id in mesh_indices and
+                    mesh_indices[volume_id].intersects_segments(starts, ends).any()]
+        if intersected_volume_ids:
+            refined_intersections.append({
+                'skeleton_id': si['skeleton_id'],
+                'volume_ids': intersected_volume_ids,
+            })
+
+    return refined_intersections
+
+
+def _get_precomputed_skeleton_innervations(project_id, skeleton_ids, volume_ids,
+        min_nodes=None, min_cable=None) -> List[Dict[str, Any]]:
+    """Look up the volumes the passed in skeletons innervate in the
+    precomputed innervation table. Stale entries of the passed in skeletons
+    are refreshed first.
+    """
+    update_skeleton_innervations(project_id, skeleton_ids, update_volumes=False)
+
+    extra_joins = []
+    extra_where = []
+    query_params = {
+        'project_id': project_id,
+        'skeleton_ids': skeleton_ids,
+        'volume_ids': volume_ids,
+    }
+    if min_nodes or min_cable:
+        extra_joins.append("""
+            JOIN catmaid_skeleton_summary css
+                ON css.skeleton_id = i.skeleton_id
+        """)
+    if min_nodes:
+        extra_where.append("""
+            AND css.num_nodes >= %(min_nodes)s
+        """)
+        query_params['min_nodes'] = min_nodes
+    if min_cable:
+        extra_where.append("""
+            AND css.cable_length >= %(min_cable)s
+        """)
+        query_params['min_cable'] = min_cable
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT i.skeleton_id, array_agg(i.volume_id ORDER BY i.volume_id)
+        FROM catmaid_skeleton_volume_innervation i
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+            ON skeleton.id = i.skeleton_id
+        JOIN UNNEST(%(volume_ids)s::bigint[]) query_volume(id)
+            ON query_volume.id = i.volume_id
+        {extra_joins}
+        WHERE i.project_id = %(project_id)s
+        {extra_where}
+        GROUP BY i.skeleton_id
+    """.format(**{
+        'extra_joins': '\n'.join(extra_joins),
+        'extra_where': '\n'.join(extra_where),
+    }), query_params)
+
+    return [{
+        'skeleton_id': row[0],
+        'volume_ids': row[1],
+    } for row in cursor.fetchall()]
+
+
+def _compute_innervations(segments, mesh_indices) -> List[Tuple[int, int, int, float]]:
+    """Compute the number of nodes and the cable length inside each passed in
+    volume mesh for each skeleton in the passed in segment map. Only
+    skeleton-volume pairs with at least one node or some cable inside the
+    volume are returned as tuples of skeleton ID, volume ID, node count and
+    cable length.
+    """
+    innervations = []
+    for skeleton_id, (starts, ends) in segments.items():
+        skeleton_min = np.minimum(starts.min(axis=0), ends.min(axis=0))
+        skeleton_max = np.maximum(starts.max(axis=0), ends.max(axis=0))
+        for volume_id, mesh_index in mesh_indices.items():
+            if np.any(skeleton_max < mesh_index.bbox_min) or \
+                    np.any(skeleton_min > mesh_index.bbox_max):
+                continue
+            # Every node is the start of exactly one segment.
+            num_nodes = int(mesh_index.contains(starts).sum())
+            cable_length = float(mesh_index.segment_lengths_inside(starts, ends).sum())
+            if num_nodes > 0 or cable_length > 0:
+                innervations.append((skeleton_id, volume_id, num_nodes, cable_length))
+    return innervations
+
+
+def _store_innervations(project_id, innervations, cursor=None) -> None:
+    """Insert the passed in list of (skeleton ID, volume ID, node count, cable
+    length) tuples into the innervation table.
+    """
+    if not innervations:
+        return
+    if not cursor:
+        cursor = connection.cursor()
+
+    skeleton_ids, volume_ids, num_nodes, cable_lengths = zip(*innervations)
+    cursor.execute("""
+        INSERT INTO catmaid_skeleton_volume_innervation (project_id,
+            skeleton_id, volume_id, num_nodes, cable_length)
+        SELECT %(project_id)s, i.skeleton_id, i.volume_id, i.num_nodes,
+            i.cable_length
+        FROM UNNEST(%(skeleton_ids)s::bigint[], %(volume_ids)s::bigint[],
+            %(num_nodes)s::int[], %(cable_lengths)s::real[])
+            i(skeleton_id, volume_id, num_nodes, cable_length)
+        ON CONFLICT (skeleton_id, volume_id) DO UPDATE
+        SET num_nodes = EXCLUDED.num_nodes,
+            cable_length = EXCLUDED.cable_length,
+            last_update = now()
+    """, {
+        'project_id': project_id,
+        'skeleton_ids': list(skeleton_ids),
+        'volume_ids': list(volume_ids),
+        'num_nodes': list(num_nodes),
+        'cable_lengths': list(cable_lengths),
+    })
+
+
+def update_skeleton_innervations(project_id, skeleton_ids=None,
+        update_volumes=True, clean=False, chunk_size=500, log=None) -> Dict[str, int]:
+    """Update the precomputed skeleton innervation table of a project
+    incrementally. Volumes that changed since the last update are intersected
+    with all skeletons and skeletons that changed since the last update are
+    intersected with all volumes. Changes are detected by comparing the
+    edition times of volumes and skeleton summaries with the ones recorded
+    during the last update. Optionally, the update of skeletons can be limited
+    to a set of skeleton IDs and the update of volumes can be disabled.
+    Returns the number of updated volumes and skeletons.
+    """
+    cursor = connection.cursor()
+    if clean:
+        for table in ('catmaid_skeleton_volume_innervation',
+                'catmaid_skeleton_innervation_state',
+                'catmaid_volume_innervation_state'):
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE project_id = %(project_id)s
+            """, {
+                'project_id': project_id,
+            })
+
+    skeleton_constraint = ''
+    if skeleton_ids is not None:
+        skeleton_constraint = """
+            JOIN UNNEST(%(skeleton_ids)s::bigint[]) query_skeleton(id)
+                ON query_skeleton.id = css.skeleton_id
+        """
+    cursor.execute("""
+        SELECT css.skeleton_id, css.last_edition_time
+        FROM catmaid_skeleton_summary css
+        {skeleton_constraint}
+        LEFT JOIN catmaid_skeleton_innervation_state s
+            ON s.skeleton_id = css.skeleton_id
+        WHERE css.project_id = %(project_id)s
+            AND (s.skeleton_id IS NULL OR s.edition_time <> css.last_edition_time)
+    """.format(skeleton_constraint=skeleton_constraint), {
+        'project_id': project_id,
+        'skeleton_ids': skeleton_ids,
+    })
+    stale_skeletons = dict(cursor.fetchall())
+
+    stale_volumes:Dict = {}
+    if update_volumes:
+        cursor.execute("""
+            SELECT v.id, v.edition_time
+            FROM catmaid_volume v
+            LEFT JOIN catmaid_volume_innervation_state s
+                ON s.volume_id = v.id
+            WHERE v.project_id = %(project_id)s
+                AND (s.volume_id IS NULL OR s.edition_time <> v.edition_time)
+        """, {
+            'project_id': project_id,
+        })
+        stale_volumes = dict(cursor.fetchall())
+
+    # Intersect changed volumes with all skeletons that are up-to-date. Stale
+    # skeletons are intersected with all volumes below.
+    if stale_volumes:
+        cursor.execute("""
+            DELETE FROM catmaid_skeleton_volume_innervation
+            WHERE volume_id = ANY(%(volume_ids)s::bigint[])
+        """, {
+            'volume_ids': list(stale_volumes.keys()),
+        })
+        mesh_indices = get_volume_mesh_indices(project_id, stale_volumes.keys())
+        for volume_id, mesh_index in mesh_indices.items():
+            cursor.execute("""
+                SELECT DISTINCT t.skeleton_id
+                FROM treenode_edge te
+                JOIN treenode t
+                    ON t.id = te.id
+                JOIN catmaid_skeleton_innervation_state s
+                    ON s.skeleton_id = t.skeleton_id
+                WHERE te.project_id = %(project_id)s
+                    AND te.edge &&& ST_MakeLine(ARRAY[
+                        ST_MakePoint(%(min_x)s, %(min_y)s, %(min_z)s),
+                        ST_MakePoint(%(max_x)s, %(max_y)s, %(max_z)s)] ::geometry[])
+            """, {
+                'project_id': project_id,
+                'min_x': mesh_index.bbox_min[0],
+                'min_y': mesh_index.bbox_min[1],
+                'min_z': mesh_index.bbox_min[2],
+                'max_x': mesh_index.bbox_max[0],
+                'max_y': mesh_index.bbox_max[1],
+                'max_z': mesh_index.bbox_max[2],
+            })
+            candidates = [row[0] for row in cursor.fetchall()
+                    if row[0] not in stale_skeletons]
+            for i in range(0, len(candidates), chunk_size):
+                segments = get_skeleton_segments(project_id, candidates[i:i + chunk_size])
+                _store_innervations(project_id,
+                        _compute_innervations(segments, {volume_id: mesh_index}), cursor)
+            if log:
+                log(f"Updated innervations of volume {volume_id} ({len(candidates)} skeleton candidates)")
+
+        cursor.execute("""
+            INSERT INTO catmaid_volume_innervation_state (volume_id, project_id,
+                edition_time)
+            SELECT v.id, %(project_id)s, v.edition_time
+            FROM UNNEST(%(volume_ids)s::bigint[], %(edition_times)s::timestamptz[])
+                v(id, edition_time)
+            ON CONFLICT (volume_id) DO UPDATE
+            SET edition_time = EXCLUDED.edition_time
+        """, {
+            'project_id': project_id,
+            'volume_ids': list(stale_volumes.keys()),
+            'edition_times': list(stale_volumes.values()),
+        })
+
+    # Intersect changed skeletons with all volumes of the project.
+    if stale_skeletons:
+        volume_ids = list(Volume.objects.filter(project_id=project_id) \
+                .values_list('id', flat=True))
+        mesh_indices = get_volume_mesh_indices(project_id, volume_ids)
+        stale_skeleton_ids = list(stale_skeletons.keys())
+        for i in range(0, len(stale_skeleton_ids), chunk_size):
+            chunk = stale_skeleton_ids[i:i + chunk_size]
+            cursor.execute("""
+                DELETE FROM catmaid_skeleton_volume_innervation
+                WHERE skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+            """, {
+                'skeleton_ids': chunk,
+            })
+            segments = get_skeleton_segments(project_id, chunk)
+            _store_innervations(project_id,
+                    _compute_innervations(segments, mesh_indices), cursor)
+            cursor.execute("""
+                INSERT INTO catmaid_skeleton_innervation_state (skeleton_id,
+                    project_id, edition_time)
+                SELECT s.id, %(project_id)s, s.edition_time
+                FROM UNNEST(%(skeleton_ids)s::bigint[], %(edition_times)s::timestamptz[])
+                    s(id, edition_time)
+                ON CONFLICT (skeleton_id) DO UPDATE
+                SET edition_time = EXCLUDED.edition_time
+            """, {
+                'project_id': project_id,
+                'skeleton_ids': chunk,
+                'edition_times': [stale_skeletons[skid] for skid in chunk],
+            })
+            if log:
+                log(f"Updated innervations of {min(i + chunk_size, len(stale_skeleton_ids))}/{len(stale_skeleton_ids)} skeletons")
+
+    return {
+        'n_updated_volumes': len(stale_volumes),
+        'n_updated_skeletons': len(stale_skeletons),
+    }
+
+
 @api_view(['GET'])
 @requires_user_role([UserRole.Annotate])
 def update_meta_information(request, project_id, volume_id) -> JsonResponse:
@@ -1314,8 +1834,54 @@ def update_volume_meta_information(project_id, volume_ids=None):
     return new_data
 
 def get_volume_data(project_id, volume_ids):
-    """Compute the volume and area for a set of volumes and update them in the
-    database.
+    """Get the name, edition time and an indexed triangle mesh (vertices and
+    faces) of each passed in volume. Surfaces that are made of triangles are
+    read from their binary representation, all others are parsed from X3D.
+    """
+    params = {
+        'project_id': project_id,
+    }
+    extra_joins = ''
+    if volume_ids:
+        extra_joins = """
+            JOIN UNNEST(%(volume_ids)s::bigint[]) query_volume(id)
+                ON query_volume.id = v.id
+        """
+        params['volume_ids'] = volume_ids
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT v.id, v.name, v.edition_time, ST_AsBinary(v.geometry)
+        FROM catmaid_volume v
+        {extra_joins}
+        WHERE v.project_id = %(project_id)s
+    """.format(extra_joins=extra_joins), params)
+
+    volumes = {}
+    other_volume_ids = []
+    for volume_id, name, edition_time, wkb in cursor.fetchall():
+        try:
+            triangles = wkb_to_triangles(wkb)
+        except ValueError:
+            other_volume_ids.append(volume_id)
+            continue
+        vertices, faces = triangles_to_indexed_mesh(triangles)
+        volumes[volume_id] = {
+            'name': name,
+            'edition_time': edition_time,
+            'vertices': vertices,
+            'faces': faces,
+        }
+
+    if other_volume_ids:
+        volumes.update(_get_volume_data_x3d(project_id, other_volume_ids))
+
+    return volumes
+
+
+def _get_volume_data_x3d(project_id, volume_ids):
+    """Get the name, edition time and an indexed mesh of each passed in volume
+    by parsing its X3D representation.
     """
     volume_data = _volume_collection(project_id, volume_ids, with_meshes=True)
     columns = volume_data['columns']
@@ -1324,6 +1890,7 @@ def get_volume_data(project_id, volume_ids):
     id_idx = columns.index('id')
     mesh_idx = columns.index('mesh')
     name_idx = columns.index('name')
+    edition_time_idx = columns.index('edition_time')
 
     # Generate volume(s) from responses
     volumes = {}
@@ -1392,6 +1959,7 @@ def get_volume_data(project_id, volume_ids):
 
         volumes[mesh_id] = {
             'name': mesh_name,
+            'edition_time': r[edition_time_idx],
             'vertices': final_vertices,
             'faces': final_faces,
         }
@@ -1399,6 +1967,152 @@ def get_volume_data(project_id, volume_ids):
     return volumes
 
 
+def get_volume_mesh_indices(project_id, volume_ids) -> Dict[int, TriangleMeshIndex]:
+    """Get a mesh index for each passed in volume, which allows exact
+    point-in-mesh and segment-in-mesh tests. Indices are cached in memory
+    and are only rebuilt if a volume changed since its index was created.
+    Volumes that can't be found are not part of the result.
+    """
+    volume_ids = list(set(volume_ids))
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT v.id, v.edition_time
+        FROM catmaid_volume v
+        JOIN UNNEST(%(volume_ids)s::bigint[]) query_volume(id)
+            ON query_volume.id = v.id
+        WHERE v.project_id = %(project_id)s
+    """, {
+        'project_id': project_id,
+        'volume_ids': volume_ids,
+    })
+    edition_times = dict(cursor.fetchall())
+
+    mesh_indices = {}
+    stale_volume_ids = []
+    with _mesh_index_cache_lock:
+        for volume_id, edition_time in edition_times.items():
+            cached = _mesh_index_cache.get(volume_id)
+            if cached and cached[0] == edition_time:
+                _mesh_index_cache.move_to_end(volume_id)
+                mesh_indices[volume_id] = cached[1]
+            else:
+                stale_volume_ids.append(volume_id)
+
+    if stale_volume_ids:
+        new_entries = {}
+        for volume_id, v in get_volume_data(project_id, stale_volume_ids).items():
+            mesh_index = TriangleMeshIndex(v['vertices'], v['faces'])
+            mesh_indices[volume_id] = mesh_index
+            new_entries[volume_id] = (v['edition_time'], mesh_index)
+
+        with _mesh_index_cache_lock:
+            for volume_id, entry in new_entries.items():
+                _mesh_index_cache[volume_id] = entry
+                _mesh_index_cache.move_to_end(volume_id)
+
+            while len(_mesh_index_cache) > settings.VOLUME_MESH_INDEX_CACHE_SIZE:
+                _mesh_index_cache.popitem(last=False)
+
+    return mesh_indices
+
+
+def get_volume_mesh_lod(project_id, volume_id, lod=0, quantization_bits=0) -> bytes:
+    """Get the binary representation of a volume's mesh at the passed in level
+    of detail (LOD), see encode_mesh(). LODs beyond the coarsest available one
+    are mapped to the coarsest one. Representations are cached in the
+    database and all LODs of a volume are recomputed together if the volume
+    changed.
+    """
+    n_lods = len(settings.VOLUME_MESH_LOD_GRID_SIZES) + 1
+    lod = min(lod, n_lods - 1)
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT v.edition_time, l.edition_time, l.data
+        FROM catmaid_volume v
+        LEFT JOIN catmaid_volume_mesh_lod l
+            ON l.volume_id = v.id
+            AND l.lod = %(lod)s
+            AND l.quantization_bits = %(quantization_bits)s
+        WHERE v.id = %(volume_id)s
+            AND v.project_id = %(project_id)s
+    """, {
+        'project_id': project_id,
+        'volume_id': volume_id,
+        'lod': lod,
+        'quantization_bits': quantization_bits,
+    })
+    row = cursor.fetchone()
+    if not row:
+        raise Http404(f"Could not find volume {volume_id}")
+
+    edition_time, lod_edition_time, data = row
+    if data is not None and lod_edition_time == edition_time:
+        return bytes(data)
+
+    mesh_lods = update_volume_mesh_lods(project_id, [volume_id], quantization_bits)
+    return mesh_lods[volume_id][lod]
+
+
+def update_volume_mesh_lods(project_id, volume_ids=None, quantization_bits=0) -> Dict[int, List[bytes]]:
+    """Compute the binary representations of all levels of detail (LODs) of the
+    passed in volumes, store them in the database and return them as a list
+    per volume. LOD 0 is the original mesh, each additional LOD is a
+    decimation of it on a grid defined by VOLUME_MESH_LOD_GRID_SIZES.
+    """
+    grid_sizes = settings.VOLUME_MESH_LOD_GRID_SIZES
+    n_lods = len(grid_sizes) + 1
+
+    mesh_lods = {}
+    rows:List[Tuple] = []
+    for volume_id, v in get_volume_data(project_id, volume_ids).items():
+        vertices = np.asarray(v['vertices'], dtype=np.float64).reshape(-1, 3)
+        faces = np.asarray(v['faces'], dtype=np.int64).reshape(-1, 3)
+        extent = (vertices.max(axis=0) - vertices.min(axis=0)).max() \
+                if len(vertices) else 0
+        lods = []
+        for lod in range(n_lods):
+            if lod > 0 and extent > 0:
+                lod_vertices, lod_faces = decimate_mesh(vertices, faces,
+                        extent / grid_sizes[lod - 1])
+            else:
+                lod_vertices, lod_faces = vertices, faces
+            data = encode_mesh(lod_vertices, lod_faces, quantization_bits, lod, n_lods)
+            lods.append(data)
+            rows.append((volume_id, lod, v['edition_time'], len(lod_vertices),
+                    len(lod_faces), data))
+        mesh_lods[volume_id] = lods
+
+    if rows:
+        cursor = connection.cursor()
+        cursor.execute("""
+            INSERT INTO catmaid_volume_mesh_lod (project_id, volume_id, lod,
+                quantization_bits, edition_time, num_vertices, num_faces, data)
+            SELECT %(project_id)s, l.volume_id, l.lod, %(quantization_bits)s,
+                l.edition_time, l.num_vertices, l.num_faces, l.data
+            FROM UNNEST(%(volume_ids)s::bigint[], %(lods)s::smallint[],
+                %(edition_times)s::timestamptz[], %(num_vertices)s::int[],
+                %(num_faces)s::int[], %(data)s::bytea[])
+                AS l(volume_id, lod, edition_time, num_vertices, num_faces, data)
+            ON CONFLICT (volume_id, lod, quantization_bits) DO UPDATE
+            SET edition_time = EXCLUDED.edition_time,
+                num_vertices = EXCLUDED.num_vertices,
+                num_faces = EXCLUDED.num_faces,
+                data = EXCLUDED.data
+        """, {
+            'project_id': project_id,
+            'quantization_bits': quantization_bits,
+            'volume_ids': [r[0] for r in rows],
+            'lods': [r[1] for r in rows],
+            'edition_times': [r[2] for r in rows],
+            'num_vertices': [r[3] for r in rows],
+            'num_faces': [r[4] for r in rows],
+            'data': [r[5] for r in rows],
+        })
+
+    return mesh_lods
+
+
 @api_view(['GET', 'POST'])
 @requires_user_role(UserRole.Browse)
 def from_origin(request:HttpRequest, project_id=None) -> JsonResponse:
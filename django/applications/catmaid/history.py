@@ -1,6 +1,11 @@
 
 import functools
+import gzip
+import os
 import re
+from typing import List
+
+from psycopg2 import sql
 
 from django.db import connection
 from django.db.transaction import TransactionManagementError
@@ -136,3 +141,125 @@ def disable_history_tracking(ignore_missing_fn=False) -> bool:
         'lock_id':  locks.history_update_event_lock
     })
     return True
+
+
+def get_history_live_tables(cursor=None) -> List[str]:
+    """Return the names of all live tables with a history table.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute("""
+        SELECT live_table::text
+        FROM catmaid_history_table
+        ORDER BY live_table::text
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_history_partitions(live_table, before, cursor=None) -> int:
+    """Move all history rows of the passed in live table, which were archived
+    before the month of <before>, into monthly partitions of the history
+    table. History queries that are constrained by the archival time (the
+    upper bound of the validity period) only read the relevant partitions.
+    Returns the number of moved rows.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute("""
+        SELECT create_history_partitions(%(live_table)s::regclass, %(before)s)
+    """, {
+        'live_table': live_table,
+        'before': before,
+    })
+    return cursor.fetchone()[0]
+
+
+def detach_history_partitions(live_table, before, cursor=None) -> List[str]:
+    """Detach all history partitions of the passed in live table that only
+    contain rows archived before <before>. Detached partitions are kept as
+    regular tables, but aren't part of history queries anymore. Returns the
+    names of the detached partitions.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute("""
+        SELECT detach_history_partitions(%(live_table)s::regclass, %(before)s)
+    """, {
+        'live_table': live_table,
+        'before': before,
+    })
+    return [row[0] for row in cursor.fetchall()]
+
+
+def export_history_partition(partition_table, target_dir, cursor=None) -> str:
+    """Write all rows of the passed in detached history partition into a
+    gzip-compressed CSV file in <target_dir> and drop the partition. Returns
+    the path of the written file.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute("""
+        SELECT detached
+        FROM catmaid_history_partition
+        WHERE partition_table = %(partition_table)s
+    """, {
+        'partition_table': partition_table,
+    })
+    result = cursor.fetchone()
+    if not result:
+        raise ValueError(f'Unknown history partition: {partition_table}')
+    if not result[0]:
+        raise ValueError(f'History partition {partition_table} needs to be '
+                'detached before it can be exported')
+
+    path = os.path.join(target_dir, f'{partition_table}.csv.gz')
+    with gzip.open(path, 'wb') as f:
+        cursor.copy_expert(sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)")
+                .format(sql.Identifier(partition_table)), f)
+    cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition_table)))
+    cursor.execute("""
+        DELETE FROM catmaid_history_partition
+        WHERE partition_table = %(partition_table)s
+    """, {
+        'partition_table': partition_table,
+    })
+    return path
+
+
+def get_detached_history_partitions(live_table=None, cursor=None) -> List[str]:
+    """Return the names of all detached history partitions, optionally only
+    of the passed in live table.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute("""
+        SELECT chp.partition_table
+        FROM catmaid_history_partition chp
+        JOIN catmaid_history_table cht
+            ON cht.history_table::text = chp.history_table
+        WHERE chp.detached
+        {}
+        ORDER BY chp.partition_table
+    """.format('AND cht.live_table = %(live_table)s::regclass' if live_table else ''), {
+        'live_table': live_table,
+    })
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_historic_table_query(live_table, columns, time_column='edition_time',
+        time_param='as_of') -> str:
+    """Return a SQL sub-query that selects the passed in columns of all rows
+    of a live table that were valid at the point in time passed in as query
+    parameter <time_param>. Rows are read from the live table if they were
+    last edited before this time and from the history table otherwise. The
+    result needs an alias. Postgres pushes constraints on it down into both
+    parts, which allows using the GiST indices on the validity periods of
+    history tables. The explicit upper bound constraint lets the query planner
+    skip history partitions that were archived before the requested time.
+    """
+    column_list = ', '.join(columns)
+    return f'''(
+        SELECT {column_list}
+        FROM {live_table}
+        WHERE {time_column} <= %({time_param})s
+        UNION ALL
+        SELECT {column_list}
+        FROM {live_table}__history
+        WHERE sys_period @> %({time_param})s::timestamptz
+        AND upper(sys_period) > %({time_param})s::timestamptz
+    )'''
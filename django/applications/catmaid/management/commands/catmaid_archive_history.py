@@ -0,0 +1,71 @@
+import os
+
+from dateutil import parser as dateparser
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from catmaid.history import (create_history_partitions,
+        detach_history_partitions, export_history_partition,
+        get_detached_history_partitions, get_history_live_tables)
+
+
+class Command(BaseCommand):
+    help = ("Move history rows into monthly partitions of their history "
+            "tables. Optionally, old partitions can be detached from history "
+            "queries and exported into compressed CSV files.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', dest='tables', nargs='+', default=None,
+            help='Only partition the history of these live tables (otherwise all)')
+        parser.add_argument('--before', dest='before', default=None,
+            help='Partition all history rows archived before the month of '
+            'this date (default: now)')
+        parser.add_argument('--detach-before', dest='detach_before', default=None,
+            help='Detach all partitions that only contain history rows '
+            'archived before this date')
+        parser.add_argument('--export-dir', dest='export_dir', default=None,
+            help='Export all detached partitions as gzip-compressed CSV files '
+            'into this directory and drop them from the database')
+
+    def parse_date(self, value):
+        try:
+            date = dateparser.parse(value)
+        except (ValueError, OverflowError):
+            raise CommandError(f'Could not parse date: {value}')
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.utc)
+        return date
+
+    def handle(self, *args, **options):
+        before = self.parse_date(options['before']) if options['before'] \
+                else timezone.now()
+        detach_before = self.parse_date(options['detach_before']) \
+                if options['detach_before'] else None
+        export_dir = options['export_dir']
+        if export_dir and not os.path.isdir(export_dir):
+            raise CommandError(f'Export directory does not exist: {export_dir}')
+
+        live_tables = options['tables']
+        if not live_tables:
+            live_tables = get_history_live_tables()
+
+        for live_table in live_tables:
+            # Every table is handled in its own transaction to keep locks
+            # short-lived.
+            with transaction.atomic():
+                cursor = connection.cursor()
+                n_moved = create_history_partitions(live_table, before, cursor)
+                self.stdout.write(f'{live_table}: moved {n_moved} history rows '
+                        'into partitions')
+                if detach_before:
+                    detached = detach_history_partitions(live_table,
+                            detach_before, cursor)
+                    for partition in detached:
+                        self.stdout.write(f'{live_table}: detached partition {partition}')
+                if export_dir:
+                    for partition in get_detached_history_partitions(live_table, cursor):
+                        path = export_history_partition(partition, export_dir, cursor)
+                        self.stdout.write(f'{live_table}: exported partition '
+                                f'{partition} to {path}')
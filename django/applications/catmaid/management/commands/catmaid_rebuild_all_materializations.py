@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
 
+from catmaid.control.annotation import (rebuild_annotation_closure,
+        rebuild_annotation_stats)
 from catmaid.control.edge import rebuild_edge_tables
 from catmaid.control.stats import populate_stats_summary
 from catmaid.control.node import update_node_query_cache
@@ -11,7 +13,8 @@ class Command(BaseCommand):
     help = "Recreates all entries for the following tables, which act as " + \
            "materialized views: treenode_edge, treenode_connector_edge, " + \
            "connector_geom, catmaid_stats_summary, node_query_cache, " + \
-           "catmaid_skeleton_summary"
+           "catmaid_skeleton_summary, catmaid_annotation_closure, " + \
+           "catmaid_annotation_stats, catmaid_annotation_co_occurrence"
 
     def handle(self, *args, **options):
         cursor = connection.cursor()
@@ -32,6 +35,12 @@ class Command(BaseCommand):
             SELECT refresh_skeleton_summary_table();
         """)
 
+        self.stdout.write('Recreating catmaid_annotation_closure')
+        rebuild_annotation_closure()
+
+        self.stdout.write('Recreating catmaid_annotation_stats, catmaid_annotation_co_occurrence')
+        rebuild_annotation_stats(project_ids)
+
         self.stdout.write('Recreating node_query_cache')
         update_node_query_cache(log=lambda x: self.stdout.write(x))
 
@@ -1,7 +1,7 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 
-from catmaid.control.stats import populate_stats_summary
+from catmaid.control.stats import populate_stats_summaries
 from catmaid.models import Project
 
 
@@ -13,6 +13,8 @@ class Command(BaseCommand):
             default=False, help='Remove all existing statistics before recomputation'),
         parser.add_argument('--project_id', dest='project_id', nargs='+',
             default=False, help='Compute only statistics for these projects only (otherwise all)'),
+        parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+            help='The number of statistics metrics that are computed in parallel'),
 
     def handle(self, *args, **options):
         cursor = connection.cursor()
@@ -33,6 +35,7 @@ class Command(BaseCommand):
                 cursor.execute("TRUNCATE catmaid_stats_summary")
 
         incremental = not clean
-        for p in projects:
-            populate_stats_summary(p.id, delete, incremental)
-            self.stdout.write(f'Computed statistics for project {p.id}')
+        failures = populate_stats_summaries([p.id for p in projects], delete,
+                incremental, options['jobs'], log=self.stdout.write)
+        if failures:
+            raise CommandError(f'Could not compute {len(failures)} statistics metrics')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catmaid.control.volume import update_skeleton_innervations
+from catmaid.models import Project
+
+
+class Command(BaseCommand):
+    help = "Update the precomputed skeleton volume innervation table, optionally from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clean', action='store_true', dest='clean',
+            default=False, help='Remove all existing innervation data before recomputation'),
+        parser.add_argument('--project_id', dest='project_id', nargs='+',
+            default=False, help='Compute only innervations for these projects only (otherwise all)'),
+        parser.add_argument('--chunk-size', dest='chunk_size', default=500, type=int,
+            help='The number of skeletons processed at a time')
+
+    def handle(self, *args, **options):
+        project_ids = options['project_id']
+        if project_ids:
+            projects = Project.objects.filter(id__in=project_ids)
+        else:
+            projects = Project.objects.all()
+
+        for p in projects:
+            with transaction.atomic():
+                result = update_skeleton_innervations(p.id, clean=options['clean'],
+                        chunk_size=options['chunk_size'],
+                        log=lambda x: self.stdout.write(x))
+            self.stdout.write(f'Updated innervations for project {p.id}: '
+                    f'{result["n_updated_volumes"]} volumes and '
+                    f'{result["n_updated_skeletons"]} skeletons changed')
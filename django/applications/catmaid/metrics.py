@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+# In-process collection of request, database and node provider metrics. All
+# values are kept per server process, i.e. each WSGI/ASGI worker collects its
+# own numbers.
+
+from bisect import bisect_left
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bounds (in seconds) of the request latency histogram buckets. An
+# implicit last bucket collects everything above the largest bound.
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+        5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram(object):
+    """A histogram with fixed buckets, each counting the observed values that
+    are smaller or equal than its upper bound (and larger than the previous
+    bound).
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[int]:
+        """Return the number of observations that are smaller or equal than
+        each bucket bound, including the implicit +Inf bound.
+        """
+        result = []
+        total = 0
+        for c in self.counts:
+            total += c
+            result.append(total)
+        return result
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class QueryCounter(object):
+    """A database execute wrapper that counts the executed queries and their
+    total execution time, see Django's connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.n_queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.n_queries += 1
+
+
+class EndpointMetrics(object):
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.latency = Histogram(buckets)
+        self.errors = 0
+        self.db_queries = 0
+        self.db_time = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'latency': self.latency.as_dict(),
+            'errors': self.errors,
+            'db_queries': self.db_queries,
+            'db_time': self.db_time,
+        }
+
+
+class ServerMetrics(object):
+    """Collects request latencies, database use per endpoint and node provider
+    use. All methods are thread-safe.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.start_time = time.time()
+            self.endpoints:Dict[str, EndpointMetrics] = {}
+            self.node_providers:Dict[str, Dict[str, int]] = {}
+
+    def observe_request(self, endpoint, duration, status=200, db_queries=0,
+            db_time=0.0) -> None:
+        """Record a single request to the passed in endpoint. Responses with a
+        status of 500 and above are counted as errors.
+        """
+        with self.lock:
+            metrics = self.endpoints.get(endpoint)
+            if not metrics:
+                metrics = self.endpoints[endpoint] = EndpointMetrics(self.buckets)
+            metrics.latency.observe(duration)
+            metrics.db_queries += db_queries
+            metrics.db_time += db_time
+            if status >= 500:
+                metrics.errors += 1
+
+    def observe_node_provider(self, provider, hit) -> None:
+        """Record whether the passed in node provider answered a node query
+        (hit) or had to defer to the next provider (miss).
+        """
+        with self.lock:
+            counts = self.node_providers.get(provider)
+            if not counts:
+                counts = self.node_providers[provider] = {'hits': 0, 'misses': 0}
+            counts['hits' if hit else 'misses'] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'since': self.start_time,
+                'endpoints': {k: v.as_dict() for k,v in self.endpoints.items()},
+                'node_providers': {k: dict(v) for k,v in self.node_providers.items()},
+            }
+
+
+server_metrics = ServerMetrics()
+
+
+def get_celery_queue_depths(timeout=2.0) -> Dict[str, Optional[int]]:
+    """Return the number of waiting messages in each known Celery queue. Queues
+    that can't be inspected map to None. If the broker can't be reached, an
+    empty dictionary is returned.
+    """
+    from celery import current_app
+
+    queue_names = {current_app.conf.task_default_queue}
+    if current_app.conf.task_queues:
+        queue_names.update(q.name for q in current_app.conf.task_queues)
+
+    depths:Dict[str, Optional[int]] = {}
+    try:
+        with current_app.connection_for_read() as conn:
+            conn.ensure_connection(max_retries=1, interval_start=0,
+                    timeout=timeout)
+            for name in sorted(queue_names):
+                try:
+                    with conn.channel() as channel:
+                        depths[name] = channel.queue_declare(queue=name,
+                                passive=True).message_count
+                except Exception as e:
+                    logger.debug(f'Could not inspect Celery queue {name}: {e}')
+                    depths[name] = None
+    except Exception as e:
+        logger.debug(f'Could not connect to Celery broker: {e}')
+
+    return depths
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def to_prometheus(metrics, queue_depths=None) -> str:
+    """Render the passed in metrics (see ServerMetrics.as_dict()) and Celery
+    queue depths in the Prometheus text exposition format.
+    """
+    lines = []
+
+    def add(name, mtype, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {mtype}')
+        for suffix, labels, value in samples:
+            label_str = ','.join(f'{k}="{_escape_label(v)}"' for k,v in labels)
+            lines.append(f'{name}{suffix}{{{label_str}}} {value}' if label_str
+                    else f'{name}{suffix} {value}')
+
+    endpoints = sorted(metrics['endpoints'].items())
+
+    latency_samples = []
+    for endpoint, m in endpoints:
+        latency = m['latency']
+        total = 0
+        for bound, count in zip(latency['buckets'] + ['+Inf'], latency['counts']):
+            total += count
+            latency_samples.append(('_bucket', (('endpoint', endpoint), ('le', bound)), total))
+        latency_samples.append(('_sum', (('endpoint', endpoint),), latency['sum']))
+        latency_samples.append(('_count', (('endpoint', endpoint),), latency['count']))
+    add('catmaid_request_duration_seconds', 'histogram',
+            'Request latency per endpoint.', latency_samples)
+
+    add('catmaid_request_errors_total', 'counter',
+            'Requests per endpoint that ended with a server error.',
+            [('', (('endpoint', e),), m['errors']) for e, m in endpoints])
+    add('catmaid_db_queries_total', 'counter',
+            'Database queries executed per endpoint.',
+            [('', (('endpoint', e),), m['db_queries']) for e, m in endpoints])
+    add('catmaid_db_query_duration_seconds_total', 'counter',
+            'Time spent on database queries per endpoint.',
+            [('', (('endpoint', e),), m['db_time']) for e, m in endpoints])
+
+    provider_samples = []
+    for provider, counts in sorted(metrics['node_providers'].items()):
+        provider_samples.append(('', (('provider', provider), ('result', 'hit')), counts['hits']))
+        provider_samples.append(('', (('provider', provider), ('result', 'miss')), counts['misses']))
+    add('catmaid_node_provider_queries_total', 'counter',
+            'Node queries per node provider, by whether the provider answered them.',
+            provider_samples)
+
+    if queue_depths is not None:
+        add('catmaid_celery_queue_length', 'gauge',
+                'Number of messages waiting in a Celery queue.',
+                [('', (('queue', q),), d) for q, d in sorted(queue_depths.items())
+                    if d is not None])
+
+    return '\n'.join(lines) + '\n'
@@ -4,10 +4,12 @@ import re
 import cProfile
 import pstats
 import logging
+import time
 
 from traceback import format_exc
 from datetime import datetime
 
+from django.db import connection
 from django.http import JsonResponse, Http404
 from django.conf import settings
 
@@ -17,6 +19,7 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.exceptions import APIException
 
 from catmaid.error import ClientError
+from catmaid.metrics import QueryCounter, server_metrics
 
 from io import StringIO
 
@@ -126,6 +129,31 @@ class AjaxExceptionMiddleware(object):
         return JsonResponse(response, status=status, safe=False)
 
 
+class RequestMetricsMiddleware(object):
+    """Record the latency, status and database use of each request in the
+    in-process server metrics, grouped by the view that handled the request.
+    These metrics are available through the server statistics API.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(query_counter):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = resolver_match.view_name if resolver_match else 'unresolved'
+        server_metrics.observe_request(endpoint, duration,
+                response.status_code, query_counter.n_queries,
+                query_counter.time)
+
+        return response
+
+
 class BasicModelMapMiddleware(object):
     """Redirect requests to stacks and projects to alternative models that will
     fetch information from other sources. If the url_prefix field is set, it is
@@ -0,0 +1,74 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+forward = """
+    CREATE TABLE catmaid_skeleton_volume_innervation (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        skeleton_id bigint REFERENCES class_instance(id) ON DELETE CASCADE NOT NULL,
+        volume_id bigint REFERENCES catmaid_volume(id) ON DELETE CASCADE NOT NULL,
+        num_nodes int NOT NULL DEFAULT 0,
+        cable_length real NOT NULL DEFAULT 0,
+        last_update timestamptz NOT NULL DEFAULT now(),
+        CONSTRAINT catmaid_skeleton_volume_innervation_skeleton_volume_uniq
+            UNIQUE (skeleton_id, volume_id)
+    );
+
+    -- Keep track of the skeleton and volume versions the innervation table
+    -- is up-to-date with.
+    CREATE TABLE catmaid_skeleton_innervation_state (
+        skeleton_id bigint PRIMARY KEY REFERENCES class_instance(id) ON DELETE CASCADE,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        edition_time timestamptz NOT NULL
+    );
+
+    CREATE TABLE catmaid_volume_innervation_state (
+        volume_id bigint PRIMARY KEY REFERENCES catmaid_volume(id) ON DELETE CASCADE,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        edition_time timestamptz NOT NULL
+    );
+
+    CREATE INDEX catmaid_skeleton_volume_innervation_project_id_volume_id_idx
+        ON catmaid_skeleton_volume_innervation (project_id, volume_id)
+        INCLUDE (skeleton_id, num_nodes, cable_length);
+    CREATE INDEX catmaid_skeleton_innervation_state_project_id_idx
+        ON catmaid_skeleton_innervation_state (project_id);
+    CREATE INDEX catmaid_volume_innervation_state_project_id_idx
+        ON catmaid_volume_innervation_state (project_id);
+"""
+
+backward = """
+    DROP TABLE catmaid_volume_innervation_state;
+    DROP TABLE catmaid_skeleton_innervation_state;
+    DROP TABLE catmaid_skeleton_volume_innervation;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0114_add_deep_link_exportable_flag'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='SkeletonVolumeInnervation',
+                fields=[
+                    ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                    ('num_nodes', models.IntegerField(default=0)),
+                    ('cable_length', models.FloatField(default=0)),
+                    ('last_update', models.DateTimeField(default=django.utils.timezone.now)),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                    ('skeleton', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.ClassInstance')),
+                    ('volume', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Volume')),
+                ],
+                options={
+                    'db_table': 'catmaid_skeleton_volume_innervation',
+                    'unique_together': {('skeleton', 'volume')},
+                },
+            ),
+        ]),
+    ]
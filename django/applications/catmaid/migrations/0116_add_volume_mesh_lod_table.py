@@ -0,0 +1,57 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+forward = """
+    CREATE TABLE catmaid_volume_mesh_lod (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        volume_id bigint REFERENCES catmaid_volume(id) ON DELETE CASCADE NOT NULL,
+        lod smallint NOT NULL,
+        quantization_bits smallint NOT NULL DEFAULT 0,
+        -- The volume edition time this representation was computed for
+        edition_time timestamptz NOT NULL,
+        num_vertices int NOT NULL,
+        num_faces int NOT NULL,
+        data bytea NOT NULL,
+        CONSTRAINT catmaid_volume_mesh_lod_volume_lod_quantization_uniq
+            UNIQUE (volume_id, lod, quantization_bits)
+    );
+
+    CREATE INDEX catmaid_volume_mesh_lod_project_id_idx
+        ON catmaid_volume_mesh_lod (project_id);
+"""
+
+backward = """
+    DROP TABLE catmaid_volume_mesh_lod;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0115_add_skeleton_volume_innervation_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='VolumeMeshLOD',
+                fields=[
+                    ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                    ('lod', models.SmallIntegerField()),
+                    ('quantization_bits', models.SmallIntegerField(default=0)),
+                    ('edition_time', models.DateTimeField()),
+                    ('num_vertices', models.IntegerField()),
+                    ('num_faces', models.IntegerField()),
+                    ('data', models.BinaryField()),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                    ('volume', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Volume')),
+                ],
+                options={
+                    'db_table': 'catmaid_volume_mesh_lod',
+                    'unique_together': {('volume', 'lod', 'quantization_bits')},
+                },
+            ),
+        ]),
+    ]
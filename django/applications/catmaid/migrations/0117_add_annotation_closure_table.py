@@ -0,0 +1,301 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+forward = """
+    -- Each row represents the fact that the descendant annotation is
+    -- (transitively) annotated with the ancestor annotation. The depth is the
+    -- length of the shortest annotation path between both. There are no
+    -- foreign keys to class_instance on purpose: entries are removed by the
+    -- link triggers below, which need the existing entries of deleted
+    -- annotations to find all affected ancestors.
+    CREATE TABLE catmaid_annotation_closure (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        ancestor_id bigint NOT NULL,
+        descendant_id bigint NOT NULL,
+        depth int NOT NULL,
+        CONSTRAINT catmaid_annotation_closure_ancestor_descendant_uniq
+            UNIQUE (ancestor_id, descendant_id)
+    );
+
+    CREATE INDEX catmaid_annotation_closure_descendant_id_idx
+        ON catmaid_annotation_closure (descendant_id)
+        INCLUDE (ancestor_id, depth);
+    CREATE INDEX catmaid_annotation_closure_project_id_idx
+        ON catmaid_annotation_closure (project_id);
+
+
+    -- Recompute all closure entries of the passed in ancestor annotations
+    -- with a breadth-first search over the annotation to annotation links.
+    -- Because the first path found to each descendant is a shortest path,
+    -- existing entries are never updated.
+    CREATE OR REPLACE FUNCTION rebuild_annotation_closure(ancestor_ids bigint[])
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        current_depth int := 1;
+        n_added bigint;
+    BEGIN
+        DELETE FROM catmaid_annotation_closure
+        WHERE ancestor_id = ANY(ancestor_ids);
+
+        INSERT INTO catmaid_annotation_closure (project_id, ancestor_id,
+            descendant_id, depth)
+        SELECT cici.project_id, cici.class_instance_b, cici.class_instance_a, 1
+        FROM class_instance_class_instance cici
+        JOIN relation r
+            ON r.id = cici.relation_id
+        JOIN class_instance ci
+            ON ci.id = cici.class_instance_a
+        JOIN class c
+            ON c.id = ci.class_id
+        WHERE cici.class_instance_b = ANY(ancestor_ids)
+            AND r.relation_name = 'annotated_with'
+            AND c.class_name = 'annotation'
+        ON CONFLICT (ancestor_id, descendant_id) DO NOTHING;
+
+        LOOP
+            INSERT INTO catmaid_annotation_closure (project_id, ancestor_id,
+                descendant_id, depth)
+            SELECT ac.project_id, ac.ancestor_id, cici.class_instance_a,
+                current_depth + 1
+            FROM catmaid_annotation_closure ac
+            JOIN class_instance_class_instance cici
+                ON cici.class_instance_b = ac.descendant_id
+            JOIN relation r
+                ON r.id = cici.relation_id
+            JOIN class_instance ci
+                ON ci.id = cici.class_instance_a
+            JOIN class c
+                ON c.id = ci.class_id
+            WHERE ac.ancestor_id = ANY(ancestor_ids)
+                AND ac.depth = current_depth
+                AND r.relation_name = 'annotated_with'
+                AND c.class_name = 'annotation'
+            ON CONFLICT (ancestor_id, descendant_id) DO NOTHING;
+
+            GET DIAGNOSTICS n_added = ROW_COUNT;
+            EXIT WHEN n_added = 0;
+            current_depth := current_depth + 1;
+        END LOOP;
+    END;
+    $$;
+
+
+    -- New annotation to annotation links connect all ancestors of the parent
+    -- annotation with all descendants of the child annotation. Links are
+    -- added one after another, so that paths through other new links are
+    -- found as well.
+    CREATE OR REPLACE FUNCTION on_insert_cici_update_annotation_closure()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        link record;
+    BEGIN
+        FOR link IN
+            SELECT DISTINCT l.project_id, l.class_instance_a AS child_id,
+                l.class_instance_b AS parent_id
+            FROM inserted_cici l
+            JOIN relation r
+                ON r.id = l.relation_id
+            JOIN class_instance ci
+                ON ci.id = l.class_instance_a
+            JOIN class c
+                ON c.id = ci.class_id
+            WHERE r.relation_name = 'annotated_with'
+                AND c.class_name = 'annotation'
+        LOOP
+            INSERT INTO catmaid_annotation_closure (project_id, ancestor_id,
+                descendant_id, depth)
+            SELECT link.project_id, a.ancestor_id, d.descendant_id,
+                MIN(a.depth + 1 + d.depth)
+            FROM (
+                SELECT link.parent_id AS ancestor_id, 0 AS depth
+                UNION ALL
+                SELECT ac.ancestor_id, ac.depth
+                FROM catmaid_annotation_closure ac
+                WHERE ac.descendant_id = link.parent_id
+            ) a
+            CROSS JOIN (
+                SELECT link.child_id AS descendant_id, 0 AS depth
+                UNION ALL
+                SELECT ac.descendant_id, ac.depth
+                FROM catmaid_annotation_closure ac
+                WHERE ac.ancestor_id = link.child_id
+            ) d
+            GROUP BY a.ancestor_id, d.descendant_id
+            ON CONFLICT (ancestor_id, descendant_id) DO UPDATE
+            SET depth = LEAST(catmaid_annotation_closure.depth, EXCLUDED.depth);
+        END LOOP;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Removed links can invalidate any path from an ancestor of the parent
+    -- annotation, which is why the closure of all those ancestors is
+    -- recomputed. The class of a deleted child can't be checked anymore if
+    -- it has been deleted along with its links, so only parents that have
+    -- annotation descendants are considered.
+    CREATE OR REPLACE FUNCTION on_delete_cici_update_annotation_closure()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        parent_ids bigint[];
+    BEGIN
+        SELECT array_agg(DISTINCT l.class_instance_b)
+        INTO parent_ids
+        FROM deleted_cici l
+        JOIN relation r
+            ON r.id = l.relation_id
+        LEFT JOIN class_instance ci
+            ON ci.id = l.class_instance_a
+        LEFT JOIN class c
+            ON c.id = ci.class_id
+        WHERE r.relation_name = 'annotated_with'
+            AND (ci.id IS NULL OR c.class_name = 'annotation')
+            AND EXISTS (
+                SELECT 1 FROM catmaid_annotation_closure ac
+                WHERE ac.ancestor_id = l.class_instance_b
+            );
+
+        IF parent_ids IS NOT NULL THEN
+            PERFORM rebuild_annotation_closure(array_cat(parent_ids, ARRAY(
+                SELECT DISTINCT ac.ancestor_id
+                FROM catmaid_annotation_closure ac
+                WHERE ac.descendant_id = ANY(parent_ids)
+            )));
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Updated links are treated like a removal of the old and an insertion of
+    -- the new link. Recomputing the ancestors of both parents covers both.
+    -- Updates that don't change the linked instances or the relation (e.g.
+    -- of the edition time) are ignored.
+    CREATE OR REPLACE FUNCTION on_edit_cici_update_annotation_closure()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        parent_ids bigint[];
+    BEGIN
+        WITH changed_link AS (
+            SELECT o.class_instance_a AS old_a, o.class_instance_b AS old_b,
+                o.relation_id AS old_relation_id,
+                n.class_instance_a AS new_a, n.class_instance_b AS new_b,
+                n.relation_id AS new_relation_id
+            FROM old_cici o
+            JOIN new_cici n
+                ON n.id = o.id
+            WHERE (o.class_instance_a, o.class_instance_b, o.relation_id) IS DISTINCT FROM
+                (n.class_instance_a, n.class_instance_b, n.relation_id)
+        )
+        SELECT array_agg(DISTINCT l.class_instance_b)
+        INTO parent_ids
+        FROM (
+            SELECT old_a, old_b, old_relation_id
+            FROM changed_link
+            UNION
+            SELECT new_a, new_b, new_relation_id
+            FROM changed_link
+        ) l(class_instance_a, class_instance_b, relation_id)
+        JOIN relation r
+            ON r.id = l.relation_id
+        JOIN class_instance ci
+            ON ci.id = l.class_instance_a
+        JOIN class c
+            ON c.id = ci.class_id
+        WHERE r.relation_name = 'annotated_with'
+            AND c.class_name = 'annotation';
+
+        IF parent_ids IS NOT NULL THEN
+            PERFORM rebuild_annotation_closure(array_cat(parent_ids, ARRAY(
+                SELECT DISTINCT ac.ancestor_id
+                FROM catmaid_annotation_closure ac
+                WHERE ac.descendant_id = ANY(parent_ids)
+            )));
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE TRIGGER on_insert_cici_update_annotation_closure
+    AFTER INSERT ON class_instance_class_instance
+    REFERENCING NEW TABLE AS inserted_cici
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_cici_update_annotation_closure();
+
+    CREATE TRIGGER on_edit_cici_update_annotation_closure
+    AFTER UPDATE ON class_instance_class_instance
+    REFERENCING NEW TABLE AS new_cici OLD TABLE AS old_cici
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_cici_update_annotation_closure();
+
+    CREATE TRIGGER on_delete_cici_update_annotation_closure
+    AFTER DELETE ON class_instance_class_instance
+    REFERENCING OLD TABLE AS deleted_cici
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_cici_update_annotation_closure();
+
+
+    -- Populate the closure table for all existing annotation hierarchies.
+    SELECT rebuild_annotation_closure(ARRAY(
+        SELECT DISTINCT cici.class_instance_b
+        FROM class_instance_class_instance cici
+        JOIN relation r
+            ON r.id = cici.relation_id
+        JOIN class_instance ci
+            ON ci.id = cici.class_instance_a
+        JOIN class c
+            ON c.id = ci.class_id
+        WHERE r.relation_name = 'annotated_with'
+            AND c.class_name = 'annotation'
+    ));
+"""
+
+backward = """
+    DROP TRIGGER on_insert_cici_update_annotation_closure ON class_instance_class_instance;
+    DROP TRIGGER on_edit_cici_update_annotation_closure ON class_instance_class_instance;
+    DROP TRIGGER on_delete_cici_update_annotation_closure ON class_instance_class_instance;
+
+    DROP FUNCTION on_insert_cici_update_annotation_closure();
+    DROP FUNCTION on_edit_cici_update_annotation_closure();
+    DROP FUNCTION on_delete_cici_update_annotation_closure();
+    DROP FUNCTION rebuild_annotation_closure(bigint[]);
+
+    DROP TABLE catmaid_annotation_closure;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0116_add_volume_mesh_lod_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='AnnotationClosure',
+                fields=[
+                    ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                    ('depth', models.IntegerField()),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                    ('ancestor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='annotation_descendants', to='catmaid.ClassInstance')),
+                    ('descendant', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='annotation_ancestors', to='catmaid.ClassInstance')),
+                ],
+                options={
+                    'db_table': 'catmaid_annotation_closure',
+                    'unique_together': {('ancestor', 'descendant')},
+                },
+            ),
+        ]),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+forward = """
+    -- Allow paging through the class instances of a project sorted by name or
+    -- ID with index scans, starting at an arbitrary position. Including the
+    -- class ID allows filtering by type without table access.
+    CREATE INDEX class_instance_project_id_name_id_idx
+        ON class_instance (project_id, name, id)
+        INCLUDE (class_id);
+    CREATE INDEX class_instance_project_id_id_idx
+        ON class_instance (project_id, id)
+        INCLUDE (class_id);
+
+    -- Cover the annotation lookups of individual entities and the model_of
+    -- lookups of neurons.
+    CREATE INDEX class_instance_class_instance_a_relation_id_idx
+        ON class_instance_class_instance (class_instance_a, relation_id)
+        INCLUDE (class_instance_b, user_id, creation_time);
+    CREATE INDEX class_instance_class_instance_b_relation_id_idx
+        ON class_instance_class_instance (class_instance_b, relation_id)
+        INCLUDE (class_instance_a);
+"""
+
+backward = """
+    DROP INDEX class_instance_project_id_name_id_idx;
+    DROP INDEX class_instance_project_id_id_idx;
+    DROP INDEX class_instance_class_instance_a_relation_id_idx;
+    DROP INDEX class_instance_class_instance_b_relation_id_idx;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0117_add_annotation_closure_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,485 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+forward = """
+    -- Usage statistics of each annotation: the number of links to it, the
+    -- most recent creation and edition time of these links and the user who
+    -- edited the most recent link.
+    CREATE TABLE catmaid_annotation_stats (
+        annotation_id bigint PRIMARY KEY REFERENCES class_instance(id) ON DELETE CASCADE,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        num_usage bigint NOT NULL DEFAULT 0,
+        last_user_id int REFERENCES auth_user(id) ON DELETE SET NULL,
+        last_creation_time timestamptz,
+        last_edition_time timestamptz
+    );
+
+    -- The number of neurons that are annotated with both annotation A and
+    -- annotation B. Each pair is stored in both directions.
+    CREATE TABLE catmaid_annotation_co_occurrence (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        project_id int REFERENCES project(id) ON DELETE CASCADE NOT NULL,
+        annotation_a_id bigint REFERENCES class_instance(id) ON DELETE CASCADE NOT NULL,
+        annotation_b_id bigint REFERENCES class_instance(id) ON DELETE CASCADE NOT NULL,
+        num_entities bigint NOT NULL,
+        CONSTRAINT catmaid_annotation_co_occurrence_a_b_uniq
+            UNIQUE (annotation_a_id, annotation_b_id)
+    );
+
+    CREATE INDEX catmaid_annotation_stats_project_id_idx
+        ON catmaid_annotation_stats (project_id);
+    CREATE INDEX catmaid_annotation_co_occurrence_project_id_idx
+        ON catmaid_annotation_co_occurrence (project_id);
+    CREATE INDEX catmaid_annotation_co_occurrence_annotation_b_id_idx
+        ON catmaid_annotation_co_occurrence (annotation_b_id);
+
+
+    -- Recompute the statistics of the passed in annotations from all their
+    -- links.
+    CREATE OR REPLACE FUNCTION refresh_annotation_stats(annotation_ids bigint[])
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        DELETE FROM catmaid_annotation_stats
+        WHERE annotation_id = ANY(annotation_ids);
+
+        INSERT INTO catmaid_annotation_stats (annotation_id, project_id,
+            num_usage, last_user_id, last_creation_time, last_edition_time)
+        SELECT DISTINCT ON (cici.class_instance_b) cici.class_instance_b,
+            cici.project_id, COUNT(*) OVER w, cici.user_id,
+            MAX(cici.creation_time) OVER w, cici.edition_time
+        FROM class_instance_class_instance cici
+        JOIN relation r
+            ON r.id = cici.relation_id
+        WHERE cici.class_instance_b = ANY(annotation_ids)
+            AND r.relation_name = 'annotated_with'
+        WINDOW w AS (PARTITION BY cici.class_instance_b)
+        ORDER BY cici.class_instance_b, cici.edition_time DESC;
+    END;
+    $$;
+
+
+    -- Update the co-occurrence counts of neurons for which the passed in
+    -- annotation links have been added and removed. The current state of the
+    -- class_instance_class_instance table is expected to include all added
+    -- links and none of the removed links. Only pairs that contain a changed
+    -- link can change, which is why other pairs aren't looked at.
+    CREATE OR REPLACE FUNCTION update_annotation_co_occurrence(
+        added_entity_ids bigint[], added_annotation_ids bigint[],
+        removed_entity_ids bigint[], removed_annotation_ids bigint[])
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        WITH changed_link AS (
+            SELECT entity_id, annotation_id, true AS added
+            FROM UNNEST(added_entity_ids, added_annotation_ids)
+                l(entity_id, annotation_id)
+            UNION ALL
+            SELECT entity_id, annotation_id, false AS added
+            FROM UNNEST(removed_entity_ids, removed_annotation_ids)
+                l(entity_id, annotation_id)
+        ), neuron_changed_link AS (
+            SELECT DISTINCT cl.entity_id, cl.annotation_id, cl.added
+            FROM changed_link cl
+            JOIN class_instance e
+                ON e.id = cl.entity_id
+            JOIN class c
+                ON c.id = e.class_id
+            WHERE c.class_name = 'neuron'
+        ), after_link AS (
+            SELECT DISTINCT cici.class_instance_a AS entity_id,
+                cici.class_instance_b AS annotation_id
+            FROM class_instance_class_instance cici
+            JOIN relation r
+                ON r.id = cici.relation_id
+            WHERE cici.class_instance_a IN (
+                    SELECT entity_id FROM neuron_changed_link)
+                AND r.relation_name = 'annotated_with'
+        ), before_link AS (
+            (
+                SELECT entity_id, annotation_id FROM after_link
+                EXCEPT
+                SELECT entity_id, annotation_id FROM neuron_changed_link
+                WHERE added
+            )
+            UNION
+            SELECT entity_id, annotation_id FROM neuron_changed_link
+            WHERE NOT added
+        ), after_pair AS (
+            SELECT l1.entity_id, l1.annotation_id AS a, l2.annotation_id AS b
+            FROM after_link l1
+            JOIN after_link l2
+                ON l1.entity_id = l2.entity_id
+                AND l1.annotation_id <> l2.annotation_id
+            WHERE EXISTS (
+                SELECT 1 FROM neuron_changed_link cl
+                WHERE cl.entity_id = l1.entity_id
+                    AND cl.annotation_id IN (l1.annotation_id, l2.annotation_id)
+            )
+        ), before_pair AS (
+            SELECT l1.entity_id, l1.annotation_id AS a, l2.annotation_id AS b
+            FROM before_link l1
+            JOIN before_link l2
+                ON l1.entity_id = l2.entity_id
+                AND l1.annotation_id <> l2.annotation_id
+            WHERE EXISTS (
+                SELECT 1 FROM neuron_changed_link cl
+                WHERE cl.entity_id = l1.entity_id
+                    AND cl.annotation_id IN (l1.annotation_id, l2.annotation_id)
+            )
+        ), pair_delta AS (
+            SELECT a, b, 1 AS delta
+            FROM (SELECT * FROM after_pair EXCEPT SELECT * FROM before_pair) added_pair
+            UNION ALL
+            SELECT a, b, -1 AS delta
+            FROM (SELECT * FROM before_pair EXCEPT SELECT * FROM after_pair) removed_pair
+        ), co_occurrence_delta AS (
+            SELECT ci.project_id, pd.a, pd.b, SUM(pd.delta) AS delta
+            FROM pair_delta pd
+            JOIN class_instance ci
+                ON ci.id = pd.a
+            GROUP BY ci.project_id, pd.a, pd.b
+            HAVING SUM(pd.delta) <> 0
+        ), co_occurrence_increase AS (
+            INSERT INTO catmaid_annotation_co_occurrence AS co (project_id,
+                annotation_a_id, annotation_b_id, num_entities)
+            SELECT project_id, a, b, delta
+            FROM co_occurrence_delta
+            WHERE delta > 0
+            ON CONFLICT (annotation_a_id, annotation_b_id) DO UPDATE
+            SET num_entities = co.num_entities + EXCLUDED.num_entities
+        )
+        UPDATE catmaid_annotation_co_occurrence co
+        SET num_entities = co.num_entities + d.delta
+        FROM co_occurrence_delta d
+        WHERE d.delta < 0
+            AND co.annotation_a_id = d.a
+            AND co.annotation_b_id = d.b;
+
+        -- Pairs that don't co-occur anymore must include a changed link.
+        DELETE FROM catmaid_annotation_co_occurrence co
+        WHERE co.num_entities <= 0
+            AND (co.annotation_a_id = ANY(added_annotation_ids || removed_annotation_ids)
+                OR co.annotation_b_id = ANY(added_annotation_ids || removed_annotation_ids));
+    END;
+    $$;
+
+
+    -- New links increase the usage count of their annotations and can update
+    -- the last use.
+    CREATE OR REPLACE FUNCTION on_insert_cici_update_annotation_stats()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        entity_ids bigint[];
+        annotation_ids bigint[];
+    BEGIN
+        WITH new_link AS (
+            SELECT l.project_id, l.class_instance_a, l.class_instance_b,
+                l.user_id, l.creation_time, l.edition_time
+            FROM inserted_cici l
+            JOIN relation r
+                ON r.id = l.relation_id
+            WHERE r.relation_name = 'annotated_with'
+        ), annotation_change AS (
+            SELECT DISTINCT ON (class_instance_b)
+                class_instance_b AS annotation_id, project_id,
+                COUNT(*) OVER w AS num_usage,
+                user_id AS last_user_id,
+                MAX(creation_time) OVER w AS last_creation_time,
+                edition_time AS last_edition_time
+            FROM new_link
+            WINDOW w AS (PARTITION BY class_instance_b)
+            ORDER BY class_instance_b, edition_time DESC
+        ), stats_update AS (
+            INSERT INTO catmaid_annotation_stats AS s (annotation_id,
+                project_id, num_usage, last_user_id, last_creation_time,
+                last_edition_time)
+            SELECT annotation_id, project_id, num_usage, last_user_id,
+                last_creation_time, last_edition_time
+            FROM annotation_change
+            ON CONFLICT (annotation_id) DO UPDATE
+            SET num_usage = s.num_usage + EXCLUDED.num_usage,
+                last_user_id = CASE
+                    WHEN s.last_edition_time IS NULL
+                        OR EXCLUDED.last_edition_time >= s.last_edition_time
+                    THEN EXCLUDED.last_user_id
+                    ELSE s.last_user_id END,
+                last_creation_time = GREATEST(s.last_creation_time,
+                    EXCLUDED.last_creation_time),
+                last_edition_time = GREATEST(s.last_edition_time,
+                    EXCLUDED.last_edition_time)
+        )
+        SELECT array_agg(class_instance_a), array_agg(class_instance_b)
+        INTO entity_ids, annotation_ids
+        FROM new_link;
+
+        IF entity_ids IS NOT NULL THEN
+            PERFORM update_annotation_co_occurrence(entity_ids,
+                annotation_ids, '{}'::bigint[], '{}'::bigint[]);
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Removed links decrease the usage count of their annotations. If a
+    -- removed link was the most recent one of its annotation, the last use
+    -- is recomputed.
+    CREATE OR REPLACE FUNCTION on_delete_cici_update_annotation_stats()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        entity_ids bigint[];
+        annotation_ids bigint[];
+        refresh_ids bigint[];
+    BEGIN
+        SELECT array_agg(l.class_instance_a), array_agg(l.class_instance_b)
+        INTO entity_ids, annotation_ids
+        FROM deleted_cici l
+        JOIN relation r
+            ON r.id = l.relation_id
+        WHERE r.relation_name = 'annotated_with';
+
+        IF entity_ids IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        WITH annotation_change AS (
+            SELECT l.class_instance_b AS annotation_id,
+                COUNT(*) AS num_usage,
+                MAX(l.creation_time) AS max_creation_time,
+                MAX(l.edition_time) AS max_edition_time
+            FROM deleted_cici l
+            JOIN relation r
+                ON r.id = l.relation_id
+            WHERE r.relation_name = 'annotated_with'
+            GROUP BY l.class_instance_b
+        ), stats_update AS (
+            UPDATE catmaid_annotation_stats s
+            SET num_usage = s.num_usage - ac.num_usage
+            FROM annotation_change ac
+            WHERE s.annotation_id = ac.annotation_id
+            RETURNING s.annotation_id, s.num_usage,
+                ac.max_creation_time >= s.last_creation_time
+                    OR ac.max_edition_time >= s.last_edition_time AS outdated
+        )
+        SELECT array_agg(annotation_id)
+        INTO refresh_ids
+        FROM stats_update
+        WHERE num_usage <= 0 OR outdated;
+
+        IF refresh_ids IS NOT NULL THEN
+            PERFORM refresh_annotation_stats(refresh_ids);
+        END IF;
+
+        PERFORM update_annotation_co_occurrence('{}'::bigint[],
+            '{}'::bigint[], entity_ids, annotation_ids);
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Updated links are rare, their annotations' statistics are recomputed.
+    -- Links that changed their entity, annotation or relation are treated
+    -- like removed and added links for the co-occurrence counts.
+    CREATE OR REPLACE FUNCTION on_edit_cici_update_annotation_stats()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        refresh_ids bigint[];
+        added_entity_ids bigint[];
+        added_annotation_ids bigint[];
+        removed_entity_ids bigint[];
+        removed_annotation_ids bigint[];
+    BEGIN
+        SELECT array_agg(DISTINCT l.class_instance_b)
+        INTO refresh_ids
+        FROM (
+            SELECT class_instance_b, relation_id FROM old_cici
+            UNION
+            SELECT class_instance_b, relation_id FROM new_cici
+        ) l
+        JOIN relation r
+            ON r.id = l.relation_id
+        WHERE r.relation_name = 'annotated_with';
+
+        IF refresh_ids IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        PERFORM refresh_annotation_stats(refresh_ids);
+
+        WITH changed_link AS (
+            SELECT o.class_instance_a AS old_a, o.class_instance_b AS old_b,
+                ro.relation_name = 'annotated_with' AS old_annotation,
+                n.class_instance_a AS new_a, n.class_instance_b AS new_b,
+                rn.relation_name = 'annotated_with' AS new_annotation
+            FROM old_cici o
+            JOIN new_cici n
+                ON n.id = o.id
+            JOIN relation ro
+                ON ro.id = o.relation_id
+            JOIN relation rn
+                ON rn.id = n.relation_id
+            WHERE (o.class_instance_a, o.class_instance_b, o.relation_id) IS DISTINCT FROM
+                (n.class_instance_a, n.class_instance_b, n.relation_id)
+        )
+        SELECT array_agg(new_a) FILTER (WHERE new_annotation),
+            array_agg(new_b) FILTER (WHERE new_annotation),
+            array_agg(old_a) FILTER (WHERE old_annotation),
+            array_agg(old_b) FILTER (WHERE old_annotation)
+        INTO added_entity_ids, added_annotation_ids, removed_entity_ids,
+            removed_annotation_ids
+        FROM changed_link;
+
+        IF added_entity_ids IS NOT NULL OR removed_entity_ids IS NOT NULL THEN
+            PERFORM update_annotation_co_occurrence(
+                COALESCE(added_entity_ids, '{}'::bigint[]),
+                COALESCE(added_annotation_ids, '{}'::bigint[]),
+                COALESCE(removed_entity_ids, '{}'::bigint[]),
+                COALESCE(removed_annotation_ids, '{}'::bigint[]));
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE TRIGGER on_insert_cici_update_annotation_stats
+    AFTER INSERT ON class_instance_class_instance
+    REFERENCING NEW TABLE AS inserted_cici
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_cici_update_annotation_stats();
+
+    CREATE TRIGGER on_edit_cici_update_annotation_stats
+    AFTER UPDATE ON class_instance_class_instance
+    REFERENCING NEW TABLE AS new_cici OLD TABLE AS old_cici
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_cici_update_annotation_stats();
+
+    CREATE TRIGGER on_delete_cici_update_annotation_stats
+    AFTER DELETE ON class_instance_class_instance
+    REFERENCING OLD TABLE AS deleted_cici
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_cici_update_annotation_stats();
+
+
+    -- Recompute both tables for the passed in projects.
+    CREATE OR REPLACE FUNCTION rebuild_annotation_stats(project_ids int[])
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        DELETE FROM catmaid_annotation_stats
+        WHERE project_id = ANY(project_ids);
+        DELETE FROM catmaid_annotation_co_occurrence
+        WHERE project_id = ANY(project_ids);
+
+        PERFORM refresh_annotation_stats(ARRAY(
+            SELECT DISTINCT cici.class_instance_b
+            FROM class_instance_class_instance cici
+            JOIN relation r
+                ON r.id = cici.relation_id
+            WHERE r.relation_name = 'annotated_with'
+                AND cici.project_id = ANY(project_ids)
+        ));
+
+        INSERT INTO catmaid_annotation_co_occurrence (project_id,
+            annotation_a_id, annotation_b_id, num_entities)
+        SELECT l1.project_id, l1.annotation_id, l2.annotation_id,
+            COUNT(*)
+        FROM (
+            SELECT DISTINCT cici.project_id, cici.class_instance_a AS entity_id,
+                cici.class_instance_b AS annotation_id
+            FROM class_instance_class_instance cici
+            JOIN relation r
+                ON r.id = cici.relation_id
+            JOIN class_instance e
+                ON e.id = cici.class_instance_a
+            JOIN class c
+                ON c.id = e.class_id
+            WHERE r.relation_name = 'annotated_with'
+                AND c.class_name = 'neuron'
+                AND cici.project_id = ANY(project_ids)
+        ) l1
+        JOIN (
+            SELECT DISTINCT cici.class_instance_a AS entity_id,
+                cici.class_instance_b AS annotation_id
+            FROM class_instance_class_instance cici
+            JOIN relation r
+                ON r.id = cici.relation_id
+            WHERE r.relation_name = 'annotated_with'
+                AND cici.project_id = ANY(project_ids)
+        ) l2
+            ON l1.entity_id = l2.entity_id
+            AND l1.annotation_id <> l2.annotation_id
+        GROUP BY l1.project_id, l1.annotation_id, l2.annotation_id;
+    END;
+    $$;
+
+    SELECT rebuild_annotation_stats(ARRAY(SELECT id FROM project));
+"""
+
+backward = """
+    DROP TRIGGER on_insert_cici_update_annotation_stats ON class_instance_class_instance;
+    DROP TRIGGER on_edit_cici_update_annotation_stats ON class_instance_class_instance;
+    DROP TRIGGER on_delete_cici_update_annotation_stats ON class_instance_class_instance;
+
+    DROP FUNCTION on_insert_cici_update_annotation_stats();
+    DROP FUNCTION on_edit_cici_update_annotation_stats();
+    DROP FUNCTION on_delete_cici_update_annotation_stats();
+    DROP FUNCTION rebuild_annotation_stats(int[]);
+    DROP FUNCTION update_annotation_co_occurrence(bigint[], bigint[], bigint[], bigint[]);
+    DROP FUNCTION refresh_annotation_stats(bigint[]);
+
+    DROP TABLE catmaid_annotation_co_occurrence;
+    DROP TABLE catmaid_annotation_stats;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catmaid', '0118_add_annotated_entity_search_indices'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='AnnotationStats',
+                fields=[
+                    ('annotation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='catmaid.ClassInstance')),
+                    ('num_usage', models.BigIntegerField(default=0)),
+                    ('last_creation_time', models.DateTimeField(null=True)),
+                    ('last_edition_time', models.DateTimeField(null=True)),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                    ('last_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ],
+                options={
+                    'db_table': 'catmaid_annotation_stats',
+                },
+            ),
+            migrations.CreateModel(
+                name='AnnotationCoOccurrence',
+                fields=[
+                    ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                    ('num_entities', models.BigIntegerField()),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                    ('annotation_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_occurrences_as_a', to='catmaid.ClassInstance')),
+                    ('annotation_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_occurrences_as_b', to='catmaid.ClassInstance')),
+                ],
+                options={
+                    'db_table': 'catmaid_annotation_co_occurrence',
+                    'unique_together': {('annotation_a', 'annotation_b')},
+                },
+            ),
+        ]),
+    ]
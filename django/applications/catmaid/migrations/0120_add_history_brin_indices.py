@@ -0,0 +1,72 @@
+from django.db import migrations
+
+
+forward = """
+    -- Allow paging through the transaction log of a project, newest first,
+    -- starting at an arbitrary transaction.
+    CREATE INDEX catmaid_transaction_info_project_id_execution_time_idx
+        ON catmaid_transaction_info (project_id, execution_time DESC,
+            transaction_id DESC);
+
+    -- History tables are only ever appended to, which is why their time and
+    -- transaction ID columns correlate well with the physical row order. BRIN
+    -- indices on these columns are very small and allow time bounded queries
+    -- to only read the matching parts of the table.
+    DO $$
+    DECLARE
+        ht record;
+    BEGIN
+        FOR ht IN
+            SELECT cht.history_table::text AS history_table,
+                cht.time_column, cht.txid_column
+            FROM catmaid_history_table cht
+        LOOP
+            IF EXISTS(SELECT 1 FROM pg_attribute
+                    WHERE attrelid = ht.history_table::regclass
+                    AND attname = ht.time_column AND NOT attisdropped) THEN
+                EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %s USING brin (%I)',
+                    ht.history_table || '_time_brin', ht.history_table,
+                    ht.time_column);
+            END IF;
+            IF EXISTS(SELECT 1 FROM pg_attribute
+                    WHERE attrelid = ht.history_table::regclass
+                    AND attname = ht.txid_column AND NOT attisdropped) THEN
+                EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %s USING brin (%I)',
+                    ht.history_table || '_txid_brin', ht.history_table,
+                    ht.txid_column);
+            END IF;
+        END LOOP;
+    END
+    $$;
+"""
+
+backward = """
+    DROP INDEX catmaid_transaction_info_project_id_execution_time_idx;
+
+    DO $$
+    DECLARE
+        ht record;
+    BEGIN
+        FOR ht IN
+            SELECT cht.history_table::text AS history_table
+            FROM catmaid_history_table cht
+        LOOP
+            EXECUTE format('DROP INDEX IF EXISTS %I',
+                ht.history_table || '_time_brin');
+            EXECUTE format('DROP INDEX IF EXISTS %I',
+                ht.history_table || '_txid_brin');
+        END LOOP;
+    END
+    $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0119_add_annotation_stats_tables'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
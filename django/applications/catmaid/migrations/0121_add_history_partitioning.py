@@ -0,0 +1,174 @@
+from django.db import migrations
+
+
+forward = """
+    -- Keeps track of all partitions of history tables. Partitions are regular
+    -- tables that inherit from the history table they partition. Since history
+    -- tables mirror the inheritance hierarchy of their live tables, declarative
+    -- partitioning can't be used for them. Each partition holds the history
+    -- rows that were archived in a particular time range, i.e. whose validity
+    -- period ends in this range. A CHECK constraint on the upper bound of the
+    -- validity period allows the query planner to skip partitions that can't
+    -- contain matching rows. Detached partitions don't inherit from their
+    -- history table anymore and aren't part of history queries.
+    CREATE TABLE catmaid_history_partition (
+        partition_table text PRIMARY KEY,
+        history_table text NOT NULL,
+        period tstzrange NOT NULL,
+        detached boolean NOT NULL DEFAULT false,
+        creation_time timestamptz NOT NULL DEFAULT current_timestamp
+    );
+
+    CREATE INDEX catmaid_history_partition_history_table_idx
+        ON catmaid_history_partition (history_table);
+
+
+    -- Move all rows of the history table of the passed in live table that
+    -- have been archived before the month of <before> into monthly partitions.
+    -- New history rows are always archived at the current time, which is why
+    -- older partitions don't receive new rows once they are complete. Missing
+    -- partitions are created. Returns the number of moved rows.
+    CREATE OR REPLACE FUNCTION create_history_partitions(live_table regclass,
+            before timestamptz)
+    RETURNS bigint
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        history_table_name text;
+        partition_table_name text;
+        partition_start timestamptz;
+        partition_end timestamptz;
+        last_partition_end timestamptz;
+        n_moved bigint;
+        n_total_moved bigint := 0;
+    BEGIN
+        SELECT cht.history_table::text
+        INTO history_table_name
+        FROM catmaid_history_table cht
+        WHERE cht.live_table = $1;
+
+        IF history_table_name IS NULL THEN
+            RAISE EXCEPTION 'Table % doesn''t have a history table', live_table;
+        END IF;
+
+        -- Partitions cover calendar months in UTC, independent of the time
+        -- zone of the current session.
+        last_partition_end := date_trunc('month', before AT TIME ZONE 'UTC')
+            AT TIME ZONE 'UTC';
+
+        EXECUTE format('SELECT date_trunc(''month'', MIN(upper(sys_period)) '
+            'AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC'' '
+            'FROM ONLY %s WHERE upper(sys_period) < %L',
+            history_table_name, last_partition_end)
+        INTO partition_start;
+
+        WHILE partition_start IS NOT NULL AND partition_start < last_partition_end LOOP
+            partition_end := partition_start + interval '1 month';
+            partition_table_name := history_table_name || '__p' ||
+                to_char(partition_start AT TIME ZONE 'UTC', 'YYYYMM');
+
+            IF to_regclass(partition_table_name) IS NULL THEN
+                EXECUTE format('CREATE TABLE %I (LIKE %s INCLUDING DEFAULTS '
+                    'INCLUDING INDEXES) INHERITS (%s)', partition_table_name,
+                    history_table_name, history_table_name);
+                EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I '
+                    'CHECK (upper(sys_period) >= %L AND upper(sys_period) < %L)',
+                    partition_table_name, partition_table_name || '_period',
+                    partition_start, partition_end);
+                INSERT INTO catmaid_history_partition (partition_table,
+                    history_table, period)
+                VALUES (partition_table_name, history_table_name,
+                    tstzrange(partition_start, partition_end));
+            END IF;
+
+            EXECUTE format('WITH moved AS ('
+                '  DELETE FROM ONLY %s '
+                '  WHERE upper(sys_period) >= %L AND upper(sys_period) < %L '
+                '  RETURNING *'
+                ') '
+                'INSERT INTO %I SELECT * FROM moved',
+                history_table_name, partition_start, partition_end,
+                partition_table_name);
+
+            GET DIAGNOSTICS n_moved = ROW_COUNT;
+            n_total_moved := n_total_moved + n_moved;
+
+            EXECUTE format('SELECT date_trunc(''month'', MIN(upper(sys_period)) '
+                'AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC'' '
+                'FROM ONLY %s WHERE upper(sys_period) >= %L AND upper(sys_period) < %L',
+                history_table_name, partition_end, last_partition_end)
+            INTO partition_start;
+        END LOOP;
+
+        RETURN n_total_moved;
+    END;
+    $$;
+
+
+    -- Detach all partitions of the history table of the passed in live table
+    -- that only contain rows archived before <before>. Detached partitions
+    -- are kept as regular tables, but aren't part of history queries anymore.
+    -- Returns the names of all detached partitions.
+    CREATE OR REPLACE FUNCTION detach_history_partitions(live_table regclass,
+            before timestamptz)
+    RETURNS SETOF text
+    LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        p record;
+    BEGIN
+        FOR p IN
+            SELECT chp.partition_table, chp.history_table
+            FROM catmaid_history_partition chp
+            JOIN catmaid_history_table cht
+                ON cht.history_table::text = chp.history_table
+            WHERE cht.live_table = $1
+                AND NOT chp.detached
+                AND upper(chp.period) <= before
+            ORDER BY chp.period
+        LOOP
+            EXECUTE format('ALTER TABLE %I NO INHERIT %s',
+                p.partition_table, p.history_table);
+            UPDATE catmaid_history_partition
+            SET detached = true
+            WHERE partition_table = p.partition_table;
+            RETURN NEXT p.partition_table;
+        END LOOP;
+    END;
+    $$;
+"""
+
+backward = """
+    -- Move all rows back into their history tables and remove the partitions.
+    DO $$
+    DECLARE
+        p record;
+    BEGIN
+        FOR p IN
+            SELECT partition_table, history_table
+            FROM catmaid_history_partition
+        LOOP
+            IF to_regclass(p.partition_table) IS NOT NULL THEN
+                EXECUTE format('INSERT INTO %s SELECT * FROM ONLY %I',
+                    p.history_table, p.partition_table);
+                EXECUTE format('DROP TABLE %I', p.partition_table);
+            END IF;
+        END LOOP;
+    END
+    $$;
+
+    DROP FUNCTION detach_history_partitions(regclass, timestamptz);
+    DROP FUNCTION create_history_partitions(regclass, timestamptz);
+    DROP TABLE catmaid_history_partition;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0120_add_history_brin_indices'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
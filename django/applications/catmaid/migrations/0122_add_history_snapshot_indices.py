@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.contrib.postgres.operations import BtreeGistExtension
+
+
+forward = """
+    -- Historic snapshots select all history rows whose validity period
+    -- contains a point in time. Combining the validity period with the
+    -- skeleton ID, the connector ID or the project and Z location in one GiST
+    -- index allows to find these rows for individual skeletons, connector
+    -- links and sections without scanning the complete history of a project.
+    CREATE INDEX treenode__history_skeleton_id_sys_period_gist
+        ON treenode__history USING gist (skeleton_id, sys_period);
+    CREATE INDEX treenode__history_project_id_location_z_sys_period_gist
+        ON treenode__history USING gist (project_id, location_z, sys_period);
+    CREATE INDEX connector__history_project_id_location_z_sys_period_gist
+        ON connector__history USING gist (project_id, location_z, sys_period);
+    CREATE INDEX treenode_connector__history_skeleton_id_sys_period_gist
+        ON treenode_connector__history USING gist (skeleton_id, sys_period);
+    CREATE INDEX treenode_connector__history_connector_id_sys_period_gist
+        ON treenode_connector__history USING gist (connector_id, sys_period);
+"""
+
+backward = """
+    DROP INDEX treenode__history_skeleton_id_sys_period_gist;
+    DROP INDEX treenode__history_project_id_location_z_sys_period_gist;
+    DROP INDEX connector__history_project_id_location_z_sys_period_gist;
+    DROP INDEX treenode_connector__history_skeleton_id_sys_period_gist;
+    DROP INDEX treenode_connector__history_connector_id_sys_period_gist;
+"""
+
+
+class Migration(migrations.Migration):
+    """Historic snapshot queries combine validity periods with regular columns
+    in GiST indices, which requires the btree_gist extension. It is part of a
+    regular Postgres setup. Like with pg_trgm, the database administrator is
+    expected to install it separately ("CREATE EXTENSION btree_gist;") if the
+    CATMAID user isn't allowed to create extensions.
+    """
+
+    dependencies = [
+        ('catmaid', '0121_add_history_partitioning'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,236 @@
+from django.db import migrations
+
+
+forward = """
+    -- The edge length of the cubic world space blocks that skeleton
+    -- footprints are made of. To use a different block size, this function
+    -- has to be replaced and all footprints have to be rebuilt using
+    -- rebuild_skeleton_footprint().
+    CREATE OR REPLACE FUNCTION skeleton_footprint_block_size()
+    RETURNS double precision
+    LANGUAGE sql IMMUTABLE AS
+    $$
+        SELECT 5000.0::double precision;
+    $$;
+
+
+    -- A coarse representation of the space occupied by each skeleton: the
+    -- grid blocks that contain at least one of its nodes, along with the
+    -- number of nodes in each block. Bounding box queries can find skeletons
+    -- with a node in blocks that are completely inside the bounding box
+    -- without looking at individual nodes or edges.
+    CREATE TABLE catmaid_skeleton_footprint (
+        skeleton_id bigint NOT NULL,
+        project_id integer NOT NULL,
+        block_x integer NOT NULL,
+        block_y integer NOT NULL,
+        block_z integer NOT NULL,
+        num_nodes integer NOT NULL,
+
+        CONSTRAINT catmaid_skeleton_footprint_pkey
+            PRIMARY KEY (skeleton_id, block_z, block_y, block_x),
+        CONSTRAINT catmaid_skeleton_footprint_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_footprint_skeleton_id_fkey FOREIGN KEY (skeleton_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+    );
+
+    -- Allow index-only lookups of all skeletons in a range of blocks.
+    CREATE INDEX catmaid_skeleton_footprint_project_id_block_idx
+        ON catmaid_skeleton_footprint (project_id, block_z, block_y, block_x)
+        INCLUDE (skeleton_id);
+
+
+    -- Recompute the footprints of all skeletons from scratch.
+    CREATE OR REPLACE FUNCTION rebuild_skeleton_footprint()
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        TRUNCATE catmaid_skeleton_footprint;
+
+        INSERT INTO catmaid_skeleton_footprint (skeleton_id, project_id,
+            block_x, block_y, block_z, num_nodes)
+        SELECT t.skeleton_id, t.project_id,
+            floor(t.location_x / skeleton_footprint_block_size())::int,
+            floor(t.location_y / skeleton_footprint_block_size())::int,
+            floor(t.location_z / skeleton_footprint_block_size())::int,
+            COUNT(*)
+        FROM treenode t
+        GROUP BY 1, 2, 3, 4, 5;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_treenode_update_footprint()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        INSERT INTO catmaid_skeleton_footprint AS sf (skeleton_id, project_id,
+            block_x, block_y, block_z, num_nodes)
+        SELECT t.skeleton_id, t.project_id,
+            floor(t.location_x / skeleton_footprint_block_size())::int,
+            floor(t.location_y / skeleton_footprint_block_size())::int,
+            floor(t.location_z / skeleton_footprint_block_size())::int,
+            COUNT(*)
+        FROM inserted_treenode t
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (skeleton_id, block_z, block_y, block_x) DO UPDATE
+        SET num_nodes = sf.num_nodes + EXCLUDED.num_nodes;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Only nodes that change their block or their skeleton change the
+    -- footprint, all other updates are ignored. Removing nodes from their old
+    -- blocks and adding them to their new blocks is done in separate
+    -- statements, because both can affect the same footprint rows.
+    CREATE OR REPLACE FUNCTION on_edit_treenode_update_footprint()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        WITH changed_treenode AS (
+            SELECT ot.skeleton_id,
+                floor(ot.location_x / skeleton_footprint_block_size())::int AS block_x,
+                floor(ot.location_y / skeleton_footprint_block_size())::int AS block_y,
+                floor(ot.location_z / skeleton_footprint_block_size())::int AS block_z,
+                nt.skeleton_id AS new_skeleton_id,
+                floor(nt.location_x / skeleton_footprint_block_size())::int AS new_block_x,
+                floor(nt.location_y / skeleton_footprint_block_size())::int AS new_block_y,
+                floor(nt.location_z / skeleton_footprint_block_size())::int AS new_block_z
+            FROM old_treenode ot
+            JOIN new_treenode nt
+                ON nt.id = ot.id
+        )
+        UPDATE catmaid_skeleton_footprint sf
+        SET num_nodes = sf.num_nodes - r.num_nodes
+        FROM (
+            SELECT ct.skeleton_id, ct.block_x, ct.block_y, ct.block_z,
+                COUNT(*) AS num_nodes
+            FROM changed_treenode ct
+            WHERE ct.skeleton_id <> ct.new_skeleton_id
+                OR ct.block_x <> ct.new_block_x
+                OR ct.block_y <> ct.new_block_y
+                OR ct.block_z <> ct.new_block_z
+            GROUP BY 1, 2, 3, 4
+        ) r
+        WHERE sf.skeleton_id = r.skeleton_id
+            AND sf.block_x = r.block_x
+            AND sf.block_y = r.block_y
+            AND sf.block_z = r.block_z;
+
+        WITH changed_treenode AS (
+            SELECT nt.skeleton_id, nt.project_id,
+                floor(nt.location_x / skeleton_footprint_block_size())::int AS block_x,
+                floor(nt.location_y / skeleton_footprint_block_size())::int AS block_y,
+                floor(nt.location_z / skeleton_footprint_block_size())::int AS block_z,
+                ot.skeleton_id AS old_skeleton_id,
+                floor(ot.location_x / skeleton_footprint_block_size())::int AS old_block_x,
+                floor(ot.location_y / skeleton_footprint_block_size())::int AS old_block_y,
+                floor(ot.location_z / skeleton_footprint_block_size())::int AS old_block_z
+            FROM old_treenode ot
+            JOIN new_treenode nt
+                ON nt.id = ot.id
+        )
+        INSERT INTO catmaid_skeleton_footprint AS sf (skeleton_id, project_id,
+            block_x, block_y, block_z, num_nodes)
+        SELECT ct.skeleton_id, ct.project_id, ct.block_x, ct.block_y,
+            ct.block_z, COUNT(*)
+        FROM changed_treenode ct
+        WHERE ct.skeleton_id <> ct.old_skeleton_id
+            OR ct.block_x <> ct.old_block_x
+            OR ct.block_y <> ct.old_block_y
+            OR ct.block_z <> ct.old_block_z
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (skeleton_id, block_z, block_y, block_x) DO UPDATE
+        SET num_nodes = sf.num_nodes + EXCLUDED.num_nodes;
+
+        DELETE FROM catmaid_skeleton_footprint sf
+        USING (
+            SELECT DISTINCT ot.skeleton_id
+            FROM old_treenode ot
+        ) s
+        WHERE sf.skeleton_id = s.skeleton_id
+            AND sf.num_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_treenode_update_footprint()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        UPDATE catmaid_skeleton_footprint sf
+        SET num_nodes = sf.num_nodes - r.num_nodes
+        FROM (
+            SELECT t.skeleton_id,
+                floor(t.location_x / skeleton_footprint_block_size())::int AS block_x,
+                floor(t.location_y / skeleton_footprint_block_size())::int AS block_y,
+                floor(t.location_z / skeleton_footprint_block_size())::int AS block_z,
+                COUNT(*) AS num_nodes
+            FROM deleted_treenode t
+            GROUP BY 1, 2, 3, 4
+        ) r
+        WHERE sf.skeleton_id = r.skeleton_id
+            AND sf.block_x = r.block_x
+            AND sf.block_y = r.block_y
+            AND sf.block_z = r.block_z;
+
+        DELETE FROM catmaid_skeleton_footprint sf
+        USING (
+            SELECT DISTINCT t.skeleton_id
+            FROM deleted_treenode t
+        ) s
+        WHERE sf.skeleton_id = s.skeleton_id
+            AND sf.num_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE TRIGGER on_insert_treenode_update_footprint
+        AFTER INSERT ON treenode REFERENCING NEW TABLE as inserted_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_treenode_update_footprint();
+    CREATE TRIGGER on_edit_treenode_update_footprint
+        AFTER UPDATE ON treenode REFERENCING NEW TABLE as new_treenode OLD TABLE as old_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_update_footprint();
+    CREATE TRIGGER on_delete_treenode_update_footprint
+        AFTER DELETE ON treenode REFERENCING OLD TABLE as deleted_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_treenode_update_footprint();
+
+    SELECT rebuild_skeleton_footprint();
+"""
+
+backward = """
+    DROP TRIGGER on_insert_treenode_update_footprint ON treenode;
+    DROP TRIGGER on_edit_treenode_update_footprint ON treenode;
+    DROP TRIGGER on_delete_treenode_update_footprint ON treenode;
+
+    DROP FUNCTION on_insert_treenode_update_footprint();
+    DROP FUNCTION on_edit_treenode_update_footprint();
+    DROP FUNCTION on_delete_treenode_update_footprint();
+    DROP FUNCTION rebuild_skeleton_footprint();
+
+    DROP TABLE catmaid_skeleton_footprint;
+
+    DROP FUNCTION skeleton_footprint_block_size();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0122_add_history_snapshot_indices'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
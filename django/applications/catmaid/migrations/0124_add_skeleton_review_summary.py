@@ -0,0 +1,294 @@
+from django.db import migrations
+
+
+forward = """
+    -- The number of reviewed nodes of each skeleton, independent of the
+    -- reviewer. A node counts as reviewed if it has at least one review.
+    CREATE TABLE catmaid_skeleton_review_summary (
+        skeleton_id bigint PRIMARY KEY,
+        project_id integer NOT NULL,
+        num_reviewed_nodes integer NOT NULL,
+
+        CONSTRAINT catmaid_skeleton_review_summary_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_review_summary_skeleton_id_fkey FOREIGN KEY (skeleton_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+    );
+
+    -- The number of nodes each reviewer reviewed in each skeleton. CATMAID
+    -- stores at most one review per node and reviewer, which is why this is
+    -- the number of reviews. The minimum review time is a lower bound of the
+    -- review times of these reviews: it isn't increased if nodes are reviewed
+    -- again or if reviews are removed. This allows to decide for most
+    -- skeletons if a reviewer whitelist accepts all reviews of a reviewer
+    -- without looking at individual reviews.
+    CREATE TABLE catmaid_skeleton_reviewer_summary (
+        skeleton_id bigint NOT NULL,
+        reviewer_id integer NOT NULL,
+        project_id integer NOT NULL,
+        num_reviewed_nodes integer NOT NULL,
+        min_review_time timestamptz NOT NULL,
+
+        CONSTRAINT catmaid_skeleton_reviewer_summary_pkey
+            PRIMARY KEY (skeleton_id, reviewer_id),
+        CONSTRAINT catmaid_skeleton_reviewer_summary_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_reviewer_summary_skeleton_id_fkey FOREIGN KEY (skeleton_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_reviewer_summary_reviewer_id_fkey FOREIGN KEY (reviewer_id)
+            REFERENCES auth_user(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+    );
+
+
+    -- Recompute both review summary tables from scratch.
+    CREATE OR REPLACE FUNCTION rebuild_skeleton_review_summary()
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        TRUNCATE catmaid_skeleton_review_summary;
+        TRUNCATE catmaid_skeleton_reviewer_summary;
+
+        INSERT INTO catmaid_skeleton_review_summary (skeleton_id, project_id,
+            num_reviewed_nodes)
+        SELECT r.skeleton_id, MIN(r.project_id), COUNT(DISTINCT r.treenode_id)
+        FROM review r
+        GROUP BY r.skeleton_id;
+
+        INSERT INTO catmaid_skeleton_reviewer_summary (skeleton_id,
+            reviewer_id, project_id, num_reviewed_nodes, min_review_time)
+        SELECT r.skeleton_id, r.reviewer_id, MIN(r.project_id), COUNT(*),
+            MIN(r.review_time)
+        FROM review r
+        GROUP BY r.skeleton_id, r.reviewer_id;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        -- Nodes are newly reviewed if all their reviews have been inserted by
+        -- this statement.
+        INSERT INTO catmaid_skeleton_review_summary AS srs (skeleton_id,
+            project_id, num_reviewed_nodes)
+        SELECT rn.skeleton_id, rn.project_id, COUNT(*)
+        FROM (
+            SELECT ir.treenode_id, ir.skeleton_id, ir.project_id,
+                COUNT(*) AS num_reviews
+            FROM inserted_review ir
+            GROUP BY 1, 2, 3
+        ) rn
+        WHERE rn.num_reviews = (
+            SELECT COUNT(*)
+            FROM review r
+            WHERE r.treenode_id = rn.treenode_id
+        )
+        GROUP BY 1, 2
+        ON CONFLICT (skeleton_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes;
+
+        INSERT INTO catmaid_skeleton_reviewer_summary AS srs (skeleton_id,
+            reviewer_id, project_id, num_reviewed_nodes, min_review_time)
+        SELECT ir.skeleton_id, ir.reviewer_id, ir.project_id, COUNT(*),
+            MIN(ir.review_time)
+        FROM inserted_review ir
+        GROUP BY 1, 2, 3
+        ON CONFLICT (skeleton_id, reviewer_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes,
+            min_review_time = LEAST(srs.min_review_time, EXCLUDED.min_review_time);
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Reviews only change their skeleton if their node does, for instance
+    -- when skeletons are split or joined. All reviews of a node are then
+    -- moved to the new skeleton together. Other changes, like new review
+    -- times, don't affect the summary.
+    CREATE OR REPLACE FUNCTION on_edit_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1
+            FROM old_review orv
+            JOIN new_review nr
+                ON nr.id = orv.id
+            WHERE nr.skeleton_id <> orv.skeleton_id
+        ) THEN
+            RETURN NULL;
+        END IF;
+
+        WITH moved_review AS (
+            SELECT orv.skeleton_id AS old_skeleton_id, nr.skeleton_id,
+                nr.project_id, nr.reviewer_id, nr.treenode_id, nr.review_time
+            FROM old_review orv
+            JOIN new_review nr
+                ON nr.id = orv.id
+            WHERE nr.skeleton_id <> orv.skeleton_id
+        )
+        UPDATE catmaid_skeleton_review_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - mr.num_reviewed_nodes
+        FROM (
+            SELECT old_skeleton_id, COUNT(DISTINCT treenode_id) AS num_reviewed_nodes
+            FROM moved_review
+            GROUP BY 1
+        ) mr
+        WHERE srs.skeleton_id = mr.old_skeleton_id;
+
+        WITH moved_review AS (
+            SELECT orv.skeleton_id AS old_skeleton_id, nr.skeleton_id,
+                nr.project_id, nr.reviewer_id, nr.treenode_id, nr.review_time
+            FROM old_review orv
+            JOIN new_review nr
+                ON nr.id = orv.id
+            WHERE nr.skeleton_id <> orv.skeleton_id
+        )
+        INSERT INTO catmaid_skeleton_review_summary AS srs (skeleton_id,
+            project_id, num_reviewed_nodes)
+        SELECT skeleton_id, project_id, COUNT(DISTINCT treenode_id)
+        FROM moved_review
+        GROUP BY 1, 2
+        ON CONFLICT (skeleton_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes;
+
+        WITH moved_review AS (
+            SELECT orv.skeleton_id AS old_skeleton_id, nr.skeleton_id,
+                nr.project_id, nr.reviewer_id, nr.treenode_id, nr.review_time
+            FROM old_review orv
+            JOIN new_review nr
+                ON nr.id = orv.id
+            WHERE nr.skeleton_id <> orv.skeleton_id
+        )
+        UPDATE catmaid_skeleton_reviewer_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - mr.num_reviewed_nodes
+        FROM (
+            SELECT old_skeleton_id, reviewer_id, COUNT(*) AS num_reviewed_nodes
+            FROM moved_review
+            GROUP BY 1, 2
+        ) mr
+        WHERE srs.skeleton_id = mr.old_skeleton_id
+            AND srs.reviewer_id = mr.reviewer_id;
+
+        WITH moved_review AS (
+            SELECT orv.skeleton_id AS old_skeleton_id, nr.skeleton_id,
+                nr.project_id, nr.reviewer_id, nr.treenode_id, nr.review_time
+            FROM old_review orv
+            JOIN new_review nr
+                ON nr.id = orv.id
+            WHERE nr.skeleton_id <> orv.skeleton_id
+        )
+        INSERT INTO catmaid_skeleton_reviewer_summary AS srs (skeleton_id,
+            reviewer_id, project_id, num_reviewed_nodes, min_review_time)
+        SELECT skeleton_id, reviewer_id, project_id, COUNT(*), MIN(review_time)
+        FROM moved_review
+        GROUP BY 1, 2, 3
+        ON CONFLICT (skeleton_id, reviewer_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes,
+            min_review_time = LEAST(srs.min_review_time, EXCLUDED.min_review_time);
+
+        DELETE FROM catmaid_skeleton_review_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM old_review) orv
+        WHERE srs.skeleton_id = orv.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        DELETE FROM catmaid_skeleton_reviewer_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM old_review) orv
+        WHERE srs.skeleton_id = orv.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        -- Nodes aren't reviewed anymore if none of their reviews is left.
+        UPDATE catmaid_skeleton_review_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - rn.num_reviewed_nodes
+        FROM (
+            SELECT dn.skeleton_id, COUNT(*) AS num_reviewed_nodes
+            FROM (
+                SELECT DISTINCT dr.skeleton_id, dr.treenode_id
+                FROM deleted_review dr
+            ) dn
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM review r
+                WHERE r.treenode_id = dn.treenode_id
+            )
+            GROUP BY 1
+        ) rn
+        WHERE srs.skeleton_id = rn.skeleton_id;
+
+        UPDATE catmaid_skeleton_reviewer_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - dr.num_reviewed_nodes
+        FROM (
+            SELECT skeleton_id, reviewer_id, COUNT(*) AS num_reviewed_nodes
+            FROM deleted_review
+            GROUP BY 1, 2
+        ) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.reviewer_id = dr.reviewer_id;
+
+        DELETE FROM catmaid_skeleton_review_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM deleted_review) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        DELETE FROM catmaid_skeleton_reviewer_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM deleted_review) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE TRIGGER on_insert_review_update_summary
+        AFTER INSERT ON review REFERENCING NEW TABLE as inserted_review
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_review_update_summary();
+    CREATE TRIGGER on_edit_review_update_summary
+        AFTER UPDATE ON review REFERENCING NEW TABLE as new_review OLD TABLE as old_review
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_review_update_summary();
+    CREATE TRIGGER on_delete_review_update_summary
+        AFTER DELETE ON review REFERENCING OLD TABLE as deleted_review
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_review_update_summary();
+
+    SELECT rebuild_skeleton_review_summary();
+"""
+
+backward = """
+    DROP TRIGGER on_insert_review_update_summary ON review;
+    DROP TRIGGER on_edit_review_update_summary ON review;
+    DROP TRIGGER on_delete_review_update_summary ON review;
+
+    DROP FUNCTION on_insert_review_update_summary();
+    DROP FUNCTION on_edit_review_update_summary();
+    DROP FUNCTION on_delete_review_update_summary();
+    DROP FUNCTION rebuild_skeleton_review_summary();
+
+    DROP TABLE catmaid_skeleton_reviewer_summary;
+    DROP TABLE catmaid_skeleton_review_summary;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0123_add_skeleton_footprint'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
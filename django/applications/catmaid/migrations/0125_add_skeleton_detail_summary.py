@@ -0,0 +1,273 @@
+from django.db import migrations
+
+
+forward = """
+    -- Details about each skeleton that go beyond the skeleton summary: its
+    -- bounding box, topology, tags and connector links. Computing these
+    -- requires looking at all nodes of a skeleton, which is why they aren't
+    -- updated on every change. Instead, triggers increase the version of a
+    -- skeleton whenever its nodes, links or tags change. The details are
+    -- recomputed when they are requested and their computed version doesn't
+    -- match the current version anymore. This way, only skeletons that
+    -- changed since they were last looked at need to be recomputed.
+    CREATE TABLE catmaid_skeleton_detail_summary (
+        skeleton_id bigint PRIMARY KEY,
+        project_id integer NOT NULL,
+        version bigint NOT NULL DEFAULT 0,
+        computed_version bigint,
+        min_x real,
+        min_y real,
+        min_z real,
+        max_x real,
+        max_y real,
+        max_z real,
+        num_branch_nodes integer,
+        num_end_nodes integer,
+        num_tagged_end_nodes integer,
+        is_fragment boolean,
+        num_input_synapses integer,
+        num_output_synapses integer,
+        -- Maps relation IDs to the number of links with this relation.
+        link_counts jsonb,
+        -- Maps "<relation ID>:<partner relation ID>" to the number of links
+        -- with the first relation to connectors that are linked with the
+        -- partner relation by other treenodes.
+        partner_link_counts jsonb,
+
+        CONSTRAINT catmaid_skeleton_detail_summary_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_detail_summary_skeleton_id_fkey FOREIGN KEY (skeleton_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+    );
+
+
+    -- Mark the details of the passed in skeletons as outdated. Skeletons that
+    -- don't exist anymore are ignored.
+    CREATE OR REPLACE FUNCTION invalidate_skeleton_detail_summary(skeleton_ids bigint[])
+    RETURNS void
+    LANGUAGE sql AS
+    $$
+        INSERT INTO catmaid_skeleton_detail_summary AS sds (skeleton_id,
+            project_id, version)
+        SELECT ci.id, ci.project_id, 1
+        FROM class_instance ci
+        JOIN (
+            SELECT DISTINCT skeleton.id
+            FROM UNNEST(skeleton_ids) skeleton(id)
+        ) s
+            ON s.id = ci.id
+        ON CONFLICT (skeleton_id) DO UPDATE
+        SET version = sds.version + 1;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_treenode_invalidate_detail_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM invalidate_skeleton_detail_summary(ARRAY(
+            SELECT t.skeleton_id
+            FROM inserted_treenode t
+        ));
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Only changes of location, parent or skeleton invalidate the details.
+    CREATE OR REPLACE FUNCTION on_edit_treenode_invalidate_detail_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM invalidate_skeleton_detail_summary(ARRAY(
+            SELECT UNNEST(ARRAY[ot.skeleton_id, nt.skeleton_id])
+            FROM old_treenode ot
+            JOIN new_treenode nt
+                ON nt.id = ot.id
+            WHERE ot.skeleton_id <> nt.skeleton_id
+                OR ot.parent_id IS DISTINCT FROM nt.parent_id
+                OR ot.location_x <> nt.location_x
+                OR ot.location_y <> nt.location_y
+                OR ot.location_z <> nt.location_z
+        ));
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_treenode_invalidate_detail_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM invalidate_skeleton_detail_summary(ARRAY(
+            SELECT t.skeleton_id
+            FROM deleted_treenode t
+        ));
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Partner link counts of a skeleton depend on the links of other
+    -- skeletons to the same connectors, which is why all skeletons linked to
+    -- a changed connector are invalidated.
+    CREATE OR REPLACE FUNCTION on_change_treenode_connector_invalidate_detail_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM invalidate_skeleton_detail_summary(ARRAY(
+                SELECT tc.skeleton_id
+                FROM treenode_connector tc
+                JOIN (
+                    SELECT DISTINCT l.connector_id
+                    FROM new_link l
+                ) c
+                    ON c.connector_id = tc.connector_id
+            ));
+        ELSIF TG_OP = 'UPDATE' THEN
+            PERFORM invalidate_skeleton_detail_summary(ARRAY(
+                SELECT l.skeleton_id
+                FROM old_link l
+                UNION
+                SELECT tc.skeleton_id
+                FROM treenode_connector tc
+                JOIN (
+                    SELECT l.connector_id
+                    FROM old_link l
+                    UNION
+                    SELECT l.connector_id
+                    FROM new_link l
+                ) c
+                    ON c.connector_id = tc.connector_id
+            ));
+        ELSE
+            PERFORM invalidate_skeleton_detail_summary(ARRAY(
+                SELECT l.skeleton_id
+                FROM old_link l
+                UNION
+                SELECT tc.skeleton_id
+                FROM treenode_connector tc
+                JOIN (
+                    SELECT DISTINCT l.connector_id
+                    FROM old_link l
+                ) c
+                    ON c.connector_id = tc.connector_id
+            ));
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_change_treenode_class_instance_invalidate_detail_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM invalidate_skeleton_detail_summary(ARRAY(
+                SELECT t.skeleton_id
+                FROM new_tci tci
+                JOIN treenode t
+                    ON t.id = tci.treenode_id
+            ));
+        ELSIF TG_OP = 'UPDATE' THEN
+            PERFORM invalidate_skeleton_detail_summary(ARRAY(
+                SELECT t.skeleton_id
+                FROM (
+                    SELECT tci.treenode_id
+                    FROM old_tci tci
+                    UNION
+                    SELECT tci.treenode_id
+                    FROM new_tci tci
+                ) tci
+                JOIN treenode t
+                    ON t.id = tci.treenode_id
+            ));
+        ELSE
+            -- If the labeled nodes have been deleted, their skeletons have
+            -- already been invalidated by the treenode triggers.
+            PERFORM invalidate_skeleton_detail_summary(ARRAY(
+                SELECT t.skeleton_id
+                FROM old_tci tci
+                JOIN treenode t
+                    ON t.id = tci.treenode_id
+            ));
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE TRIGGER on_insert_treenode_invalidate_detail_summary
+        AFTER INSERT ON treenode REFERENCING NEW TABLE as inserted_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_treenode_invalidate_detail_summary();
+    CREATE TRIGGER on_edit_treenode_invalidate_detail_summary
+        AFTER UPDATE ON treenode REFERENCING NEW TABLE as new_treenode OLD TABLE as old_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_invalidate_detail_summary();
+    CREATE TRIGGER on_delete_treenode_invalidate_detail_summary
+        AFTER DELETE ON treenode REFERENCING OLD TABLE as deleted_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_treenode_invalidate_detail_summary();
+
+    CREATE TRIGGER on_insert_treenode_connector_invalidate_detail_summary
+        AFTER INSERT ON treenode_connector REFERENCING NEW TABLE as new_link
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_change_treenode_connector_invalidate_detail_summary();
+    CREATE TRIGGER on_edit_treenode_connector_invalidate_detail_summary
+        AFTER UPDATE ON treenode_connector REFERENCING NEW TABLE as new_link OLD TABLE as old_link
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_change_treenode_connector_invalidate_detail_summary();
+    CREATE TRIGGER on_delete_treenode_connector_invalidate_detail_summary
+        AFTER DELETE ON treenode_connector REFERENCING OLD TABLE as old_link
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_change_treenode_connector_invalidate_detail_summary();
+
+    CREATE TRIGGER on_insert_treenode_class_instance_invalidate_detail_summary
+        AFTER INSERT ON treenode_class_instance REFERENCING NEW TABLE as new_tci
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_change_treenode_class_instance_invalidate_detail_summary();
+    CREATE TRIGGER on_edit_treenode_class_instance_invalidate_detail_summary
+        AFTER UPDATE ON treenode_class_instance REFERENCING NEW TABLE as new_tci OLD TABLE as old_tci
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_change_treenode_class_instance_invalidate_detail_summary();
+    CREATE TRIGGER on_delete_treenode_class_instance_invalidate_detail_summary
+        AFTER DELETE ON treenode_class_instance REFERENCING OLD TABLE as old_tci
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_change_treenode_class_instance_invalidate_detail_summary();
+"""
+
+backward = """
+    DROP TRIGGER on_insert_treenode_invalidate_detail_summary ON treenode;
+    DROP TRIGGER on_edit_treenode_invalidate_detail_summary ON treenode;
+    DROP TRIGGER on_delete_treenode_invalidate_detail_summary ON treenode;
+    DROP TRIGGER on_insert_treenode_connector_invalidate_detail_summary ON treenode_connector;
+    DROP TRIGGER on_edit_treenode_connector_invalidate_detail_summary ON treenode_connector;
+    DROP TRIGGER on_delete_treenode_connector_invalidate_detail_summary ON treenode_connector;
+    DROP TRIGGER on_insert_treenode_class_instance_invalidate_detail_summary ON treenode_class_instance;
+    DROP TRIGGER on_edit_treenode_class_instance_invalidate_detail_summary ON treenode_class_instance;
+    DROP TRIGGER on_delete_treenode_class_instance_invalidate_detail_summary ON treenode_class_instance;
+
+    DROP FUNCTION on_insert_treenode_invalidate_detail_summary();
+    DROP FUNCTION on_edit_treenode_invalidate_detail_summary();
+    DROP FUNCTION on_delete_treenode_invalidate_detail_summary();
+    DROP FUNCTION on_change_treenode_connector_invalidate_detail_summary();
+    DROP FUNCTION on_change_treenode_class_instance_invalidate_detail_summary();
+    DROP FUNCTION invalidate_skeleton_detail_summary(bigint[]);
+
+    DROP TABLE catmaid_skeleton_detail_summary;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0124_add_skeleton_review_summary'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,322 @@
+from django.db import migrations
+
+
+forward = """
+    -- All labels of treenodes, along with the skeleton and location of the
+    -- labeled treenode. Each entry represents a "labeled_as" link in the
+    -- treenode_class_instance table and uses its ID. This allows to find
+    -- labeled nodes without joining links, relations and treenodes.
+    CREATE TABLE catmaid_treenode_label (
+        id bigint PRIMARY KEY,
+        treenode_id bigint NOT NULL,
+        skeleton_id bigint NOT NULL,
+        label_id bigint NOT NULL,
+        project_id integer NOT NULL,
+        location_x real NOT NULL,
+        location_y real NOT NULL,
+        location_z real NOT NULL,
+
+        CONSTRAINT catmaid_treenode_label_treenode_id_fkey FOREIGN KEY (treenode_id)
+            REFERENCES treenode(id) ON DELETE CASCADE,
+        CONSTRAINT catmaid_treenode_label_label_id_fkey FOREIGN KEY (label_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_treenode_label_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+    );
+
+    CREATE INDEX catmaid_treenode_label_project_id_label_id_idx
+        ON catmaid_treenode_label (project_id, label_id)
+        INCLUDE (treenode_id, location_x, location_y, location_z);
+    CREATE INDEX catmaid_treenode_label_skeleton_id_label_id_idx
+        ON catmaid_treenode_label (skeleton_id, label_id);
+    CREATE INDEX catmaid_treenode_label_treenode_id_idx
+        ON catmaid_treenode_label (treenode_id);
+
+
+    -- The number of nodes in each skeleton that have a particular label.
+    CREATE TABLE catmaid_skeleton_label (
+        skeleton_id bigint NOT NULL,
+        label_id bigint NOT NULL,
+        project_id integer NOT NULL,
+        num_nodes integer NOT NULL,
+
+        CONSTRAINT catmaid_skeleton_label_pkey
+            PRIMARY KEY (skeleton_id, label_id),
+        CONSTRAINT catmaid_skeleton_label_skeleton_id_fkey FOREIGN KEY (skeleton_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_label_label_id_fkey FOREIGN KEY (label_id)
+            REFERENCES class_instance(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_label_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+    );
+
+    -- Allow index-only lookups of all skeletons with a label.
+    CREATE INDEX catmaid_skeleton_label_project_id_label_id_idx
+        ON catmaid_skeleton_label (project_id, label_id)
+        INCLUDE (skeleton_id);
+
+
+    -- Recompute both label index tables from scratch.
+    CREATE OR REPLACE FUNCTION rebuild_label_index()
+    RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        TRUNCATE catmaid_skeleton_label;
+        DELETE FROM catmaid_treenode_label;
+
+        INSERT INTO catmaid_treenode_label (id, treenode_id, skeleton_id,
+            label_id, project_id, location_x, location_y, location_z)
+        SELECT tci.id, tci.treenode_id, t.skeleton_id, tci.class_instance_id,
+            tci.project_id, t.location_x, t.location_y, t.location_z
+        FROM treenode_class_instance tci
+        JOIN relation r
+            ON r.id = tci.relation_id
+        JOIN treenode t
+            ON t.id = tci.treenode_id
+        WHERE r.relation_name = 'labeled_as';
+
+        -- The skeleton label table has been maintained by the triggers on
+        -- the treenode label table already.
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_treenode_class_instance_update_label_index()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        INSERT INTO catmaid_treenode_label (id, treenode_id, skeleton_id,
+            label_id, project_id, location_x, location_y, location_z)
+        SELECT tci.id, tci.treenode_id, t.skeleton_id, tci.class_instance_id,
+            tci.project_id, t.location_x, t.location_y, t.location_z
+        FROM inserted_tci tci
+        JOIN relation r
+            ON r.id = tci.relation_id
+        JOIN treenode t
+            ON t.id = tci.treenode_id
+        WHERE r.relation_name = 'labeled_as';
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Changed links are removed from the index and added again, which is done
+    -- in separate statements, because both can affect the same index rows.
+    CREATE OR REPLACE FUNCTION on_edit_treenode_class_instance_update_label_index()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        DELETE FROM catmaid_treenode_label tl
+        USING old_tci tci
+        WHERE tl.id = tci.id;
+
+        INSERT INTO catmaid_treenode_label (id, treenode_id, skeleton_id,
+            label_id, project_id, location_x, location_y, location_z)
+        SELECT tci.id, tci.treenode_id, t.skeleton_id, tci.class_instance_id,
+            tci.project_id, t.location_x, t.location_y, t.location_z
+        FROM new_tci tci
+        JOIN relation r
+            ON r.id = tci.relation_id
+        JOIN treenode t
+            ON t.id = tci.treenode_id
+        WHERE r.relation_name = 'labeled_as';
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_treenode_class_instance_update_label_index()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        DELETE FROM catmaid_treenode_label tl
+        USING deleted_tci tci
+        WHERE tl.id = tci.id;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Labels of deleted treenodes are removed through the foreign key, only
+    -- skeleton and location changes have to be handled.
+    CREATE OR REPLACE FUNCTION on_edit_treenode_update_label_index()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        UPDATE catmaid_treenode_label tl
+        SET skeleton_id = nt.skeleton_id,
+            location_x = nt.location_x,
+            location_y = nt.location_y,
+            location_z = nt.location_z
+        FROM old_treenode ot
+        JOIN new_treenode nt
+            ON nt.id = ot.id
+        WHERE tl.treenode_id = nt.id
+            AND (ot.skeleton_id <> nt.skeleton_id
+                OR ot.location_x <> nt.location_x
+                OR ot.location_y <> nt.location_y
+                OR ot.location_z <> nt.location_z);
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_treenode_label_update_skeleton_label()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        INSERT INTO catmaid_skeleton_label AS sl (skeleton_id, label_id,
+            project_id, num_nodes)
+        SELECT tl.skeleton_id, tl.label_id, tl.project_id, COUNT(*)
+        FROM inserted_treenode_label tl
+        GROUP BY 1, 2, 3
+        ON CONFLICT (skeleton_id, label_id) DO UPDATE
+        SET num_nodes = sl.num_nodes + EXCLUDED.num_nodes;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    -- Only skeleton changes affect the skeleton labels. Removing labels from
+    -- their old skeletons and adding them to their new skeletons is done in
+    -- separate statements, because both can affect the same rows.
+    CREATE OR REPLACE FUNCTION on_edit_treenode_label_update_skeleton_label()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        UPDATE catmaid_skeleton_label sl
+        SET num_nodes = sl.num_nodes - r.num_nodes
+        FROM (
+            SELECT otl.skeleton_id, otl.label_id, COUNT(*) AS num_nodes
+            FROM old_treenode_label otl
+            JOIN new_treenode_label ntl
+                ON ntl.id = otl.id
+            WHERE otl.skeleton_id <> ntl.skeleton_id
+            GROUP BY 1, 2
+        ) r
+        WHERE sl.skeleton_id = r.skeleton_id
+            AND sl.label_id = r.label_id;
+
+        INSERT INTO catmaid_skeleton_label AS sl (skeleton_id, label_id,
+            project_id, num_nodes)
+        SELECT ntl.skeleton_id, ntl.label_id, ntl.project_id, COUNT(*)
+        FROM old_treenode_label otl
+        JOIN new_treenode_label ntl
+            ON ntl.id = otl.id
+        WHERE otl.skeleton_id <> ntl.skeleton_id
+        GROUP BY 1, 2, 3
+        ON CONFLICT (skeleton_id, label_id) DO UPDATE
+        SET num_nodes = sl.num_nodes + EXCLUDED.num_nodes;
+
+        DELETE FROM catmaid_skeleton_label sl
+        USING (
+            SELECT DISTINCT otl.skeleton_id
+            FROM old_treenode_label otl
+        ) s
+        WHERE sl.skeleton_id = s.skeleton_id
+            AND sl.num_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_treenode_label_update_skeleton_label()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        UPDATE catmaid_skeleton_label sl
+        SET num_nodes = sl.num_nodes - r.num_nodes
+        FROM (
+            SELECT tl.skeleton_id, tl.label_id, COUNT(*) AS num_nodes
+            FROM deleted_treenode_label tl
+            GROUP BY 1, 2
+        ) r
+        WHERE sl.skeleton_id = r.skeleton_id
+            AND sl.label_id = r.label_id;
+
+        DELETE FROM catmaid_skeleton_label sl
+        USING (
+            SELECT DISTINCT tl.skeleton_id
+            FROM deleted_treenode_label tl
+        ) s
+        WHERE sl.skeleton_id = s.skeleton_id
+            AND sl.num_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE TRIGGER on_insert_treenode_class_instance_update_label_index
+        AFTER INSERT ON treenode_class_instance REFERENCING NEW TABLE as inserted_tci
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_treenode_class_instance_update_label_index();
+    CREATE TRIGGER on_edit_treenode_class_instance_update_label_index
+        AFTER UPDATE ON treenode_class_instance REFERENCING NEW TABLE as new_tci OLD TABLE as old_tci
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_class_instance_update_label_index();
+    CREATE TRIGGER on_delete_treenode_class_instance_update_label_index
+        AFTER DELETE ON treenode_class_instance REFERENCING OLD TABLE as deleted_tci
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_treenode_class_instance_update_label_index();
+
+    CREATE TRIGGER on_edit_treenode_update_label_index
+        AFTER UPDATE ON treenode REFERENCING NEW TABLE as new_treenode OLD TABLE as old_treenode
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_update_label_index();
+
+    CREATE TRIGGER on_insert_treenode_label_update_skeleton_label
+        AFTER INSERT ON catmaid_treenode_label REFERENCING NEW TABLE as inserted_treenode_label
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_treenode_label_update_skeleton_label();
+    CREATE TRIGGER on_edit_treenode_label_update_skeleton_label
+        AFTER UPDATE ON catmaid_treenode_label REFERENCING NEW TABLE as new_treenode_label OLD TABLE as old_treenode_label
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_label_update_skeleton_label();
+    CREATE TRIGGER on_delete_treenode_label_update_skeleton_label
+        AFTER DELETE ON catmaid_treenode_label REFERENCING OLD TABLE as deleted_treenode_label
+        FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_treenode_label_update_skeleton_label();
+
+    SELECT rebuild_label_index();
+"""
+
+backward = """
+    DROP TRIGGER on_insert_treenode_class_instance_update_label_index ON treenode_class_instance;
+    DROP TRIGGER on_edit_treenode_class_instance_update_label_index ON treenode_class_instance;
+    DROP TRIGGER on_delete_treenode_class_instance_update_label_index ON treenode_class_instance;
+    DROP TRIGGER on_edit_treenode_update_label_index ON treenode;
+    DROP TRIGGER on_insert_treenode_label_update_skeleton_label ON catmaid_treenode_label;
+    DROP TRIGGER on_edit_treenode_label_update_skeleton_label ON catmaid_treenode_label;
+    DROP TRIGGER on_delete_treenode_label_update_skeleton_label ON catmaid_treenode_label;
+
+    DROP FUNCTION on_insert_treenode_class_instance_update_label_index();
+    DROP FUNCTION on_edit_treenode_class_instance_update_label_index();
+    DROP FUNCTION on_delete_treenode_class_instance_update_label_index();
+    DROP FUNCTION on_edit_treenode_update_label_index();
+    DROP FUNCTION on_insert_treenode_label_update_skeleton_label();
+    DROP FUNCTION on_edit_treenode_label_update_skeleton_label();
+    DROP FUNCTION on_delete_treenode_label_update_skeleton_label();
+    DROP FUNCTION rebuild_label_index();
+
+    DROP TABLE catmaid_skeleton_label;
+    DROP TABLE catmaid_treenode_label;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0125_add_skeleton_detail_summary'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,222 @@
+from django.db import migrations
+
+
+forward = """
+    -- The number of reviewed nodes of a skeleton counts each node only once,
+    -- no matter how many reviews it has. Whether a node becomes reviewed or
+    -- unreviewed by a change depends on the reviews of other transactions. If
+    -- two transactions review the same node or remove its last two reviews
+    -- concurrently, neither would see the other's change. The review triggers
+    -- therefore lock the changed nodes first, ordered by ID to avoid
+    -- deadlocks. A second transaction waits until the first one commits.
+    -- With the default READ COMMITTED isolation level, its following
+    -- statements then see the other transaction's reviews. The lock doesn't
+    -- conflict with the key share lock of the review's foreign key.
+    CREATE OR REPLACE FUNCTION on_insert_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM 1
+        FROM treenode t
+        JOIN (
+            SELECT DISTINCT ir.treenode_id
+            FROM inserted_review ir
+        ) ir
+            ON ir.treenode_id = t.id
+        ORDER BY t.id
+        FOR NO KEY UPDATE OF t;
+
+        -- Nodes are newly reviewed if all their reviews have been inserted by
+        -- this statement.
+        INSERT INTO catmaid_skeleton_review_summary AS srs (skeleton_id,
+            project_id, num_reviewed_nodes)
+        SELECT rn.skeleton_id, rn.project_id, COUNT(*)
+        FROM (
+            SELECT ir.treenode_id, ir.skeleton_id, ir.project_id,
+                COUNT(*) AS num_reviews
+            FROM inserted_review ir
+            GROUP BY 1, 2, 3
+        ) rn
+        WHERE rn.num_reviews = (
+            SELECT COUNT(*)
+            FROM review r
+            WHERE r.treenode_id = rn.treenode_id
+        )
+        GROUP BY 1, 2
+        ON CONFLICT (skeleton_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes;
+
+        INSERT INTO catmaid_skeleton_reviewer_summary AS srs (skeleton_id,
+            reviewer_id, project_id, num_reviewed_nodes, min_review_time)
+        SELECT ir.skeleton_id, ir.reviewer_id, ir.project_id, COUNT(*),
+            MIN(ir.review_time)
+        FROM inserted_review ir
+        GROUP BY 1, 2, 3
+        ON CONFLICT (skeleton_id, reviewer_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes,
+            min_review_time = LEAST(srs.min_review_time, EXCLUDED.min_review_time);
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        -- Nodes that are deleted along with their reviews aren't returned.
+        PERFORM 1
+        FROM treenode t
+        JOIN (
+            SELECT DISTINCT dr.treenode_id
+            FROM deleted_review dr
+        ) dr
+            ON dr.treenode_id = t.id
+        ORDER BY t.id
+        FOR NO KEY UPDATE OF t;
+
+        -- Nodes aren't reviewed anymore if none of their reviews is left.
+        UPDATE catmaid_skeleton_review_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - rn.num_reviewed_nodes
+        FROM (
+            SELECT dn.skeleton_id, COUNT(*) AS num_reviewed_nodes
+            FROM (
+                SELECT DISTINCT dr.skeleton_id, dr.treenode_id
+                FROM deleted_review dr
+            ) dn
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM review r
+                WHERE r.treenode_id = dn.treenode_id
+            )
+            GROUP BY 1
+        ) rn
+        WHERE srs.skeleton_id = rn.skeleton_id;
+
+        UPDATE catmaid_skeleton_reviewer_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - dr.num_reviewed_nodes
+        FROM (
+            SELECT skeleton_id, reviewer_id, COUNT(*) AS num_reviewed_nodes
+            FROM deleted_review
+            GROUP BY 1, 2
+        ) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.reviewer_id = dr.reviewer_id;
+
+        DELETE FROM catmaid_skeleton_review_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM deleted_review) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        DELETE FROM catmaid_skeleton_reviewer_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM deleted_review) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+"""
+
+backward = """
+    CREATE OR REPLACE FUNCTION on_insert_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        -- Nodes are newly reviewed if all their reviews have been inserted by
+        -- this statement.
+        INSERT INTO catmaid_skeleton_review_summary AS srs (skeleton_id,
+            project_id, num_reviewed_nodes)
+        SELECT rn.skeleton_id, rn.project_id, COUNT(*)
+        FROM (
+            SELECT ir.treenode_id, ir.skeleton_id, ir.project_id,
+                COUNT(*) AS num_reviews
+            FROM inserted_review ir
+            GROUP BY 1, 2, 3
+        ) rn
+        WHERE rn.num_reviews = (
+            SELECT COUNT(*)
+            FROM review r
+            WHERE r.treenode_id = rn.treenode_id
+        )
+        GROUP BY 1, 2
+        ON CONFLICT (skeleton_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes;
+
+        INSERT INTO catmaid_skeleton_reviewer_summary AS srs (skeleton_id,
+            reviewer_id, project_id, num_reviewed_nodes, min_review_time)
+        SELECT ir.skeleton_id, ir.reviewer_id, ir.project_id, COUNT(*),
+            MIN(ir.review_time)
+        FROM inserted_review ir
+        GROUP BY 1, 2, 3
+        ON CONFLICT (skeleton_id, reviewer_id) DO UPDATE
+        SET num_reviewed_nodes = srs.num_reviewed_nodes + EXCLUDED.num_reviewed_nodes,
+            min_review_time = LEAST(srs.min_review_time, EXCLUDED.min_review_time);
+
+        RETURN NULL;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_delete_review_update_summary()
+    RETURNS trigger
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        -- Nodes aren't reviewed anymore if none of their reviews is left.
+        UPDATE catmaid_skeleton_review_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - rn.num_reviewed_nodes
+        FROM (
+            SELECT dn.skeleton_id, COUNT(*) AS num_reviewed_nodes
+            FROM (
+                SELECT DISTINCT dr.skeleton_id, dr.treenode_id
+                FROM deleted_review dr
+            ) dn
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM review r
+                WHERE r.treenode_id = dn.treenode_id
+            )
+            GROUP BY 1
+        ) rn
+        WHERE srs.skeleton_id = rn.skeleton_id;
+
+        UPDATE catmaid_skeleton_reviewer_summary srs
+        SET num_reviewed_nodes = srs.num_reviewed_nodes - dr.num_reviewed_nodes
+        FROM (
+            SELECT skeleton_id, reviewer_id, COUNT(*) AS num_reviewed_nodes
+            FROM deleted_review
+            GROUP BY 1, 2
+        ) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.reviewer_id = dr.reviewer_id;
+
+        DELETE FROM catmaid_skeleton_review_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM deleted_review) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        DELETE FROM catmaid_skeleton_reviewer_summary srs
+        USING (SELECT DISTINCT skeleton_id FROM deleted_review) dr
+        WHERE srs.skeleton_id = dr.skeleton_id
+            AND srs.num_reviewed_nodes <= 0;
+
+        RETURN NULL;
+    END;
+    $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catmaid', '0126_add_label_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -437,6 +437,63 @@ class ClassInstanceClassInstance(models.Model):
     class Meta:
         db_table = "class_instance_class_instance"
 
+class AnnotationClosure(models.Model):
+    """The transitive closure of the annotation hierarchy: each row states
+    that the descendant annotation is (transitively) annotated with the
+    ancestor annotation, with <depth> being the length of the shortest path
+    between both. This table is maintained by triggers on the
+    class_instance_class_instance table.
+    """
+
+    class Meta:
+        db_table = "catmaid_annotation_closure"
+        unique_together = (("ancestor", "descendant"),)
+
+    id = models.BigAutoField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    # Entries are removed by database triggers, which is why there are no
+    # database constraints for both annotations.
+    ancestor = models.ForeignKey(ClassInstance, db_constraint=False,
+            related_name='annotation_descendants', on_delete=models.DO_NOTHING)
+    descendant = models.ForeignKey(ClassInstance, db_constraint=False,
+            related_name='annotation_ancestors', on_delete=models.DO_NOTHING)
+    depth = models.IntegerField()
+
+class AnnotationStats(models.Model):
+    """Usage statistics for an annotation: the number of links to it, when the
+    most recent link was created and edited and who edited it. This table is
+    maintained by triggers on the class_instance_class_instance table.
+    """
+
+    class Meta:
+        db_table = "catmaid_annotation_stats"
+
+    annotation = models.OneToOneField(ClassInstance, on_delete=models.CASCADE,
+            primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    num_usage = models.BigIntegerField(default=0)
+    last_user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    last_creation_time = models.DateTimeField(null=True)
+    last_edition_time = models.DateTimeField(null=True)
+
+class AnnotationCoOccurrence(models.Model):
+    """The number of neurons that are annotated with both annotation A and
+    annotation B. Every pair is stored in both directions. This table is
+    maintained by triggers on the class_instance_class_instance table.
+    """
+
+    class Meta:
+        db_table = "catmaid_annotation_co_occurrence"
+        unique_together = (("annotation_a", "annotation_b"),)
+
+    id = models.BigAutoField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    annotation_a = models.ForeignKey(ClassInstance, on_delete=models.CASCADE,
+            related_name='co_occurrences_as_a')
+    annotation_b = models.ForeignKey(ClassInstance, on_delete=models.CASCADE,
+            related_name='co_occurrences_as_b')
+    num_entities = models.BigIntegerField()
+
 class BrokenSlice(models.Model):
     stack = models.ForeignKey(Stack, on_delete=models.CASCADE)
     index = models.IntegerField()
@@ -757,6 +814,28 @@ class Volume(UserFocusedModel):
     geometry = SerializableGeometryField()
 
 
+class VolumeMeshLOD(models.Model):
+    """A cached binary representation of a volume's mesh at a particular level
+    of detail (LOD), see catmaid.control.meshes.encode_mesh(). LOD 0 is the
+    original mesh, higher levels are increasingly decimated. Entries are
+    recomputed when the volume's edition time changes.
+    """
+
+    class Meta:
+        db_table = "catmaid_volume_mesh_lod"
+        unique_together = (("volume", "lod", "quantization_bits"),)
+
+    id = models.BigAutoField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    volume = models.ForeignKey(Volume, on_delete=models.CASCADE)
+    lod = models.SmallIntegerField()
+    quantization_bits = models.SmallIntegerField(default=0)
+    edition_time = models.DateTimeField()
+    num_vertices = models.IntegerField()
+    num_faces = models.IntegerField()
+    data = models.BinaryField()
+
+
 class VolumeClassInstance(UserFocusedModel):
     # Repeat the columns inherited from 'relation_instance'
     relation = models.ForeignKey(Relation, on_delete=models.CASCADE)
@@ -1414,6 +1493,29 @@ class SkeletonSummary(models.Model):
     def __str__(self) -> str:
         return f"Skeleton {self.skeleton_id} summary ({self.num_nodes} nodes, {self.cable_length} nm)"
 
+
+class SkeletonVolumeInnervation(models.Model):
+    """Holds the number of nodes and the cable length of a skeleton inside a
+    volume. This table acts as a cache and is updated incrementally based on
+    the edition times of skeletons and volumes, see
+    catmaid.control.volume.update_skeleton_innervations().
+    """
+
+    class Meta:
+        db_table = "catmaid_skeleton_volume_innervation"
+        unique_together = (("skeleton", "volume"),)
+
+    id = models.BigAutoField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    skeleton = models.ForeignKey(ClassInstance, on_delete=models.CASCADE)
+    volume = models.ForeignKey(Volume, on_delete=models.CASCADE)
+    num_nodes = models.IntegerField(null=False, default=0)
+    cable_length = models.FloatField(null=False, default=0)
+    last_update = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f"Skeleton {self.skeleton_id} in volume {self.volume_id} ({self.num_nodes} nodes, {self.cable_length} nm)"
+
 class DataSource(NonCascadingUserFocusedModel):
     """A simple object representing a data source, which are mainly used to
     reference the origin of imported skeletons. This table is tracked by the
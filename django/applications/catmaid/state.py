@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from collections import defaultdict
 import decimal
 from functools import reduce
 import json
@@ -11,108 +12,65 @@ from catmaid.error import ClientError
 
 
 class StateMatchingError(ClientError):
-    """Indicates that a state check wasn't successful"""
-    def __init__(self, message, state):
+    """Indicates that a state check wasn't successful. All failed checks are
+    available as (check, id, other_id) triples in the mismatches field, which
+    is also returned to the client as meta data.
+    """
+    def __init__(self, message, state, mismatches=None):
         super().__init__(message)
         self.unmatched_state = state
+        self.mismatches = mismatches or []
+        self.meta = {
+            'mismatches': self.mismatches,
+        }
 
     def __str__(self) -> str:
         return "{}: {}".format(self.args[0],
             str(self.unmatched_state) or "(no details found)")
 
 
-class SQL:
-    was_edited = """
-        SELECT 1 FROM location t
-        WHERE t.id = %s
-        AND t.edition_time >=(%s::timestamptz - '1 ms'::interval)
-        AND t.edition_time < (%s::timestamptz + '1 ms'::interval)
-        LIMIT 1
-    """
-    is_parent = """
-        SELECT 1 FROM treenode t
-        WHERE t.parent_id = %s AND t.id = %s
-    """
-    is_child = """
-        SELECT 1 FROM treenode t
-        WHERE t.id = %s AND t.parent_id = %s
-    """
-    is_root = """
-        SELECT 1 FROM treenode t
-        WHERE t.parent_id IS NULL AND t.id = %s
-    """
-    all_children = """
-        SELECT CASE WHEN sub.c=0 THEN 1 ELSE 0 END FROM (
-            SELECT COUNT(*) FROM treenode t %s WHERE t.parent_id = %s %s
-        ) sub(c)
-    """
-    all_links = """
-        SELECT CASE WHEN sub.c=0 THEN 1 ELSE 0 END FROM (
-            SELECT COUNT(*) FROM treenode_connector l %s WHERE l.treenode_id = %s %s
-        ) sub(c)
-    """
-    all_links_c = """
-        SELECT CASE WHEN sub.c=0 THEN 1 ELSE 0 END FROM (
-            SELECT COUNT(*) FROM treenode_connector l %s WHERE l.connector_id = %s %s
-        ) sub(c)
+class StateCheck:
+    """A single expectation on the database state. State checks are collected
+    first and then tested all at once by check_state(), which combines checks
+    of the same kind into one set based query. The following kinds and
+    parameters are supported:
+
+    edited:       (table, id, edition_time)
+    parent:       (node_id, parent_id)
+    root:         (node_id,)
+    all_children: (node_id, [child_id, ...])
+    all_links:    (treenode_id, [link_id, ...])
+    all_c_links:  (connector_id, [link_id, ...])
     """
 
-    @staticmethod
-    def edited(table):
-        return f"""
-            SELECT 1 FROM {table} t
-            WHERE t.id = %s
-            AND t.edition_time >=(%s::timestamptz - '1 ms'::interval)
-            AND t.edition_time < (%s::timestamptz + '1 ms'::interval)
-        """
+    kinds = ('edited', 'parent', 'root', 'all_children', 'all_links',
+            'all_c_links')
 
-class StateCheck:
-    """A simple wraper arround state check SQL and parameters for it"""
+    # Tables whose edition time can be checked
+    edited_tables = ('location', 'treenode', 'connector', 'treenode_connector')
 
-    def __init__(self, sql, params):
-        if not isinstance(sql, str):
-            raise ValueError("No SQL string")
-        self.sql = sql
-        self.params = params if type(params) in (list, tuple) else (params,)
+    def __init__(self, kind, params):
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown state check: {kind}")
+        params = params if type(params) in (list, tuple) else (params,)
+        if kind == 'edited' and params[0] not in self.edited_tables:
+            raise ValueError(f"Can't check edition time of table {params[0]}")
+        self.kind = kind
+        self.params = params
 
     def __str__(self) -> str:
-        return f"SQL: {self.sql} Parameters: {self.params}"
+        return f"Check: {self.kind} Parameters: {self.params}"
 
-def make_all_children_query(child_ids, node_id) -> StateCheck:
-    if child_ids:
-        table_sql, table_args = list_to_table(child_ids, 1)
-        args = table_args
-        child_query = f" LEFT JOIN {table_sql} p(id) ON t.id = p.id "
-        constraints = "AND p.id IS NULL"
-        args.append(node_id)
-        return StateCheck(SQL.all_children % (child_query, "%s", constraints), args)
-    else:
-        return StateCheck(SQL.all_children % ("", "%s", ""), [node_id])
 
-def make_all_links_query(link_ids, node_id, is_connector=False) -> StateCheck:
-    template = SQL.all_links_c if is_connector else SQL.all_links
-    if link_ids:
-        table_sql, table_args = list_to_table(link_ids, 1)
-        args = table_args
-        link_query = f" LEFT JOIN {table_sql} p(id) ON l.id = p.id "
-        constraints = "AND p.id IS NULL"
-        args.append(node_id)
-        return StateCheck(template % (link_query, "%s", constraints), args)
-    else:
-        return StateCheck(template % ("", "%s", ""), [node_id])
+def make_edition_time_check(node_id, edition_time, table='location') -> StateCheck:
+    return StateCheck('edited', (table, node_id, edition_time))
 
-def list_to_table(input_list, n=1) -> Tuple[str, Any]:
-    if n == 1:
-        args:List[Tuple] = [(e,) for e in input_list]
-    elif n == 2:
-        args = [(e[0], e[1]) for e in input_list]
-    else:
-        raise ValueError("Invalid n parameter for list_to_table")
-    if not args: # empty input_list or invalid n
-        raise ValueError("Could't parse list argument in state check")
+def make_all_children_query(child_ids, node_id) -> StateCheck:
+    return StateCheck('all_children', (node_id, list(child_ids or [])))
 
-    records_list_template = ','.join(['%s'] * len(args))
-    return (f"(VALUES {records_list_template})", args)
+def make_all_links_query(link_ids, node_id, is_connector=False) -> StateCheck:
+    kind = 'all_c_links' if is_connector else 'all_links'
+    return StateCheck(kind, (node_id, list(link_ids or [])))
 
 def has_only_truthy_values(element, n=2) -> bool:
     return n == len(element) and all(element)
@@ -182,7 +140,7 @@ def collect_state_checks(node_id, state, cursor, node=False,
         node = [node_id, state['edition_time']]
 
         # Make sure the node itself is valid
-        state_checks = [StateCheck(SQL.was_edited, (node[0], node[1], node[1]))]
+        state_checks = [make_edition_time_check(node[0], node[1])]
     else:
         node = [node_id]
 
@@ -203,11 +161,10 @@ def collect_state_checks(node_id, state, cursor, node=False,
             if is_parent:
                 if parent_id == node_id:
                     raise ValueError(f"No valid state provided, parent is same as node ({parent_id})")
-                state_checks.append(StateCheck(SQL.is_parent, (parent_id, node_id)))
-            state_checks.append(StateCheck(SQL.was_edited,
-                (parent_id, parent[1], parent[1])))
+                state_checks.append(StateCheck('parent', (node_id, parent_id)))
+            state_checks.append(make_edition_time_check(parent_id, parent[1]))
         else:
-            state_checks.append(StateCheck(SQL.is_root, (node_id,)))
+            state_checks.append(StateCheck('root', (node_id,)))
 
     if children:
         child_nodes = state.get('children')
@@ -219,8 +176,8 @@ def collect_state_checks(node_id, state, cursor, node=False,
         if type(children) == bool:
             state_checks.append(make_all_children_query(
                 [int(c[0]) for c in child_nodes], node_id))
-        state_checks.extend(StateCheck(SQL.was_edited, (c[0], c[1], c[1])) for c in child_nodes)
-        state_checks.extend(StateCheck(SQL.is_child, (c[0], node_id)) for c in child_nodes)
+        state_checks.extend(make_edition_time_check(c[0], c[1]) for c in child_nodes)
+        state_checks.extend(StateCheck('parent', (c[0], node_id)) for c in child_nodes)
 
     if links:
         links = state.get('links')
@@ -231,8 +188,8 @@ def collect_state_checks(node_id, state, cursor, node=False,
 
         state_checks.append(make_all_links_query(
             [int(link[0]) for link in links], node_id))
-        state_checks.extend(StateCheck(SQL.edited('treenode_connector'),
-            (link[0], link[1], link[1])) for link in links)
+        state_checks.extend(make_edition_time_check(link[0], link[1],
+            'treenode_connector') for link in links)
 
     if c_links:
         c_links = state.get('c_links')
@@ -243,8 +200,8 @@ def collect_state_checks(node_id, state, cursor, node=False,
 
         state_checks.append(make_all_links_query(
             [int(link[0]) for link in c_links], node_id, True))
-        state_checks.extend(StateCheck(SQL.edited('treenode_connector'),
-            (link[0], link[1], link[1])) for link in c_links)
+        state_checks.extend(make_edition_time_check(link[0], link[1],
+            'treenode_connector') for link in c_links)
 
 
     return state_checks
@@ -296,10 +253,8 @@ def validate_state(node_ids, state, node=False, is_parent=False,
             if len(unseen) > 0:
                 raise ValueError("Couldn't find state info on node(s) {}".format(
                     ", ".join(str(n) for n in unseen)))
-            state_checks = []
-            for node_state in state:
-                state_checks.append(StateCheck(SQL.was_edited,
-                    (node_state[0], node_state[1], node_state[1])))
+            state_checks = [make_edition_time_check(node_state[0], node_state[1])
+                    for node_state in state]
             check_state(state, state_checks, cursor)
         else:
             check_sets = [collect_state_checks(n, state, cursor, node=node,
@@ -323,10 +278,13 @@ def lock_node(node_id, cursor) -> None:
 
 def lock_nodes(node_ids, cursor) -> None:
     if node_ids:
-        node_template = ",".join(("%s",) * len(node_ids))
-        cursor.execute(f"""
-            SELECT id FROM treenode WHERE id IN ({node_template}) FOR UPDATE
-        """, node_ids)
+        cursor.execute("""
+            SELECT id FROM treenode
+            WHERE id = ANY(%(node_ids)s::bigint[])
+            FOR UPDATE
+        """, {
+            'node_ids': list(node_ids),
+        })
     else:
         raise ValueError("No nodes to lock")
 
@@ -344,23 +302,99 @@ def make_nocheck_state(parsed=False):
     return state
 
 def check_state(state, state_checks, cursor) -> None:
-    """Raise an error if state checks can't be passed."""
+    """Raise an error if state checks can't be passed. All checks are tested
+    in a single query, which unnests the parameters of each kind of check
+    into arrays and joins them against the tracing tables. The raised error
+    lists all mismatches in its meta data as (check, id, other_id) triples,
+    e.g. ('parent', node_id, expected_parent_id).
+    """
     # Skip actual tests if state checking is disabled in state
     if is_disabled(state):
         return
 
-    sql_checks = [sc.sql for sc in state_checks]
-    args:List = []
-    for sc in state_checks:
-        args.extend(p for p in sc.params)
-
-    if sql_checks:
-        cursor.execute("(" + ") INTERSECT (".join(sql_checks) + ")", args)
-    else:
-        cursor.execute("SELECT 1")
-    state_check_results = cursor.fetchall()
+    mismatches = find_state_mismatches(state_checks, cursor)
+    if mismatches:
+        raise StateMatchingError("The provided state differs from the database state",
+                state, mismatches)
 
-    # Expect results to have a length of the number of checks made and that
-    # each result equals one.
-    if not state_check_results or 1 != len(state_check_results) or 1 != state_check_results[0][0]:
-        raise StateMatchingError("The provided state differs from the database state", state)
+def find_state_mismatches(state_checks, cursor) -> List[Tuple[str, int, Optional[int]]]:
+    """Test all passed in state checks in one query and return a list of all
+    checks that failed as (check, id, other_id) triples.
+    """
+    params:Dict[str, List] = defaultdict(list)
+    edited_tables = set()
+    for sc in state_checks:
+        if sc.kind == 'edited':
+            table, node_id, edition_time = sc.params
+            edited_tables.add(table)
+            params[f'edited_{table}_ids'].append(node_id)
+            params[f'edited_{table}_times'].append(edition_time)
+        elif sc.kind == 'parent':
+            params['parent_node_ids'].append(sc.params[0])
+            params['parent_ids'].append(sc.params[1])
+        elif sc.kind == 'root':
+            params['root_ids'].append(sc.params[0])
+        else:
+            # Completeness checks refer to a set of known children or links
+            # of a node.
+            node_id, known_ids = sc.params
+            params[f'{sc.kind}_node_ids'].append(node_id)
+            params[f'{sc.kind}_known_node_ids'].extend([node_id] * len(known_ids))
+            params[f'{sc.kind}_known_ids'].extend(known_ids)
+
+    queries = []
+    for table in sorted(edited_tables):
+        queries.append(f"""
+            SELECT 'edited', e.id, NULL::bigint
+            FROM UNNEST(%(edited_{table}_ids)s::bigint[],
+                    %(edited_{table}_times)s::timestamptz[]) e(id, edition_time)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} t
+                WHERE t.id = e.id
+                AND t.edition_time >= (e.edition_time - '1 ms'::interval)
+                AND t.edition_time < (e.edition_time + '1 ms'::interval)
+            )
+        """)
+    if params['parent_node_ids']:
+        queries.append("""
+            SELECT 'parent', p.id, p.parent_id
+            FROM UNNEST(%(parent_node_ids)s::bigint[],
+                    %(parent_ids)s::bigint[]) p(id, parent_id)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM treenode t
+                WHERE t.id = p.id AND t.parent_id = p.parent_id
+            )
+        """)
+    if params['root_ids']:
+        queries.append("""
+            SELECT 'root', r.id, NULL::bigint
+            FROM UNNEST(%(root_ids)s::bigint[]) r(id)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM treenode t
+                WHERE t.id = r.id AND t.parent_id IS NULL
+            )
+        """)
+    # For completeness checks, every child or link that is not part of the
+    # known set is a mismatch.
+    for kind, table, id_column in (('all_children', 'treenode', 'parent_id'),
+            ('all_links', 'treenode_connector', 'treenode_id'),
+            ('all_c_links', 'treenode_connector', 'connector_id')):
+        if params[f'{kind}_node_ids']:
+            queries.append(f"""
+                SELECT '{kind}', t.{id_column}, t.id
+                FROM {table} t
+                JOIN UNNEST(%({kind}_node_ids)s::bigint[]) n(id)
+                    ON t.{id_column} = n.id
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM UNNEST(%({kind}_known_node_ids)s::bigint[],
+                            %({kind}_known_ids)s::bigint[]) k(node_id, id)
+                    WHERE k.node_id = t.{id_column} AND k.id = t.id
+                )
+            """)
+
+    if not queries:
+        return []
+
+    cursor.execute(" UNION ALL ".join(queries), params)
+    return cursor.fetchall()
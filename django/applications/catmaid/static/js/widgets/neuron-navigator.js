@@ -1239,6 +1239,13 @@
     let selectedNeuronIds = new Set();
     let selectedSkeletonIds = new Set();
     let essentialParams = {};
+    // Range cursors for result pages of the current query, mapped by their
+    // start index, along with the last known total number of results.
+    let pagingState = {
+      queryKey: null,
+      cursors: new Map(),
+      totalRecords: 0,
+    };
 
     // Fill neuron table
     var datatable = $(table).DataTable({
@@ -1313,9 +1320,35 @@
           }
         }
 
+        // If the previous page of the same query has been loaded before, use
+        // its range cursor to continue after it. This is faster for deep
+        // pages and the total number of results doesn't need to be counted
+        // again.
+        let queryParams = Object.assign({}, params);
+        delete queryParams['range_start'];
+        let queryKey = JSON.stringify(queryParams);
+        if (queryKey !== pagingState.queryKey) {
+          pagingState.queryKey = queryKey;
+          pagingState.cursors.clear();
+        }
+        let rangeCursor = pagingState.cursors.get(data.start);
+        if (rangeCursor) {
+          params['range_after'] = rangeCursor;
+          params['count_mode'] = 'none';
+        }
+
         // Request data from back-end
         CATMAID.fetch(project.id + '/annotations/query-targets', 'POST', params)
           .then(function(json) {
+            if (json.totalRecords === null) {
+              json.totalRecords = pagingState.totalRecords;
+            } else {
+              pagingState.totalRecords = json.totalRecords;
+            }
+            if (json.nextRangeCursor && queryKey === pagingState.queryKey) {
+              pagingState.cursors.set(data.start + data.length, json.nextRangeCursor);
+            }
+
             // Format result so that DataTables can understand it
             var result = {
               draw: data.draw,
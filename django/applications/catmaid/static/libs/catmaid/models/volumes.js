@@ -101,6 +101,79 @@
       return result;
     },
 
+    /**
+     * Retrieve the mesh of a volume in binary form, optionally at a lower level
+     * of detail (LOD).
+     *
+     * @param {integer} projectId        The project the volume is part of
+     * @param {integer} volumeId         The volume to retrieve the mesh for
+     * @param {integer} lod              (optional) The level of detail, 0 is
+     *                                   the original mesh.
+     * @param {integer} quantizationBits (optional) Number of bits vertex
+     *                                   coordinates are quantized to (1-16).
+     * @param {API}     api              (optional) API to use
+     *
+     * @returns {Object} Promise that is resolved with an object with the fields
+     *                   vertices (Float32Array), indices (Uint32Array), lod
+     *                   and nLods.
+     */
+    getMesh: function(projectId, volumeId, lod = 0, quantizationBits = 0, api = undefined) {
+      return CATMAID.fetch({
+        url: `${projectId}/volumes/${volumeId}/mesh`,
+        method: 'GET',
+        data: {
+          lod: lod,
+          quantization_bits: quantizationBits,
+        },
+        raw: true,
+        responseType: 'arraybuffer',
+        api: api,
+      }).then(CATMAID.Volumes.decodeMesh);
+    },
+
+    /**
+     * Decode a mesh in CATMAID's binary indexed mesh format. A 40 byte header
+     * is followed by vertices (float32 or quantized uint16 triplets) and
+     * triangle indices (uint32 triplets). All values are little endian.
+     */
+    decodeMesh: function(buffer) {
+      let view = new DataView(buffer);
+      let magic = String.fromCharCode(view.getUint8(0), view.getUint8(1),
+          view.getUint8(2), view.getUint8(3));
+      if (magic !== 'CMSH' || view.getUint8(4) !== 1) {
+        throw new CATMAID.ValueError("Unsupported mesh format");
+      }
+      let quantizationBits = view.getUint8(5);
+      let nVertices = view.getUint32(8, true);
+      let nFaces = view.getUint32(12, true);
+      let offset = [0, 1, 2].map(i => view.getFloat32(16 + 4 * i, true));
+      let scale = [0, 1, 2].map(i => view.getFloat32(28 + 4 * i, true));
+
+      let pos = 40;
+      let vertices = new Float32Array(nVertices * 3);
+      if (quantizationBits) {
+        for (let i = 0; i < nVertices * 3; ++i, pos += 2) {
+          vertices[i] = offset[i % 3] + view.getUint16(pos, true) * scale[i % 3];
+        }
+      } else {
+        for (let i = 0; i < nVertices * 3; ++i, pos += 4) {
+          vertices[i] = view.getFloat32(pos, true);
+        }
+      }
+      pos += (4 - pos % 4) % 4;
+      let indices = new Uint32Array(nFaces * 3);
+      for (let i = 0; i < nFaces * 3; ++i, pos += 4) {
+        indices[i] = view.getUint32(pos, true);
+      }
+
+      return {
+        vertices: vertices,
+        indices: indices,
+        lod: view.getUint8(6),
+        nLods: view.getUint8(7),
+      };
+    },
+
     /**
      * Converts simple X3D IndexedFaceSet and IndexedTriangleSet nodes to a VRML
      * representation.
@@ -6,6 +6,8 @@ from catmaid.control.cropping import cleanup as cropping_cleanup, process_crop_j
 from catmaid.control.nat.r import export_skeleton_as_nrrd_async
 from catmaid.control.treenodeexport import process_export_job
 from catmaid.control.roi import create_roi_image
+from catmaid.control.skeleton import (cleanup_skeleton_import_jobs,
+        import_skeleton_archive_chunk)
 from catmaid.control.node import update_node_query_cache as do_update_node_query_cache
 from catmaid.control.authentication import deactivate_inactive_users as \
     deactivate_inactive_users_impl
@@ -30,11 +32,25 @@ def cleanup_cropped_stacks() -> str:
     return "Cleaned cropped stacks directory"
 
 
+@shared_task
+def cleanup_skeleton_imports() -> str:
+    """Define a periodic task that removes the folders of skeleton archive
+    import jobs that completed longer ago than the
+    IMPORTED_SKELETON_ARCHIVE_JOB_MAX_AGE setting or that didn't change for
+    longer than the IMPORTED_SKELETON_ARCHIVE_INCOMPLETE_JOB_MAX_AGE setting.
+    """
+    n_removed = cleanup_skeleton_import_jobs(
+            settings.IMPORTED_SKELETON_ARCHIVE_JOB_MAX_AGE,
+            settings.IMPORTED_SKELETON_ARCHIVE_INCOMPLETE_JOB_MAX_AGE)
+    return f"Removed {n_removed} skeleton import jobs"
+
+
 @shared_task
 def update_project_statistics() -> str:
     """Call management command to update all project statistics
     """
-    call_command('catmaid_refresh_node_statistics')
+    call_command('catmaid_refresh_node_statistics',
+            jobs=settings.STATS_SUMMARY_POPULATION_JOBS)
     return "Updated project node statistics summary"
 
 
@@ -42,10 +58,20 @@ def update_project_statistics() -> str:
 def update_project_statistics_from_scratch() -> str:
     """Call management command to update all project statistics
     """
-    call_command('catmaid_refresh_node_statistics', clean=True)
+    call_command('catmaid_refresh_node_statistics', clean=True,
+            jobs=settings.STATS_SUMMARY_POPULATION_JOBS)
     return "Updated and cleand project node statistics summary"
 
 
+@shared_task
+def update_skeleton_innervations() -> str:
+    """Call management command to update the precomputed skeleton volume
+    innervation table of all projects incrementally.
+    """
+    call_command('catmaid_update_innervation_table')
+    return "Updated skeleton innervation table"
+
+
 @shared_task
 def update_node_query_cache() -> str:
     """Update the query cache of changed sections for node providers defined in
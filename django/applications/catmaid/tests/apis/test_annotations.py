@@ -4,8 +4,11 @@ import json
 
 from datetime import datetime
 
-from catmaid.control.annotation import _annotate_entities
+from catmaid.control.annotation import _annotate_entities, _remove_annotation
 from catmaid.control.annotation import create_annotation_query
+from catmaid.control.annotation import get_sub_annotation_ids
+from catmaid.models import (AnnotationClosure, AnnotationCoOccurrence,
+        AnnotationStats, ClassInstance)
 
 from .common import CatmaidApiTestCase
 
@@ -268,3 +271,216 @@ class AnnotationsApiTests(CatmaidApiTestCase):
         ]
         self.assertEqual(parsed_response['totalRecords'], 1)
         self.assertCountEqual(parsed_response['entities'], expected_entities)
+
+
+    def test_annotation_closure(self):
+        self.fake_authentication()
+
+        def closure():
+            return set(AnnotationClosure.objects.filter(
+                    project_id=self.test_project_id).values_list(
+                    'ancestor_id', 'descendant_id', 'depth'))
+
+        def annotate(entity_ids, annotation):
+            annotations, _, _ = _annotate_entities(self.test_project_id,
+                    entity_ids, {annotation: {'user_id': self.test_user_id}})
+            return list(annotations.keys())[0].id
+
+        # Build the hierarchy A -> B -> C and A -> C, with neuron 233 being
+        # annotated with C.
+        c = annotate([233], 'C')
+        b = annotate([c], 'B')
+        a = annotate([b, c], 'A')
+        self.assertEqual(closure(), {(a, b, 1), (a, c, 1), (b, c, 1)})
+
+        sub_annotations = get_sub_annotation_ids(self.test_project_id,
+                [frozenset([a]), frozenset([b]), frozenset([c])], None, None)
+        self.assertCountEqual(sub_annotations[frozenset([a])], [b, c])
+        self.assertCountEqual(sub_annotations[frozenset([b])], [c])
+        self.assertCountEqual(sub_annotations[frozenset([c])], [])
+
+        # Removing the direct link between A and C keeps C a sub-annotation of
+        # A through B.
+        _remove_annotation(self.test_user, self.test_project_id, [c], a)
+        self.assertEqual(closure(), {(a, b, 1), (a, c, 2), (b, c, 1)})
+
+        # Deleting B disconnects A and C.
+        ClassInstance.objects.filter(id=b).delete()
+        self.assertEqual(closure(), set())
+
+
+    def test_annotations_query_targets_range_cursor(self):
+        self.fake_authentication()
+
+        def query(params):
+            response = self.client.post(
+                '/%d/annotations/query-targets' % (self.test_project_id,),
+                params)
+            self.assertStatus(response)
+            return json.loads(response.content.decode('utf-8'))
+
+        for sort_by in ('id', 'name'):
+            for sort_dir in ('asc', 'desc'):
+                parsed_response = query({'sort_by': sort_by,
+                    'sort_dir': sort_dir, 'range_start': 0,
+                    'range_length': 100})
+                expected_ids = [e['id'] for e in parsed_response['entities']]
+                self.assertEqual(parsed_response['totalRecords'], 17)
+                self.assertNotIn('nextRangeCursor', parsed_response)
+
+                # Page through all results using range cursors
+                params = {'sort_by': sort_by, 'sort_dir': sort_dir,
+                        'range_start': 0, 'range_length': 5}
+                paged_ids = []
+                n_pages = 0
+                while True:
+                    parsed_response = query(params)
+                    if 'range_after' in params:
+                        self.assertIsNone(parsed_response['totalRecords'])
+                    paged_ids.extend(e['id'] for e in parsed_response['entities'])
+                    n_pages += 1
+                    if 'nextRangeCursor' not in parsed_response:
+                        break
+                    params['range_after'] = parsed_response['nextRangeCursor']
+                    params['count_mode'] = 'none'
+                self.assertEqual(n_pages, 4)
+                self.assertEqual(paged_ids, expected_ids)
+
+        # Estimated counts are numbers as well
+        parsed_response = query({'sort_by': 'name', 'range_start': 0,
+            'range_length': 5, 'count_mode': 'estimate'})
+        self.assertIsInstance(parsed_response['totalRecords'], int)
+
+        # Cursors can't be used with a different sort order
+        parsed_response = query({'sort_by': 'id', 'range_start': 0,
+            'range_length': 5})
+        response = self.client.post(
+            '/%d/annotations/query-targets' % (self.test_project_id,),
+            {'sort_by': 'name', 'range_length': 5,
+             'range_after': parsed_response['nextRangeCursor']})
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_annotation_stats(self):
+        self.fake_authentication()
+
+        def annotate(entity_ids, annotation):
+            annotations, _, _ = _annotate_entities(self.test_project_id,
+                    entity_ids, {annotation: {'user_id': self.test_user_id}})
+            return list(annotations.keys())[0].id
+
+        def co_occurrences():
+            return set(AnnotationCoOccurrence.objects.filter(
+                    project_id=self.test_project_id).values_list(
+                    'annotation_a_id', 'annotation_b_id', 'num_entities'))
+
+        a = annotate([233, 2365, 2381], 'A')
+        b = annotate([233, 2365], 'B')
+        c = annotate([233], 'C')
+
+        stats_a = AnnotationStats.objects.get(annotation_id=a)
+        self.assertEqual(stats_a.num_usage, 3)
+        self.assertEqual(stats_a.last_user_id, self.test_user_id)
+        self.assertIsNotNone(stats_a.last_creation_time)
+        self.assertEqual(AnnotationStats.objects.get(annotation_id=c).num_usage, 1)
+
+        self.assertEqual(co_occurrences(), {
+            (a, b, 2), (b, a, 2),
+            (a, c, 1), (c, a, 1),
+            (b, c, 1), (c, b, 1),
+        })
+
+        # Co-annotations of A on neurons, including A itself
+        response = self.client.post(
+            '/%d/annotations/table-list' % (self.test_project_id,),
+            {'parallel_annotations[0]': a})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response['recordsTotal'], 3)
+        usage = {row[4]: row[2] for row in parsed_response['data']}
+        self.assertEqual(usage, {a: 3, b: 2, c: 1})
+
+        # Removing links updates both tables
+        _remove_annotation(self.test_user, self.test_project_id, [233], b)
+        self.assertEqual(AnnotationStats.objects.get(annotation_id=b).num_usage, 1)
+        self.assertEqual(co_occurrences(), {
+            (a, b, 1), (b, a, 1),
+            (a, c, 1), (c, a, 1),
+        })
+
+        _remove_annotation(self.test_user, self.test_project_id, [233], c)
+        self.assertFalse(AnnotationStats.objects.filter(annotation_id=c).exists())
+        self.assertEqual(co_occurrences(), {(a, b, 1), (b, a, 1)})
+
+
+    def test_bulk_annotate_and_remove(self):
+        self.fake_authentication()
+
+        neuron_ids = [233, 2365, 2381]
+        response = self.client.post(
+            '/%d/annotations/bulk-add' % (self.test_project_id,), {
+                'annotations': ['bulk A', 'bulk B'],
+                'entity_ids': neuron_ids,
+                'chunk_size': 2,
+            })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        a = parsed_response['annotations']['bulk A']
+        b = parsed_response['annotations']['bulk B']
+        self.assertCountEqual(parsed_response['new_annotations'], [a, b])
+        self.assertEqual(parsed_response['n_created_links'], 6)
+        self.assertEqual(parsed_response['chunks'], [
+            {'offset': 0, 'n_entities': 2, 'n_created_links': 4},
+            {'offset': 2, 'n_entities': 1, 'n_created_links': 2},
+        ])
+        for nid in neuron_ids:
+            aq = create_annotation_query(self.test_project_id, {'neuron_id': nid})
+            self.assertCountEqual([ci.id for ci in aq], [a, b])
+
+        # Existing links and annotations are reused
+        response = self.client.post(
+            '/%d/annotations/bulk-add' % (self.test_project_id,), {
+                'annotations': ['bulk A'],
+                'entity_ids': neuron_ids,
+            })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response['annotations'], {'bulk A': a})
+        self.assertEqual(parsed_response['new_annotations'], [])
+        self.assertEqual(parsed_response['n_created_links'], 0)
+
+        # Unknown entities are rejected
+        response = self.client.post(
+            '/%d/annotations/bulk-add' % (self.test_project_id,), {
+                'annotations': ['bulk A'],
+                'entity_ids': [233, 999999],
+            })
+        self.assertStatus(response, code=400)
+
+        # Remove both annotations from two of the three neurons, which keeps
+        # both annotations in use.
+        response = self.client.post(
+            '/%d/annotations/bulk-remove' % (self.test_project_id,), {
+                'annotation_ids': [a, b],
+                'entity_ids': [233, 2365],
+                'chunk_size': 1,
+            })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response['n_deleted_links'], 4)
+        self.assertEqual(parsed_response['n_missed_links'], 0)
+        self.assertEqual(len(parsed_response['chunks']), 2)
+        self.assertEqual(parsed_response['deleted_annotations'], [])
+        self.assertEqual(parsed_response['left_uses'], {str(a): 1, str(b): 1})
+
+        # Removing the last use of A deletes the annotation itself
+        response = self.client.post(
+            '/%d/annotations/bulk-remove' % (self.test_project_id,), {
+                'annotation_ids': [a],
+                'entity_ids': [2381],
+            })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response['deleted_annotations'], [a])
+        self.assertFalse(ClassInstance.objects.filter(id=a).exists())
+        self.assertTrue(ClassInstance.objects.filter(id=b).exists())
@@ -92,6 +92,35 @@ class NodesApiTests(CatmaidApiTestCase):
         self.assertEqual(expected_result, parsed_response)
 
 
+    def test_node_nearest_bulk(self):
+        self.fake_authentication()
+        response = self.client.post(
+            '/%d/nodes/nearest-bulk' % self.test_project_id,
+            {
+                'points': json.dumps([[5115, 3835, 4050], [7030, 1980, 0], [5115, 3835, 0]]),
+                'skeleton_ids': [2388, -1, 361],
+            }
+        )
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        expected_result = [
+            [2394, 2388, 3110, 6030, 0],
+            [367, 361, 7030, 1980, 0],
+            [367, 361, 7030, 1980, 0],
+        ]
+        self.assertEqual(expected_result, parsed_response)
+
+        # Points and skeleton IDs need to match
+        response = self.client.post(
+            '/%d/nodes/nearest-bulk' % self.test_project_id,
+            {
+                'points': json.dumps([[5115, 3835, 4050], [7030, 1980, 0]]),
+                'skeleton_ids': [2388],
+            }
+        )
+        self.assertStatus(response, 400)
+
+
     def test_node_user_info(self):
         self.fake_authentication()
 
@@ -520,3 +549,53 @@ class NodesApiTests(CatmaidApiTestCase):
         self.assertEqual({}, parsed_response[2])
         self.assertEqual(False, parsed_response[3])
         self.assertEqual(expected_rel_response, parsed_response[4])
+
+
+    def test_node_list_as_of(self):
+        self.fake_authentication()
+
+        # All changes in this test share the same transaction time, which is
+        # why the snapshot time needs to be before it.
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT current_timestamp - interval '1 second'
+        """)
+        as_of = cursor.fetchone()[0]
+
+        # Move node 405 and delete node 403 along with its labels.
+        cursor.execute("""
+            UPDATE treenode SET location_x = 7400.0 WHERE id = 405
+        """)
+        cursor.execute("""
+            DELETE FROM treenode_class_instance WHERE treenode_id = 403;
+            DELETE FROM treenode WHERE id = 403;
+        """)
+
+        params = {
+            'z1': 0,
+            'top': 2000,
+            'left': 7000,
+            'right': 8000,
+            'bottom': 4000,
+            'z2': 9,
+        }
+
+        response = self.client.post('/%d/node/list' % (self.test_project_id,),
+                params)
+        self.assertStatus(response)
+        live_nodes = dict((n[0], n) for n in json.loads(
+                response.content.decode('utf-8'))[0])
+        self.assertNotIn(403, live_nodes)
+        self.assertEqual(7400.0, live_nodes[405][2])
+
+        response = self.client.post('/%d/node/list' % (self.test_project_id,),
+                dict(params, as_of=as_of.isoformat()))
+        self.assertStatus(response)
+        historic_nodes = dict((n[0], n[:8]) for n in json.loads(
+                response.content.decode('utf-8'))[0])
+        self.assertEqual([403, 377, 7840.0, 2380.0, 0.0, 5, -1.0, 373],
+                historic_nodes.get(403))
+        self.assertEqual([405, 377, 7390.0, 3510.0, 0.0, 5, -1.0, 373],
+                historic_nodes.get(405))
+        self.assertEqual([377, None, 7620.0, 2890.0, 0.0, 5, -1.0, 373],
+                historic_nodes.get(377))
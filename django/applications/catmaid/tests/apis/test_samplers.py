@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from catmaid.control.sampler import SAMPLER_CREATED_CLASS
+from catmaid.control.tracing import setup_tracing
+from catmaid.models import (Sampler, SamplerDomain, SamplerDomainType,
+        SamplerInterval, SamplerState, Treenode, TreenodeClassInstance)
+
+from .common import CatmaidApiTestCase
+
+
+class SamplersApiTests(CatmaidApiTestCase):
+
+    def create_domain(self, skeleton_id, start_node_id):
+        setup_tracing(self.test_project_id)
+        sampler = Sampler.objects.create(project_id=self.test_project_id,
+                user=self.test_user, skeleton_id=skeleton_id,
+                interval_length=1000, interval_error=250,
+                sampler_state=SamplerState.objects.get(name='open'))
+        return SamplerDomain.objects.create(project_id=self.test_project_id,
+                user=self.test_user, sampler=sampler,
+                start_node_id=start_node_id,
+                domain_type=SamplerDomainType.objects.get(name='regular'))
+
+    def test_add_all_intervals(self):
+        self.fake_authentication()
+        domain = self.create_domain(235, 237)
+
+        # Node 239 is a child of node 237. Two new nodes are added on this
+        # edge: node -1 between 239 and 237 and node -2 between 239 and the
+        # first new node. The final path is 239 -> -2 -> -1 -> 237.
+        added_nodes = [
+            [-1, 239, 237, 1100.0, 2917.5, 0.0],
+            [-2, 239, -1, 1117.5, 2858.75, 0.0],
+        ]
+        response = self.client.post(
+                '/%d/samplers/domains/%d/intervals/add-all' % (
+                    self.test_project_id, domain.id), {
+                    'intervals[0][0]': 237,
+                    'intervals[0][1]': -1,
+                    'intervals[1][0]': -2,
+                    'intervals[1][1]': 243,
+                    'added_nodes': json.dumps(added_nodes),
+                })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(2, parsed_response['n_added_nodes'])
+
+        intervals = parsed_response['intervals']
+        self.assertEqual(2, len(intervals))
+        self.assertEqual(237, intervals[0]['start_node_id'])
+        self.assertEqual(243, intervals[1]['end_node_id'])
+        new_node_1 = Treenode.objects.get(id=intervals[0]['end_node_id'])
+        new_node_2 = Treenode.objects.get(id=intervals[1]['start_node_id'])
+        self.assertNotEqual(new_node_1.id, new_node_2.id)
+        for new_node in (new_node_1, new_node_2):
+            self.assertTrue(new_node.id > 0)
+            self.assertEqual(235, new_node.skeleton_id)
+
+        self.assertEqual((1100.0, 2917.5, 0.0), (new_node_1.location_x,
+                new_node_1.location_y, new_node_1.location_z))
+        self.assertEqual((1117.5, 2858.75, 0.0), (new_node_2.location_x,
+                new_node_2.location_y, new_node_2.location_z))
+        self.assertEqual(237, new_node_1.parent_id)
+        self.assertEqual(new_node_1.id, new_node_2.parent_id)
+        self.assertEqual(new_node_2.id, Treenode.objects.get(id=239).parent_id)
+
+        for new_node in (new_node_1, new_node_2):
+            labels = TreenodeClassInstance.objects.filter(treenode=new_node,
+                    relation__relation_name='labeled_as').values_list(
+                    'class_instance__name', flat=True)
+            self.assertEqual([SAMPLER_CREATED_CLASS], list(labels))
+
+        stored_intervals = SamplerInterval.objects.filter(domain=domain) \
+                .order_by('id').values_list('start_node_id', 'end_node_id')
+        self.assertEqual([(237, new_node_1.id), (new_node_2.id, 243)],
+                list(stored_intervals))
+
+    def test_add_all_intervals_invalid_nodes(self):
+        self.fake_authentication()
+        domain = self.create_domain(235, 237)
+        n_nodes = Treenode.objects.count()
+
+        def add_node(added_node):
+            return self.client.post(
+                    '/%d/samplers/domains/%d/intervals/add-all' % (
+                        self.test_project_id, domain.id), {
+                        'intervals[0][0]': 237,
+                        'intervals[0][1]': -1,
+                        'added_nodes': json.dumps([added_node]),
+                    })
+
+        # The new node isn't collinear with child and parent.
+        response = add_node([-1, 239, 237, 1200.0, 2917.5, 0.0])
+        self.assertStatus(response, 400)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertIn('has to be collinear', parsed_response['error'])
+
+        # Node 241 isn't a child of node 237.
+        response = add_node([-1, 241, 237, 1202.5, 2847.5, 0.0])
+        self.assertStatus(response, 400)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertIn('need to be child and parent', parsed_response['error'])
+
+        # Nodes 405 and 377 are part of skeleton 373, not of the sampled
+        # skeleton 235.
+        response = add_node([-1, 405, 377, 7505.0, 3200.0, 0.0])
+        self.assertStatus(response, 400)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertIn('Could not find nodes in skeleton 235',
+                parsed_response['error'])
+
+        self.assertEqual(n_nodes, Treenode.objects.count())
+        self.assertEqual(0, SamplerInterval.objects.filter(domain=domain).count())
@@ -1,19 +1,24 @@
 # -*- coding: utf-8 -*-
 
-from io import StringIO
+from io import BytesIO, StringIO
 import json
 import platform
 import re
+import tempfile
 from typing import Any, Dict
 from unittest import skipIf
+from unittest.mock import patch
 from urllib.parse import urlencode
+import zipfile
 
 from django.db import connection, transaction
 from django.shortcuts import get_object_or_404
 from guardian.shortcuts import assign_perm
 
 from catmaid.control.annotation import _annotate_entities, annotations_for_skeleton
-from catmaid.control.skeleton import _get_neuronname_from_skeletonid
+from catmaid.control.skeleton import (_compute_skeleton_details_in_thread,
+        _get_neuronname_from_skeletonid, cleanup_skeleton_import_jobs,
+        import_skeleton_archive_chunk, update_skeleton_detail_summary)
 from catmaid.models import (
     ClassInstance, ClassInstanceClassInstance, Log, Review, TreenodeConnector,
     ReviewerWhitelist, Treenode, User, ClientDatastore, ClientData
@@ -210,6 +215,98 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assertEqual(error_message, parsed_response.get('error'))
 
 
+    def prepare_attribution_test(self, skeleton_id, editor_id, reviewed_nodes):
+        """Make <editor_id> the editor of all nodes of a skeleton and the last
+        editor in its summary and let this user review the passed in nodes.
+        """
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE treenode SET editor_id = %(editor_id)s
+            WHERE skeleton_id = %(skeleton_id)s;
+            UPDATE catmaid_skeleton_summary SET last_editor_id = %(editor_id)s
+            WHERE skeleton_id = %(skeleton_id)s;
+        """, {
+            'editor_id': editor_id,
+            'skeleton_id': skeleton_id,
+        })
+        for node_id in reviewed_nodes:
+            Review.objects.create(project_id=self.test_project_id,
+                    reviewer_id=editor_id, treenode_id=node_id,
+                    skeleton_id=Treenode.objects.get(id=node_id).skeleton_id)
+
+    def get_review_summary(self, skeleton_id, reviewer_id):
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT srs.num_reviewed_nodes, (
+                SELECT num_reviewed_nodes
+                FROM catmaid_skeleton_reviewer_summary
+                WHERE skeleton_id = %(skeleton_id)s
+                    AND reviewer_id = %(reviewer_id)s)
+            FROM catmaid_skeleton_review_summary srs
+            WHERE srs.skeleton_id = %(skeleton_id)s
+        """, {
+            'skeleton_id': skeleton_id,
+            'reviewer_id': reviewer_id,
+        })
+        return cursor.fetchone()
+
+    def get_last_editor(self, skeleton_id):
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT last_editor_id FROM catmaid_skeleton_summary
+            WHERE skeleton_id = %(skeleton_id)s
+        """, {
+            'skeleton_id': skeleton_id,
+        })
+        return cursor.fetchone()[0]
+
+
+    def test_split_skeleton_moves_only_downstream_data(self):
+        self.fake_authentication()
+
+        # Skeleton 2388 consists of the path 2392 -> 2394 -> 2396 and node
+        # 2394 is linked to a connector through link 2405.
+        old_skeleton_id = 2388
+        other_user_id = 5
+        self.prepare_attribution_test(old_skeleton_id, other_user_id,
+                [2392, 2394, 2396])
+
+        response = self.client.post(
+            '/%d/skeleton/split' % (self.test_project_id,),
+            {'treenode_id': 2394, 'upstream_annotation_map': '{}', 'downstream_annotation_map': '{}'})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        new_skeleton_id = parsed_response['new_skeleton_id']
+
+        self.assertTreenodeHasProperties(2392, None, old_skeleton_id)
+        self.assertTreenodeHasProperties(2394, None, new_skeleton_id)
+        self.assertTreenodeHasProperties(2396, 2394, new_skeleton_id)
+        self.assertEqual(new_skeleton_id,
+                TreenodeConnector.objects.get(id=2405).skeleton_id)
+
+        # Only the split node is edited by the user who split the skeleton.
+        self.assertEqual(other_user_id, Treenode.objects.get(id=2392).editor_id)
+        self.assertEqual(self.test_user_id, Treenode.objects.get(id=2394).editor_id)
+        self.assertEqual(other_user_id, Treenode.objects.get(id=2396).editor_id)
+        self.assertEqual(self.test_user_id, self.get_last_editor(new_skeleton_id))
+
+        reviews = dict(Review.objects.filter(treenode_id__in=[2392, 2394, 2396]) \
+                .values_list('treenode_id', 'skeleton_id'))
+        self.assertEqual({
+            2392: old_skeleton_id,
+            2394: new_skeleton_id,
+            2396: new_skeleton_id,
+        }, reviews)
+        self.assertEqual((1, 1), self.get_review_summary(old_skeleton_id,
+                other_user_id))
+        self.assertEqual((2, 2), self.get_review_summary(new_skeleton_id,
+                other_user_id))
+
+        # Nodes and links of other skeletons are unchanged.
+        self.assertEqual(2411, TreenodeConnector.objects.get(id=2429).skeleton_id)
+        self.assertEqual(1, Treenode.objects.filter(skeleton_id=old_skeleton_id).count())
+
+
     def test_split_skeleton_annotations(self):
         self.fake_authentication()
 
@@ -427,6 +524,44 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assertCountEqual(expected_result, parsed_response['skeletons'])
 
 
+    def test_skeletons_in_bounding_box(self):
+        self.fake_authentication()
+
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT DISTINCT skeleton_id FROM treenode WHERE project_id = %s
+        """, (self.test_project_id,))
+        all_skeleton_ids = [r[0] for r in cursor.fetchall()]
+
+        # A bounding box that contains complete footprint blocks and all nodes.
+        response = self.client.post(
+                '/%d/skeletons/in-bounding-box' % (self.test_project_id,), {
+                    'minx': -20000, 'miny': -20000, 'minz': -20000,
+                    'maxx': 50000, 'maxy': 50000, 'maxz': 50000,
+                })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertCountEqual(all_skeleton_ids, parsed_response)
+
+        # The footprint has to follow split skeletons and moved nodes.
+        response = self.client.post(
+            '/%d/skeleton/split' % (self.test_project_id,),
+            {'treenode_id': 2394, 'upstream_annotation_map': '{}', 'downstream_annotation_map': '{}'})
+        self.assertStatus(response)
+        Treenode.objects.filter(id=2396).update(location_x=60000)
+
+        footprint_query = """
+            SELECT skeleton_id, block_x, block_y, block_z, num_nodes
+            FROM catmaid_skeleton_footprint
+            ORDER BY 1, 2, 3, 4
+        """
+        cursor.execute(footprint_query)
+        footprint = cursor.fetchall()
+        cursor.execute("SELECT rebuild_skeleton_footprint()")
+        cursor.execute(footprint_query)
+        self.assertEqual(cursor.fetchall(), footprint)
+
+
     def test_skeleton_permissions(self):
         skeleton_id = 235
 
@@ -650,6 +785,143 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         # Also check response length to be sure there were no duplicates.
         self.assertEqual(len(expected_result), len(parsed_response))
 
+    def test_skeleton_summary_details(self):
+        self.fake_authentication()
+        skeleton_ids = [235, 373, 2364, 2388, 2411, 2462]
+
+        def get_expected_details():
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT t.skeleton_id, MIN(t.location_x), MIN(t.location_y),
+                    MIN(t.location_z), MAX(t.location_x), MAX(t.location_y),
+                    MAX(t.location_z),
+                    COUNT(*) FILTER (WHERE (SELECT COUNT(*) FROM treenode c
+                        WHERE c.parent_id = t.id) > 1),
+                    COUNT(*) FILTER (WHERE t.parent_id IS NULL OR NOT EXISTS(
+                        SELECT 1 FROM treenode c WHERE c.parent_id = t.id))
+                FROM treenode t
+                WHERE t.skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+                GROUP BY t.skeleton_id
+            """, {
+                'skeleton_ids': skeleton_ids,
+            })
+            return {str(r[0]): {
+                'bbox': {
+                    'min': {'x': r[1], 'y': r[2], 'z': r[3]},
+                    'max': {'x': r[4], 'y': r[5], 'z': r[6]},
+                },
+                'num_branch_nodes': r[7],
+                'num_end_nodes': r[8],
+            } for r in cursor.fetchall()}
+
+        def get_details():
+            response = self.client.post(f'/{self.test_project_id}/skeletons/summary', {
+                'skeleton_ids': skeleton_ids,
+                'with_details': True,
+            })
+            self.assertStatus(response)
+            parsed_response = json.loads(response.content.decode('utf-8'))
+            return {skid: {
+                'bbox': s['bbox'],
+                'num_branch_nodes': s['num_branch_nodes'],
+                'num_end_nodes': s['num_end_nodes'],
+            } for skid, s in parsed_response.items()}
+
+        self.assertEqual(get_expected_details(), get_details())
+
+        # Moving a node and adding a new branch has to be reflected in the
+        # details.
+        Treenode.objects.filter(id=2374).update(location_x=100000.0)
+        root = Treenode.objects.filter(skeleton_id=373, parent__isnull=True).first()
+        Treenode.objects.create(project_id=self.test_project_id,
+                skeleton_id=373, parent=root, user_id=self.test_user_id,
+                editor_id=self.test_user_id, location_x=root.location_x,
+                location_y=root.location_y, location_z=root.location_z,
+                radius=-1, confidence=5)
+        details = get_details()
+        self.assertEqual(get_expected_details(), details)
+        self.assertEqual(100000.0, details['2364']['bbox']['max']['x'])
+
+        # Plain and partner link counts have to match the links in the
+        # database.
+        url = f'/{self.test_project_id}/skeletons/connectivity-counts'
+        response = self.client.post(url, {
+            'skeleton_ids': skeleton_ids,
+            'count_partner_links': False,
+        })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        expected_counts:Dict[str, Dict[str, int]] = {}
+        for link in TreenodeConnector.objects.filter(skeleton_id__in=skeleton_ids):
+            skeleton_counts = expected_counts.setdefault(str(link.skeleton_id), {})
+            skeleton_counts[str(link.relation_id)] = skeleton_counts.get(str(link.relation_id), 0) + 1
+        self.assertEqual(expected_counts, parsed_response['connectivity'])
+
+        response = self.client.post(url, {
+            'skeleton_ids': skeleton_ids,
+            'source_relations': ['presynaptic_to'],
+            'target_relations': ['postsynaptic_to'],
+        })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT tc.skeleton_id, tc.relation_id, COUNT(*)
+            FROM treenode_connector tc
+            JOIN relation r
+                ON r.id = tc.relation_id
+            JOIN treenode_connector tc2
+                ON tc2.connector_id = tc.connector_id
+                AND tc2.id <> tc.id
+            JOIN relation r2
+                ON r2.id = tc2.relation_id
+            WHERE tc.skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+                AND r.relation_name = 'presynaptic_to'
+                AND r2.relation_name = 'postsynaptic_to'
+            GROUP BY 1, 2
+        """, {
+            'skeleton_ids': skeleton_ids,
+        })
+        expected_counts = {}
+        for skeleton_id, relation_id, count in cursor.fetchall():
+            expected_counts.setdefault(str(skeleton_id), {})[str(relation_id)] = count
+        self.assertEqual(expected_counts, parsed_response['connectivity'])
+
+    def test_skeleton_completeness(self):
+        self.fake_authentication()
+        skeleton_ids = [235, 373, 2364, 2388, 2411, 2462]
+        url = f'/{self.test_project_id}/skeletons/completeness'
+
+        # Without constraints, all skeletons are complete.
+        response = self.client.post(url, {
+            'skeleton_ids': skeleton_ids,
+            'open_ends_percent': 1.0,
+            'min_nodes': 0,
+            'ignore_fragments': False,
+        })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(sorted([skid, True] for skid in skeleton_ids),
+                sorted(parsed_response))
+
+        # Streamed results have to match regular results.
+        response = self.client.post(url, {
+            'skeleton_ids': skeleton_ids,
+            'min_nodes': 0,
+        })
+        self.assertStatus(response)
+        expected_result = json.loads(response.content.decode('utf-8'))
+
+        response = self.client.post(url, {
+            'skeleton_ids': skeleton_ids,
+            'min_nodes': 0,
+            'format': 'ndjson',
+        })
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(sorted(expected_result),
+                sorted(json.loads(line) for line in lines))
+
     @skipIf(run_with_pypy, "Synapse clustering test disabled in PyPy")
     def test_skeleton_graph(self):
         """This tests compartment graph features, among them synapse clustering.
@@ -819,6 +1091,48 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assertEqual(new_skeleton_id, get_object_or_404(TreenodeConnector, id=2405).skeleton_id)
 
 
+    def test_join_skeletons_moves_attribution_and_reviews(self):
+        self.fake_authentication()
+
+        # Join the root of skeleton 2388 (2392 -> 2394 -> 2396) into node 2415
+        # of skeleton 2411.
+        link_to = 2392 # Skeleton ID: 2388
+        link_from = 2415 # Skeleton ID: 2411
+        other_user_id = 5
+        self.prepare_attribution_test(2388, other_user_id, [2392, 2394, 2396])
+        self.prepare_attribution_test(2411, other_user_id, [2415])
+
+        response = self.client.post(
+                '/%d/skeleton/join' % self.test_project_id, {
+                    'from_id': link_from,
+                    'to_id': link_to,
+                    'annotation_set': '{}'})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(2411, parsed_response['result_skeleton_id'])
+        self.assertEqual(2388, parsed_response['deleted_skeleton_id'])
+
+        self.assertTreenodeHasProperties(2392, 2415, 2411)
+        self.assertTreenodeHasProperties(2394, 2392, 2411)
+        self.assertTreenodeHasProperties(2396, 2394, 2411)
+        self.assertEqual(2411, TreenodeConnector.objects.get(id=2405).skeleton_id)
+        self.assertEqual(2411, TreenodeConnector.objects.get(id=2429).skeleton_id)
+
+        # Only the merged in node is edited by the user who joined the
+        # skeletons, and the skeleton summary is attributed to this user.
+        self.assertEqual(self.test_user_id, Treenode.objects.get(id=2392).editor_id)
+        self.assertEqual(other_user_id, Treenode.objects.get(id=2394).editor_id)
+        self.assertEqual(other_user_id, Treenode.objects.get(id=2396).editor_id)
+        self.assertEqual(self.test_user_id, self.get_last_editor(2411))
+
+        self.assertEqual(set([2411]), set(Review.objects.filter(
+                treenode_id__in=[2392, 2394, 2396, 2415]).values_list(
+                'skeleton_id', flat=True)))
+        self.assertEqual(0, Review.objects.filter(skeleton_id=2388).count())
+        self.assertEqual((4, 4), self.get_review_summary(2411, other_user_id))
+        self.assertIsNone(self.get_review_summary(2388, other_user_id))
+
+
     def test_join_skeletons_with_two_stable_annotations_disabled(self):
         self.fake_authentication()
 
@@ -1018,6 +1332,10 @@ class SkeletonsApiTests(CatmaidApiTestCase):
 
         new_root = 407
 
+        # Edge confidences are moved along with the reversed edges.
+        Treenode.objects.filter(id=407).update(confidence=2)
+        Treenode.objects.filter(id=405).update(confidence=3)
+
         count_logs = lambda: Log.objects.all().count()
         log_count = count_logs()
 
@@ -1040,6 +1358,14 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         assertHasParent(377, 405)
         assertHasParent(407, None)
 
+        def assertHasConfidence(treenode_id, confidence):
+            treenode = get_object_or_404(Treenode, id=treenode_id)
+            self.assertEqual(confidence, treenode.confidence)
+
+        assertHasConfidence(405, 2)
+        assertHasConfidence(377, 3)
+        assertHasConfidence(407, 5)
+
 
     def test_review_status(self):
         self.fake_authentication()
@@ -1082,6 +1408,57 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         expected_result = {'2388': [3, 1]}
         self.assertJSONEqual(response.content.decode('utf-8'), expected_result)
 
+        # Only accept reviews after the existing ones
+        ReviewerWhitelist.objects.filter(project_id=self.test_project_id,
+                user_id=self.test_user_id).update(accept_after="2014-03-18T00:00:00Z")
+        response = self.client.post(url,
+                {'skeleton_ids[0]': skeleton_id, 'whitelist': 'true'})
+        self.assertStatus(response)
+        expected_result = {'2388': [3, 0]}
+        self.assertJSONEqual(response.content.decode('utf-8'), expected_result)
+
+        # Limit reviews to a set of users
+        response = self.client.post(url,
+                {'skeleton_ids[0]': skeleton_id, 'user_ids[0]': 3})
+        self.assertStatus(response)
+        expected_result = {'2388': [3, 2]}
+        self.assertJSONEqual(response.content.decode('utf-8'), expected_result)
+
+        response = self.client.post(url,
+                {'skeleton_ids[0]': skeleton_id, 'user_ids[0]': 2, 'user_ids[1]': 3})
+        self.assertStatus(response)
+        expected_result = {'2388': [3, 2]}
+        self.assertJSONEqual(response.content.decode('utf-8'), expected_result)
+
+        # Reviews move along with their nodes if a skeleton is split
+        response = self.client.post(
+            '/%d/skeleton/split' % (self.test_project_id,),
+            {'treenode_id': 2394, 'upstream_annotation_map': '{}', 'downstream_annotation_map': '{}'})
+        self.assertStatus(response)
+        new_skeleton_id = json.loads(response.content.decode('utf-8'))['new_skeleton_id']
+        response = self.client.post(url, {'skeleton_ids[0]': skeleton_id,
+                'skeleton_ids[1]': new_skeleton_id})
+        self.assertStatus(response)
+        expected_result = {'2388': [1, 0], str(new_skeleton_id): [2, 2]}
+        self.assertJSONEqual(response.content.decode('utf-8'), expected_result)
+
+        # The review summary matches the reviews after deleting a review
+        Review.objects.filter(treenode_id=2396, reviewer_id=2).delete()
+        summary_query = """
+            SELECT skeleton_id, reviewer_id, num_reviewed_nodes
+            FROM catmaid_skeleton_reviewer_summary
+            UNION ALL
+            SELECT skeleton_id, NULL, num_reviewed_nodes
+            FROM catmaid_skeleton_review_summary
+            ORDER BY 1, 2
+        """
+        cursor = connection.cursor()
+        cursor.execute(summary_query)
+        summary = cursor.fetchall()
+        cursor.execute("SELECT rebuild_skeleton_review_summary()")
+        cursor.execute(summary_query)
+        self.assertEqual(cursor.fetchall(), summary)
+
 
     def test_export_review_skeleton(self):
         self.fake_authentication()
@@ -1294,6 +1671,48 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assert_skeletons_by_node_labels([2342, 351], expected_result)
 
 
+    def test_skeleton_label_index(self):
+        self.fake_authentication()
+
+        def assert_index_matches_labels():
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT t.skeleton_id, tci.class_instance_id, COUNT(*)
+                FROM treenode_class_instance tci
+                JOIN relation r
+                    ON r.id = tci.relation_id
+                JOIN treenode t
+                    ON t.id = tci.treenode_id
+                WHERE r.relation_name = 'labeled_as'
+                GROUP BY 1, 2
+                ORDER BY 1, 2
+            """)
+            expected_labels = cursor.fetchall()
+            cursor.execute("""
+                SELECT skeleton_id, label_id, num_nodes
+                FROM catmaid_skeleton_label
+                ORDER BY 1, 2
+            """)
+            self.assertEqual(expected_labels, cursor.fetchall())
+
+        assert_index_matches_labels()
+
+        # Add and replace labels.
+        for treenode_id, tags in ((403, 'Testlabel'), (405, 'Testlabel'),
+                (403, 'other label')):
+            response = self.client.post(
+                    f'/{self.test_project_id}/label/treenode/{treenode_id}/update',
+                    {'tags': tags})
+            self.assertStatus(response)
+            assert_index_matches_labels()
+
+        # Moving and deleting labeled nodes.
+        Treenode.objects.filter(id=405).update(skeleton_id=361)
+        assert_index_matches_labels()
+        Treenode.objects.filter(id=261).delete()
+        assert_index_matches_labels()
+
+
     def test_skeleton_validity_list(self):
         self.fake_authentication()
 
@@ -1406,9 +1825,102 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assertFalse(ClassInstance.objects.filter(id=neuron_id).exists())
         self.assertTrue(ClassInstance.objects.filter(id=new_neuron_id).exists())
 
+    def test_compact_skeleton_as_of(self):
+        self.fake_authentication()
+        skeleton_id = 373
+
+        # All changes in this test share the same transaction time, which is
+        # why the snapshot time needs to be before it.
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT current_timestamp - interval '1 second'
+        """)
+        as_of = cursor.fetchone()[0]
+
+        cursor.execute("""
+            UPDATE treenode SET location_x = 1000.0 WHERE id = 403
+        """)
+
+        url = f'/{self.test_project_id}/skeletons/{skeleton_id}/compact-detail'
+        response = self.client.get(url)
+        self.assertStatus(response)
+        live_nodes = json.loads(response.content.decode('utf-8'))[0]
+        self.assertIn([403, 377, 3, 1000.0, 2380.0, 0.0, -1.0, 5], live_nodes)
+
+        response = self.client.get(url, {
+            'as_of': as_of.isoformat(),
+        })
+        self.assertStatus(response)
+        historic_nodes = json.loads(response.content.decode('utf-8'))[0]
+        self.assertCountEqual(historic_nodes, [
+            [377, None, 3, 7620.0, 2890.0, 0.0, -1.0, 5],
+            [403, 377, 3, 7840.0, 2380.0, 0.0, -1.0, 5],
+            [405, 377, 3, 7390.0, 3510.0, 0.0, -1.0, 5],
+            [407, 405, 3, 7080.0, 3960.0, 0.0, -1.0, 5],
+            [409, 407, 3, 6630.0, 4330.0, 0.0, -1.0, 5],
+        ])
+
+        # History data and snapshots can't be combined.
+        response = self.client.get(url, {
+            'as_of': as_of.isoformat(),
+            'with_history': 'true',
+        })
+        self.assertEqual(response.status_code, 400)
+
 
 class SkeletonsApiTransactionTests(CatmaidApiTransactionTestCase):
 
+    def test_skeleton_detail_summary_in_parallel(self):
+        skeleton_ids = [235, 373, 2364, 2388, 2411, 2462]
+        cursor = connection.cursor()
+
+        def get_details():
+            cursor.execute("""
+                SELECT skeleton_id, computed_version = version, min_x, min_y,
+                    min_z, max_x, max_y, max_z, num_branch_nodes,
+                    num_end_nodes, num_tagged_end_nodes, is_fragment,
+                    num_input_synapses, num_output_synapses, link_counts,
+                    partner_link_counts
+                FROM catmaid_skeleton_detail_summary
+                WHERE skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+                ORDER BY skeleton_id
+            """, {
+                'skeleton_ids': skeleton_ids,
+            })
+            return cursor.fetchall()
+
+        def invalidate_details():
+            cursor.execute("""
+                SELECT invalidate_skeleton_detail_summary(%(skeleton_ids)s::bigint[])
+            """, {
+                'skeleton_ids': skeleton_ids,
+            })
+
+        update_skeleton_detail_summary(self.test_project_id, skeleton_ids)
+        expected_details = get_details()
+        self.assertEqual(len(skeleton_ids), len(expected_details))
+        self.assertTrue(all(d[1] for d in expected_details))
+
+        # With three skeletons per chunk, two threads compute the details,
+        # each in its own transaction.
+        invalidate_details()
+        with patch('catmaid.control.skeleton.SKELETON_DETAIL_SUMMARY_CHUNK_SIZE', 3), \
+                patch('catmaid.control.skeleton._compute_skeleton_details_in_thread',
+                        wraps=_compute_skeleton_details_in_thread) as compute_in_thread:
+            update_skeleton_detail_summary(self.test_project_id, skeleton_ids,
+                    jobs=4)
+            self.assertEqual(2, compute_in_thread.call_count)
+            self.assertEqual(expected_details, get_details())
+
+            # Threads wouldn't see uncommitted changes of the calling
+            # transaction, which therefore computes the details itself.
+            with transaction.atomic():
+                invalidate_details()
+                update_skeleton_detail_summary(self.test_project_id,
+                        skeleton_ids, jobs=4)
+                self.assertEqual(2, compute_in_thread.call_count)
+                self.assertEqual(expected_details, get_details())
+
     def test_import_skeleton(self):
         self.fake_authentication()
 
@@ -1973,3 +2485,205 @@ class SkeletonsApiTransactionTests(CatmaidApiTransactionTestCase):
         # skeleton.
         n_skeleton_nodes = Treenode.objects.filter(skeleton_id=post_force_update_skeleton_id_2).count()
         self.assertEqual(n_skeleton_nodes, n_orig_skeleton_nodes)
+
+
+    def test_import_skeletons_bulk(self):
+        self.fake_authentication()
+        assign_perm('can_import', self.test_user, self.test_project)
+
+        orig_skeleton_id = 235
+        response = self.client.get('/%d/skeleton/%d/swc' % (self.test_project_id, orig_skeleton_id))
+        self.assertStatus(response)
+        orig_swc_string = response.content.decode('utf-8')
+        n_orig_skeleton_nodes = Treenode.objects.filter(skeleton_id=orig_skeleton_id).count()
+
+        cyclic_swc_string = '1 0 1 2 3 4 -1\n2 0 1 2 3 4 3\n3 0 1 2 3 4 2\n'
+
+        response = self.client.post('/%d/skeletons/import-bulk' % (self.test_project_id,), {
+            'a.swc': StringIO(orig_swc_string),
+            'b.swc': StringIO(orig_swc_string),
+            'c.swc': StringIO(cyclic_swc_string),
+            'd.txt': StringIO(orig_swc_string),
+            'use_file_names': True,
+            'annotations': ['bulk'],
+        })
+
+        transaction.commit()
+
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        imported = {r['file_name']: r for r in parsed_response['imported']}
+        self.assertEqual(set(['a.swc', 'b.swc']), set(imported.keys()))
+        errors = {e['file_name']: e['error'] for e in parsed_response['errors']}
+        self.assertEqual(set(['c.swc', 'd.txt']), set(errors.keys()))
+        self.assertIn('cycle', errors['c.swc'])
+
+        for file_name, name in (('a.swc', 'a'), ('b.swc', 'b')):
+            result = imported[file_name]
+            skeleton_id = result['skeleton_id']
+            id_map = result['node_id_map']
+            self.assertEqual(n_orig_skeleton_nodes, len(id_map))
+            self.assertEqual(n_orig_skeleton_nodes,
+                    Treenode.objects.filter(skeleton_id=skeleton_id).count())
+
+            neuron = ClassInstance.objects.get(id=result['neuron_id'])
+            self.assertEqual(name, neuron.name)
+            self.assertEqual(set(['bulk']), set(annotations_for_skeleton(
+                    self.test_project_id, skeleton_id).keys()))
+
+            for tn in Treenode.objects.filter(skeleton_id=orig_skeleton_id):
+                new_tn = Treenode.objects.get(id=id_map[str(tn.id)])
+                self.assertEqual(skeleton_id, new_tn.skeleton_id)
+                if tn.parent_id:
+                    self.assertEqual(id_map[str(tn.parent_id)], new_tn.parent_id)
+                else:
+                    self.assertIsNone(new_tn.parent_id)
+                self.assertEqual(tn.location_x, new_tn.location_x)
+                self.assertEqual(tn.location_y, new_tn.location_y)
+                self.assertEqual(tn.location_z, new_tn.location_z)
+
+
+    def test_import_skeleton_archive(self):
+        self.fake_authentication()
+        assign_perm('can_import', self.test_user, self.test_project)
+
+        orig_skeleton_id = 235
+        response = self.client.get('/%d/skeleton/%d/swc' % (self.test_project_id, orig_skeleton_id))
+        self.assertStatus(response)
+        orig_swc_string = response.content.decode('utf-8')
+        n_orig_skeleton_nodes = Treenode.objects.filter(skeleton_id=orig_skeleton_id).count()
+
+        archive_data = BytesIO()
+        with zipfile.ZipFile(archive_data, 'w') as archive:
+            archive.writestr('a.swc', orig_swc_string)
+            archive.writestr('b.swc', orig_swc_string)
+            archive.writestr('c.swc', '1 0 1 2 3 4 -1\n2 0 1 2 3 4 3\n3 0 1 2 3 4 2\n')
+            archive.writestr('readme.txt', 'Not a skeleton')
+            archive.writestr('manifest.json', json.dumps({
+                'annotations': ['archive'],
+                'files': {
+                    'a.swc': {'name': 'Neuron A', 'annotations': ['first']},
+                },
+            }))
+        archive_data.seek(0)
+        archive_data.name = 'skeletons.zip'
+
+        # Run tasks synchronously and collect user messages.
+        messages = []
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root,
+                        IMPORTED_SKELETON_ARCHIVE_FILES_PER_TASK=2), \
+                patch('catmaid.control.skeleton.msg_user',
+                        lambda user_id, event, data: messages.append((event, data))), \
+                patch.object(import_skeleton_archive_chunk, 'delay',
+                        lambda *args: import_skeleton_archive_chunk(*args)):
+            response = self.client.post('/%d/skeletons/import-archive' % (self.test_project_id,),
+                    {'file': archive_data})
+            transaction.commit()
+            self.assertStatus(response)
+            parsed_response = json.loads(response.content.decode('utf-8'))
+            self.assertEqual(3, parsed_response['n_files'])
+            self.assertEqual(2, parsed_response['n_tasks'])
+            self.assertEqual([], parsed_response['errors'])
+            job_id = parsed_response['job_id']
+
+            response = self.client.get('/%d/skeletons/import-archive/%s' % (
+                    self.test_project_id, job_id))
+            self.assertStatus(response)
+            status = json.loads(response.content.decode('utf-8'))
+
+            # Recent jobs are kept, old ones are removed.
+            self.assertEqual(0, cleanup_skeleton_import_jobs(60, 60))
+            self.assertEqual(1, cleanup_skeleton_import_jobs(-1, 60))
+            response = self.client.get('/%d/skeletons/import-archive/%s' % (
+                    self.test_project_id, job_id))
+            self.assertStatus(response, 400)
+
+        self.assertEqual('complete', status['status'])
+        self.assertEqual(2, status['n_completed_tasks'])
+        self.assertEqual(['c.swc'], [e['file_name'] for e in status['errors']])
+        imported = {r['file_name']: r for r in status['imported']}
+        self.assertEqual(set(['a.swc', 'b.swc']), set(imported.keys()))
+
+        self.assertEqual(['skeleton-import-update', 'skeleton-import-update',
+                'skeleton-import-complete'], [m[0] for m in messages])
+        self.assertEqual(2, messages[-1][1]['n_imported'])
+
+        expected = {
+            'a.swc': ('Neuron A', set(['archive', 'first'])),
+            'b.swc': ('b', set(['archive'])),
+        }
+        for file_name, (name, annotations) in expected.items():
+            result = imported[file_name]
+            self.assertEqual(n_orig_skeleton_nodes, result['n_nodes'])
+            self.assertEqual(n_orig_skeleton_nodes, Treenode.objects.filter(
+                    skeleton_id=result['skeleton_id']).count())
+            neuron = ClassInstance.objects.get(id=result['neuron_id'])
+            self.assertEqual(name, neuron.name)
+            self.assertEqual(annotations, set(annotations_for_skeleton(
+                    self.test_project_id, result['skeleton_id']).keys()))
+
+    def test_import_skeleton_archive_import_info(self):
+        self.fake_authentication()
+        assign_perm('can_import', self.test_user, self.test_project)
+
+        orig_skeleton_id = 235
+        response = self.client.get('/%d/skeleton/%d/swc' % (self.test_project_id, orig_skeleton_id))
+        self.assertStatus(response)
+        orig_swc_string = response.content.decode('utf-8')
+        n_orig_skeleton_nodes = Treenode.objects.filter(skeleton_id=orig_skeleton_id).count()
+
+        archive_data = BytesIO()
+        with zipfile.ZipFile(archive_data, 'w') as archive:
+            archive.writestr('a.swc', orig_swc_string)
+            archive.writestr('b.swc', orig_swc_string)
+        archive_data.seek(0)
+        archive_data.name = 'skeletons.zip'
+
+        # Queue tasks and run them after the request, each file in its own
+        # transaction, like a Celery worker would.
+        queued_tasks = []
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root,
+                        IMPORTED_SKELETON_ARCHIVE_FILES_PER_TASK=1), \
+                patch('catmaid.control.skeleton.msg_user',
+                        lambda user_id, event, data: None), \
+                patch.object(import_skeleton_archive_chunk, 'delay',
+                        lambda *args: queued_tasks.append(args)):
+            response = self.client.post('/%d/skeletons/import-archive' % (self.test_project_id,),
+                    {'file': archive_data})
+            self.assertStatus(response)
+            job_id = json.loads(response.content.decode('utf-8'))['job_id']
+            self.assertEqual(2, len(queued_tasks))
+
+            import_skeleton_archive_chunk(*queued_tasks[0])
+            response = self.client.get('/%d/skeletons/import-archive/%s' % (
+                    self.test_project_id, job_id))
+            self.assertStatus(response)
+            status = json.loads(response.content.decode('utf-8'))
+            self.assertEqual('running', status['status'])
+            self.assertEqual(1, len(status['imported']))
+            skeleton_id = status['imported'][0]['skeleton_id']
+
+            # Incomplete jobs expire only after their own maximum age. If the
+            # second task runs after its job expired, it ends without
+            # importing anything.
+            self.assertEqual(0, cleanup_skeleton_import_jobs(-1, 60))
+            self.assertEqual(1, cleanup_skeleton_import_jobs(-1, -1))
+            n_nodes = Treenode.objects.count()
+            result = import_skeleton_archive_chunk(*queued_tasks[1])
+            self.assertIn('expired', result)
+            self.assertEqual(n_nodes, Treenode.objects.count())
+
+        # All nodes imported by the task are reported as imported.
+        response = self.client.post('/%d/skeletons/import-info' % (self.test_project_id,), {
+            'skeleton_ids': [skeleton_id],
+        })
+        self.assertStatus(response)
+        import_info = json.loads(response.content.decode('utf-8'))
+        self.assertEqual({
+            str(skeleton_id): {
+                'n_imported_treenodes': n_orig_skeleton_nodes,
+            },
+        }, import_info)
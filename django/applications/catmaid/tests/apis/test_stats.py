@@ -12,8 +12,10 @@ from catmaid.models import Connector
 from catmaid.tests.apis.common import CatmaidApiTestCase
 from catmaid.control import stats
 from catmaid.control.common import get_relation_to_id_map, get_class_to_id_map
+from catmaid.metrics import server_metrics
 from guardian.shortcuts import assign_perm
 from io import StringIO
+from unittest.mock import patch
 
 
 class StatsApiTests(CatmaidApiTestCase):
@@ -162,6 +164,58 @@ class StatsApiTests(CatmaidApiTestCase):
         parsed_response = json.loads(response.content.decode('utf-8'))
         self.assertEqual(expected_result, parsed_response)
 
+    def test_stats_summary_metric_failure(self):
+        cursor = connection.cursor()
+        cursor.execute("""TRUNCATE treenode CASCADE""")
+        self.add_test_treenodes()
+
+        def fail(project_id, incremental=True, cursor=None):
+            raise ValueError("Test failure")
+
+        # A failing metric doesn't prevent other metrics from being stored.
+        with patch.dict(stats.stats_summary_metrics, {'cable': fail}):
+            failures = stats.populate_stats_summaries([self.test_project_id])
+        self.assertEqual(failures, [(self.test_project_id, 'cable', 'Test failure')])
+
+        cursor.execute("""
+            SELECT SUM(n_treenodes), SUM(cable_length)
+            FROM catmaid_stats_summary
+            WHERE project_id = %s
+        """, (self.test_project_id,))
+        self.assertEqual(cursor.fetchone(), (8, 0.0))
+
+        # Only the failed metric needs to be computed again.
+        stats.populate_stats_summary(self.test_project_id, metrics=['cable'])
+        cursor.execute("""
+            SELECT SUM(n_treenodes), SUM(cable_length)
+            FROM catmaid_stats_summary
+            WHERE project_id = %s
+        """, (self.test_project_id,))
+        n_treenodes, cable_length = cursor.fetchone()
+        self.assertEqual(n_treenodes, 8)
+        self.assertTrue(cable_length > 0)
+
+    def test_server_metrics(self):
+        self.fake_authentication()
+        assign_perm('can_administer', self.test_user, self.test_project)
+        server_metrics.reset()
+
+        response = self.client.get(f'/{self.test_project_id}/stats/summary')
+        self.assertStatus(response)
+
+        response = self.client.get(f'/{self.test_project_id}/stats/server/metrics',
+                {'celery': 'false'})
+        self.assertStatus(response)
+        metrics = response.content.decode('utf-8').split('\n')
+        endpoint = 'endpoint="catmaid.control.stats.stats_summary"'
+        self.assertIn(f'catmaid_request_duration_seconds_count{{{endpoint}}} 1', metrics)
+        self.assertIn(f'catmaid_request_duration_seconds_bucket{{{endpoint},le="+Inf"}} 1', metrics)
+        self.assertIn(f'catmaid_request_errors_total{{{endpoint}}} 0', metrics)
+        n_queries = [m for m in metrics if m.startswith(f'catmaid_db_queries_total{{{endpoint}}}')]
+        self.assertEqual(len(n_queries), 1)
+        self.assertTrue(int(n_queries[0].split(' ')[1]) > 0)
+        self.assertFalse(any(m.startswith('catmaid_celery_queue_length') for m in metrics))
+
     def test_project_agg_stats(self):
         self.fake_authentication()
         response = self.client.get(f'/{self.test_project_id}/stats/aggregates')
@@ -14,7 +14,8 @@ from guardian.shortcuts import assign_perm
 
 from .common import CatmaidApiTestCase
 from catmaid.models import Volume
-from catmaid.control.volume import BoxVolume
+from catmaid.control.meshes import decode_mesh
+from catmaid.control.volume import BoxVolume, update_skeleton_innervations
 
 
 FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fixtures')
@@ -182,7 +183,7 @@ class VolumeTests(CatmaidApiTestCase):
                 ]),
             },
         )
-        self.assertStatus(response, code=200)
+        self.assertStatus(response)
 
         # No faces
         response = self.client.post(
@@ -264,3 +265,124 @@ class VolumeTests(CatmaidApiTestCase):
             },
         )
         self.assertStatus(response, code=400)
+
+    def test_exact_intersection(self):
+        self.fake_authentication()
+
+        response = self.client.get(
+            f'/{self.test_project_id}/volumes/{self.test_vol_1_id}/intersect',
+            {'x': 0.5, 'y': 0.5, 'z': 0.5, 'exact': 'true'})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response, {'intersects': True})
+
+        response = self.client.get(
+            f'/{self.test_project_id}/volumes/{self.test_vol_1_id}/intersect',
+            {'x': 1.5, 'y': 0.5, 'z': 0.5, 'exact': 'true'})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response, {'intersects': False})
+
+    def test_intersect_points(self):
+        self.fake_authentication()
+        response = self.client.post(
+            f'/{self.test_project_id}/volumes/intersect-points',
+            {
+                'volume_ids': [self.test_vol_1_id],
+                'points': json.dumps([[0, 0, 0], [0.9, -0.9, 0.9], [2, 0, 0], [0, 0, -1.1]]),
+            })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response, {
+            str(self.test_vol_1_id): [True, True, False, False],
+        })
+
+    def test_precomputed_skeleton_innervations(self):
+        self.fake_authentication()
+        cursor = connection.cursor()
+        cursor.execute("SELECT refresh_skeleton_summary_table()")
+
+        # A box that contains the nodes 377 and 403 of skeleton 373.
+        box_volume = BoxVolume(
+            self.test_project_id, self.test_user_id,
+            {
+                'title': 'Skeleton 373 box',
+                'type': 'box',
+                'min_x': 7000,
+                'min_y': 2000,
+                'min_z': -10,
+                'max_x': 8000,
+                'max_y': 3000,
+                'max_z': 10,
+            }
+        )
+        box_volume_id = box_volume.save()
+
+        response = self.client.post(
+            f'/{self.test_project_id}/volumes/skeleton-innervations',
+            {
+                'skeleton_ids': [373],
+                'precomputed': 'true',
+            })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(parsed_response, [{
+            'skeleton_id': 373,
+            'volume_ids': [box_volume_id],
+        }])
+
+        cursor.execute("""
+            SELECT num_nodes, cable_length
+            FROM catmaid_skeleton_volume_innervation
+            WHERE skeleton_id = 373 AND volume_id = %s
+        """, (box_volume_id,))
+        num_nodes, cable_length = cursor.fetchone()
+        self.assertEqual(num_nodes, 2)
+        # The edge 377-403 is fully inside, the edge 405-377 crosses y = 3000.
+        self.assertAlmostEqual(cable_length, 555.4277 + 117.3, places=0)
+
+        # Changing only the volume title keeps the innervation data valid.
+        update_skeleton_innervations(self.test_project_id)
+        response = self.client.post(
+            f'/{self.test_project_id}/volumes/{box_volume_id}/', {'title': 'New title'},
+        )
+        self.assertStatus(response)
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM catmaid_volume_innervation_state s
+            JOIN catmaid_volume v
+                ON v.id = s.volume_id
+            WHERE v.id = %s AND s.edition_time = v.edition_time
+        """, (box_volume_id,))
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_volume_mesh(self):
+        self.fake_authentication()
+        response = self.client.get(
+            f'/{self.test_project_id}/volumes/{self.test_vol_1_id}/mesh')
+        self.assertStatus(response)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        vertices, faces, header = decode_mesh(response.content)
+        self.assertEqual(len(vertices), 8)
+        self.assertEqual(len(faces), 12)
+        self.assertEqual(sorted(map(tuple, vertices.tolist())),
+                [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)])
+        self.assertEqual(header['lod'], 0)
+
+        # LODs beyond the coarsest one map to the coarsest one. All LODs are
+        # cached for the requested quantization.
+        response = self.client.get(
+            f'/{self.test_project_id}/volumes/{self.test_vol_1_id}/mesh',
+            {'lod': 100, 'quantization_bits': 12})
+        self.assertStatus(response)
+        vertices, faces, header = decode_mesh(response.content)
+        self.assertEqual(header['lod'], header['n_lods'] - 1)
+        self.assertEqual(header['quantization_bits'], 12)
+
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM catmaid_volume_mesh_lod
+            WHERE volume_id = %s AND quantization_bits = 12
+        """, (self.test_vol_1_id,))
+        self.assertEqual(cursor.fetchone()[0], header['n_lods'])
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import os
+import tempfile
 import time
+from datetime import timedelta
 
 from django.db import connection, transaction, InternalError
 from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 from guardian.shortcuts import assign_perm
 from catmaid import history
 from catmaid.models import Class, Project, User
@@ -290,6 +294,20 @@ class HistoryTableTests(TransactionTestCase):
         'catmaid_transaction_info',
         'catmaid_stats_summary',
         'catmaid_skeleton_summary',
+        'catmaid_skeleton_volume_innervation',
+        'catmaid_skeleton_innervation_state',
+        'catmaid_volume_innervation_state',
+        'catmaid_volume_mesh_lod',
+        'catmaid_annotation_closure',
+        'catmaid_annotation_stats',
+        'catmaid_annotation_co_occurrence',
+        'catmaid_history_partition',
+        'catmaid_skeleton_footprint',
+        'catmaid_skeleton_review_summary',
+        'catmaid_skeleton_reviewer_summary',
+        'catmaid_skeleton_detail_summary',
+        'catmaid_treenode_label',
+        'catmaid_skeleton_label',
 
         # Regular unversioned non-CATMAID tables
         'djkombu_queue',
@@ -1351,3 +1369,74 @@ class HistoryTableTests(TransactionTestCase):
         cursor.execute("""
             DROP TABLE _history_test_;
         """)
+
+    def test_history_partitioning(self):
+        """Test if history rows can be moved into partitions, are still
+        accessible through the history table and view and can be detached and
+        exported.
+        """
+        cursor = connection.cursor()
+
+        cursor.execute("""
+            INSERT INTO "class" (user_id, project_id, class_name)
+            VALUES (%(user_id)s, %(project_id)s, 'testclass')
+            RETURNING id
+        """, {
+            'user_id': self.user.id,
+            'project_id': self.project.id
+        })
+        class_id = cursor.fetchone()[0]
+        transaction.commit()
+
+        cursor.execute("""
+            UPDATE "class" SET class_name='newname'
+            WHERE id=%s
+        """, (class_id,))
+        transaction.commit()
+
+        n_history_entries = len(self.get_history_entries(cursor, 'class'))
+        n_history_view_entries = len(self.get_history_view_entries(cursor, 'class'))
+        self.assertTrue(n_history_entries > 0)
+
+        # Partition all history rows, including the ones from this month.
+        before = timezone.now() + timedelta(days=40)
+        n_moved = history.create_history_partitions('class', before, cursor)
+        transaction.commit()
+        self.assertEqual(n_moved, n_history_entries)
+
+        cursor.execute("SELECT COUNT(*) FROM ONLY class__history")
+        self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(len(self.get_history_entries(cursor, 'class')),
+                n_history_entries)
+        self.assertEqual(len(self.get_history_view_entries(cursor, 'class')),
+                n_history_view_entries)
+
+        cursor.execute("""
+            SELECT class_name FROM class__history WHERE id = %s
+        """, (class_id,))
+        self.assertEqual(cursor.fetchall(), [('testclass',)])
+
+        # Detached partitions aren't part of the history anymore.
+        detached = history.detach_history_partitions('class', before, cursor)
+        transaction.commit()
+        self.assertTrue(len(detached) > 0)
+        self.assertEqual(len(self.get_history_entries(cursor, 'class')), 0)
+        self.assertEqual(len(self.get_history_view_entries(cursor, 'class')),
+                n_history_view_entries - n_history_entries)
+
+        # Exporting removes the partitions.
+        self.assertCountEqual(detached,
+                history.get_detached_history_partitions('class', cursor))
+        with tempfile.TemporaryDirectory() as export_dir:
+            for partition in detached:
+                path = history.export_history_partition(partition, export_dir, cursor)
+                self.assertTrue(os.path.exists(path))
+        transaction.commit()
+
+        cursor.execute("""
+            SELECT COUNT(*) FROM catmaid_history_partition
+        """)
+        self.assertEqual(cursor.fetchone()[0], 0)
+        for partition in detached:
+            cursor.execute("SELECT to_regclass(%s)", (partition,))
+            self.assertIsNone(cursor.fetchone()[0])
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+import numpy as np
+
+from django.test import TestCase
+
+from catmaid.control.meshes import (TriangleMeshIndex, decimate_mesh,
+        decode_mesh, encode_mesh, triangles_to_indexed_mesh, wkb_to_triangles)
+
+
+# A unit cube with one corner in the origin
+CUBE_VERTICES = [[x, y, z] for z in (0, 1) for y in (0, 1) for x in (0, 1)]
+CUBE_FACES = [[0, 2, 1], [1, 2, 3], [0, 1, 5], [0, 5, 4], [2, 6, 7], [2, 7, 3],
+        [4, 7, 6], [4, 5, 7], [0, 6, 2], [0, 4, 6], [1, 3, 5], [3, 7, 5]]
+
+
+class MeshIndexTests(TestCase):
+
+    def test_contains(self):
+        index = TriangleMeshIndex(CUBE_VERTICES, CUBE_FACES)
+        result = index.contains([
+            [0.5, 0.5, 0.5],
+            [0.25, 0.75, 0.1],
+            # Points on the projection of shared edges and vertices must not
+            # be counted twice.
+            [0.5, 0.5, 0.25],
+            [0.0001, 0.0001, 0.5],
+            [1.5, 0.5, 0.5],
+            [0.5, 0.5, -0.5],
+            [0.5, 0.5, 1.5],
+        ])
+        self.assertEqual(result.tolist(), [True, True, True, True, False, False, False])
+
+    def test_segment_intersection(self):
+        index = TriangleMeshIndex(CUBE_VERTICES, CUBE_FACES)
+        starts = [[-1, 0.5, 0.5], [0.2, 0.2, 0.2], [2, 2, 2], [-1, 0.25, 0.5]]
+        ends = [[2, 0.5, 0.5], [0.8, 0.2, 0.2], [3, 3, 3], [0.5, 0.25, 0.5]]
+        self.assertEqual(index.intersects_segments(starts, ends).tolist(),
+                [True, True, False, True])
+
+        lengths = index.segment_lengths_inside(starts, ends)
+        for length, expected in zip(lengths, [1.0, 0.6, 0.0, 0.5]):
+            self.assertAlmostEqual(length, expected)
+
+
+class MeshEncodingTests(TestCase):
+
+    def test_wkb_to_indexed_mesh(self):
+        triangles = np.asarray(CUBE_VERTICES, dtype=np.float64)[CUBE_FACES]
+        wkb = struct.pack('<BII', 1, 1016, len(triangles)) + b''.join(
+                struct.pack('<BIII', 1, 1017, 1, 4) +
+                np.vstack([t, t[:1]]).astype('<f8').tobytes() for t in triangles)
+        parsed = wkb_to_triangles(wkb)
+        self.assertTrue(np.array_equal(parsed, triangles))
+
+        vertices, faces = triangles_to_indexed_mesh(parsed)
+        self.assertEqual(len(vertices), 8)
+        self.assertTrue(np.array_equal(vertices[faces], triangles))
+
+        # Points aren't surfaces
+        with self.assertRaises(ValueError):
+            wkb_to_triangles(struct.pack('<BI3d', 1, 1001, 0, 0, 0))
+
+    def test_encode_decode(self):
+        vertices = np.asarray(CUBE_VERTICES, dtype=np.float64) * 1000 + 50
+        data = encode_mesh(vertices, CUBE_FACES)
+        self.assertEqual(len(data), 40 + 8 * 12 + 12 * 12)
+        decoded_vertices, decoded_faces, header = decode_mesh(data)
+        self.assertTrue(np.allclose(decoded_vertices, vertices))
+        self.assertEqual(decoded_faces.tolist(), CUBE_FACES)
+        self.assertEqual(header, {'quantization_bits': 0, 'lod': 0, 'n_lods': 1})
+
+        data = encode_mesh(vertices, CUBE_FACES, quantization_bits=10, lod=2, n_lods=3)
+        self.assertEqual(len(data), 40 + 8 * 6 + 12 * 12)
+        decoded_vertices, decoded_faces, header = decode_mesh(data)
+        self.assertTrue(np.allclose(decoded_vertices, vertices, atol=0.1))
+        self.assertEqual(decoded_faces.tolist(), CUBE_FACES)
+        self.assertEqual(header, {'quantization_bits': 10, 'lod': 2, 'n_lods': 3})
+
+    def test_decimate(self):
+        # A cube with a subdivided top face, the center vertex of the top face is
+        # merged with a corner and two of the top triangles collapse.
+        vertices = np.asarray(CUBE_VERTICES + [[0.5, 0.5, 1.0]], dtype=np.float64)
+        faces = [f for f in CUBE_FACES if f not in ([4, 7, 6], [4, 5, 7])]
+        faces += [[4, 5, 8], [5, 7, 8], [7, 6, 8], [6, 4, 8]]
+        decimated_vertices, decimated_faces = decimate_mesh(vertices, faces, 0.9)
+        self.assertEqual(len(decimated_vertices), 8)
+        self.assertEqual(len(decimated_faces), 12)
+        self.assertTrue(np.all(decimated_faces < len(decimated_vertices)))
+
+        # With coarse cells, everything collapses.
+        decimated_vertices, decimated_faces = decimate_mesh(CUBE_VERTICES, CUBE_FACES, 10)
+        self.assertEqual(len(decimated_faces), 0)
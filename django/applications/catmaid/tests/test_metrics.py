@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from catmaid.metrics import Histogram, ServerMetrics, to_prometheus
+
+
+class ServerMetricsTests(TestCase):
+
+    def test_histogram(self):
+        h = Histogram(buckets=(0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 2.0):
+            h.observe(v)
+        self.assertEqual(h.counts, [2, 1, 1])
+        self.assertEqual(h.cumulative_counts(), [2, 3, 4])
+        self.assertEqual(h.count, 4)
+        self.assertAlmostEqual(h.sum, 2.65)
+
+    def test_server_metrics(self):
+        m = ServerMetrics(buckets=(0.1, 1.0))
+        m.observe_request('a', 0.05, 200, 3, 0.01)
+        m.observe_request('a', 0.5, 500, 2, 0.02)
+        m.observe_request('b', 2.0, 404)
+        m.observe_node_provider('GridCachedJsonNodeProvider', False)
+        m.observe_node_provider('Postgis3dNodeProvider', True)
+        m.observe_node_provider('Postgis3dNodeProvider', True)
+
+        result = m.as_dict()
+        self.assertEqual(result['endpoints']['a']['latency']['counts'], [1, 1, 0])
+        self.assertEqual(result['endpoints']['a']['errors'], 1)
+        self.assertEqual(result['endpoints']['a']['db_queries'], 5)
+        self.assertAlmostEqual(result['endpoints']['a']['db_time'], 0.03)
+        self.assertEqual(result['endpoints']['b']['errors'], 0)
+        self.assertEqual(result['node_providers'], {
+            'GridCachedJsonNodeProvider': {'hits': 0, 'misses': 1},
+            'Postgis3dNodeProvider': {'hits': 2, 'misses': 0},
+        })
+
+        text = to_prometheus(result, {'celery': 4, 'missing': None})
+        lines = text.split('\n')
+        self.assertIn('# TYPE catmaid_request_duration_seconds histogram', lines)
+        self.assertIn('catmaid_request_duration_seconds_bucket{endpoint="a",le="0.1"} 1', lines)
+        self.assertIn('catmaid_request_duration_seconds_bucket{endpoint="a",le="1.0"} 2', lines)
+        self.assertIn('catmaid_request_duration_seconds_bucket{endpoint="a",le="+Inf"} 2', lines)
+        self.assertIn('catmaid_request_duration_seconds_count{endpoint="b"} 1', lines)
+        self.assertIn('catmaid_request_errors_total{endpoint="a"} 1', lines)
+        self.assertIn('catmaid_node_provider_queries_total{provider="GridCachedJsonNodeProvider",result="miss"} 1', lines)
+        self.assertIn('catmaid_celery_queue_length{queue="celery"} 4', lines)
+        self.assertFalse(any('queue="missing"' in l for l in lines))
+
+        m.reset()
+        self.assertEqual(m.as_dict()['endpoints'], {})
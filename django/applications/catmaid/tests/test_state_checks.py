@@ -421,6 +421,35 @@ class StateCheckingTest(CatmaidTestCase):
                 lambda: state.validate_state(285, s6, neighborhood=True))
 
 
+    def test_all_mismatches_reported(self):
+        ps1 = [
+            [247, '2011-12-05T13:51:36.955Z'],
+            [249, '3011-12-05T13:51:36.955Z'],
+            [251, '1011-12-05T13:51:36.955Z']
+        ]
+        s1 = json.dumps(ps1)
+        with self.assertRaises(state.StateMatchingError) as cm:
+            state.validate_state([247, 249, 251], s1, multinode=True)
+        self.assertCountEqual(cm.exception.mismatches, [
+            ('edited', 249, None),
+            ('edited', 251, None),
+        ])
+
+        ps2 = {
+            'edition_time': '2011-12-04T13:51:36.955Z',
+            'parent': [283, '2011-12-15T13:51:36.955Z'],
+            'children': [],
+            'links': [[360, '3011-12-20T10:46:01.360Z']],
+        }
+        s2 = json.dumps(ps2)
+        with self.assertRaises(state.StateMatchingError) as cm:
+            state.validate_state(285, s2, neighborhood=True)
+        self.assertCountEqual(cm.exception.mismatches, [
+            ('edited', 360, None),
+            ('all_children', 285, 289),
+        ])
+
+
     def test_has_only_truthy_values(self):
         self.assertTrue(state.has_only_truthy_values([True, 1]))
         self.assertFalse(state.has_only_truthy_values([True], n=2))
@@ -231,3 +231,51 @@ class TransactionLogTests(TransactionTestCase, AssertStatusMixin):
         self.assertAlmostEqual(6.2, txid_locaton_2['x'], 5)
         self.assertAlmostEqual(11.2, txid_locaton_2['y'], 5)
         self.assertAlmostEqual(16.2, txid_locaton_2['z'], 5)
+
+    def test_transaction_collection_paging(self):
+        """Transactions can be paged through with range cursors and streamed.
+        """
+        for i in range(3):
+            response = self.client.post('/%d/treenode/create' % self.project.id, {
+                'x': 5 + i,
+                'y': 10,
+                'z': 15,
+                'confidence': 5,
+                'parent_id': -1,
+                'radius': 2})
+            self.assertStatus(response)
+            transaction.commit()
+
+        response = self.client.get('/%d/transactions/' % self.project.id)
+        self.assertStatus(response)
+        all_transactions = json.loads(response.content.decode('utf-8'))
+        n_transactions = all_transactions['total_count']
+        self.assertGreaterEqual(n_transactions, 3)
+        self.assertEqual(n_transactions, len(all_transactions['transactions']))
+        self.assertIsNone(all_transactions['next_range_cursor'])
+
+        # Page through all transactions, two at a time
+        paged_transactions = []
+        range_after = None
+        while True:
+            params = {'range_length': 2, 'with_count': False}
+            if range_after:
+                params['range_after'] = range_after
+            response = self.client.get('/%d/transactions/' % self.project.id,
+                    params)
+            self.assertStatus(response)
+            parsed_response = json.loads(response.content.decode('utf-8'))
+            self.assertIsNone(parsed_response['total_count'])
+            paged_transactions.extend(parsed_response['transactions'])
+            range_after = parsed_response['next_range_cursor']
+            if not range_after:
+                break
+        self.assertEqual(paged_transactions, all_transactions['transactions'])
+
+        # Stream all transactions as newline delimited JSON
+        response = self.client.get('/%d/transactions/' % self.project.id,
+                {'format': 'ndjson'})
+        self.assertStatus(response)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(l) for l in lines],
+                all_transactions['transactions'])
@@ -74,6 +74,56 @@ class UtilTests(TestCase):
         self.assertTrue(is_collinear(p1, p2, p3))
         self.assertTrue(is_collinear(p1, p2, p3, True))
 
+    def test_are_collinear(self):
+        from catmaid.util import Point3D, are_collinear, is_collinear
+
+        a = [[-1.0, 1.0, 1.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0],
+             [0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [-299924.0, 505016.0, 40.0],
+             [0.0, 0.0, 0.0]]
+        b = [[1.0, 2.0, 3.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0],
+             [0.0, 0.0, 1.0], [1.0, 0.001, 0.0], [-319905.0, 505904.0, 40.0],
+             [2.0, 2.0, 0.0]]
+        c = [[-2.0, 0.5, 0.0], [1.5, 0.0, 0.0], [0.0, 0.5, 0.0],
+             [0.0, 0.0, 1.5], [0.5, 0.0005, 0.0], [-309915.0, 505460.0, 40.0],
+             [1.0, 1.5, 0.0]]
+
+        for between in (False, True):
+            expected = [is_collinear(Point3D(*p1), Point3D(*p2), Point3D(*p3),
+                    between) for p1, p2, p3 in zip(a, b, c)]
+            self.assertEqual(expected, are_collinear(a, b, c, between).tolist())
+
+        self.assertEqual([False, False, True, False, True, True, False],
+                are_collinear(a, b, c, True).tolist())
+
+    def test_edge_count_to_node(self):
+        from catmaid.control.tree_util import (edge_count_to_node,
+                node_degrees, to_parent_index_arrays)
+
+        rows = [(10, None), (5, 10), (7, 5), (3, 5), (20, 10), (21, 20)]
+        node_ids, parent_index = to_parent_index_arrays(rows)
+        self.assertEqual([3, 5, 7, 10, 20, 21], node_ids.tolist())
+        self.assertEqual([1, 3, 1, -1, 3, 4], parent_index.tolist())
+        self.assertEqual([1, 3, 1, 2, 2, 1], node_degrees(parent_index).tolist())
+        self.assertEqual([3, 2, 3, 1, 2, 3],
+                edge_count_to_node(parent_index, 3).tolist())
+        self.assertEqual([3, 2, 1, 3, 4, 5],
+                edge_count_to_node(parent_index, 2).tolist())
+
+    def test_arbor_topology(self):
+        from catmaid.control.tree_util import build_arbor_topology
+
+        rows = [(10, None), (5, 10), (7, 5), (3, 5), (20, 10), (21, 20), (1, 3)]
+        arbor = build_arbor_topology(rows)
+        self.assertEqual([1, 3, 5, 7, 10, 20, 21], arbor.node_ids.tolist())
+        self.assertEqual([1, 2, 4, 2, -1, 4, 5], arbor.parent_index.tolist())
+        self.assertEqual([0, 0, 1, 3, 3, 5, 6, 6], arbor.child_offsets.tolist())
+        self.assertEqual([0, 1, 3, 2, 5, 6], arbor.child_index.tolist())
+        self.assertEqual([0, 1, 2, 0, 2, 1, 0], arbor.num_children.tolist())
+        self.assertEqual([0, 1, 2, 0, 4, 1, 0],
+                [arbor.arbor_size(i) for i in range(len(arbor.node_ids))])
+        self.assertEqual([1, 3], arbor.children(arbor.index_of(5)).tolist())
+        self.assertRaises(ValueError, arbor.index_of, 4)
+
     def test_get_version(self):
         from mysite.utils import get_version
 
@@ -192,6 +192,7 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/stats/user-history$', stats.stats_user_history),
     url(r'^(?P<project_id>\d+)/stats/user-activity$', stats.stats_user_activity),
     url(r'^(?P<project_id>\d+)/stats/server$', stats.ServerStats.as_view()),
+    url(r'^(?P<project_id>\d+)/stats/server/metrics$', stats.server_metrics_prometheus),
 ]
 
 # Annotations
@@ -201,6 +202,8 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/annotations/forskeletons$', annotation.annotations_for_skeletons),
     url(r'^(?P<project_id>\d+)/annotations/table-list$', annotation.list_annotations_datatable),
     url(r'^(?P<project_id>\d+)/annotations/add$', record_view("annotations.add")(annotation.annotate_entities)),
+    url(r'^(?P<project_id>\d+)/annotations/bulk-add$', annotation.bulk_annotate_entities_view),
+    url(r'^(?P<project_id>\d+)/annotations/bulk-remove$', annotation.bulk_remove_annotations_view),
     url(r'^(?P<project_id>\d+)/annotations/add-neuron-names$', record_view("annotations.addneuronname")(annotation.add_neuron_name_annotations)),
     url(r'^(?P<project_id>\d+)/annotations/remove$', record_view("annotations.remove")(annotation.remove_annotations)),
     url(r'^(?P<project_id>\d+)/annotations/replace$', record_view("annotations.replace")(annotation.replace_annotations)),
@@ -274,6 +277,7 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/nodes/most-recent$', node.most_recent_treenode),
     url(r'^(?P<project_id>\d+)/nodes/location$', node.get_locations),
     url(r'^(?P<project_id>\d+)/nodes/nearest$', node.node_nearest),
+    url(r'^(?P<project_id>\d+)/nodes/nearest-bulk$', node.node_nearest_bulk),
     url(r'^(?P<project_id>\d+)/node/update$', record_view("nodes.update_location")(node.node_update)),
     url(r'^(?P<project_id>\d+)/node/list$', node.node_list_tuples),
     url(r'^(?P<project_id>\d+)/node/get_location$', node.get_location),
@@ -346,6 +350,9 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/skeletons/sampler-count$', skeleton.list_sampler_count),
     url(r'^(?P<project_id>\d+)/skeleton/(?P<skeleton_id>\d+)/permissions$', skeleton.get_skeleton_permissions),
     url(r'^(?P<project_id>\d+)/skeletons/import$', record_view("skeletons.import")(skeleton.import_skeleton)),
+    url(r'^(?P<project_id>\d+)/skeletons/import-bulk$', record_view("skeletons.import")(skeleton.import_skeletons)),
+    url(r'^(?P<project_id>\d+)/skeletons/import-archive$', record_view("skeletons.import")(skeleton.import_skeleton_archive)),
+    url(r'^(?P<project_id>\d+)/skeletons/import-archive/(?P<job_id>[a-z0-9]+)$', skeleton.import_skeleton_archive_status),
     url(r'^(?P<project_id>\d+)/skeleton/annotationlist$', skeleton.annotation_list),
     url(r'^(?P<project_id>\d+)/skeletons/within-spatial-distance$', skeleton.within_spatial_distance),
     url(r'^(?P<project_id>\d+)/skeletons/node-labels$', skeleton.skeletons_by_node_labels),
@@ -568,9 +575,11 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/volumes/import$', record_view("volumes.create")(volume.import_volumes)),
     url(r'^(?P<project_id>\d+)/volumes/entities/$', volume.get_volume_entities),
     url(r'^(?P<project_id>\d+)/volumes/skeleton-innervations$', volume.get_skeleton_innervations),
+    url(r'^(?P<project_id>\d+)/volumes/intersect-points$', volume.intersect_points),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/$', volume.VolumeDetail.as_view()),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/intersect$', volume.intersects),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/export\.(?P<extension>\w+)', volume.export_volume),
+    url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/mesh$', volume.get_volume_mesh),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/update-meta-info$', volume.update_meta_information),
 ]
 
@@ -2,6 +2,7 @@
 
 import argparse
 import math
+import numpy as np
 
 
 # Respected precision
@@ -71,6 +72,39 @@ def is_collinear(a, b, c, between=False, eps=epsilon) -> bool:
     else:
         return True
 
+def are_collinear(a, b, c, between=False, eps=epsilon) -> np.ndarray:
+    """Test many triples of points for collinearity at once, like
+    is_collinear() does for a single triple. The parameters a, b and c are
+    lists of [x, y, z] points of the same length, or arrays of shape (n, 3).
+    Returns an array of n booleans.
+    """
+    a, b, c = (np.asarray(p, dtype=np.float64).reshape(-1, 3) for p in (a, b, c))
+
+    # General point equation: a + (b - a) * t, calculate d = b - a and t for
+    # all dimensions where d isn't zero.
+    d = b - a
+    nonzero = d != 0
+    t = np.where(nonzero, (c - a) / np.where(nonzero, d, 1.0), 0.0)
+
+    # Factors of all dimensions need to match the factor of the first dimension
+    # where d isn't zero, unless they are zero.
+    first = np.argmax(nonzero, axis=1)
+    valid_t = t[np.arange(len(t)), first]
+    later = nonzero & (np.arange(3) > first[:, np.newaxis])
+    mismatch = later & (np.abs(t) >= eps) & \
+            (np.abs(valid_t[:, np.newaxis] - t) >= eps)
+    result = ~mismatch.any(axis=1)
+
+    # Re-calculate C and check if it matches the input
+    result &= (np.abs(a + t * d - c) < eps).all(axis=1)
+
+    if between:
+        # If C is only allowed to be between A and B, check if T is between
+        # zero and one.
+        result &= (t.min(axis=1) >= 0.0) & (t.max(axis=1) <= 1.0)
+
+    return result
+
 def str2bool(v) -> bool:
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
         return True
@@ -51,6 +51,8 @@ MANAGERS = ADMINS
 USE_I18N = True
 
 MIDDLEWARE = [
+    # Collects request latency and database use, see the server statistics API.
+    'catmaid.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -257,6 +259,7 @@ MEDIA_ROI_SUBDIRECTORY = 'roi'
 MEDIA_TREENODE_SUBDIRECTORY = 'treenode_archives'
 MEDIA_EXPORT_SUBDIRECTORY = 'export'
 MEDIA_CACHE_SUBDIRECTORY = 'cache'
+MEDIA_IMPORT_SUBDIRECTORY = 'import'
 
 # Cropping output extension
 CROPPING_OUTPUT_FILE_EXTENSION = "tiff"
@@ -272,6 +275,25 @@ GENERATED_FILES_MAXIMUM_SIZE = 52428800
 # The default is 5 megabytes.
 IMPORTED_SKELETON_FILE_MAXIMUM_SIZE = 5242880
 
+# The maximum allowed size in bytes for archives of skeleton files uploaded for
+# asynchronous import. The default is 100 megabytes.
+IMPORTED_SKELETON_ARCHIVE_MAXIMUM_SIZE = 104857600
+
+# The number of files in a skeleton archive import that are imported together
+# by a single Celery task. Multiple tasks run in parallel on available workers.
+IMPORTED_SKELETON_ARCHIVE_FILES_PER_TASK = 50
+
+# The number of seconds after which the files of a skeleton archive import job
+# are removed, counted from the job's completion. Afterwards, the job status
+# can't be queried anymore. The default is one day.
+IMPORTED_SKELETON_ARCHIVE_JOB_MAX_AGE = 60 * 60 * 24
+
+# The number of seconds after which the files of a skeleton archive import job
+# that isn't complete are removed, counted from the job's last change. Such
+# jobs might still wait for a worker, which is why this should be much longer
+# than IMPORTED_SKELETON_ARCHIVE_JOB_MAX_AGE. The default is one week.
+IMPORTED_SKELETON_ARCHIVE_INCOMPLETE_JOB_MAX_AGE = 60 * 60 * 24 * 7
+
 # The maximum allowed image size for imported images. The default is 3MB.
 IMPORTED_IMAGE_FILE_MAXIMUM_SIZE = 3145728
 
@@ -356,6 +378,11 @@ CELERY_TASK_SERIALIZER = 'pickle'
 # CELERY_TIMEZONE = 'America/New_York'
 # CELERY_ENABLE_UTC = False
 
+# The number of statistics summary metrics (per project) that the periodic
+# statistics update tasks compute in parallel, each using its own database
+# connection.
+STATS_SUMMARY_POPULATION_JOBS = 4
+
 # The default set of periodic tasks
 CELERY_BEAT_SCHEDULE = {
     # Clean cropped stack directory every night at 23:30.
@@ -363,6 +390,11 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'catmaid.tasks.cleanup_cropped_stacks',
         'schedule': crontab(hour=23, minute=30)
     },
+    # Remove old skeleton archive import jobs every night at 23:35.
+    'daily-skeleton-import-cleanup': {
+        'task': 'catmaid.tasks.cleanup_skeleton_imports',
+        'schedule': crontab(hour=23, minute=35)
+    },
     # Update project statistics every night at 23:45.
     'daily-project-stats-summary-update': {
         'task': 'catmaid.tasks.update_project_statistics_from_scratch',
@@ -512,6 +544,33 @@ DEFAULT_CACHE_GRID_CELL_WIDTH = 25000
 DEFAULT_CACHE_GRID_CELL_HEIGHT = 25000
 DEFAULT_CACHE_GRID_CELL_DEPTH = 40
 
+# The maximum number of volume mesh indices kept in memory by each worker
+# process. These indices are used for exact volume intersection tests.
+VOLUME_MESH_INDEX_CACHE_SIZE = 500
+
+# The maximum number of skeleton KD-trees kept in memory by each worker process.
+# These trees are used for skeleton restricted bulk nearest node queries.
+NEAREST_NODE_KDTREE_CACHE_SIZE = 100
+
+# The maximum number of skeleton topologies kept in memory by each worker
+# process. These are used to navigate skeletons and to find open leaves.
+ARBOR_TOPOLOGY_CACHE_SIZE = 100
+
+# The number of threads, each with its own database connection, that
+# recompute the detail summary of changed skeletons for completeness requests,
+# if more skeletons changed than fit into a single query.
+SKELETON_DETAIL_SUMMARY_UPDATE_JOBS = 4
+
+# The levels of detail (LODs) volume meshes are available in. LOD 0 is always
+# the original mesh. Each entry here defines an additional LOD by the number of
+# grid cells along the longest bounding box axis of a volume, vertices in the
+# same cell are merged.
+VOLUME_MESH_LOD_GRID_SIZES = (256, 64, 16)
+
+# The number of entities that are annotated or de-annotated per transaction by
+# the bulk annotation endpoints.
+ANNOTATION_BULK_CHUNK_SIZE = 5000
+
 # Whether Postgres should emit "catmaid.spatial-update" events on changes of
 # spatial data (e.g. inserts, updates and deletions of treenodes, connectors and
 # connector links).